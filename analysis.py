@@ -0,0 +1,464 @@
+"""
+Analysis Module for Comparatron
+Handles image analysis jobs on a pool of worker processes reading frames from the capture ring
+"""
+
+import collections
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, CancelledError, TimeoutError as FutureTimeout
+import numpy as np
+from capture import FrameRing
+from profiling import profiler
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Registry of analysis operations keyed by name
+OPERATIONS = {}
+
+
+def register_operation(name):
+    """
+    Decorator that adds an analysis operation to the registry
+
+    Operations are called as func(image, origin, **params) in a worker process,
+    where image is the ROI (possibly a read-only view into shared memory) and
+    origin its (x, y) offset in the frame; they return a JSON-serializable dict
+    with positions in frame pixels.
+
+    Args:
+        name (str): Operation name used by the job API
+    """
+    def decorator(func):
+        OPERATIONS[name] = func
+        return func
+    return decorator
+
+
+def available_operations():
+    """
+    List the registered analysis operations
+
+    Returns:
+        list: Dictionaries with name and description
+    """
+    return [{'name': name, 'description': (func.__doc__ or '').strip().splitlines()[0]}
+            for name, func in OPERATIONS.items()]
+
+
+@register_operation('focus')
+def focus_metrics(image, origin, **params):
+    """Sharpness of the ROI (variance of the Laplacian and Tenengrad gradient energy)"""
+    import cv2 as cv
+    from vision import to_gray
+    gray = to_gray(image)
+    laplacian = cv.Laplacian(gray, cv.CV_64F)
+    gx = cv.Sobel(gray, cv.CV_64F, 1, 0, ksize=3)
+    gy = cv.Sobel(gray, cv.CV_64F, 0, 1, ksize=3)
+    return {'laplacian_variance': float(laplacian.var()), 'tenengrad': float(np.mean(gx * gx + gy * gy))}
+
+
+@register_operation('intensity')
+def intensity_stats(image, origin, **params):
+    """Mean, standard deviation, minimum and maximum gray level of the ROI"""
+    from vision import to_gray
+    gray = to_gray(image)
+    return {'mean': float(gray.mean()), 'std': float(gray.std()), 'min': int(gray.min()), 'max': int(gray.max())}
+
+
+@register_operation('edge')
+def edge_point(image, origin, search_radius=40, low_threshold=50, high_threshold=150, **params):
+    """Sub-pixel edge point nearest to the ROI centre"""
+    from vision import refine_edge_point
+    point = refine_edge_point(image, int(search_radius), low_threshold, high_threshold)
+    if point is None:
+        return {'found': False}
+    return {'found': True, 'x': point[0] + origin[0], 'y': point[1] + origin[1]}
+
+
+@register_operation('fiducial')
+def fiducial_point(image, origin, mode='blob', search_radius=None, **params):
+    """Sub-pixel centre of the fiducial nearest to the ROI centre"""
+    from vision import locate_fiducial
+    point = locate_fiducial(image, mode, search_radius)
+    if point is None:
+        return {'found': False}
+    return {'found': True, 'x': point[0] + origin[0], 'y': point[1] + origin[1]}
+
+
+@register_operation('template')
+def template_match(image, origin, template=None, **params):
+    """Best normalized cross-correlation match of a template inside the ROI"""
+    import cv2 as cv
+    from vision import to_gray
+    if template is None:
+        raise ValueError("The template operation needs a 'template' image")
+    gray = to_gray(image)
+    template = to_gray(np.asarray(template, dtype=np.uint8))
+    th, tw = template.shape[:2]
+    if th > gray.shape[0] or tw > gray.shape[1]:
+        raise ValueError("Template is larger than the ROI")
+    scores = cv.matchTemplate(gray, template, cv.TM_CCOEFF_NORMED)
+    _, score, _, (x, y) = cv.minMaxLoc(scores)
+    return {'x': x + (tw - 1) / 2.0 + origin[0], 'y': y + (th - 1) / 2.0 + origin[1], 'score': float(score)}
+
+
+@register_operation('circle')
+def circle_measurement(image, origin, **params):
+    """Hole or circle around the ROI centre (Hough search refined by a sub-pixel edge fit)"""
+    from vision import measure_circle
+    circle = measure_circle(image, **params)
+    if circle is None:
+        return {'found': False}
+    return {'found': True, 'x': circle['center'][0] + origin[0], 'y': circle['center'][1] + origin[1],
+            'radius': circle['radius'], 'rms': circle['rms'], 'points': circle['points'],
+            'coverage': circle['coverage']}
+
+
+@register_operation('silhouette')
+def silhouette_outlines(image, origin, **params):
+    """Sub-pixel outlines of backlit parts in the ROI"""
+    from vision import extract_silhouette
+    result = extract_silhouette(image, **params)
+    for contour in result['contours']:
+        contour['points'] = (contour['points'] + origin).tolist()
+        contour['centroid'] = (contour['centroid'][0] + origin[0], contour['centroid'][1] + origin[1])
+    return result
+
+
+# Frame rings attached by this worker process, by shared memory name
+_rings = collections.OrderedDict()
+_MAX_RINGS = 4
+
+
+def _worker_init():
+    """Pool process setup: stay below the capture and web threads, one OpenCV thread each"""
+    try:
+        os.nice(5)
+    except (AttributeError, OSError):
+        pass
+    import cv2 as cv
+    cv.setNumThreads(1)
+
+
+def _attach(ring_name):
+    """Attach to a frame ring once per worker process"""
+    ring = _rings.get(ring_name)
+    if ring is None:
+        ring = _rings[ring_name] = FrameRing.attach(ring_name)
+        while len(_rings) > _MAX_RINGS:
+            _, old = _rings.popitem(last=False)
+            old.close()
+    else:
+        _rings.move_to_end(ring_name)
+    return ring
+
+
+def clip_roi(roi, shape):
+    """
+    Clip an (x, y, width, height) ROI to a frame
+
+    Returns:
+        tuple: Clipped (x, y, width, height); the whole frame if roi is None
+    """
+    h, w = shape[:2]
+    if roi is None:
+        return 0, 0, w, h
+    x, y, rw, rh = (int(round(v)) for v in roi)
+    x0, y0 = min(max(x, 0), w), min(max(y, 0), h)
+    x1, y1 = min(max(x + rw, x0), w), min(max(y + rh, y0), h)
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def run_operation(operation, params, roi, ring_name=None, seq=None, image=None):
+    """
+    Execute one job (in a worker process)
+
+    The ROI is analysed in place in the shared frame ring; if the frame was
+    overwritten meanwhile the result is discarded with an error.
+
+    Args:
+        operation (str): Registered operation name
+        params (dict): Keyword arguments of the operation
+        roi (tuple): (x, y, width, height) in frame pixels, None for the whole frame
+        ring_name (str): FrameRing to read the frame from
+        seq (int): Frame sequence number in the ring
+        image (numpy.ndarray): Frame passed directly when there is no ring
+
+    Returns:
+        dict: 'result', 'roi', 'seq', 'frame_time' and 'timing_ms' (read, compute)
+    """
+    start = time.perf_counter()
+    frame_time = None
+    ring = None
+    if ring_name is not None:
+        ring = _attach(ring_name)
+        found, frame_time, image = ring.get(seq)
+        if image is None:
+            raise RuntimeError(f"Frame {seq} is not in the capture ring (any more)")
+        seq = found
+    x, y, w, h = clip_roi(roi, image.shape)
+    if w == 0 or h == 0:
+        raise ValueError("ROI is outside the frame")
+    view = image[y:y + h, x:x + w]
+    read = time.perf_counter()
+    result = OPERATIONS[operation](view, (x, y), **(params or {}))
+    if ring is not None and not ring.valid(seq):
+        raise RuntimeError("Frame was overwritten during the analysis")
+    done = time.perf_counter()
+    return {'result': result, 'roi': [x, y, w, h], 'seq': seq, 'frame_time': frame_time,
+            'timing_ms': {'read': (read - start) * 1000, 'compute': (done - read) * 1000}}
+
+
+class AnalysisJob:
+    """
+    Class holding one analysis request, its future and its timings
+    """
+
+    def __init__(self, job_id, operation, params, roi, ring_name=None, seq=None, image=None):
+        self.id = job_id
+        self.operation = operation
+        self.params = params or {}
+        self.roi = roi
+        self.ring_name = ring_name
+        self.seq = seq
+        self.image = image
+        self.future = Future()  # Resolves to the result dict of run_operation
+        self.status = 'queued'
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self._created = time.perf_counter()
+        self._started = None
+
+    @property
+    def done(self):
+        return self.status in ('finished', 'failed', 'cancelled')
+
+    def wait(self, timeout=None):
+        """Wait until the job is done; returns True if it is"""
+        try:
+            self.future.exception(timeout)
+        except (CancelledError, FutureTimeout):
+            pass
+        return self.done
+
+    def snapshot(self):
+        """
+        Describe the job for the API
+
+        Returns:
+            dict: Status, operation, frame, ROI, result and timings (ms)
+        """
+        info = {'id': self.id, 'operation': self.operation, 'status': self.status, 'error': self.error,
+                'seq': self.seq, 'roi': self.roi, 'result': None, 'frame_time': None, 'timing_ms': None,
+                'created': self.created, 'started': self.started, 'finished': self.finished}
+        if self.status == 'finished':
+            outcome = self.future.result()
+            info.update(result=outcome['result'], roi=outcome['roi'], seq=outcome['seq'],
+                        frame_time=outcome['frame_time'], timing_ms=outcome['timing_ms'])
+        return info
+
+
+class AnalysisService:
+    """
+    Class running analysis jobs on worker processes
+
+    Jobs wait in a bounded queue in this process and only as many are handed
+    to the pool as there are workers, so queued jobs can still be cancelled and
+    a full queue rejects new jobs instead of piling up work (backpressure). The
+    pool leaves one core to the capture and web processes and its workers run
+    at a lower priority, so analysis does not starve the video feed. The pool
+    is started on the first job.
+    """
+
+    def __init__(self, max_workers=None, max_queue=None, max_history=100):
+        """
+        Initialize the service
+
+        Args:
+            max_workers (int): Worker processes; default one less than the CPU count
+            max_queue (int): Jobs waiting for a worker before new ones are rejected
+            max_history (int): Finished jobs kept for later queries
+        """
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 1) - 1)
+        self.max_queue = max_queue or 4 * self.max_workers
+        self.max_history = max_history
+        self.jobs = collections.OrderedDict()
+        self.rejected = 0
+        self.completed = 0
+        self._ids = itertools.count(1)
+        self._queue = collections.deque()
+        self._running = 0
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def submit(self, operation, params=None, roi=None, ring_name=None, seq=None, image=None):
+        """
+        Queue an analysis job
+
+        Args:
+            operation (str): Registered operation name
+            params (dict): Keyword arguments of the operation
+            roi (tuple): (x, y, width, height) in frame pixels, None for the whole frame
+            ring_name (str): FrameRing holding the frame (see capture.CaptureProcess)
+            seq (int): Frame sequence number in the ring, None for the newest frame when the job runs
+            image (numpy.ndarray): Frame to analyse when there is no ring
+
+        Returns:
+            AnalysisJob: The queued job, or None if the queue is full
+        """
+        if operation not in OPERATIONS:
+            raise ValueError(f"Unknown analysis operation '{operation}'")
+        if ring_name is None and image is None:
+            raise ValueError("An analysis job needs a frame ring or an image")
+        with self._lock:
+            if len(self._queue) >= self.max_queue:
+                self.rejected += 1
+                return None
+            job = AnalysisJob(str(next(self._ids)), operation, params, roi, ring_name, seq, image)
+            self.jobs[job.id] = job
+            self._prune()
+            self._queue.append(job)
+        self._dispatch()
+        return job
+
+    def _dispatch(self):
+        """Hand queued jobs to the pool while workers are free"""
+        while True:
+            with self._lock:
+                if self._running >= self.max_workers or not self._queue:
+                    return
+                job = self._queue.popleft()
+                if not job.future.set_running_or_notify_cancel():
+                    continue
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(self.max_workers, multiprocessing.get_context('spawn'),
+                                                     initializer=_worker_init)
+                self._running += 1
+                job.status = 'running'
+                job.started = time.time()
+                job._started = time.perf_counter()
+            try:
+                future = self._pool.submit(run_operation, job.operation, job.params, job.roi,
+                                           job.ring_name, job.seq, job.image)
+            except Exception as e:
+                self._finish(job, None, e)
+                continue
+            job.image = None  # Sent to the worker, not needed here any more
+            future.add_done_callback(lambda f, job=job: self._finish(job, f))
+
+    def _finish(self, job, future, error=None):
+        """Record the outcome of a job and start the next one"""
+        if future is not None:
+            error = future.exception()
+        now = time.perf_counter()
+        with self._lock:
+            self._running -= 1
+            job.finished = time.time()
+            if job.status == 'cancelled':
+                pass  # Result of a job cancelled while running is discarded
+            elif error is not None:
+                job.status = 'failed'
+                job.error = str(error)
+                job.future.set_exception(error)
+            else:
+                outcome = future.result()
+                outcome['timing_ms'].update(queued=(job._started - job._created) * 1000,
+                                            total=(now - job._created) * 1000)
+                job.status = 'finished'
+                self.completed += 1
+                job.future.set_result(outcome)
+        if job.status == 'finished':
+            profiler.record(f'analysis.{job.operation}', now - job._started)
+        self._dispatch()
+
+    def get(self, job_id):
+        """Return the job with the given id or None"""
+        return self.jobs.get(str(job_id))
+
+    def cancel(self, job_id):
+        """
+        Cancel a job
+
+        A queued job is dropped; a running job is marked cancelled and its
+        result is discarded when the worker finishes.
+
+        Returns:
+            bool: True if the job exists
+        """
+        job = self.get(job_id)
+        if job is None:
+            return False
+        with self._lock:
+            if job.done:
+                return True
+            if job.status == 'queued':
+                try:
+                    self._queue.remove(job)
+                except ValueError:
+                    pass
+                job.future.cancel()
+            else:
+                job.future.set_exception(CancelledError(f"Analysis job {job.id} was cancelled"))
+            job.status = 'cancelled'
+            job.finished = time.time()
+        return True
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond max_history"""
+        finished = [job_id for job_id, job in self.jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - self.max_history)]:
+            del self.jobs[job_id]
+
+    def list_jobs(self):
+        """Snapshots of the known jobs"""
+        return [job.snapshot() for job in list(self.jobs.values())]
+
+    def stats(self):
+        """
+        Queue and worker state
+
+        Returns:
+            dict: workers, queue length and limit, running, completed and rejected jobs
+        """
+        with self._lock:
+            return {'workers': self.max_workers, 'started': self._pool is not None,
+                    'queued': len(self._queue), 'max_queue': self.max_queue, 'running': self._running,
+                    'completed': self.completed, 'rejected': self.rejected}
+
+    def close(self):
+        """Cancel the queued jobs and stop the worker processes"""
+        with self._lock:
+            queued, self._queue = list(self._queue), collections.deque()
+            pool, self._pool = self._pool, None
+        for job in queued:
+            job.future.cancel()
+            job.status = 'cancelled'
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    # Analyse a synthetic frame published through a frame ring
+    import cv2 as cv
+    ring = FrameRing(slots=4)
+    frame = np.full((480, 640, 3), 200, np.uint8)
+    cv.circle(frame, (320, 240), 40, (30, 30, 30), -1)
+    seq = ring.write(frame, time.time())
+
+    service = AnalysisService(max_workers=2)
+    jobs = [service.submit(name, roi=(200, 120, 240, 240), ring_name=ring.name, seq=seq)
+            for name in ('focus', 'intensity', 'edge', 'fiducial')]
+    for job in jobs:
+        job.wait(30)
+        print(job.snapshot())
+    print(service.stats())
+    service.close()
+    ring.close()
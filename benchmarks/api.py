@@ -0,0 +1,94 @@
+"""
+HTTP API Benchmark for Comparatron
+Measures request latency and throughput of the web API under concurrent clients
+"""
+
+import argparse
+import tempfile
+import threading
+import time
+import urllib.request
+from harness import stats, quiet, serve, report, emit
+from emulator import GRBLEmulator
+
+# /api/get_machine_status is left out by default: it sends '?' through send_command,
+# which waits out its full response timeout (see grbl.py)
+ENDPOINTS = ('/api/status', '/api/recorded_points', '/api/jobs', '/api/stations')
+
+
+def run(clients=(1, 4, 16), requests_per_client=50, endpoints=ENDPOINTS, points=1000):
+    """
+    Hit the API from several client threads at once
+
+    The default station is connected to the GRBL emulator and holds `points`
+    recorded points, so the routes return realistic payloads.
+
+    Args:
+        clients (list): Concurrent client counts to measure
+        requests_per_client (int): Requests per client and endpoint
+        endpoints (list): Routes to request (GET)
+        points (int): Recorded points served by /api/recorded_points
+
+    Returns:
+        list: Per client count and endpoint: latency statistics (ms) and requests/s
+    """
+    from stations import StationRegistry
+    from gui_flask import ComparatronFlaskGUI
+
+    emulator = GRBLEmulator()
+    with quiet():
+        registry = StationRegistry(filename=None, data_root=tempfile.mkdtemp(prefix='comparatron-bench-'))
+        gui = ComparatronFlaskGUI(registry)
+        station = registry.default
+        station.serial_comm.connect_to_com(emulator.port)
+        for i in range(points):
+            gui.record_point(i * 0.01, (i % 50) * 0.01)
+
+    results = []
+    try:
+        with serve(gui.app) as base, quiet():
+            for count in clients:
+                for endpoint in endpoints:
+                    latencies = []
+                    errors = []
+                    lock = threading.Lock()
+
+                    def client():
+                        own = []
+                        for _ in range(requests_per_client):
+                            start = time.perf_counter()
+                            try:
+                                with urllib.request.urlopen(base + endpoint, timeout=30) as response:
+                                    response.read()
+                                own.append(time.perf_counter() - start)
+                            except OSError as e:
+                                with lock:
+                                    errors.append(str(e))
+                        with lock:
+                            latencies.extend(own)
+
+                    threads = [threading.Thread(target=client) for _ in range(count)]
+                    start = time.perf_counter()
+                    for thread in threads:
+                        thread.start()
+                    for thread in threads:
+                        thread.join()
+                    elapsed = time.perf_counter() - start
+                    results.append({'clients': count, 'endpoint': endpoint, 'latency_ms': stats(latencies),
+                                    'requests_per_second': len(latencies) / elapsed, 'errors': len(errors)})
+    finally:
+        with quiet():
+            registry.close()
+        emulator.close()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='HTTP API latency under concurrent clients')
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--requests', type=int, default=50, help='Requests per client and endpoint')
+    parser.add_argument('--endpoints', nargs='+', default=list(ENDPOINTS))
+    parser.add_argument('--output', help='Write the JSON result to this file')
+    args = parser.parse_args()
+    settings = dict(clients=args.clients, requests_per_client=args.requests, endpoints=args.endpoints)
+    emit(report('api', run(**settings), **settings), args.output)
@@ -0,0 +1,214 @@
+"""
+Hardware Stand-ins for the Comparatron Benchmarks
+Handles a GRBL 1.1 emulator on a pseudo terminal and a synthetic camera
+"""
+
+import os
+import re
+import select
+import threading
+import time
+import tty
+import cv2 as cv
+import numpy as np
+
+# GRBL 1.1 defaults answered to $$
+GRBL_SETTINGS = {0: '10', 1: '25', 2: '0', 3: '0', 4: '0', 5: '0', 6: '0', 10: '1', 11: '0.010', 12: '0.002',
+                 13: '0', 20: '0', 21: '0', 22: '0', 23: '0', 24: '25.000', 25: '500.000', 26: '250', 27: '1.000',
+                 30: '1000', 31: '0', 32: '0', 100: '80.000', 101: '80.000', 102: '250.000', 110: '5000.000',
+                 111: '5000.000', 112: '500.000', 120: '200.000', 121: '200.000', 122: '10.000', 130: '200.000',
+                 131: '200.000', 132: '200.000'}
+
+
+class GRBLEmulator:
+    """
+    Class emulating a GRBL controller behind a pseudo terminal
+
+    The slave device path can be opened with pyserial like a real port, so the
+    complete SerialCommunicator code path is measured. '?' is answered
+    immediately (real-time command), every line with 'ok' after `line_time`,
+    and output is paced at the serial baud rate. G0-G3 targets and G92 work
+    offsets are tracked, so status reports follow the commanded moves.
+    """
+
+    def __init__(self, line_time=0.0, baudrate=115200):
+        """
+        Initialize and start the emulator
+
+        Args:
+            line_time (float): Processing time per received line before its 'ok' (s)
+            baudrate (int): Serial speed used to pace the replies, 0 for unlimited
+        """
+        self.line_time = line_time
+        self.byte_time = 10.0 / baudrate if baudrate else 0.0  # 8N1: 10 bits per byte
+        self.position = [0.0, 0.0, 0.0]  # Machine position
+        self.offset = [0.0, 0.0, 0.0]  # G92 work coordinate offset
+        self.lines = 0
+        self.master, slave = os.openpty()
+        tty.setraw(slave)
+        self.port = os.ttyname(slave)
+        self._slave = slave  # Kept open so the master does not see a hangup between clients
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='grbl-emulator', daemon=True)
+        self._thread.start()
+
+    def _send(self, text):
+        data = text.encode()
+        if self.byte_time:
+            time.sleep(len(data) * self.byte_time)
+        os.write(self.master, data)
+
+    def _status(self):
+        x, y, z = self.position
+        ox, oy, oz = self.offset
+        return f'<Idle|MPos:{x:.3f},{y:.3f},{z:.3f}|FS:0,0|WCO:{ox:.3f},{oy:.3f},{oz:.3f}>\r\n'
+
+    def _line(self, line):
+        """Execute one received line"""
+        self.lines += 1
+        if self.line_time:
+            time.sleep(self.line_time)
+        if line == '$$':
+            self._send(''.join(f'${n}={v}\r\n' for n, v in GRBL_SETTINGS.items()) + 'ok\r\n')
+            return
+        if line.startswith('G92'):
+            # The current position gets the given work coordinates
+            for axis, value in re.findall(r'([XYZ])(-?\d+\.?\d*)', line):
+                index = 'XYZ'.index(axis)
+                self.offset[index] = self.position[index] - float(value)
+        elif re.match(r'G[0-3]\b|G[0-3]X|G[0-3]Y', line):
+            for axis, value in re.findall(r'([XYZ])(-?\d+\.?\d*)', line):
+                index = 'XYZ'.index(axis)
+                self.position[index] = float(value) + self.offset[index]
+        self._send('ok\r\n')
+
+    def _run(self):
+        buffer = b''
+        while self._running:
+            ready, _, _ = select.select([self.master], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                data = os.read(self.master, 4096)
+            except OSError:
+                return
+            if self.byte_time:
+                time.sleep(len(data) * self.byte_time)
+            for byte in data:
+                char = bytes([byte])
+                if char == b'?':
+                    self._send(self._status())
+                elif char in (b'!', b'~', b'\x18'):
+                    continue  # Feed hold, resume and reset are accepted silently
+                elif char in (b'\n', b'\r'):
+                    line = buffer.decode(errors='ignore').strip()
+                    buffer = b''
+                    if line:
+                        self._line(line)
+                else:
+                    buffer += char
+
+    def close(self):
+        """Stop the emulator and close the pseudo terminal"""
+        self._running = False
+        self._thread.join(timeout=1)
+        os.close(self.master)
+        os.close(self._slave)
+
+
+class SyntheticCamera:
+    """
+    Class imitating cv.VideoCapture with textured frames that carry their index
+
+    The frame index and the capture time are drawn as large black/white blocks
+    along the top edge, which survive JPEG compression, so a client can tell
+    which capture a received frame came from and when it was taken, even when
+    the camera runs in another process.
+    """
+
+    BITS = 16  # Frame index band
+    TIME_BITS = 32  # Capture time band, 0.1 ms units modulo 2**32
+    BAND = 16  # Band height in pixels
+
+    def __init__(self, width=640, height=480, fps=30.0):
+        self.width = width
+        self.height = height
+        self.interval = 1.0 / fps if fps else 0.0
+        rng = np.random.default_rng(0)
+        self.texture = cv.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (5, 5), 1)
+        self.index = 0
+        self._next = time.perf_counter()
+        self.opened = True
+
+    def isOpened(self):
+        return self.opened
+
+    @classmethod
+    def _draw_bits(cls, frame, band, value, bits):
+        block = frame.shape[1] // bits
+        rows = slice(band * cls.BAND, (band + 1) * cls.BAND)
+        for bit in range(bits):
+            frame[rows, bit * block:(bit + 1) * block] = 255 if (value >> bit) & 1 else 0
+
+    @classmethod
+    def _read_bits(cls, frame, band, bits, scale=1.0):
+        block = frame.shape[1] / bits
+        row = frame[int((band * cls.BAND + cls.BAND // 2) * scale)]
+        return sum(1 << bit for bit in range(bits) if row[int((bit + 0.5) * block)].mean() > 127)
+
+    def read(self):
+        """Return the next frame, paced at the camera frame rate"""
+        delay = self._next - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        self._next = max(self._next, time.perf_counter()) + self.interval
+        frame = self.texture.copy()
+        self._draw_bits(frame, 0, self.index, self.BITS)
+        self._draw_bits(frame, 1, int(time.time() * 1e4) & 0xffffffff, self.TIME_BITS)
+        self.index += 1
+        return True, frame
+
+    @classmethod
+    def decode_index(cls, frame, scale=1.0):
+        """Read the frame index back from a (decoded, possibly scaled) frame"""
+        return cls._read_bits(frame, 0, cls.BITS, scale)
+
+    @classmethod
+    def decode_time(cls, frame, now=None, scale=1.0):
+        """Read the capture time (time.time() scale) back from a frame taken less than 5 days before now"""
+        now = time.time() if now is None else now
+        age = ((int(now * 1e4) & 0xffffffff) - cls._read_bits(frame, 1, cls.TIME_BITS, scale)) & 0xffffffff
+        return now - age / 1e4
+
+    def set(self, *args):
+        return True
+
+    def release(self):
+        self.opened = False
+
+
+def open_synthetic_camera(camera_index, width=640, height=480, fps=30.0):
+    """Camera factory for CaptureProcess (module level, so a worker process can import it)"""
+    return SyntheticCamera(width, height, fps)
+
+
+if __name__ == "__main__":
+    # Talk to the emulator through pyserial and check the frame index round trip
+    import serial
+
+    emulator = GRBLEmulator()
+    port = serial.Serial(emulator.port, 115200, timeout=1)
+    port.write(b'?')
+    print(f"Status: {port.readline().strip()}")
+    port.write(b'G1X1.5Y2\n')
+    print(f"Move: {port.readline().strip()}, position {emulator.position}")
+    port.close()
+    emulator.close()
+
+    camera = SyntheticCamera()
+    for _ in range(3):
+        _, frame = camera.read()
+    ok, jpeg = cv.imencode('.jpg', frame, [cv.IMWRITE_JPEG_QUALITY, 50])
+    decoded = cv.imdecode(jpeg, cv.IMREAD_COLOR)
+    print(f"Frame index after JPEG: {SyntheticCamera.decode_index(decoded)} (expected 2), "
+          f"age {(time.time() - SyntheticCamera.decode_time(decoded)) * 1000:.1f} ms")
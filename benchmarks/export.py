@@ -0,0 +1,78 @@
+"""
+Export Benchmark for Comparatron
+Measures export time versus point count for the DXF and the registered point formats
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from harness import quiet, report, emit
+from dxf_handler import DXFHandler
+from exporters import export_points
+
+FORMATS = ('dxf', 'svg', 'csv', 'npy', 'gcode')
+
+
+def make_handler(count, seed=0):
+    """DXFHandler holding count points along a noisy outline"""
+    rng = np.random.default_rng(seed)
+    t = np.linspace(0, 2 * np.pi, count, endpoint=False)
+    points = np.column_stack([50 * np.cos(t), 30 * np.sin(t)]) + rng.normal(0, 0.002, (count, 2))
+    handler = DXFHandler()
+    handler.add_points_from_list(points.tolist())
+    return handler
+
+
+def run(counts=(1000, 10000, 50000), formats=FORMATS, fit_counts=(1000, 10000)):
+    """
+    Time every format for every point count
+
+    Args:
+        counts (list): Point counts
+        formats (list): Export format names (see exporters.available_formats)
+        fit_counts (list): Point counts also exported as fitted DXF geometry
+
+    Returns:
+        list: {'points', 'format', 'seconds', 'points_per_second', 'bytes'}
+    """
+    # The first DXF export pays for the lazy ezdxf import; report it separately
+    start = time.perf_counter()
+    import ezdxf  # noqa: F401
+    results = [{'points': 0, 'format': 'ezdxf-import', 'seconds': time.perf_counter() - start}]
+    directory = tempfile.mkdtemp(prefix='comparatron-bench-')
+    try:
+        for count in counts:
+            start = time.perf_counter()
+            handler = make_handler(count)
+            results.append({'points': count, 'format': 'record', 'seconds': time.perf_counter() - start})
+            jobs = [(name, {}) for name in formats]
+            if count in fit_counts:
+                jobs.append(('dxf-fit', {'fit_geometry': True}))
+            for name, options in jobs:
+                filename = os.path.join(directory, f'points-{count}.{name.split("-")[0]}')
+                with quiet():
+                    start = time.perf_counter()
+                    if name == 'dxf-fit':
+                        ok = handler.export_dxf(filename, **options)
+                    else:
+                        ok = export_points(handler, filename, format_name=name)
+                    elapsed = time.perf_counter() - start
+                results.append({'points': count, 'format': name, 'success': bool(ok), 'seconds': elapsed,
+                                'points_per_second': count / elapsed if elapsed else None,
+                                'bytes': os.path.getsize(filename) if ok and os.path.exists(filename) else None})
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Export time versus point count')
+    parser.add_argument('--counts', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--formats', nargs='+', default=list(FORMATS))
+    parser.add_argument('--output', help='Write the JSON result to this file')
+    args = parser.parse_args()
+    settings = dict(counts=args.counts, formats=args.formats)
+    emit(report('export', run(**settings), **settings), args.output)
@@ -0,0 +1,105 @@
+"""
+Serial Link Benchmark for Comparatron
+Measures send_command round trips, streaming throughput and status report parsing against the GRBL emulator
+"""
+
+import argparse
+import time
+from harness import stats, quiet, report, emit
+from emulator import GRBLEmulator
+from serial_comm import SerialCommunicator, parse_status_report
+
+STATUS_REPORTS = [
+    '<Idle|MPos:0.000,0.000,0.000|FS:0,0|WCO:0.000,0.000,0.000>',
+    '<Run|MPos:12.345,-6.789,0.000|FS:1200,0|Ov:100,100,100>',
+    '<Jog|WPos:1.000,2.000,3.000|Bf:15,128|FS:500,0>',
+    '<Hold:0|MPos:100.000,50.000,-1.000|FS:0,0|Pn:XY>',
+]
+
+
+def time_calls(func, count):
+    """Call func count times and return the individual durations"""
+    durations = []
+    for _ in range(count):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def parse_rate(iterations=20000):
+    """
+    Status report parse rate
+
+    Returns:
+        dict: reports parsed per second and the mean time per report (us)
+    """
+    start = time.perf_counter()
+    for i in range(iterations):
+        parse_status_report(STATUS_REPORTS[i % len(STATUS_REPORTS)], (1.0, 2.0, 0.0))
+    elapsed = time.perf_counter() - start
+    return {'reports_per_second': iterations / elapsed, 'mean_us': elapsed / iterations * 1e6}
+
+
+def run(round_trips=50, stream_lines=1000, line_time=0.0, baudrate=115200, status_command_trips=2):
+    """
+    Run the serial benchmarks
+
+    Args:
+        round_trips (int): send_command / get_machine_status calls to time
+        stream_lines (int): G-code lines streamed with stream_commands
+        line_time (float): Emulated processing time per line (s)
+        baudrate (int): Emulated serial speed
+        status_command_trips (int): Timed send_command('?') calls (these wait for the
+            response timeout because GRBL sends no 'ok' after a status report)
+
+    Returns:
+        dict: Benchmark results
+    """
+    results = {'status_parse': parse_rate()}
+    emulator = GRBLEmulator(line_time=line_time, baudrate=baudrate)
+    comm = SerialCommunicator()
+    try:
+        with quiet():
+            if not comm.connect_to_com(emulator.port):
+                raise RuntimeError(f"Could not open the emulator port {emulator.port}")
+            results['send_command_ms'] = stats(time_calls(lambda: comm.send_command('G4P0'), round_trips))
+            results['get_machine_status_ms'] = stats(time_calls(comm.get_machine_status, round_trips))
+            results['send_command_status_ms'] = stats(time_calls(lambda: comm.send_command('?'),
+                                                                 status_command_trips))
+            results['settings_read_ms'] = stats(time_calls(comm.get_settings_list, 3))
+
+            lines = [f'G1X{i % 100 * 0.1:.3f}Y{i % 37 * 0.1:.3f}F1000' for i in range(stream_lines)]
+            start = time.perf_counter()
+            responses = comm.stream_commands(lines, timeout=120.0)
+            streamed = time.perf_counter() - start
+            sequential_lines = lines[:min(100, stream_lines)]
+            start = time.perf_counter()
+            for line in sequential_lines:
+                comm.send_command(line)
+            sequential = time.perf_counter() - start
+        results['streaming'] = {
+            'lines': stream_lines,
+            'acknowledged': len(responses or []),
+            'seconds': streamed,
+            'lines_per_second': stream_lines / streamed,
+            'sequential_lines_per_second': len(sequential_lines) / sequential
+        }
+    finally:
+        with quiet():
+            comm.disconnect()
+        emulator.close()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serial link benchmark against the GRBL emulator')
+    parser.add_argument('--round-trips', type=int, default=50)
+    parser.add_argument('--stream-lines', type=int, default=1000)
+    parser.add_argument('--line-time', type=float, default=0.0, help='Emulated time per line (s)')
+    parser.add_argument('--baudrate', type=int, default=115200)
+    parser.add_argument('--output', help='Write the JSON result to this file')
+    args = parser.parse_args()
+    settings = dict(round_trips=args.round_trips, stream_lines=args.stream_lines, line_time=args.line_time,
+                    baudrate=args.baudrate)
+    emit(report('grbl', run(**settings), **settings), args.output)
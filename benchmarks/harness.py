@@ -0,0 +1,96 @@
+"""
+Benchmark Harness for Comparatron
+Shared helpers of the benchmark scripts: statistics, quiet execution, a local HTTP server and JSON output
+"""
+
+import contextlib
+import io
+import json
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+
+def stats(values, scale=1000.0):
+    """
+    Summarize durations
+
+    Args:
+        values (list): Durations in seconds
+        scale (float): Unit factor of the output (1000 = milliseconds)
+
+    Returns:
+        dict: count, mean, min, p50, p95, p99 and max in the scaled unit
+    """
+    if not values:
+        return {'count': 0}
+    ordered = sorted(values)
+
+    def percentile(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * scale
+
+    return {'count': len(ordered), 'mean': statistics.fmean(ordered) * scale, 'min': ordered[0] * scale,
+            'p50': percentile(0.5), 'p95': percentile(0.95), 'p99': percentile(0.99), 'max': ordered[-1] * scale}
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silence the modules' progress prints and INFO logging while measuring"""
+    level = logging.root.manager.disable
+    logging.disable(logging.WARNING)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        logging.disable(level)
+
+
+@contextlib.contextmanager
+def serve(app):
+    """
+    Serve a WSGI application on a free local port in a background thread
+
+    Yields:
+        str: Base URL of the server
+    """
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_port}'
+    finally:
+        server.shutdown()
+        thread.join(timeout=5)
+
+
+def report(name, results, **settings):
+    """
+    Wrap benchmark results with the information needed to compare runs
+
+    Returns:
+        dict: name, timestamp, Python/platform details, settings and results
+    """
+    import platform
+    return {'benchmark': name, 'timestamp': time.time(), 'python': platform.python_version(),
+            'machine': platform.machine(), 'platform': platform.platform(), 'settings': settings,
+            'results': results}
+
+
+def emit(data, output=None):
+    """Print a result as JSON and optionally write it to a file"""
+    text = json.dumps(data, indent=2)
+    if output:
+        directory = os.path.dirname(output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
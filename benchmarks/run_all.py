@@ -0,0 +1,68 @@
+"""
+Benchmark Runner for Comparatron
+Runs every benchmark without hardware and writes one combined JSON report
+"""
+
+import argparse
+import os
+import time
+import traceback
+from harness import REPO_DIR, report, emit
+import api
+import export
+import grbl
+import startup
+import video
+
+# (quick settings, full settings) of every benchmark
+SUITE = {
+    'startup': (startup.run, dict(repeats=2), dict(repeats=5)),
+    'grbl': (grbl.run, dict(round_trips=20, stream_lines=300), dict(round_trips=50, stream_lines=1000)),
+    'video': (video.run, dict(frames=30, clients=(1, 4), encode_seconds=0.2),
+              dict(frames=120, clients=(1, 4, 8), encode_seconds=1.0)),
+    'export': (export.run, dict(counts=(1000, 10000), fit_counts=(1000,)),
+               dict(counts=(1000, 10000, 50000), fit_counts=(1000, 10000))),
+    'api': (api.run, dict(clients=(1, 4), requests_per_client=20), dict(clients=(1, 4, 16), requests_per_client=100)),
+}
+
+
+def run(names=None, full=False):
+    """
+    Run the selected benchmarks
+
+    A failing benchmark is reported with its error instead of aborting the run.
+
+    Args:
+        names (list): Benchmarks to run, None for all
+        full (bool): Use the longer, more stable settings
+
+    Returns:
+        dict: Result (or error) and duration per benchmark
+    """
+    results = {}
+    for name in names or SUITE:
+        func, quick_settings, full_settings = SUITE[name]
+        settings = full_settings if full else quick_settings
+        print(f"Running {name} benchmark...", flush=True)
+        start = time.perf_counter()
+        try:
+            results[name] = {'settings': settings, 'results': func(**settings)}
+        except Exception as e:
+            results[name] = {'settings': settings, 'error': str(e), 'traceback': traceback.format_exc()}
+        results[name]['seconds'] = time.perf_counter() - start
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run the Comparatron benchmark suite')
+    parser.add_argument('names', nargs='*', help=f"Benchmarks to run: {', '.join(SUITE)} (default: all)")
+    parser.add_argument('--full', action='store_true', help='Longer runs with more samples')
+    parser.add_argument('--output', help='JSON file to write (default: benchmarks/results/<timestamp>.json)')
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in SUITE]
+    if unknown:
+        parser.error(f"unknown benchmark: {', '.join(unknown)}")
+    output = args.output or os.path.join(REPO_DIR, 'benchmarks', 'results',
+                                         time.strftime('%Y%m%d-%H%M%S') + '.json')
+    emit(report('suite', run(args.names, args.full), full=args.full), output)
+    print(f"Results written to {output}")
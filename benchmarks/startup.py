@@ -0,0 +1,102 @@
+"""
+Startup Benchmark for Comparatron
+Measures the time from process start to the first HTTP response of the web interface
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Started in a fresh interpreter; prints the module import time before serving
+SERVER_SCRIPT = """
+import sys, time
+started = time.perf_counter()
+import gui_flask
+print(f"IMPORT {time.perf_counter() - started:.6f}", flush=True)
+gui = gui_flask.ComparatronFlaskGUI()
+print(f"INIT {time.perf_counter() - started:.6f}", flush=True)
+gui.app.run(host='127.0.0.1', port=int(sys.argv[1]), threaded=True)
+"""
+
+
+def free_port():
+    """Return a TCP port that is currently unused"""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def measure_once(url_path='/api/status', timeout=60.0):
+    """
+    Start the web interface once and wait for its first successful response
+
+    Args:
+        url_path (str): Route polled until it answers
+        timeout (float): Maximum wait (s)
+
+    Returns:
+        dict: 'import', 'init' and 'first_response' times in seconds after process start
+    """
+    port = free_port()
+    env = dict(os.environ, HOME=tempfile.mkdtemp(prefix='comparatron-bench-'))
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-c', SERVER_SCRIPT, str(port)], cwd=REPO_DIR, env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    try:
+        result = {}
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}{url_path}', timeout=1.0) as response:
+                    if response.status == 200:
+                        result['first_response'] = time.perf_counter() - started
+                        break
+            except OSError:
+                time.sleep(0.005)
+        else:
+            raise RuntimeError(f"No response from the server within {timeout} s")
+    finally:
+        process.terminate()
+        output, _ = process.communicate(timeout=10)
+    for line in output.splitlines():
+        key, _, value = line.partition(' ')
+        if key in ('IMPORT', 'INIT'):
+            result[key.lower()] = float(value)
+    return result
+
+
+def run(repeats=5):
+    """
+    Measure the startup several times
+
+    Returns:
+        dict: Samples plus the median and minimum of every phase
+    """
+    samples = [measure_once() for _ in range(repeats)]
+    summary = {}
+    for key in ('import', 'init', 'first_response'):
+        values = [s[key] for s in samples if key in s]
+        if values:
+            summary[key] = {'median': statistics.median(values), 'min': min(values)}
+    return {'benchmark': 'startup', 'python': sys.version.split()[0], 'repeats': repeats,
+            'timestamp': time.time(), 'summary': summary, 'samples': samples}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure the web interface startup time')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--output', help='Write the JSON result to this file')
+    args = parser.parse_args()
+    report = json.dumps(run(args.repeats), indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report)
+    print(report)
@@ -0,0 +1,225 @@
+"""
+Video Benchmark for Comparatron
+Measures JPEG encode throughput and the capture-to-browser latency of the MJPEG feed
+"""
+
+import argparse
+import socket
+import threading
+import time
+import urllib.parse
+import urllib.request
+import cv2 as cv
+import numpy as np
+from harness import stats, quiet, serve, report, emit
+from emulator import SyntheticCamera, open_synthetic_camera
+
+RESOLUTIONS = ((320, 240), (640, 480), (1280, 720), (1920, 1080))
+QUALITIES = (50, 80, 95)
+
+
+def encode_throughput(resolutions=RESOLUTIONS, qualities=QUALITIES, seconds=0.5):
+    """
+    JPEG encode rate of camera-like frames
+
+    Args:
+        resolutions (list): (width, height) pairs
+        qualities (list): JPEG qualities
+        seconds (float): Measuring time per combination
+
+    Returns:
+        list: {'width', 'height', 'quality', 'frames_per_second', 'megapixels_per_second', 'bytes'}
+    """
+    results = []
+    for width, height in resolutions:
+        _, frame = SyntheticCamera(width, height, fps=0).read()
+        for quality in qualities:
+            params = [cv.IMWRITE_JPEG_QUALITY, quality]
+            frames = 0
+            size = 0
+            start = time.perf_counter()
+            while time.perf_counter() - start < seconds:
+                ok, buffer = cv.imencode('.jpg', frame, params)
+                size = len(buffer)
+                frames += 1
+            elapsed = time.perf_counter() - start
+            results.append({'width': width, 'height': height, 'quality': quality,
+                            'frames_per_second': frames / elapsed,
+                            'megapixels_per_second': frames * width * height / elapsed / 1e6, 'bytes': size})
+    return results
+
+
+class ThrottledFeed:
+    """
+    Class reading /video_feed at a limited rate, like a viewer on a slow link
+
+    A small receive buffer keeps the unread data on the server side, where a
+    slow network would hold it, instead of in the client's socket.
+    """
+
+    def __init__(self, url, rate, timeout=10):
+        """
+        Connect and request the feed
+
+        Args:
+            url (str): Feed URL
+            rate (float): Link rate in bytes/s
+            timeout (float): Socket timeout in seconds
+        """
+        parts = urllib.parse.urlsplit(url)
+        self.rate = rate
+        self.sock = socket.socket()
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        self.sock.settimeout(timeout)
+        self.sock.connect((parts.hostname, parts.port))
+        path = parts.path + ('?' + parts.query if parts.query else '')
+        self.sock.sendall(f'GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\n\r\n'.encode())
+        self._start = time.perf_counter()
+        self._received = 0
+
+    def read1(self, size):
+        """Read at most 2 KiB, waiting so the average stays at the link rate"""
+        chunk = self.sock.recv(min(size, 2048))
+        self._received += len(chunk)
+        delay = self._start + self._received / self.rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        return chunk
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.sock.close()
+
+
+def read_mjpeg(response, count, on_frame):
+    """Read count JPEG parts of a multipart MJPEG response, calling on_frame(jpeg bytes)"""
+    buffer = b''
+    received = 0
+    while received < count:
+        chunk = response.read1(65536)
+        if not chunk:
+            break
+        buffer += chunk
+        while True:
+            start = buffer.find(b'\xff\xd8')
+            end = buffer.find(b'\xff\xd9', start + 2)
+            if start < 0 or end < 0:
+                break
+            on_frame(buffer[start:end + 2])
+            buffer = buffer[end + 2:]
+            received += 1
+
+
+def feed_latency(frames=60, clients=1, fps=30.0, capture_process=False, link_rate=None, query=''):
+    """
+    Time from camera capture to a complete JPEG at the HTTP client
+
+    A synthetic camera feeds the default station of a real (local) server; every
+    frame carries its capture time. With capture_process the camera runs in a
+    capture worker process and frames reach the server through the frame ring.
+
+    Args:
+        frames (int): Frames to receive per client
+        clients (int): Concurrent viewers of the same station
+        fps (float): Synthetic camera frame rate
+        capture_process (bool): Capture in a worker process instead of a thread
+        link_rate (float): Bytes/s each viewer reads at, unlimited if None
+        query (str): Query string of the feed URL (e.g. 'quality=50&fps=10')
+
+    Returns:
+        dict: Latency statistics (ms), the received frame rate and the mean JPEG size per client
+    """
+    import functools
+    import tempfile
+    from capture import CaptureProcess, FRAME_SHAPE
+    from stations import StationRegistry
+    from gui_flask import ComparatronFlaskGUI
+
+    with quiet():
+        registry = StationRegistry(filename=None, data_root=tempfile.mkdtemp(prefix='comparatron-bench-'))
+        gui = ComparatronFlaskGUI(registry)
+    station = registry.default
+    if capture_process:
+        camera = CaptureProcess(0, opener=functools.partial(open_synthetic_camera, fps=fps))
+        if not camera.start():
+            raise RuntimeError("Capture process did not start")
+    else:
+        camera = SyntheticCamera(fps=fps)
+    station.camera = camera
+    station.camera_index = 0
+    station.running = True
+    capture = threading.Thread(target=station.update_frames, daemon=True)
+    capture.start()
+
+    latencies = []
+    rates = []
+    sizes = []
+    lock = threading.Lock()
+
+    def viewer(base):
+        received = []
+
+        def on_frame(jpeg):
+            now = time.time()
+            image = cv.imdecode(np.frombuffer(jpeg, np.uint8), cv.IMREAD_COLOR)
+            # The adaptive stream may scale the station frames down
+            scale = image.shape[1] / FRAME_SHAPE[1]
+            received.append((now, now - SyntheticCamera.decode_time(image, now, scale), len(jpeg)))
+
+        url = base + '/video_feed' + ('?' + query if query else '')
+        feed = ThrottledFeed(url, link_rate) if link_rate else urllib.request.urlopen(url, timeout=10)
+        with feed as response:
+            read_mjpeg(response, frames, on_frame)
+        # The first frames may predate the connection; a throttled stream needs a while to adapt
+        received = received[len(received) // 2 if link_rate else 2:]
+        with lock:
+            latencies.extend(latency for _, latency, _ in received)
+            sizes.extend(size for _, _, size in received)
+            if len(received) > 1:
+                rates.append((len(received) - 1) / (received[-1][0] - received[0][0]))
+
+    try:
+        with serve(gui.app) as base, quiet():
+            threads = [threading.Thread(target=viewer, args=(base,)) for _ in range(clients)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+    finally:
+        station.running = False
+        capture.join(timeout=2)
+        with quiet():
+            registry.close()
+    return {'clients': clients, 'camera_fps': fps, 'capture_process': capture_process, 'link_rate': link_rate,
+            'query': query, 'latency_ms': stats(latencies),
+            'received_fps': stats(rates, scale=1.0), 'jpeg_bytes': stats(sizes, scale=1.0)}
+
+
+def run(frames=60, clients=(1, 4), fps=30.0, encode_seconds=0.5, capture_process=False, link_rate=None,
+        query=''):
+    """
+    Run the video benchmarks
+
+    Returns:
+        dict: 'encode' throughput table and 'feed' latency per client count
+    """
+    return {'encode': encode_throughput(seconds=encode_seconds),
+            'feed': [feed_latency(frames, n, fps, capture_process, link_rate, query) for n in clients]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='JPEG encode and video feed latency benchmark')
+    parser.add_argument('--frames', type=int, default=60)
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--fps', type=float, default=30.0)
+    parser.add_argument('--encode-seconds', type=float, default=0.5)
+    parser.add_argument('--capture-process', action='store_true', help='Capture in a worker process')
+    parser.add_argument('--link-rate', type=float, help='Bytes/s each viewer reads at (a slow link)')
+    parser.add_argument('--query', default='', help="Feed query string, e.g. 'quality=50&fps=10&scale=0.5'")
+    parser.add_argument('--output', help='Write the JSON result to this file')
+    args = parser.parse_args()
+    settings = dict(frames=args.frames, clients=args.clients, fps=args.fps, encode_seconds=args.encode_seconds,
+                    capture_process=args.capture_process, link_rate=args.link_rate, query=args.query)
+    emit(report('video', run(**settings), **settings), args.output)
@@ -0,0 +1,361 @@
+"""
+Best-Fit Module for Comparatron
+Handles ICP alignment of measured points to nominal CAD geometry and colour-mapped deviation reports
+"""
+
+import logging
+import math
+import time
+import numpy as np
+from profiling import timed
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Residuals this small are never treated as outliers (mm)
+MIN_INLIER_DISTANCE = 1e-4
+
+# Deviation colour map stops: (fraction of the scale, RGB)
+COLOR_STOPS = ((0.0, (0, 160, 0)), (0.5, (230, 200, 0)), (1.0, (210, 0, 0)))
+
+
+def _normals(index, ids, points, nearest):
+    """
+    Unit normals of the nominal geometry at the nearest points
+
+    The direction from the nearest point to the measured point is used where
+    the two differ; points lying on the geometry get the primitive's normal.
+    """
+    normals = points - nearest
+    length = np.hypot(normals[:, 0], normals[:, 1])
+    flat = length < 1e-12
+    if flat.any():
+        fid = ids[flat]
+        fn = np.empty((len(fid), 2))
+        is_line = fid < index.n_lines
+        seg = index.lines[fid[is_line]]
+        fn[is_line] = np.column_stack((seg[:, 1] - seg[:, 3], seg[:, 2] - seg[:, 0]))
+        arc = index.arcs[fid[~is_line] - index.n_lines]
+        fn[~is_line] = nearest[flat][~is_line] - arc[:, :2]
+        normals[flat] = fn
+        length[flat] = np.hypot(fn[:, 0], fn[:, 1])
+    return normals / np.where(length > 0, length, 1.0)[:, None]
+
+
+def _point_to_line_step(points, nearest, normals):
+    """
+    Linearized point-to-line least-squares update
+
+    Args:
+        points (numpy.ndarray): (K, 2) current (transformed) measured points
+        nearest (numpy.ndarray): (K, 2) matching nominal points
+        normals (numpy.ndarray): (K, 2) nominal normals at the matches
+
+    Returns:
+        tuple: (angle (rad), translation (2,), rotation centre (2,))
+    """
+    centre = points.mean(axis=0)
+    rel = points - centre
+    # d/dtheta of the rotated point is (-y, x); only its normal component counts
+    a = np.column_stack((rel[:, 0] * normals[:, 1] - rel[:, 1] * normals[:, 0], normals))
+    b = -np.einsum('ij,ij->i', points - nearest, normals)
+    (theta, tx, ty), _, _, _ = np.linalg.lstsq(a, b, rcond=None)
+    return float(theta), np.array([tx, ty]), centre
+
+
+@timed('bestfit.icp')
+def best_fit(nominal, points, max_iterations=50, tolerance=1e-5, outlier_sigma=3.0, max_distance=None,
+             sample=5000, full_iterations=2, initial=None, block=1):
+    """
+    Align measured points to nominal geometry with point-to-line ICP
+
+    Each iteration matches every point to the nearest nominal line or arc
+    through the grid index, rejects outliers (beyond outlier_sigma robust
+    standard deviations or max_distance) and solves the linearized rigid
+    update in one least-squares step, so points slide along the geometry
+    instead of being pinned to their first match. Large point sets are first
+    aligned on a random sample; only the last iterations and the deviations
+    use every point.
+
+    Args:
+        nominal (NominalGeometry): Nominal geometry
+        points (numpy.ndarray): (N, 2) measured points in part coordinates
+        max_iterations (int): Iteration limit on the sample
+        tolerance (float): Stop when the update moves no point by more than this (mm)
+        outlier_sigma (float): Rejection threshold in robust standard deviations, None to keep all
+        max_distance (float): Pairs farther apart are never used (mm)
+        sample (int): Points used for the coarse iterations, 0 to always use all
+        full_iterations (int): Iterations on the complete set after the sample has converged
+        initial (tuple): Starting (rotation in degrees, dx, dy)
+        block (int): Query grouping in grid cells (see GeometryIndex.nearest_many)
+
+    Returns:
+        dict: 'rotation' (degrees, counter-clockwise about the origin), 'translation'
+            {'x', 'y'}, 'matrix' (2x3: aligned = matrix @ [x, y, 1]), 'iterations',
+            'converged', deviation 'rms', 'mean' and 'max' over all points, 'inliers'
+            (points within the rejection threshold), 'points', 'seconds' and the
+            per-point arrays 'aligned', 'deviations', 'nearest', 'entities'
+    """
+    start_time = time.perf_counter()
+    pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(pts) < 2:
+        raise ValueError("At least two points are needed for a best fit")
+    index = nominal.index
+    angle, translation = 0.0, np.zeros(2)
+    if initial is not None:
+        angle, translation = math.radians(initial[0]), np.array(initial[1:3], dtype=np.float64)
+
+    def transformed(subset):
+        c, s = math.cos(angle), math.sin(angle)
+        return subset @ np.array([[c, s], [-s, c]]) + translation
+
+    def iterate(subset, limit):
+        nonlocal angle, translation
+        reach = max(np.ptp(subset[:, 0]), np.ptp(subset[:, 1]), 1e-9)
+        for iteration in range(1, limit + 1):
+            moved = transformed(subset)
+            ids, dist, nearest = index.nearest_many(moved, block=block)
+            keep = np.isfinite(dist)
+            if max_distance is not None:
+                keep &= dist <= max_distance
+            if outlier_sigma is not None and keep.any():
+                sigma = 1.4826 * float(np.median(dist[keep]))
+                keep &= dist <= max(outlier_sigma * sigma, MIN_INLIER_DISTANCE)
+            if keep.sum() < 2:
+                raise RuntimeError("Too few points near the nominal geometry to fit")
+            normals = _normals(index, ids[keep], moved[keep], nearest[keep])
+            theta, shift, centre = _point_to_line_step(moved[keep], nearest[keep], normals)
+            # Compose the update (rotation about centre, then shift) with the current transform
+            c, s = math.cos(theta), math.sin(theta)
+            rot = np.array([[c, -s], [s, c]])
+            angle += theta
+            translation = rot @ (translation - centre) + centre + shift
+            if abs(theta) * reach + math.hypot(*shift) < tolerance:
+                return iteration, True
+        return limit, False
+
+    iterations, converged = 0, False
+    if sample and len(pts) > sample:
+        subset = pts[np.random.default_rng(0).choice(len(pts), sample, replace=False)]
+        iterations, converged = iterate(subset, max_iterations)
+        if full_iterations:
+            more, converged = iterate(pts, full_iterations)
+            iterations += more
+    else:
+        iterations, converged = iterate(pts, max_iterations)
+
+    aligned = transformed(pts)
+    ids, deviations, nearest = index.nearest_many(aligned, block=block)
+    inliers = np.isfinite(deviations)
+    if max_distance is not None:
+        inliers &= deviations <= max_distance
+    if outlier_sigma is not None:
+        sigma = 1.4826 * float(np.median(deviations[inliers])) if inliers.any() else 0.0
+        inliers &= deviations <= max(outlier_sigma * sigma, MIN_INLIER_DISTANCE)
+    c, s = math.cos(angle), math.sin(angle)
+    return {
+        'rotation': math.degrees(math.atan2(s, c)),
+        'translation': {'x': float(translation[0]), 'y': float(translation[1])},
+        'matrix': [[c, -s, float(translation[0])], [s, c, float(translation[1])]],
+        'iterations': iterations,
+        'converged': converged,
+        'rms': float(np.sqrt(np.mean(deviations ** 2))),
+        'mean': float(deviations.mean()),
+        'max': float(deviations.max()),
+        'inliers': int(inliers.sum()),
+        'points': len(pts),
+        'seconds': time.perf_counter() - start_time,
+        'aligned': aligned,
+        'deviations': deviations,
+        'nearest': nearest,
+        'entities': nominal.entity_ids[ids],
+    }
+
+
+def fit_summary(result):
+    """The best_fit result without its per-point arrays"""
+    return {key: value for key, value in result.items() if not isinstance(value, np.ndarray)}
+
+
+def deviation_colors(deviations, scale):
+    """
+    Map deviations to colours: green at 0, yellow at half the scale, red at and above it
+
+    Args:
+        deviations (numpy.ndarray): (N,) deviations in mm
+        scale (float): Deviation shown fully red (e.g. the tolerance)
+
+    Returns:
+        numpy.ndarray: (N, 3) uint8 RGB colours
+    """
+    f = np.clip(np.asarray(deviations, dtype=np.float64) / max(scale, 1e-12), 0.0, 1.0)
+    stops = np.array([s for s, _ in COLOR_STOPS])
+    colors = np.array([c for _, c in COLOR_STOPS], dtype=np.float64)
+    return np.column_stack([np.interp(f, stops, colors[:, i]) for i in range(3)]).round().astype(np.uint8)
+
+
+def _scale(result, tolerance):
+    """Colour scale: the tolerance, or the 99th percentile deviation without one"""
+    if tolerance:
+        return float(tolerance)
+    deviations = result['deviations'][np.isfinite(result['deviations'])]
+    return max(float(np.percentile(deviations, 99)) if len(deviations) else 0.0, 1e-6)
+
+
+def _arc_svg(cx, cy, r, a0, sweep):
+    """SVG path of a counter-clockwise arc (full circles as two halves)"""
+    if sweep >= 2.0 * math.pi - 1e-9:
+        return (f"M{cx + r:.4f},{cy:.4f}A{r:.4f},{r:.4f} 0 1 1 {cx - r:.4f},{cy:.4f}"
+                f"A{r:.4f},{r:.4f} 0 1 1 {cx + r:.4f},{cy:.4f}")
+    x0, y0 = cx + r * math.cos(a0), cy + r * math.sin(a0)
+    x1, y1 = cx + r * math.cos(a0 + sweep), cy + r * math.sin(a0 + sweep)
+    return f"M{x0:.4f},{y0:.4f}A{r:.4f},{r:.4f} 0 {1 if sweep > math.pi else 0} 1 {x1:.4f},{y1:.4f}"
+
+
+def write_deviation_svg(filename, result, nominal=None, tolerance=None, marker_radius=0.05, margin=2.0):
+    """
+    Write the aligned points coloured by deviation, over the nominal outline, as SVG
+
+    Args:
+        filename (str): Output path
+        result (dict): Result of best_fit
+        nominal (NominalGeometry): Geometry drawn underneath, omitted if None
+        tolerance (float): Deviation shown fully red; 99th percentile if None
+        marker_radius (float): Point marker radius (mm)
+        margin (float): Border around the drawing (mm)
+    """
+    points = result['aligned']
+    scale = _scale(result, tolerance)
+    colors = deviation_colors(result['deviations'], scale)
+    lo, hi = points.min(axis=0), points.max(axis=0)
+    if nominal is not None:
+        b = nominal.get_bounds()
+        lo = np.minimum(lo, (b['min_x'], b['min_y']))
+        hi = np.maximum(hi, (b['max_x'], b['max_y']))
+    legend = 0.04 * max(hi - lo) + 1.0  # Height of the colour bar below the drawing
+    width = hi[0] - lo[0] + 2 * margin
+    height = hi[1] - lo[1] + 2 * margin + 2 * legend
+    x0, y1 = lo[0] - margin, hi[1] + margin
+    with open(filename, 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{width:.4f}mm" height="{height:.4f}mm" '
+                f'viewBox="0 0 {width:.4f} {height:.4f}">\n')
+        f.write(f'<g transform="matrix(1 0 0 -1 {-x0:.4f} {y1:.4f})">\n')
+        if nominal is not None:
+            f.write(f'<g fill="none" stroke="#404040" stroke-width="{marker_radius / 2:.4f}">\n')
+            f.write(''.join(f'<path d="M{a:.4f},{b:.4f}L{c:.4f},{d:.4f}"/>\n' for a, b, c, d in nominal.lines))
+            f.write(''.join(f'<path d="{_arc_svg(*arc)}"/>\n' for arc in nominal.arcs))
+            f.write('</g>\n')
+        f.write('<g stroke="none">\n')
+        for start in range(0, len(points), 4096):
+            f.write(''.join(f'<circle cx="{x:.4f}" cy="{y:.4f}" r="{marker_radius:.4f}" '
+                            f'fill="#{r:02x}{g:02x}{b:02x}"/>\n'
+                            for (x, y), (r, g, b) in zip(points[start:start + 4096], colors[start:start + 4096])))
+        f.write('</g>\n</g>\n')
+        # Colour bar with its end values
+        bar_y, bar_w = height - 1.5 * legend, (width - 2 * margin) / 20
+        for i, (r, g, b) in enumerate(deviation_colors(np.linspace(0, scale, 20), scale)):
+            f.write(f'<rect x="{margin + i * bar_w:.4f}" y="{bar_y:.4f}" width="{bar_w:.4f}" '
+                    f'height="{legend / 2:.4f}" fill="#{r:02x}{g:02x}{b:02x}"/>\n')
+        f.write(f'<text x="{margin:.4f}" y="{height - 0.2 * legend:.4f}" font-size="{legend / 2:.4f}">0 mm</text>\n')
+        f.write(f'<text x="{width - margin:.4f}" y="{height - 0.2 * legend:.4f}" font-size="{legend / 2:.4f}" '
+                f'text-anchor="end">&#8805; {scale:.4f} mm</text>\n')
+        f.write('</svg>\n')
+
+
+def write_deviation_dxf(filename, result, nominal=None, tolerance=None, bands=10, marker_radius=0.05):
+    """
+    Write the aligned points coloured by deviation as DXF
+
+    Points go to one layer per deviation band (DEVIATION_00 .. DEVIATION_<bands - 1>,
+    the last one also holding everything beyond the scale) with the band colour as
+    layer true colour, so bands can be switched on and off in CAD. The nominal
+    outline goes to layer NOMINAL.
+
+    Args:
+        filename (str): Output path
+        result (dict): Result of best_fit
+        nominal (NominalGeometry): Geometry written to layer NOMINAL, omitted if None
+        tolerance (float): Deviation of the last band; 99th percentile if None
+        bands (int): Number of colour bands
+        marker_radius (float): Radius of the point marker circles (mm)
+    """
+    import ezdxf
+    from ezdxf import colors as dxf_colors
+
+    scale = _scale(result, tolerance)
+    doc = ezdxf.new(dxfversion='R2010')
+    msp = doc.modelspace()
+    centres = (np.arange(bands) + 0.5) / bands * scale
+    for i, (r, g, b) in enumerate(deviation_colors(centres, scale)):
+        layer = doc.layers.add(f'DEVIATION_{i:02d}')
+        layer.rgb = (int(r), int(g), int(b))
+        layer.description = f'{i * scale / bands:.4f} - {(i + 1) * scale / bands:.4f} mm'
+    band = np.minimum((result['deviations'] / scale * bands).astype(np.int64), bands - 1)
+    for (x, y), i in zip(result['aligned'], band):
+        msp.add_circle((float(x), float(y)), marker_radius,
+                       dxfattribs={'layer': f'DEVIATION_{i:02d}', 'color': dxf_colors.BYLAYER})
+    if nominal is not None:
+        doc.layers.add('NOMINAL', color=8)
+        for x0, y0, x1, y1 in nominal.lines:
+            msp.add_line((x0, y0), (x1, y1), dxfattribs={'layer': 'NOMINAL'})
+        for cx, cy, r, a0, sweep in nominal.arcs:
+            if sweep >= 2.0 * math.pi - 1e-9:
+                msp.add_circle((cx, cy), r, dxfattribs={'layer': 'NOMINAL'})
+            else:
+                msp.add_arc((cx, cy), r, math.degrees(a0), math.degrees(a0 + sweep), dxfattribs={'layer': 'NOMINAL'})
+    doc.saveas(filename)
+
+
+@timed('bestfit.export')
+def export_deviation_map(filename, result, nominal=None, tolerance=None, **options):
+    """
+    Export a colour-mapped deviation drawing; the extension selects SVG or DXF
+
+    Args:
+        filename (str): Output path ending in .svg or .dxf
+        result (dict): Result of best_fit
+        nominal (NominalGeometry): Geometry drawn with the points
+        tolerance (float): Deviation shown fully red
+        **options: Passed on to write_deviation_svg / write_deviation_dxf
+
+    Returns:
+        bool: True if export successful, False otherwise
+    """
+    writers = {'svg': write_deviation_svg, 'dxf': write_deviation_dxf}
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension not in writers:
+        print(f"Unknown deviation map format: {extension}")
+        return False
+    try:
+        writers[extension](filename, result, nominal, tolerance, **options)
+        print(f"Deviation map exported to: {filename}")
+        return True
+    except Exception as e:
+        logging.error(f"Error exporting deviation map to {filename}: {e}")
+        print(f"Error exporting deviation map to {filename}: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    # Align a rotated, shifted and noisy scan of a plate with holes to its nominal geometry
+    from dxf_handler import NominalGeometry
+
+    rng = np.random.default_rng(1)
+    lines = np.array([(0, 0, 100, 0), (100, 0, 100, 60), (100, 60, 0, 60), (0, 60, 0, 0)], dtype=np.float64)
+    arcs = np.array([(20 + 30 * i, 30, 8, 0, 2 * math.pi) for i in range(3)])
+    nominal = NominalGeometry(lines, arcs, np.arange(7), [{'type': 'LINE', 'layer': '0'}] * 4 +
+                              [{'type': 'CIRCLE', 'layer': '0'}] * 3)
+    t = rng.uniform(0, 1, 20000)
+    edges = lines[rng.integers(0, 4, 20000)]
+    scan = edges[:, :2] + t[:, None] * (edges[:, 2:] - edges[:, :2])
+    ang = rng.uniform(0, 2 * math.pi, 10000)
+    centres = arcs[rng.integers(0, 3, 10000), :2]
+    scan = np.vstack((scan, centres + 8.02 * np.column_stack((np.cos(ang), np.sin(ang)))))
+    scan += rng.normal(0, 0.003, scan.shape)
+    c, s = math.cos(math.radians(-0.8)), math.sin(math.radians(-0.8))
+    scan = scan @ np.array([[c, s], [-s, c]]) + (0.6, -0.4)  # Part placed off-nominal
+    fit = best_fit(nominal, scan)
+    print(f"Rotation {fit['rotation']:.4f} deg, translation {fit['translation']}, rms {fit['rms'] * 1000:.1f} um, "
+          f"{fit['iterations']} iterations in {fit['seconds']:.2f} s")
+    # export_deviation_map('deviation.svg', fit, nominal, tolerance=0.05)
@@ -0,0 +1,216 @@
+"""
+Calibration Module for Comparatron
+Runs the guided steps/mm and squareness calibration against a reference scale or square
+"""
+
+import logging
+import math
+import time
+import numpy as np
+from camera_manager import pixel_to_stage
+from compensation import CompensationMap
+from machine_control import move_gcode
+from settle import SettleDetector
+from grbl_settings import GRBLSettingsManager
+from vision import locate_fiducial
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def reference_points(length_x, length_y=None):
+    """
+    Nominal fiducial positions of a reference artifact, relative to its first fiducial
+
+    Args:
+        length_x (float): Calibrated length along X (scale or square side) in mm
+        length_y (float): Calibrated length along Y in mm, None for a square with equal sides
+
+    Returns:
+        list: (x, y) corner positions of the square: origin, +X, +X+Y, +Y
+    """
+    length_y = length_x if length_y is None else length_y
+    return [(0.0, 0.0), (length_x, 0.0), (length_x, length_y), (0.0, length_y)]
+
+
+class CalibrationRunner:
+    """
+    Class to measure a reference artifact with the camera and derive axis corrections
+
+    The run starts with the crosshair over the first fiducial. Every fiducial is
+    approached from the same direction (rapid to a point below and left of it, then
+    a short feed move) so backlash does not enter the measurement. The fiducial is
+    then located in a fresh frame and its offset from the crosshair added to the
+    Idle position.
+    """
+
+    def __init__(self, controller, grab_frame, mm_per_pixel, settings=None):
+        """
+        Initialize the runner
+
+        Args:
+            controller (MachineController): Machine controller
+            grab_frame (callable): grab_frame(after) returns (frame, capture time) of the
+                first frame captured after time `after`, or (None, None)
+            mm_per_pixel (float): Camera scale used for the fiducial offset
+            settings (GRBLSettingsManager): Shared settings cache, a private one if None
+        """
+        self.controller = controller
+        self.settle = SettleDetector(controller, grab_frame)
+        self.mm_per_pixel = mm_per_pixel
+        self.settings = settings or GRBLSettingsManager(controller.comm)
+
+    def measure_fiducial(self, x, y, feed_rate, approach=0.5, mode='blob', search_radius=None, settle_time=0.0):
+        """
+        Move to a nominal position and measure the fiducial under the camera
+
+        Args:
+            x (float): Target X in work coordinates (mm)
+            y (float): Target Y in work coordinates (mm)
+            feed_rate (float): Feed rate of the final approach (mm/min)
+            approach (float): Length of the final approach along +X and +Y (mm)
+            mode (str): Fiducial type for vision.locate_fiducial
+            search_radius (int): Fiducial search radius in pixels
+            settle_time (float): Extra delay after Idle before the image settle check (s)
+
+        Returns:
+            dict: {'x', 'y'} measured machine position and the fiducial 'pixel'
+        """
+        commands = ['G90']
+        if approach > 0:
+            commands.append(move_gcode(x - approach, y - approach, rapid=True))
+        commands.append(move_gcode(x, y, feed_rate=feed_rate))
+        if not self.controller.execute(commands):
+            raise RuntimeError(f"Move to ({x:.3f}, {y:.3f}) was not accepted by the machine")
+        status = self.controller.wait_for_idle()
+        if status is None:
+            raise RuntimeError(f"Machine did not reach Idle at ({x:.3f}, {y:.3f})")
+        if settle_time > 0:
+            time.sleep(settle_time)
+
+        frame, _, _ = self.settle.wait_for_settled_frame(time.time())
+        if frame is None:
+            raise RuntimeError("No camera frame available")
+        pixel = locate_fiducial(frame, mode, search_radius)
+        if pixel is None:
+            raise RuntimeError(f"No fiducial found near ({x:.3f}, {y:.3f})")
+        mx, my = pixel_to_stage(pixel[0], pixel[1], status['x'], status['y'], self.mm_per_pixel, frame.shape)
+        return {'x': mx, 'y': my, 'pixel': [pixel[0], pixel[1]]}
+
+    def read_steps_per_mm(self):
+        """
+        Read the current $100/$101 values from the machine
+
+        Returns:
+            dict: {100: float, 101: float}, or None if the settings could not be read
+        """
+        try:
+            return {100: float(self.settings.get(100)), 101: float(self.settings.get(101))}
+        except (TypeError, ValueError):
+            return None
+
+    def write_steps_per_mm(self, values):
+        """
+        Write new steps/mm values to GRBL (stored in its EEPROM)
+
+        Args:
+            values (dict): {setting number: value}
+
+        Returns:
+            bool: True if every write was acknowledged
+        """
+        result = self.settings.apply({number: f"{value:.3f}" for number, value in values.items()})
+        return not result['failed']
+
+    def run(self, job, nominal, feed_rate=200, repeats=1, approach=0.5, mode='blob', search_radius=None,
+            settle_time=0.0, write_back=False):
+        """
+        Job function: measure every reference fiducial and compute the corrections
+
+        Args:
+            job (Job): Job receiving one result per measured fiducial
+            nominal (list): Calibrated (x, y) fiducial positions relative to the first one
+            feed_rate (float): Feed rate of the final approaches (mm/min)
+            repeats (int): Measurements per fiducial, averaged
+            approach (float): Length of the final approach (mm)
+            mode (str): Fiducial type, 'blob' or 'corner'
+            search_radius (int): Fiducial search radius in pixels
+            settle_time (float): Extra delay after Idle before each frame (s)
+            write_back (bool): Write the corrected $100/$101 to the machine
+
+        Summary (job.summary):
+            scale_x/scale_y (true/commanded length), squareness_error_degrees,
+            steps ({'$100': {'old', 'new'}, ...}), written, residual rms/max and
+            the CompensationMap to apply ('map')
+        """
+        nominal = np.asarray(nominal, dtype=np.float64).reshape(-1, 2)
+        start = self.controller.get_current_position()
+        if start is None:
+            raise RuntimeError("Could not read the machine position")
+        origin = np.array([start['x'], start['y']]) - nominal[0]
+        steps = self.read_steps_per_mm()
+
+        measured = []
+        for index, point in enumerate(nominal):
+            samples = []
+            for _ in range(max(1, int(repeats))):
+                if job.cancelled:
+                    return
+                target = origin + point
+                samples.append(self.measure_fiducial(target[0], target[1], feed_rate, approach, mode,
+                                                     search_radius, settle_time))
+            xy = np.array([[s['x'], s['y']] for s in samples])
+            mean = xy.mean(axis=0)
+            measured.append(mean)
+            job.add_result({'index': index,
+                            'nominal': {'x': float(point[0]), 'y': float(point[1])},
+                            'measured': {'x': float(mean[0]), 'y': float(mean[1])},
+                            'spread': float(np.hypot(*(xy - mean).T).max()),
+                            'pixels': [s['pixel'] for s in samples]})
+
+        # Return to the first fiducial
+        if self.controller.execute(['G90', move_gcode(start['x'], start['y'], rapid=True)]):
+            self.controller.wait_for_idle()
+
+        fitted = CompensationMap.from_reference(nominal, np.array(measured), origin=(start['x'], start['y']))
+        summary = {
+            'scale_x': fitted.scale_x,
+            'scale_y': fitted.scale_y,
+            'squareness_error_degrees': math.degrees(fitted.squareness),
+            'residual_rms': fitted.metadata['affine_rms'],
+            'residual_max': fitted.metadata['affine_max'],
+            'steps': None,
+            'written': False
+        }
+        if steps is not None:
+            # scale = true / commanded travel, so the axis needs 1/scale times the steps
+            new_steps = {100: steps[100] / fitted.scale_x, 101: steps[101] / fitted.scale_y}
+            summary['steps'] = {f'${n}': {'old': steps[n], 'new': round(new_steps[n], 3)} for n in (100, 101)}
+            if write_back:
+                summary['written'] = self.write_steps_per_mm(new_steps)
+        elif write_back:
+            logging.warning("Current steps/mm unknown, corrected values not written")
+
+        # GRBL cannot correct squareness; once the scales are fixed in firmware
+        # only the squareness is left for the software map
+        metadata = dict(fitted.metadata, source='guided calibration', timestamp=time.time(),
+                        nominal=nominal.tolist())
+        if summary['written']:
+            comp = CompensationMap(1.0, 1.0, fitted.squareness, fitted.origin, metadata=metadata)
+        else:
+            comp = CompensationMap(fitted.scale_x, fitted.scale_y, fitted.squareness, fitted.origin,
+                                   metadata=metadata)
+        summary['map'] = comp.to_dict()
+        job.summary = summary
+        logging.info(f"Calibration: scale_x={fitted.scale_x:.6f} scale_y={fitted.scale_y:.6f} "
+                     f"squareness={summary['squareness_error_degrees']:.4f} deg")
+
+
+if __name__ == "__main__":
+    # Test the step correction arithmetic on simulated measurements of a 100 mm square
+    nominal = np.array(reference_points(100.0))
+    truth = CompensationMap(1.004, 0.997, math.radians(0.03))
+    measured = np.linalg.solve(truth._matrix, nominal.T).T
+    fitted = CompensationMap.from_reference(nominal, measured)
+    print(f"$100: 80.000 -> {80.0 / fitted.scale_x:.3f}, $101: 80.000 -> {80.0 / fitted.scale_y:.3f}, "
+          f"squareness {math.degrees(fitted.squareness):.4f} deg")
@@ -11,6 +11,52 @@ import os
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Default optical scale of the microscope at the processed 640x480 resolution
+DEFAULT_MM_PER_PIXEL = 0.01
+
+
+def stage_to_pixel(points, stage_x, stage_y, mm_per_pixel, frame_shape):
+    """
+    Project machine coordinates into frame pixel coordinates
+
+    The crosshair (frame centre) is the current stage position; image Y points down
+    while machine Y points up.
+
+    Args:
+        points (numpy.ndarray): (N, 2) machine coordinates in mm
+        stage_x (float): Current stage X position in mm
+        stage_y (float): Current stage Y position in mm
+        mm_per_pixel (float): Optical scale
+        frame_shape (tuple): Frame shape (height, width, ...)
+
+    Returns:
+        numpy.ndarray: (N, 2) float pixel coordinates
+    """
+    h, w = frame_shape[:2]
+    pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    px = w / 2.0 + (pts[:, 0] - stage_x) / mm_per_pixel
+    py = h / 2.0 - (pts[:, 1] - stage_y) / mm_per_pixel
+    return np.column_stack((px, py))
+
+
+def pixel_to_stage(px, py, stage_x, stage_y, mm_per_pixel, frame_shape):
+    """
+    Convert a frame pixel position to machine coordinates (inverse of stage_to_pixel)
+
+    Args:
+        px (float): Pixel column
+        py (float): Pixel row
+        stage_x (float): Current stage X position in mm
+        stage_y (float): Current stage Y position in mm
+        mm_per_pixel (float): Optical scale
+        frame_shape (tuple): Frame shape (height, width, ...)
+
+    Returns:
+        tuple: (x, y) machine coordinates in mm
+    """
+    h, w = frame_shape[:2]
+    return stage_x + (px - w / 2.0) * mm_per_pixel, stage_y - (py - h / 2.0) * mm_per_pixel
+
 
 def find_available_cameras(max_cameras=20):
     """
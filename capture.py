@@ -0,0 +1,323 @@
+"""
+Capture Module for Comparatron
+Handles camera capture in a worker process that publishes frames through a shared-memory ring
+"""
+
+import logging
+import multiprocessing
+import time
+from multiprocessing import shared_memory
+import numpy as np
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Processed frame size (height, width, channels)
+FRAME_SHAPE = (480, 640, 3)
+
+# Slots in a ring; a frame view stays valid until SLOTS - 1 newer frames were written
+DEFAULT_SLOTS = 8
+
+
+def _aligned(size, alignment=64):
+    return (size + alignment - 1) // alignment * alignment
+
+
+class FrameRing:
+    """
+    Class holding the most recent camera frames in shared memory
+
+    Layout: an int64 header (frame shape, slot count, latest sequence number),
+    per-slot sequence numbers and capture times, then the frame slots. Frame n
+    (counting from 1) goes to slot n % slots; its sequence number is cleared
+    while the slot is written, so readers can tell a frame that was overwritten
+    (or torn) from a valid one. Any process can attach by name and read frames
+    as NumPy views without copying.
+    """
+
+    HEADER_FIELDS = 8  # height, width, channels, slots, latest sequence, reserved
+
+    def __init__(self, name=None, shape=FRAME_SHAPE, slots=DEFAULT_SLOTS):
+        """
+        Create a ring, or attach to an existing one
+
+        Args:
+            name (str): Shared memory name to attach to; None creates a new ring
+            shape (tuple): Frame shape of a new ring
+            slots (int): Number of frame slots of a new ring
+        """
+        if name is None:
+            header_size = _aligned(self.HEADER_FIELDS * 8)
+            size = header_size + 2 * _aligned(slots * 8) + slots * int(np.prod(shape))
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.owner = True
+            header = np.ndarray((self.HEADER_FIELDS,), np.int64, self.shm.buf)
+            header[:] = 0
+            header[:3] = shape
+            header[3] = slots
+            del header
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self._map()
+
+    def _map(self):
+        """Create the NumPy views of the header, slot table and frames"""
+        buf = self.shm.buf
+        self._header = np.ndarray((self.HEADER_FIELDS,), np.int64, buf)
+        height, width, channels, slots = (int(v) for v in self._header[:4])
+        self.shape = (height, width, channels)
+        self.slots = slots
+        offset = _aligned(self.HEADER_FIELDS * 8)
+        self._seqs = np.ndarray((slots,), np.int64, buf, offset)
+        offset += _aligned(slots * 8)
+        self._times = np.ndarray((slots,), np.float64, buf, offset)
+        offset += _aligned(slots * 8)
+        self._frames = np.ndarray((slots,) + self.shape, np.uint8, buf, offset)
+
+    @classmethod
+    def attach(cls, name):
+        """Attach to the ring with the given shared memory name"""
+        return cls(name=name)
+
+    @property
+    def name(self):
+        """Shared memory name other processes attach with"""
+        return self.shm.name
+
+    @property
+    def latest_seq(self):
+        """Sequence number of the newest complete frame (0 before the first one)"""
+        return int(self._header[4])
+
+    def write(self, frame, frame_time):
+        """
+        Publish a frame
+
+        Args:
+            frame (numpy.ndarray): Frame of the ring's shape
+            frame_time (float): time.time() at which the frame is at least this recent
+
+        Returns:
+            int: Sequence number of the frame
+        """
+        seq = self.latest_seq + 1
+        slot = seq % self.slots
+        self._seqs[slot] = 0  # Invalid while the slot is written
+        self._frames[slot] = frame
+        self._times[slot] = frame_time
+        self._seqs[slot] = seq
+        self._header[4] = seq
+        return seq
+
+    def valid(self, seq):
+        """Whether frame seq is still in the ring (not overwritten or being written)"""
+        return seq > 0 and int(self._seqs[seq % self.slots]) == seq
+
+    def get(self, seq=None):
+        """
+        Zero-copy view of a frame
+
+        The view is only valid until the slot is reused; check valid(seq) after
+        using it, or use read() for a copy.
+
+        Args:
+            seq (int): Frame to return, None for the newest
+
+        Returns:
+            tuple: (seq, capture time, frame view), or (None, None, None) if unavailable
+        """
+        if seq is None:
+            seq = self.latest_seq
+        if not self.valid(seq):
+            return None, None, None
+        slot = seq % self.slots
+        return seq, float(self._times[slot]), self._frames[slot]
+
+    def read(self, seq=None):
+        """
+        Copy of a frame, guaranteed not to be torn
+
+        Returns:
+            tuple: (seq, capture time, frame copy), or (None, None, None) if unavailable
+        """
+        seq, frame_time, view = self.get(seq)
+        if view is None:
+            return None, None, None
+        frame = view.copy()
+        if not self.valid(seq):
+            return None, None, None
+        return seq, frame_time, frame
+
+    def close(self):
+        """Detach from the shared memory (the creator also removes it)"""
+        self._header = self._seqs = self._times = self._frames = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # Views handed out by get() are still alive; the mapping goes with them
+            logging.warning(f"Frame ring {self.shm.name} still has frame views in use")
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def capture_worker(ring_name, camera_index, ready, stop, new_frame, opener=None):
+    """
+    Capture loop run in the worker process
+
+    Args:
+        ring_name (str): Shared memory name of the FrameRing to write
+        camera_index (int): Camera to open
+        ready (multiprocessing.connection.Connection): Receives True once the camera works, else False
+        stop (multiprocessing.Event): Set by the web process to end the loop
+        new_frame (multiprocessing.Event): Set after every published frame
+        opener (callable): Camera factory taking the index; defaults to initialize_camera
+    """
+    import cv2 as cv
+    if opener is None:
+        from camera_manager import initialize_camera as opener
+
+    ring = FrameRing.attach(ring_name)
+    camera = None
+    try:
+        camera = opener(camera_index)
+        ready.send(camera is not None and camera.isOpened())
+        if camera is None:
+            return
+        height, width = ring.shape[:2]
+        failures = 0
+        while not stop.is_set():
+            read_start = time.time()
+            ret, frame = camera.read()  # Blocks at the camera frame rate
+            if not ret:
+                failures += 1
+                time.sleep(min(0.01 * failures, 0.5))
+                continue
+            failures = 0
+            if frame.shape[0] != height or frame.shape[1] != width:
+                frame = cv.resize(frame, (width, height))
+            ring.write(frame, read_start)
+            new_frame.set()
+    except Exception as e:
+        logging.error(f"Capture worker for camera {camera_index} failed: {e}")
+        print(f"Capture worker for camera {camera_index} failed: {e}")
+        try:
+            ready.send(False)
+        except (OSError, ValueError):
+            pass
+    finally:
+        if camera is not None:
+            camera.release()
+        ring.close()
+
+
+class CaptureProcess:
+    """
+    Class running the camera capture of one station in its own process
+
+    Capture and resizing then no longer compete with the request threads for
+    the GIL; frames are published in a FrameRing that the web process and
+    analysis workers read without copying. Offers isOpened()/release() like
+    cv.VideoCapture, so it can stand in for the station's camera object.
+    """
+
+    def __init__(self, camera_index, slots=DEFAULT_SLOTS, opener=None):
+        """
+        Initialize (the process is started by start())
+
+        Args:
+            camera_index (int): Camera to open in the worker
+            slots (int): Frame slots of the ring
+            opener (callable): Picklable camera factory (for tests and benchmarks)
+        """
+        self.camera_index = camera_index
+        self.slots = slots
+        self.opener = opener
+        self.ring = None
+        self.process = None
+        self._context = multiprocessing.get_context('spawn')  # Forking a threaded server is unsafe
+        self._stop = self._context.Event()
+        self._new_frame = self._context.Event()
+
+    def start(self, timeout=20.0):
+        """
+        Start the worker and wait until its camera works
+
+        Args:
+            timeout (float): Longest wait for the camera to open
+
+        Returns:
+            bool: True if the camera delivers frames
+        """
+        self.ring = FrameRing(slots=self.slots)
+        receiver, sender = self._context.Pipe(duplex=False)
+        self.process = self._context.Process(
+            target=capture_worker, name=f'capture-{self.camera_index}', daemon=True,
+            args=(self.ring.name, self.camera_index, sender, self._stop, self._new_frame, self.opener))
+        self.process.start()
+        sender.close()
+        ok = False
+        try:
+            if receiver.poll(timeout):
+                ok = receiver.recv()
+        except EOFError:
+            ok = False
+        finally:
+            receiver.close()
+        if not ok:
+            logging.warning(f"Capture process could not open camera {self.camera_index}")
+            self.release()
+        return ok
+
+    def isOpened(self):
+        """Whether the worker is running"""
+        return self.process is not None and self.process.is_alive()
+
+    def wait(self, timeout=0.5):
+        """
+        Wait for a frame newer than the last wait() call returned for
+
+        Returns:
+            bool: True if a new frame was published
+        """
+        if not self._new_frame.wait(timeout):
+            return False
+        self._new_frame.clear()
+        return True
+
+    def release(self):
+        """Stop the worker and remove the ring"""
+        self._stop.set()
+        if self.process is not None:
+            self.process.join(timeout=2.0)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join(timeout=1.0)
+            self.process = None
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+
+if __name__ == "__main__":
+    # Write and read back frames through a ring, then try camera 0 in a worker
+    ring = FrameRing(slots=4)
+    reader = FrameRing.attach(ring.name)
+    for i in range(6):
+        ring.write(np.full(FRAME_SHAPE, i, np.uint8), time.time())
+    seq, frame_time, frame = reader.read()
+    print(f"Latest frame {seq}, value {frame[0, 0, 0]}; frame 1 still valid: {reader.valid(1)}")
+    reader.close()
+    ring.close()
+
+    capture = CaptureProcess(0)
+    if capture.start():
+        if capture.wait(2.0):
+            seq, frame_time, frame = capture.ring.read()
+            print(f"Camera frame {seq}: {frame.shape}")
+        capture.release()
+    else:
+        print("No camera available")
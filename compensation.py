@@ -0,0 +1,290 @@
+"""
+Compensation Module for Comparatron
+Corrects machine coordinates for axis scale, squareness and residual grid errors
+"""
+
+import json
+import logging
+import math
+import os
+import numpy as np
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Default location of the active compensation map
+DEFAULT_COMPENSATION_FILE = os.path.expanduser('~/.comparatron/compensation.json')
+
+_cache = {}
+
+
+class CompensationMap:
+    """
+    Class holding a 2D error map and applying it to (N, 2) point arrays
+
+    The correction of a machine position p is
+
+        corrected = origin + A @ (p - origin) + grid(p)
+
+    with A = [[scale_x, scale_y * sin(s)], [0, scale_y * cos(s)]]. The X axis is the
+    reference direction and s is the squareness error: the actual angle between the
+    axes is 90 degrees minus s. grid(p) is an optional bilinear residual map defined
+    on a regular grid of machine positions (constant beyond its border).
+    """
+
+    def __init__(self, scale_x=1.0, scale_y=1.0, squareness=0.0, origin=(0.0, 0.0), grid=None, metadata=None):
+        """
+        Initialize the map
+
+        Args:
+            scale_x (float): True length per commanded length along X
+            scale_y (float): True length per commanded length along Y
+            squareness (float): Squareness error in radians
+            origin (tuple): Position where the affine correction is zero (mm)
+            grid (dict): Optional residual grid {'origin': (x0, y0), 'spacing': (hx, hy),
+                'dx': 2D list, 'dy': 2D list}, rows along Y
+            metadata (dict): Free-form information (reference artifact, date, fit residuals)
+        """
+        self.scale_x = float(scale_x)
+        self.scale_y = float(scale_y)
+        self.squareness = float(squareness)
+        self.origin = np.asarray(origin, dtype=np.float64)
+        self.grid = grid
+        self.metadata = dict(metadata or {})
+
+        # Everything derived from the parameters is computed once here
+        self._matrix = np.array([[self.scale_x, self.scale_y * math.sin(self.squareness)],
+                                 [0.0, self.scale_y * math.cos(self.squareness)]])
+        self._offset = self.origin - self.origin @ self._matrix.T
+        self._grid_coeffs = None
+        if grid is not None:
+            self._prepare_grid(grid)
+
+    def _prepare_grid(self, grid):
+        """Precompute per-cell bilinear coefficients c0 + c1*fx + c2*fy + c3*fx*fy"""
+        dx = np.asarray(grid['dx'], dtype=np.float64)
+        dy = np.asarray(grid['dy'], dtype=np.float64)
+        if dx.shape != dy.shape or dx.ndim != 2 or min(dx.shape) < 2:
+            raise ValueError("Compensation grid needs matching dx/dy arrays of at least 2x2 nodes")
+        values = np.stack((dx, dy), axis=-1)  # (ny, nx, 2)
+        v00 = values[:-1, :-1]
+        v10 = values[:-1, 1:]
+        v01 = values[1:, :-1]
+        v11 = values[1:, 1:]
+        self._grid_coeffs = np.stack((v00, v10 - v00, v01 - v00, v11 - v10 - v01 + v00), axis=2)
+        self._grid_origin = np.asarray(grid['origin'], dtype=np.float64)
+        self._grid_spacing = np.asarray(grid['spacing'], dtype=np.float64)
+        self._grid_cells = np.array([dx.shape[1] - 1, dx.shape[0] - 1])
+
+    @property
+    def is_identity(self):
+        return (self.scale_x == 1.0 and self.scale_y == 1.0 and self.squareness == 0.0
+                and self._grid_coeffs is None)
+
+    def grid_correction(self, points):
+        """
+        Evaluate the bilinear residual grid
+
+        Args:
+            points (numpy.ndarray): (N, 2) machine positions
+
+        Returns:
+            numpy.ndarray: (N, 2) corrections (zeros without a grid)
+        """
+        pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if self._grid_coeffs is None:
+            return np.zeros_like(pts)
+        u = (pts - self._grid_origin) / self._grid_spacing
+        cell = np.clip(np.floor(u), 0, self._grid_cells - 1).astype(np.intp)
+        frac = np.clip(u - cell, 0.0, 1.0)
+        c = self._grid_coeffs[cell[:, 1], cell[:, 0]]  # (N, 4, 2)
+        fx = frac[:, 0:1]
+        fy = frac[:, 1:2]
+        return c[:, 0] + c[:, 1] * fx + c[:, 2] * fy + c[:, 3] * (fx * fy)
+
+    def apply(self, points):
+        """
+        Correct an (N, 2) array of machine positions
+
+        Args:
+            points (numpy.ndarray): Raw machine coordinates
+
+        Returns:
+            numpy.ndarray: Corrected coordinates (new array)
+        """
+        pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        corrected = pts @ self._matrix.T + self._offset
+        if self._grid_coeffs is not None:
+            corrected += self.grid_correction(pts)
+        return corrected
+
+    def apply_point(self, x, y):
+        """
+        Correct a single position
+
+        Returns:
+            tuple: (x, y) corrected coordinates
+        """
+        cx, cy = self.apply(np.array([[x, y]]))[0]
+        return float(cx), float(cy)
+
+    @classmethod
+    def from_reference(cls, nominal, measured, grid_spacing=None, origin=(0.0, 0.0)):
+        """
+        Fit a map from positions measured on a reference artifact
+
+        The artifact may be placed with any rotation and offset; a general affine
+        fit nominal ~ M @ measured + t is decomposed as M = R @ A (QR), R being the
+        placement rotation and A the machine's scale/squareness matrix. Residuals
+        after the fit are spread onto a grid when grid_spacing is given.
+
+        Args:
+            nominal: (N, 2) calibrated artifact coordinates, N >= 3
+            measured: (N, 2) machine coordinates of the same features
+            grid_spacing (float): Residual grid spacing in mm, None for affine only
+            origin (tuple): Origin of the affine correction
+
+        Returns:
+            CompensationMap: Fitted map; metadata holds the residual statistics
+        """
+        nom = np.asarray(nominal, dtype=np.float64).reshape(-1, 2)
+        meas = np.asarray(measured, dtype=np.float64).reshape(-1, 2)
+        if len(nom) != len(meas) or len(nom) < 3:
+            raise ValueError("Need at least 3 matching nominal/measured points")
+
+        design = np.column_stack((meas, np.ones(len(meas))))
+        solution, _, rank, _ = np.linalg.lstsq(design, nom, rcond=None)
+        if rank < 3:
+            raise ValueError("Reference points are collinear")
+        m = solution[:2].T
+        t = solution[2]
+        q, r = np.linalg.qr(m)
+        signs = np.sign(np.diag(r))
+        signs[signs == 0] = 1.0
+        q = q * signs
+        r = signs[:, None] * r
+        if r[0, 0] <= 0 or r[1, 1] <= 0:
+            raise ValueError("Reference fit is mirrored; check the point correspondence")
+
+        scale_x = r[0, 0]
+        scale_y = math.hypot(r[0, 1], r[1, 1])
+        squareness = math.atan2(r[0, 1], r[1, 1])
+
+        # Residuals expressed in the machine frame
+        residuals = (nom - (meas @ m.T + t)) @ q
+        rms = float(np.sqrt((residuals ** 2).sum(axis=1).mean()))
+        metadata = {'points': int(len(nom)), 'affine_rms': rms,
+                    'affine_max': float(np.hypot(*residuals.T).max())}
+
+        grid = None
+        if grid_spacing:
+            grid = _splat_grid(meas, residuals, float(grid_spacing))
+        return cls(scale_x, scale_y, squareness, origin, grid, metadata)
+
+    def to_dict(self):
+        return {
+            'scale_x': self.scale_x,
+            'scale_y': self.scale_y,
+            'squareness_error_degrees': math.degrees(self.squareness),
+            'origin': self.origin.tolist(),
+            'grid': self.grid,
+            'metadata': self.metadata
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get('scale_x', 1.0), data.get('scale_y', 1.0),
+                   math.radians(data.get('squareness_error_degrees', 0.0)),
+                   data.get('origin', (0.0, 0.0)), data.get('grid'), data.get('metadata'))
+
+    def save(self, filename=DEFAULT_COMPENSATION_FILE):
+        """
+        Save the map as JSON
+
+        Returns:
+            bool: True if saved successfully
+        """
+        try:
+            directory = os.path.dirname(filename)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(filename, 'w') as f:
+                json.dump(self.to_dict(), f, indent=2)
+            _cache.pop(filename, None)
+            logging.info(f"Saved compensation map to {filename}")
+            return True
+        except Exception as e:
+            logging.error(f"Error saving compensation map to {filename}: {e}")
+            print(f"Error saving compensation map to {filename}: {e}")
+            return False
+
+
+def _splat_grid(points, values, spacing):
+    """
+    Average scattered residuals onto grid nodes with bilinear weights
+
+    Nodes without nearby samples get a zero correction.
+    """
+    lo = np.floor(points.min(axis=0) / spacing) * spacing
+    hi = np.ceil(points.max(axis=0) / spacing) * spacing
+    shape = np.maximum(np.round((hi - lo) / spacing).astype(int) + 1, 2)
+    u = (points - lo) / spacing
+    cell = np.clip(np.floor(u), 0, shape - 2).astype(np.intp)
+    frac = u - cell
+    sums = np.zeros((shape[1], shape[0], 2))
+    weights = np.zeros((shape[1], shape[0]))
+    for ox, oy in ((0, 0), (1, 0), (0, 1), (1, 1)):
+        w = (frac[:, 0] if ox else 1 - frac[:, 0]) * (frac[:, 1] if oy else 1 - frac[:, 1])
+        np.add.at(weights, (cell[:, 1] + oy, cell[:, 0] + ox), w)
+        np.add.at(sums, (cell[:, 1] + oy, cell[:, 0] + ox), w[:, None] * values)
+    grid_values = np.where(weights[..., None] > 1e-9, sums / np.maximum(weights, 1e-9)[..., None], 0.0)
+    return {'origin': lo.tolist(), 'spacing': [spacing, spacing],
+            'dx': grid_values[..., 0].tolist(), 'dy': grid_values[..., 1].tolist()}
+
+
+def load_compensation(filename=DEFAULT_COMPENSATION_FILE):
+    """
+    Load a compensation map, reusing the cached instance while the file is unchanged
+
+    Args:
+        filename (str): Path of the JSON map
+
+    Returns:
+        CompensationMap: The map, or None if the file does not exist or is invalid
+    """
+    try:
+        mtime = os.path.getmtime(filename)
+    except OSError:
+        return None
+    cached = _cache.get(filename)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    try:
+        with open(filename) as f:
+            comp = CompensationMap.from_dict(json.load(f))
+    except Exception as e:
+        logging.error(f"Error loading compensation map {filename}: {e}")
+        print(f"Error loading compensation map {filename}: {e}")
+        return None
+    _cache[filename] = (mtime, comp)
+    return comp
+
+
+if __name__ == "__main__":
+    # Fit a map from a simulated 5x5 artifact and time the correction of 100k points
+    import time
+
+    rng = np.random.default_rng(0)
+    gx, gy = np.meshgrid(np.arange(5) * 25.0, np.arange(5) * 25.0)
+    nominal = np.column_stack((gx.ravel(), gy.ravel()))
+    truth = CompensationMap(1.002, 0.998, math.radians(0.05))
+    # Invert the true error to simulate what the machine would report
+    measured = np.linalg.solve(truth._matrix, nominal.T).T + rng.normal(0, 0.002, nominal.shape)
+    fitted = CompensationMap.from_reference(nominal, measured, grid_spacing=50.0)
+    print(f"scale_x={fitted.scale_x:.5f} scale_y={fitted.scale_y:.5f} "
+          f"squareness={math.degrees(fitted.squareness):.4f} deg, rms={fitted.metadata['affine_rms']:.4f} mm")
+
+    points = rng.uniform(0, 100, (100000, 2))
+    start = time.perf_counter()
+    fitted.apply(points)
+    print(f"Corrected {len(points)} points in {(time.perf_counter() - start) * 1000:.1f} ms")
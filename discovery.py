@@ -0,0 +1,135 @@
+"""
+Device Discovery Module for Comparatron
+Scans for serial ports and cameras in the background so startup does not wait for them
+"""
+
+import logging
+import threading
+from camera_manager import find_available_cameras, refresh_camera_detection
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class DeviceDiscovery:
+    """
+    Class caching the serial port and camera lists, filled by background scans
+
+    Probing cameras opens every /dev/video device and reads frames, which takes
+    seconds; the web interface answers while the first scan runs and the routes
+    wait for its result only when they need it.
+    """
+
+    def __init__(self, serial_communicator):
+        """
+        Initialize the discovery (no scan is started yet)
+
+        Args:
+            serial_communicator (SerialCommunicator): Used for the GRBL port filtering
+        """
+        self.serial_comm = serial_communicator
+        self.ports = []
+        self.port_names = []
+        self.cameras = []
+        self._lock = threading.Lock()
+        self._scans = {}  # 'ports'/'cameras' -> threading.Event set when the scan finished
+
+    def _scan(self, kind, func):
+        """Run a scan on a daemon thread unless one of that kind is already running"""
+        with self._lock:
+            done = self._scans.get(kind)
+            if done is not None and not done.is_set():
+                return done
+            done = threading.Event()
+            self._scans[kind] = done
+
+        def scan():
+            try:
+                func()
+            except Exception as e:
+                logging.error(f"Error scanning {kind}: {e}")
+                print(f"Error scanning {kind}: {e}")
+            finally:
+                done.set()
+
+        threading.Thread(target=scan, name=f'discover-{kind}', daemon=True).start()
+        return done
+
+    def _find_ports(self):
+        """Enumerate the serial ports (GRBL candidates first)"""
+        ports = self.serial_comm.get_available_ports()
+        self.ports, self.port_names = ports, [str(port) for port in ports]
+
+    def _find_cameras(self, refresh=False):
+        """Probe the cameras"""
+        self.cameras = refresh_camera_detection() if refresh else find_available_cameras()
+
+    def start(self):
+        """Start the initial port and camera scans"""
+        self._scan('ports', self._find_ports)
+        self._scan('cameras', self._find_cameras)
+
+    def scan_ports(self, timeout=None):
+        """
+        Rescan the serial ports
+
+        Args:
+            timeout (float): Wait up to this long for the scan, None to wait until done
+
+        Returns:
+            list: Port names (the previous list if the scan did not finish in time)
+        """
+        self._scan('ports', self._find_ports).wait(timeout)
+        return self.port_names
+
+    def scan_cameras(self, timeout=None, refresh=True):
+        """
+        Rescan the cameras
+
+        Args:
+            timeout (float): Wait up to this long for the scan, None to wait until done
+            refresh (bool): Use the more thorough refresh_camera_detection
+
+        Returns:
+            list: Camera indices (the previous list if the scan did not finish in time)
+        """
+        self._scan('cameras', lambda: self._find_cameras(refresh)).wait(timeout)
+        return self.cameras
+
+    def get_ports(self, timeout=5.0):
+        """
+        Return the port names, waiting for a running scan
+
+        Args:
+            timeout (float): Maximum wait for a scan in progress (s)
+        """
+        self._wait('ports', self._find_ports, timeout)
+        return self.port_names
+
+    def get_cameras(self, timeout=30.0):
+        """
+        Return the camera indices, waiting for a running scan
+
+        Args:
+            timeout (float): Maximum wait for a scan in progress (s)
+        """
+        self._wait('cameras', self._find_cameras, timeout)
+        return self.cameras
+
+    def _wait(self, kind, func, timeout):
+        """Start a scan if none ever ran, then wait for the latest one"""
+        done = self._scans.get(kind) or self._scan(kind, func)
+        done.wait(timeout)
+
+
+if __name__ == "__main__":
+    # Test a background scan
+    import time
+    from serial_comm import SerialCommunicator
+
+    discovery = DeviceDiscovery(SerialCommunicator())
+    started = time.perf_counter()
+    discovery.start()
+    print(f"Scans started in {(time.perf_counter() - started) * 1000:.1f} ms")
+    print(f"Ports: {discovery.get_ports()}, cameras: {discovery.get_cameras()}")
+    print(f"Scans finished after {time.perf_counter() - started:.2f} s")
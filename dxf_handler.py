@@ -3,8 +3,11 @@ DXF Handling Module for Comparatron
 Handles creation and export of DXF files
 """
 
-import ezdxf
+import math
 import logging
+import numpy as np
+from geometry_fit import fit_geometry, bulge_centre
+from profiling import timed
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -22,10 +25,49 @@ class DXFHandler:
         Args:
             dxf_version (str): DXF version to use
         """
-        self.doc = ezdxf.new(dxfversion=dxf_version)
-        self.doc.layers.new(name="COMPARATRON_OUTPUT", dxfattribs={"color": 2})
-        self.msp = self.doc.modelspace()
+        self.dxf_version = dxf_version
+        self._doc = None  # ezdxf document, only built when needed (ezdxf is slow to import)
         self.points = []
+        self.shapes = []
+        self._point_array = None  # Cached (N, 2) array, rebuilt lazily after changes
+
+    @property
+    def doc(self):
+        """
+        The ezdxf document of the recorded points and shapes
+
+        Built on first use from the recorded data (each entity on the layer it was added
+        with), then kept up to date by the add methods.
+        """
+        if self._doc is None:
+            doc, msp, attribs = self._new_document()
+            for p in self.points:
+                msp.add_point((p["x"], p["y"]), dxfattribs=self._layer_attribs(p, attribs))
+            for shape in self.shapes:
+                self._add_shape(msp, shape, attribs)
+            self._doc = doc
+        return self._doc
+
+    @property
+    def msp(self):
+        """Modelspace of the document"""
+        return self.doc.modelspace()
+
+    @staticmethod
+    def _layer_attribs(record, attribs):
+        """Entity attributes with the layer stored in a point or shape record, if any"""
+        if "layer" in record:
+            return dict(attribs, layer=record["layer"])
+        return attribs
+
+    @classmethod
+    def _add_shape(cls, msp, shape, attribs):
+        """Add a polyline or circle shape dictionary to a modelspace"""
+        attribs = cls._layer_attribs(shape, attribs)
+        if shape["type"] == "polyline":
+            msp.add_lwpolyline(shape["vertices"], format="xyb", close=shape["closed"], dxfattribs=attribs)
+        elif shape["type"] == "circle":
+            msp.add_circle(shape["center"], shape["radius"], dxfattribs=attribs)
     
     def add_point(self, x, y, layer="COMPARATRON_OUTPUT"):
         """
@@ -37,13 +79,62 @@ class DXFHandler:
             layer (str): Layer name for the point
         """
         try:
-            point = self.msp.add_point((x, y), dxfattribs={"color": 7, "layer": layer})
-            self.points.append({"x": x, "y": y, "entity": point})
+            point = {"x": x, "y": y, "layer": layer}
+            if self._doc is not None:
+                self._doc.modelspace().add_point((x, y), dxfattribs={"color": 7, "layer": layer})
+            self.points.append(point)
+            self._point_array = None
             return True
         except Exception as e:
             print(f"Error adding point ({x}, {y}): {e}")
             return False
     
+    def add_circle(self, cx, cy, radius, layer="COMPARATRON_OUTPUT"):
+        """
+        Add a circle to the DXF drawing
+
+        Args:
+            cx (float): Centre X coordinate
+            cy (float): Centre Y coordinate
+            radius (float): Circle radius
+            layer (str): Layer name for the circle
+
+        Returns:
+            bool: True if the circle was added
+        """
+        try:
+            shape = {"type": "circle", "center": (cx, cy), "radius": float(radius), "layer": layer}
+            if self._doc is not None:
+                self._add_shape(self._doc.modelspace(), shape, {"color": 7})
+            self.shapes.append(shape)
+            return True
+        except Exception as e:
+            print(f"Error adding circle ({cx}, {cy}, r={radius}): {e}")
+            return False
+
+    def add_polyline(self, vertices, closed=False, layer="COMPARATRON_OUTPUT"):
+        """
+        Add a lightweight polyline to the DXF drawing
+
+        Args:
+            vertices (list): List of (x, y) or (x, y, bulge) tuples
+            closed (bool): Whether the polyline is closed
+            layer (str): Layer name for the polyline
+
+        Returns:
+            bool: True if the polyline was added
+        """
+        try:
+            vertices = [(v[0], v[1], v[2] if len(v) > 2 else 0.0) for v in vertices]
+            shape = {"type": "polyline", "vertices": vertices, "closed": closed, "layer": layer}
+            if self._doc is not None:
+                self._add_shape(self._doc.modelspace(), shape, {"color": 7})
+            self.shapes.append(shape)
+            return True
+        except Exception as e:
+            print(f"Error adding polyline with {len(vertices)} vertices: {e}")
+            return False
+
     def add_points_from_list(self, points_list):
         """
         Add multiple points from a list of (x, y) tuples
@@ -75,26 +166,120 @@ class DXFHandler:
         """
         return self.points.copy()
     
+    def get_point_array(self):
+        """
+        Get all points as a NumPy array, shared by the exporters
+
+        Returns:
+            numpy.ndarray: (N, 2) float64 array of x, y coordinates (read-only view)
+        """
+        if self._point_array is None or len(self._point_array) != len(self.points):
+            arr = np.array([(p["x"], p["y"]) for p in self.points], dtype=np.float64).reshape(-1, 2)
+            arr.flags.writeable = False
+            self._point_array = arr
+        return self._point_array
+
     def clear_points(self):
         """
         Clear all points from the drawing
         """
         # In ezdxf, we can't easily remove entities after they're added,
-        # so we create a new document instead
-        self.__init__(dxf_version=self.doc.dxfversion)
+        # so we start over with a new (lazily created) document instead
+        self.__init__(dxf_version=self.dxf_version)
     
-    def export_dxf(self, filename):
+    def fit_geometry(self, tolerance=0.01, max_gap=None, points=None):
+        """
+        Fit lines, arcs and circles to the recorded points in recording order
+
+        Args:
+            tolerance (float): Maximum deviation of a point from its entity (mm)
+            max_gap (float): Gap (mm) between points that starts a new entity
+            points (numpy.ndarray): Points to fit instead of the stored ones (e.g. transformed)
+
+        Returns:
+            list: Entity dictionaries (see geometry_fit.GeometryFitter.fit)
+        """
+        if points is None:
+            points = self.get_point_array()
+        if len(points) == 0:
+            return []
+        return fit_geometry(points, tolerance=tolerance, max_gap=max_gap)
+
+    def build_geometry_document(self, tolerance=0.01, max_gap=None, transform=None):
+        """
+        Build a new DXF document holding fitted geometry instead of bare points
+
+        Args:
+            tolerance (float): Maximum deviation of a point from its entity (mm)
+            max_gap (float): Gap (mm) between points that starts a new entity
+            transform (ExportTransform): Applied to the points and shapes before fitting
+
+        Returns:
+            Drawing: ezdxf document with LWPOLYLINE, CIRCLE and POINT entities
+        """
+        points = self.get_point_array()
+        shapes = self.shapes
+        if transform is not None:
+            transform.fit(points, shapes)
+            points = transform.apply(points)
+            shapes = [transform.apply_shape(s) for s in shapes]
+        doc, msp, attribs = self._new_document()
+
+        for entity in self.fit_geometry(tolerance, max_gap, points) + shapes:
+            if entity["type"] in ("polyline", "circle"):
+                self._add_shape(msp, entity, attribs)
+            elif entity["type"] == "point":
+                msp.add_point((entity["x"], entity["y"]), dxfattribs=attribs)
+        return doc
+
+    def build_transformed_document(self, transform):
+        """
+        Build a new DXF document with the points and shapes passed through a transform
+
+        Args:
+            transform (ExportTransform): Transform pipeline (e.g. with error compensation)
+
+        Returns:
+            Drawing: ezdxf document
+        """
+        doc, msp, attribs = self._new_document()
+        points = self.get_point_array()
+        transform.fit(points, self.shapes)
+        for p, (x, y) in zip(self.points, transform.apply(points)):
+            msp.add_point((float(x), float(y)), dxfattribs=self._layer_attribs(p, attribs))
+        for shape in self.shapes:
+            self._add_shape(msp, transform.apply_shape(shape), attribs)
+        return doc
+
+    def _new_document(self):
+        """Create an empty document with the output layer"""
+        import ezdxf
+        doc = ezdxf.new(dxfversion=self.dxf_version)
+        doc.layers.new(name="COMPARATRON_OUTPUT", dxfattribs={"color": 2})
+        return doc, doc.modelspace(), {"color": 7, "layer": "COMPARATRON_OUTPUT"}
+
+    @timed('export.dxf')
+    def export_dxf(self, filename, fit_geometry=False, tolerance=0.01, max_gap=None, transform=None):
         """
         Export the DXF drawing to a file
         
         Args:
             filename (str): Path to save the DXF file
+            fit_geometry (bool): Replace the points by fitted polylines, arcs and circles
+            tolerance (float): Fitting tolerance in mm when fit_geometry is set
+            max_gap (float): Gap in mm that starts a new entity when fit_geometry is set
+            transform (ExportTransform): Optional transform (e.g. error compensation) applied on export
             
         Returns:
             bool: True if export successful, False otherwise
         """
         try:
-            self.doc.saveas(filename)
+            if fit_geometry:
+                self.build_geometry_document(tolerance, max_gap, transform).saveas(filename)
+            elif transform is not None:
+                self.build_transformed_document(transform).saveas(filename)
+            else:
+                self.doc.saveas(filename)
             print(f"DXF exported to: {filename}")
             return True
         except Exception as e:
@@ -111,16 +296,503 @@ class DXFHandler:
         if not self.points:
             return {"min_x": 0, "min_y": 0, "max_x": 0, "max_y": 0}
         
-        x_coords = [p["x"] for p in self.points]
-        y_coords = [p["y"] for p in self.points]
+        arr = self.get_point_array()
+        lo = arr.min(axis=0)
+        hi = arr.max(axis=0)
         
         return {
-            "min_x": min(x_coords),
-            "min_y": min(y_coords),
-            "max_x": max(x_coords),
-            "max_y": max(y_coords)
+            "min_x": float(lo[0]),
+            "min_y": float(lo[1]),
+            "max_x": float(hi[0]),
+            "max_y": float(hi[1])
+        }
+
+
+def point_segment_distances(px, py, segments):
+    """
+    Distances from points to line segments, broadcasting over both
+
+    Args:
+        px (numpy.ndarray): Point X coordinates, shape (K, 1) or scalar
+        py (numpy.ndarray): Point Y coordinates, shape (K, 1) or scalar
+        segments (numpy.ndarray): (C, 4) array of x0, y0, x1, y1
+
+    Returns:
+        tuple: (distances, nearest x, nearest y), each broadcast to (K, C)
+    """
+    x0, y0 = segments[:, 0], segments[:, 1]
+    dx, dy = segments[:, 2] - x0, segments[:, 3] - y0
+    len_sq = dx * dx + dy * dy
+    len_sq = np.where(len_sq > 0, len_sq, 1.0)
+    t = np.clip(((px - x0) * dx + (py - y0) * dy) / len_sq, 0.0, 1.0)
+    nx = x0 + t * dx
+    ny = y0 + t * dy
+    return np.hypot(px - nx, py - ny), nx, ny
+
+
+def arc_end_points(arcs):
+    """
+    Append start and end point coordinates to an arc array
+
+    Args:
+        arcs (numpy.ndarray): (C, 5) array of cx, cy, radius, start angle, CCW sweep
+
+    Returns:
+        numpy.ndarray: (C, 9) array with sx, sy, ex, ey appended
+    """
+    cx, cy, r, a0, sweep = (arcs[:, i] for i in range(5))
+    return np.column_stack((arcs[:, :5], cx + r * np.cos(a0), cy + r * np.sin(a0),
+                            cx + r * np.cos(a0 + sweep), cy + r * np.sin(a0 + sweep)))
+
+
+def point_arc_distances(px, py, arcs):
+    """
+    Distances from points to circular arcs, broadcasting over both
+
+    Args:
+        px (numpy.ndarray): Point X coordinates, shape (K, 1) or scalar
+        py (numpy.ndarray): Point Y coordinates, shape (K, 1) or scalar
+        arcs (numpy.ndarray): (C, 5) array of cx, cy, radius, start angle, CCW sweep
+            (radians), or the (C, 9) form from arc_end_points
+
+    Returns:
+        tuple: (distances, nearest x, nearest y), each broadcast to (K, C)
+    """
+    if arcs.shape[1] < 9:
+        arcs = arc_end_points(arcs)
+    cx, cy, r, sweep = arcs[:, 0], arcs[:, 1], arcs[:, 2], arcs[:, 4]
+    sx, sy, ex, ey = arcs[:, 5], arcs[:, 6], arcs[:, 7], arcs[:, 8]
+    vx, vy = px - cx, py - cy
+    dist_c = np.hypot(vx, vy)
+    # Angular containment from cross products with the end radii (no trigonometry): a
+    # minor arc needs the point left of the start and right of the end radius, a major
+    # arc only needs it to stay out of the complementary minor arc
+    left_of_start = (sx - cx) * vy - (sy - cy) * vx >= 0
+    right_of_end = vx * (ey - cy) - vy * (ex - cx) >= 0
+    on_arc = np.where(sweep <= np.pi, left_of_start & right_of_end, left_of_start | right_of_end)
+    on_arc |= sweep >= 2.0 * np.pi - 1e-12
+    # Nearest point on the full circle, then fall back to the nearer end point
+    safe = np.where(dist_c > 0, dist_c, 1.0)
+    qx = np.where(dist_c > 0, cx + vx * (r / safe), sx)
+    qy = np.where(dist_c > 0, cy + vy * (r / safe), sy)
+    d0 = np.hypot(px - sx, py - sy)
+    d1 = np.hypot(px - ex, py - ey)
+    use0 = d0 <= d1
+    nx = np.where(on_arc, qx, np.where(use0, sx, ex))
+    ny = np.where(on_arc, qy, np.where(use0, sy, ey))
+    d = np.where(on_arc, np.abs(dist_c - r), np.minimum(d0, d1))
+    return d, nx, ny
+
+
+class GeometryIndex:
+    """
+    Uniform grid spatial index over line segments and circular arcs
+    """
+
+    MAX_CELLS_PER_AXIS = 1024
+
+    def __init__(self, lines, arcs, cell_size=None):
+        """
+        Build the index
+
+        Args:
+            lines (numpy.ndarray): (L, 4) array of x0, y0, x1, y1
+            arcs (numpy.ndarray): (A, 5) array of cx, cy, radius, start angle, CCW sweep
+            cell_size (float): Grid cell size in mm; chosen from the data if None
+
+        Primitive ids 0..L-1 refer to lines and L..L+A-1 to arcs.
+        """
+        self.lines = np.ascontiguousarray(lines, dtype=np.float64).reshape(-1, 4)
+        self.arcs = np.ascontiguousarray(arcs, dtype=np.float64).reshape(-1, 5)
+        self._arcs_ext = arc_end_points(self.arcs)
+        self.n_lines = len(self.lines)
+        m = self.n_lines + len(self.arcs)
+        if m == 0:
+            raise ValueError("Cannot index an empty geometry")
+
+        # Sample every primitive densely enough to know which cells it passes through
+        line_len = np.hypot(self.lines[:, 2] - self.lines[:, 0], self.lines[:, 3] - self.lines[:, 1])
+        arc_len = self.arcs[:, 2] * self.arcs[:, 4]
+        lengths = np.concatenate((line_len, arc_len))
+        lo, hi = self._extent()
+        self.origin = lo
+        extent = np.maximum(hi - lo, 1e-9)
+        if cell_size is None:
+            # Aim for a few primitives per occupied cell
+            cell_size = max(float(np.sqrt(extent[0] * extent[1] / m)) * 2.0, float(np.median(lengths)), 1e-6)
+        self.cell_size = max(float(cell_size), float(extent.max()) / self.MAX_CELLS_PER_AXIS)
+        self.nx = int(extent[0] // self.cell_size) + 1
+        self.ny = int(extent[1] // self.cell_size) + 1
+
+        # Sample at half-cell spacing; every point of a primitive is then within a quarter
+        # cell of a sample, so registering each sample in all cells within that radius
+        # makes the registration conservative
+        samples = np.ceil(lengths / (self.cell_size * 0.5)).astype(np.int64) + 1
+        ids = np.repeat(np.arange(m), samples)
+        first = np.cumsum(samples) - samples
+        t = (np.arange(len(ids)) - first[ids]) / np.maximum(samples[ids] - 1, 1)
+        sx, sy = np.empty(len(ids)), np.empty(len(ids))
+        is_line = ids < self.n_lines
+        li = ids[is_line]
+        sx[is_line] = self.lines[li, 0] + t[is_line] * (self.lines[li, 2] - self.lines[li, 0])
+        sy[is_line] = self.lines[li, 1] + t[is_line] * (self.lines[li, 3] - self.lines[li, 1])
+        ai = ids[~is_line] - self.n_lines
+        ang = self.arcs[ai, 3] + t[~is_line] * self.arcs[ai, 4]
+        sx[~is_line] = self.arcs[ai, 0] + self.arcs[ai, 2] * np.cos(ang)
+        sy[~is_line] = self.arcs[ai, 1] + self.arcs[ai, 2] * np.sin(ang)
+
+        h = self.cell_size * 0.25
+        keys = np.concatenate([self._cell_keys(sx + ox, sy + oy) for ox in (-h, h) for oy in (-h, h)])
+        pairs = np.unique(keys * m + np.tile(ids, 4))
+        self.cell_items = pairs % m
+        self.cell_start = np.searchsorted(pairs // m, np.arange(self.nx * self.ny + 1))
+
+    def _extent(self):
+        """Bounding box of all primitives (arcs use their full circle for simplicity)"""
+        boxes = []
+        if len(self.lines):
+            xy = self.lines.reshape(-1, 2)
+            boxes += [xy.min(axis=0), xy.max(axis=0)]
+        if len(self.arcs):
+            c, r = self.arcs[:, :2], self.arcs[:, 2:3]
+            boxes += [(c - r).min(axis=0), (c + r).max(axis=0)]
+        boxes = np.array(boxes)
+        return boxes.min(axis=0), boxes.max(axis=0)
+
+    def _cell_coords(self, x, y):
+        ix = np.clip(((np.asarray(x) - self.origin[0]) // self.cell_size).astype(np.int64), 0, self.nx - 1)
+        iy = np.clip(((np.asarray(y) - self.origin[1]) // self.cell_size).astype(np.int64), 0, self.ny - 1)
+        return ix, iy
+
+    def _cell_keys(self, x, y):
+        ix, iy = self._cell_coords(x, y)
+        return iy * self.nx + ix
+
+    def _block(self, ix0, iy0, ix1, iy1):
+        """Primitive ids registered in a rectangular block of cells (clipped to the grid)"""
+        ix0, iy0 = max(ix0, 0), max(iy0, 0)
+        ix1, iy1 = min(ix1, self.nx - 1), min(iy1, self.ny - 1)
+        if ix0 > ix1 or iy0 > iy1:
+            return np.empty(0, dtype=np.int64)
+        parts = [self.cell_items[self.cell_start[cy * self.nx + ix0]:self.cell_start[cy * self.nx + ix1 + 1]]
+                 for cy in range(iy0, iy1 + 1)]
+        return np.concatenate(parts)
+
+    def _ring(self, ix0, iy0, ix1, iy1, r):
+        """Primitive ids in the cells at Chebyshev distance exactly r from a block"""
+        if r == 0:
+            return self._block(ix0, iy0, ix1, iy1)
+        parts = [self._block(ix0 - r, iy0 - r, ix1 + r, iy0 - r),
+                 self._block(ix0 - r, iy1 + r, ix1 + r, iy1 + r),
+                 self._block(ix0 - r, iy0 - r + 1, ix0 - r, iy1 + r - 1),
+                 self._block(ix1 + r, iy0 - r + 1, ix1 + r, iy1 + r - 1)]
+        return np.concatenate(parts)
+
+    def distances(self, px, py, ids):
+        """
+        Distances from points to a set of primitives
+
+        Args:
+            px (numpy.ndarray): (K, 1) X coordinates
+            py (numpy.ndarray): (K, 1) Y coordinates
+            ids (numpy.ndarray): (C,) primitive ids
+
+        Returns:
+            tuple: (distances, nearest x, nearest y), each (K, C)
+        """
+        is_line = ids < self.n_lines
+        if is_line.all():
+            return point_segment_distances(px, py, self.lines[ids])
+        if not is_line.any():
+            return point_arc_distances(px, py, self._arcs_ext[ids - self.n_lines])
+        shape = (np.broadcast(px, ids).shape[0], len(ids))
+        d, nx, ny = np.empty(shape), np.empty(shape), np.empty(shape)
+        d[:, is_line], nx[:, is_line], ny[:, is_line] = point_segment_distances(px, py, self.lines[ids[is_line]])
+        d[:, ~is_line], nx[:, ~is_line], ny[:, ~is_line] = point_arc_distances(
+            px, py, self._arcs_ext[ids[~is_line] - self.n_lines])
+        return d, nx, ny
+
+    def nearest_many(self, points, block=1):
+        """
+        Nearest primitive for each of many points
+
+        Points are grouped into blocks of block x block cells so each group gathers its
+        candidate primitives once and evaluates them with a single broadcast.
+
+        Args:
+            points (numpy.ndarray): (K, 2) array of query points
+            block (int): Group size in cells; larger blocks suit dense queries
+
+        Returns:
+            tuple: (primitive ids (K,), distances (K,), nearest points (K, 2))
+        """
+        pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        k = len(pts)
+        out_id = np.full(k, -1, dtype=np.int64)
+        out_d = np.full(k, np.inf)
+        out_p = np.zeros((k, 2))
+        if k == 0:
+            return out_id, out_d, out_p
+
+        ix, iy = self._cell_coords(pts[:, 0], pts[:, 1])
+        bx, by = ix // block, iy // block
+        keys = by * (self.nx // block + 1) + bx
+        order = np.argsort(keys, kind="stable")
+        groups = np.split(order, np.flatnonzero(np.diff(keys[order])) + 1)
+        max_ring = max(self.nx, self.ny)
+        cs = self.cell_size
+
+        for group in groups:
+            gx0, gy0 = int(bx[group[0]]) * block, int(by[group[0]]) * block
+            gx1, gy1 = gx0 + block - 1, gy0 + block - 1
+            px, py = pts[group, 0:1], pts[group, 1:2]
+            best = np.full(len(group), np.inf)
+            best_id = np.full(len(group), -1, dtype=np.int64)
+            best_x, best_y = np.zeros(len(group)), np.zeros(len(group))
+            rows = np.arange(len(group))
+            for r in range(max_ring + 1):
+                cand = self._ring(gx0, gy0, gx1, gy1, r)
+                if len(cand):
+                    d, nx, ny = self.distances(px, py, cand)
+                    j = np.argmin(d, axis=1)
+                    dj = d[rows, j]
+                    better = dj < best
+                    best = np.where(better, dj, best)
+                    best_id = np.where(better, cand[j], best_id)
+                    best_x = np.where(better, nx[rows, j], best_x)
+                    best_y = np.where(better, ny[rows, j], best_y)
+                # Primitives not seen yet do not touch the searched cells, so they are at
+                # least as far away as the border of the searched region
+                x_lo = self.origin[0] + (gx0 - r) * cs
+                y_lo = self.origin[1] + (gy0 - r) * cs
+                x_hi = self.origin[0] + (gx1 + r + 1) * cs
+                y_hi = self.origin[1] + (gy1 + r + 1) * cs
+                border = np.minimum(np.minimum(px[:, 0] - x_lo, x_hi - px[:, 0]),
+                                    np.minimum(py[:, 0] - y_lo, y_hi - py[:, 0]))
+                if np.all(best <= border):
+                    break
+                # Once the ring covers the whole grid nothing is left to find
+                if gx0 - r <= 0 and gy0 - r <= 0 and gx1 + r >= self.nx - 1 and gy1 + r >= self.ny - 1:
+                    break
+            out_id[group] = best_id
+            out_d[group] = best
+            out_p[group, 0] = best_x
+            out_p[group, 1] = best_y
+        return out_id, out_d, out_p
+
+    def nearest(self, x, y):
+        """
+        Nearest primitive to a single point
+
+        Returns:
+            tuple: (primitive id, distance, (nearest x, nearest y))
+        """
+        ids, d, p = self.nearest_many(np.array([[x, y]]))
+        return int(ids[0]), float(d[0]), (float(p[0, 0]), float(p[0, 1]))
+
+    def items_in_rect(self, min_x, min_y, max_x, max_y):
+        """
+        Ids of primitives registered in the cells overlapping a rectangle
+
+        Returns:
+            numpy.ndarray: Unique primitive ids
+        """
+        if (max_x < self.origin[0] or max_y < self.origin[1] or
+                min_x > self.origin[0] + self.nx * self.cell_size or
+                min_y > self.origin[1] + self.ny * self.cell_size):
+            return np.empty(0, dtype=np.int64)
+        ix0, iy0 = (int(v) for v in self._cell_coords(min_x, min_y))
+        ix1, iy1 = (int(v) for v in self._cell_coords(max_x, max_y))
+        return np.unique(self._block(ix0, iy0, ix1, iy1))
+
+
+class NominalGeometry:
+    """
+    Nominal CAD geometry imported from a DXF file, held as indexed lines and arcs
+    """
+
+    SUPPORTED_TYPES = "LINE ARC CIRCLE LWPOLYLINE POLYLINE ELLIPSE SPLINE INSERT"
+
+    def __init__(self, lines, arcs, entity_ids, entity_info):
+        """
+        Initialize from primitive arrays (use NominalGeometry.from_dxf to load a file)
+
+        Args:
+            lines (numpy.ndarray): (L, 4) array of x0, y0, x1, y1
+            arcs (numpy.ndarray): (A, 5) array of cx, cy, radius, start angle, CCW sweep
+            entity_ids (numpy.ndarray): (L + A,) source entity of every primitive
+            entity_info (list): Per-entity dictionaries with 'type' and 'layer'
+        """
+        self.index = GeometryIndex(lines, arcs)
+        self.lines = self.index.lines
+        self.arcs = self.index.arcs
+        self.entity_ids = np.asarray(entity_ids, dtype=np.int64)
+        self.entity_info = entity_info
+
+    @classmethod
+    def from_dxf(cls, filename, chord_tolerance=0.001, layers=None):
+        """
+        Load a DXF file; lines and arcs are kept exact, other curves are flattened
+
+        Args:
+            filename (str): Path to the DXF file
+            chord_tolerance (float): Maximum deviation when flattening ellipses and splines (mm)
+            layers (list): Only import these layers (all layers if None)
+
+        Returns:
+            NominalGeometry: Indexed nominal geometry
+        """
+        import ezdxf
+        from ezdxf import path as ezpath
+
+        doc = ezdxf.readfile(filename)
+        lines, line_ent, arcs, arc_ent = [], [], [], []
+        entity_info = []
+
+        def add_bulge_segment(x0, y0, x1, y1, bulge, ent):
+            if abs(bulge) < 1e-12:
+                lines.append((x0, y0, x1, y1))
+                line_ent.append(ent)
+                return
+            cx, cy = bulge_centre(x0, y0, x1, y1, bulge)
+            sweep = 4.0 * math.atan(bulge)
+            radius = math.hypot(x0 - cx, y0 - cy)
+            # Store every arc counter-clockwise
+            sx, sy = (x0, y0) if sweep > 0 else (x1, y1)
+            arcs.append((cx, cy, radius, math.atan2(sy - cy, sx - cx), abs(sweep)))
+            arc_ent.append(ent)
+
+        def flatten(entity):
+            kind = entity.dxftype()
+            if kind == "INSERT":
+                for child in entity.virtual_entities():
+                    flatten(child)
+                return
+            if layers is not None and entity.dxf.layer not in layers:
+                return
+            ent = len(entity_info)
+            entity_info.append({"type": kind, "layer": entity.dxf.layer})
+            if kind == "LINE":
+                s, e = entity.dxf.start, entity.dxf.end
+                lines.append((s.x, s.y, e.x, e.y))
+                line_ent.append(ent)
+            elif kind in ("ARC", "CIRCLE"):
+                c, r = entity.dxf.center, entity.dxf.radius
+                if kind == "CIRCLE":
+                    start, sweep = 0.0, 2.0 * math.pi
+                else:
+                    start = math.radians(entity.dxf.start_angle)
+                    sweep = math.radians((entity.dxf.end_angle - entity.dxf.start_angle) % 360.0) or 2.0 * math.pi
+                arcs.append((c.x, c.y, r, start, sweep))
+                arc_ent.append(ent)
+            elif kind == "LWPOLYLINE":
+                verts = list(entity.get_points("xyb"))
+                if entity.closed and len(verts) > 1:
+                    verts.append(verts[0])
+                for (x0, y0, b), (x1, y1, _) in zip(verts[:-1], verts[1:]):
+                    add_bulge_segment(x0, y0, x1, y1, b, ent)
+            else:
+                try:
+                    v = np.array([(p.x, p.y) for p in ezpath.make_path(entity).flattening(chord_tolerance)])
+                except Exception as e:
+                    logging.warning(f"Skipping {kind} entity that could not be flattened: {e}")
+                    return
+                for row in np.hstack((v[:-1], v[1:])) if len(v) > 1 else []:
+                    lines.append(tuple(row))
+                    line_ent.append(ent)
+
+        for entity in doc.modelspace().query(cls.SUPPORTED_TYPES):
+            flatten(entity)
+
+        lines = np.array(lines, dtype=np.float64).reshape(-1, 4)
+        arcs = np.array(arcs, dtype=np.float64).reshape(-1, 5)
+        # Zero-length pieces (repeated vertices) add nothing to the outline
+        keep_l = np.hypot(lines[:, 2] - lines[:, 0], lines[:, 3] - lines[:, 1]) > 1e-12
+        keep_a = arcs[:, 2] > 1e-12
+        if not keep_l.any() and not keep_a.any():
+            raise ValueError(f"No supported geometry found in {filename}")
+        ids = np.concatenate((np.array(line_ent, dtype=np.int64)[keep_l], np.array(arc_ent, dtype=np.int64)[keep_a]))
+        geometry = cls(lines[keep_l], arcs[keep_a], ids, entity_info)
+        logging.info(f"Imported {len(entity_info)} entities ({keep_l.sum()} lines, {keep_a.sum()} arcs) from {filename}")
+        return geometry
+
+    def get_entity_count(self):
+        """
+        Get the number of imported DXF entities
+
+        Returns:
+            int: Number of entities
+        """
+        return len(self.entity_info)
+
+    def get_bounds(self):
+        """
+        Get the bounding box of the nominal geometry
+
+        Returns:
+            dict: Dictionary with min_x, min_y, max_x, max_y values
+        """
+        lo, hi = self.index._extent()
+        return {"min_x": float(lo[0]), "min_y": float(lo[1]), "max_x": float(hi[0]), "max_y": float(hi[1])}
+
+    def deviation(self, x, y):
+        """
+        Deviation of a measured point from the nominal geometry
+
+        Args:
+            x (float): Measured X coordinate
+            y (float): Measured Y coordinate
+
+        Returns:
+            dict: distance, nearest nominal point, entity index, type and layer
+        """
+        idx, dist, (nx, ny) = self.index.nearest(float(x), float(y))
+        entity = int(self.entity_ids[idx])
+        info = self.entity_info[entity]
+        return {
+            "distance": dist,
+            "nearest": {"x": nx, "y": ny},
+            "entity": entity,
+            "entity_type": info["type"],
+            "layer": info["layer"],
         }
 
+    def deviations(self, points, block=4):
+        """
+        Deviations of many measured points from the nominal geometry
+
+        Args:
+            points (numpy.ndarray): (K, 2) array of measured points
+            block (int): Query grouping in grid cells (see GeometryIndex.nearest_many)
+
+        Returns:
+            tuple: (distances (K,), nearest nominal points (K, 2), entity indices (K,))
+        """
+        idx, dist, nearest = self.index.nearest_many(points, block=block)
+        return dist, nearest, self.entity_ids[idx]
+
+    def outline_in_view(self, min_x, min_y, max_x, max_y, max_chord=0.01):
+        """
+        Polylines (machine coordinates) of the geometry that may be visible in a rectangle
+
+        Args:
+            min_x, min_y, max_x, max_y (float): View rectangle in mm
+            max_chord (float): Maximum chord error when sampling arcs (mm)
+
+        Returns:
+            list: (N, 2) arrays, one per visible primitive
+        """
+        ids = self.index.items_in_rect(min_x, min_y, max_x, max_y)
+        line_ids = ids[ids < self.index.n_lines]
+        outlines = list(self.lines[line_ids].reshape(-1, 2, 2))
+        for cx, cy, r, a0, sweep in self.arcs[ids[ids >= self.index.n_lines] - self.index.n_lines]:
+            # Chord error r(1 - cos(step/2)) <= max_chord
+            step = 2.0 * math.acos(max(-1.0, 1.0 - max_chord / r)) if r > max_chord else math.pi / 4
+            n = int(min(max(math.ceil(sweep / max(step, 1e-6)), 2), 720)) + 1
+            ang = a0 + np.linspace(0.0, sweep, n)
+            outlines.append(np.column_stack((cx + r * np.cos(ang), cy + r * np.sin(ang))))
+        return outlines
+
 
 if __name__ == "__main__":
     # Test the DXFHandler class
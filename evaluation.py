@@ -0,0 +1,516 @@
+"""
+Evaluation Module for Comparatron
+Handles GD&T-style form and position evaluation of measured point groups
+"""
+
+import logging
+import math
+import threading
+import time
+import cv2 as cv
+import numpy as np
+from geometry_fit import fit_circle_geometric
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Feature types a point group can be evaluated as
+FEATURE_KINDS = ('line', 'circle', 'point')
+
+# Circle fits with a radius beyond this multiple of the points' extent have run off to a line
+MAX_RADIUS_RATIO = 1000.0
+
+
+def convex_hull_indices(points):
+    """
+    Indices of the convex hull vertices of a point set
+
+    Args:
+        points (numpy.ndarray): (N, 2) points
+
+    Returns:
+        numpy.ndarray: Hull vertex indices into points
+    """
+    if len(points) < 3:
+        return np.arange(len(points))
+    # OpenCV needs float32; centring keeps the precision at micrometre level
+    centred = (points - points.mean(axis=0)).astype(np.float32)
+    return cv.convexHull(centred, returnPoints=False).ravel()
+
+
+def minimum_zone_straightness(points, hull=None):
+    """
+    Minimum-zone straightness: width of the narrowest strip holding all points
+
+    The narrowest strip has one side on a convex hull edge (rotating calipers),
+    so only the hull edges are tried.
+
+    Args:
+        points (numpy.ndarray): (N, 2) points
+        hull (numpy.ndarray): Precomputed hull indices (see convex_hull_indices)
+
+    Returns:
+        tuple: (width, unit direction of the strip)
+    """
+    hull_points = points[convex_hull_indices(points) if hull is None else hull]
+    if len(hull_points) < 3:
+        edge = points[-1] - points[0]
+        norm = math.hypot(*edge)
+        return 0.0, (edge / norm if norm > 0 else np.array([1.0, 0.0]))
+    edges = np.roll(hull_points, -1, axis=0) - hull_points
+    lengths = np.hypot(edges[:, 0], edges[:, 1])
+    valid = lengths > 0
+    edges, starts, lengths = edges[valid], hull_points[valid], lengths[valid]
+    best_width, best_edge = np.inf, 0
+    for first in range(0, len(edges), 512):
+        e, s = edges[first:first + 512], starts[first:first + 512]
+        # Distance of every hull vertex from every edge line, (edges, vertices)
+        rel_x = hull_points[None, :, 0] - s[:, 0:1]
+        rel_y = hull_points[None, :, 1] - s[:, 1:2]
+        widths = np.abs(e[:, 0:1] * rel_y - e[:, 1:2] * rel_x).max(axis=1) / lengths[first:first + 512]
+        i = int(np.argmin(widths))
+        if widths[i] < best_width:
+            best_width, best_edge = float(widths[i]), first + i
+    return best_width, edges[best_edge] / lengths[best_edge]
+
+
+def _nelder_mead(func, start, step, xtol=1e-10, max_iterations=500):
+    """Minimize a function of a 2D point (no derivatives needed)"""
+    simplex = np.array([start, start + (step, 0.0), start + (0.0, step)], dtype=np.float64)
+    values = np.array([func(p) for p in simplex])
+    for _ in range(max_iterations):
+        order = np.argsort(values)
+        simplex, values = simplex[order], values[order]
+        if np.abs(simplex[1:] - simplex[0]).max() <= xtol:
+            break
+        centre = simplex[:2].mean(axis=0)
+        reflected = 2.0 * centre - simplex[2]
+        f_reflected = func(reflected)
+        if f_reflected < values[0]:
+            expanded = 3.0 * centre - 2.0 * simplex[2]
+            f_expanded = func(expanded)
+            simplex[2], values[2] = (expanded, f_expanded) if f_expanded < f_reflected else (reflected, f_reflected)
+        elif f_reflected < values[1]:
+            simplex[2], values[2] = reflected, f_reflected
+        else:
+            contracted = 0.5 * (centre + simplex[2])
+            f_contracted = func(contracted)
+            if f_contracted < values[2]:
+                simplex[2], values[2] = contracted, f_contracted
+            else:
+                simplex[1:] = 0.5 * (simplex[1:] + simplex[0])
+                values[1:] = [func(p) for p in simplex[1:]]
+    best = int(np.argmin(values))
+    return simplex[best], float(values[best])
+
+
+def minimum_zone_roundness(points, start):
+    """
+    Minimum-zone roundness: smallest radial gap between two concentric circles holding all points
+
+    Args:
+        points (numpy.ndarray): (N, 2) points
+        start (tuple): Starting centre, usually the least-squares centre
+
+    Returns:
+        tuple: (roundness, centre (2,))
+    """
+    def zone(centre):
+        r = np.hypot(points[:, 0] - centre[0], points[:, 1] - centre[1])
+        return float(r.max() - r.min())
+
+    start = np.asarray(start, dtype=np.float64)
+    initial = zone(start)
+    scale = max(np.ptp(points[:, 0]), np.ptp(points[:, 1]), 1e-9)
+    centre, value = _nelder_mead(zone, start, max(initial, 1e-6 * scale), xtol=1e-9 * scale)
+    if value > initial:
+        return initial, start
+    return value, centre
+
+
+class FeatureGroup:
+    """
+    Class holding the points of one feature with incrementally updated fits
+
+    Points are appended to a growing buffer. The moment sums of the
+    least-squares line and (algebraic) circle fit and the convex hull are
+    updated per added point, so a live evaluation during digitizing only
+    needs one vectorized residual pass over the points. Results are cached
+    until the next point arrives.
+    """
+
+    def __init__(self, name, kind='line'):
+        """
+        Initialize an empty group
+
+        Args:
+            name (str): Group name
+            kind (str): Feature type ('line', 'circle' or 'point')
+        """
+        if kind not in FEATURE_KINDS:
+            raise ValueError(f"Unknown feature type {kind!r}, expected one of {', '.join(FEATURE_KINDS)}")
+        self.name = name
+        self.kind = kind
+        self.count = 0
+        self.version = 0
+        self._buffer = np.empty((64, 2))
+        self._origin = None  # Moment sums are taken relative to the first point
+        # Sums of u, v, uu, uv, vv, uw, vw, w with w = uu + vv
+        self._sums = np.zeros(8)
+        self._hull = np.empty(0, dtype=np.int64)
+        self._circle = None  # Last geometric circle fit, used as starting point
+        self._zone_centre = None  # Last minimum-zone centre, used as starting point
+        self._cache = None
+
+    @property
+    def points(self):
+        """(N, 2) view of the points"""
+        return self._buffer[:self.count]
+
+    def add_points(self, points):
+        """
+        Append points and update the running fits
+
+        Args:
+            points (numpy.ndarray): (K, 2) points in mm
+        """
+        new = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if not len(new):
+            return
+        if self.count + len(new) > len(self._buffer):
+            grown = np.empty((max(2 * len(self._buffer), self.count + len(new)), 2))
+            grown[:self.count] = self.points
+            self._buffer = grown
+        first = self.count
+        self._buffer[first:first + len(new)] = new
+        self.count += len(new)
+        if self._origin is None:
+            self._origin = new[0].copy()
+        u, v = new[:, 0] - self._origin[0], new[:, 1] - self._origin[1]
+        w = u * u + v * v
+        self._sums += (u.sum(), v.sum(), u @ u, u @ v, v @ v, u @ w, v @ w, w.sum())
+        # The hull of all points is the hull of the old hull plus the new points
+        candidates = np.concatenate((self._hull, np.arange(first, self.count)))
+        self._hull = candidates[convex_hull_indices(self.points[candidates])]
+        self.version += 1
+
+    def _line(self, result):
+        n = self.count
+        su, sv, suu, suv, svv = self._sums[:5]
+        mean = np.array([su, sv]) / n
+        cov = np.array([[suu / n - mean[0] ** 2, suv / n - mean[0] * mean[1]],
+                        [suv / n - mean[0] * mean[1], svv / n - mean[1] ** 2]])
+        direction = np.linalg.eigh(cov)[1][:, 1]
+        if direction @ (self.points[-1] - self.points[0]) < 0:
+            direction = -direction  # Point along the digitizing direction
+        centroid = mean + self._origin
+        normal = np.array([-direction[1], direction[0]])
+        rel = self.points - centroid
+        residuals = rel @ normal
+        along = rel @ direction
+        zone, _ = minimum_zone_straightness(self.points, self._hull)
+        result.update(centroid={'x': float(centroid[0]), 'y': float(centroid[1])},
+                      direction={'x': float(direction[0]), 'y': float(direction[1])},
+                      angle=math.degrees(math.atan2(direction[1], direction[0])),
+                      length=float(np.ptp(along)),
+                      straightness_ls=float(np.ptp(residuals)),
+                      straightness_mz=min(zone, float(np.ptp(residuals))))
+
+    def _kasa(self):
+        """Algebraic circle fit from the moment sums"""
+        su, sv, suu, suv, svv, suw, svw, sw = self._sums
+        a = np.array([[suu, suv, su], [suv, svv, sv], [su, sv, self.count]])
+        try:
+            p, q, c = np.linalg.solve(a, (suw, svw, sw))
+        except np.linalg.LinAlgError:
+            return None
+        cx, cy = p / 2.0, q / 2.0
+        r_sq = c + cx * cx + cy * cy
+        if not np.isfinite(r_sq) or r_sq <= 0:
+            return None
+        return cx + self._origin[0], cy + self._origin[1], math.sqrt(r_sq)
+
+    def _circle_rms(self, circle):
+        """RMS radial residual of the points for a (cx, cy, r) circle"""
+        cx, cy, r = circle
+        return float(np.sqrt(np.mean((np.hypot(self.points[:, 0] - cx, self.points[:, 1] - cy) - r) ** 2)))
+
+    def _circle_fit(self, result):
+        # Start from the Kasa fit; the previous circle only when it still fits the points better,
+        # so an early fit that diverged cannot carry over to the next points
+        starts = [c for c in (self._kasa(), self._circle) if c is not None]
+        starts.sort(key=self._circle_rms)
+        extent = float(np.hypot(*np.ptp(self.points, axis=0)))
+        circle = None
+        for start in starts or [None]:
+            circle = fit_circle_geometric(self.points, initial=start, iterations=10)
+            if circle is not None and circle[2] <= MAX_RADIUS_RATIO * extent:
+                break
+            circle = None
+        self._circle = circle
+        if circle is None:
+            result['message'] = 'Points are collinear'
+            return
+        cx, cy, r = circle
+        radial = np.hypot(self.points[:, 0] - cx, self.points[:, 1] - cy)
+        roundness_ls = float(np.ptp(radial))
+        roundness_mz, centre = minimum_zone_roundness(self.points, self._zone_centre
+                                                      if self._zone_centre is not None else (cx, cy))
+        self._zone_centre = centre
+        result.update(center={'x': cx, 'y': cy}, radius=r, diameter=2.0 * r,
+                      roundness_ls=roundness_ls, roundness_mz=min(roundness_mz, roundness_ls),
+                      center_mz={'x': float(centre[0]), 'y': float(centre[1])})
+
+    def evaluate(self):
+        """
+        Fit the feature and compute its form error (cached until points are added)
+
+        Returns:
+            dict: 'name', 'kind', 'count' and, when enough points exist:
+                line: 'centroid', 'direction', 'angle' (deg), 'length', 'straightness_ls', 'straightness_mz'
+                circle: 'center', 'radius', 'diameter', 'roundness_ls', 'roundness_mz', 'center_mz'
+                point: 'center', 'spread' (largest distance from the mean)
+        """
+        if self._cache is not None and self._cache['version'] == self.version:
+            return self._cache
+        start = time.perf_counter()
+        result = {'name': self.name, 'kind': self.kind, 'count': self.count, 'version': self.version}
+        needed = {'line': 2, 'circle': 3, 'point': 1}[self.kind]
+        if self.count < needed:
+            result['message'] = f'{needed - self.count} more point(s) needed'
+        elif self.kind == 'line':
+            self._line(result)
+        elif self.kind == 'circle':
+            self._circle_fit(result)
+        else:
+            mean = self.points.mean(axis=0)
+            result.update(center={'x': float(mean[0]), 'y': float(mean[1])},
+                          spread=float(np.hypot(*(self.points - mean).T).max()))
+        result['seconds'] = time.perf_counter() - start
+        self._cache = result
+        return result
+
+
+def _location(result):
+    """Centre of a point/circle result or centroid of a line result"""
+    key = 'centroid' if result['kind'] == 'line' else 'center'
+    if key not in result:
+        raise ValueError(f"Feature {result['name']} has no fit yet")
+    return np.array([result[key]['x'], result[key]['y']])
+
+
+def feature_distance(a, b):
+    """
+    Distance between two evaluated features
+
+    Centres (points, circles) give the centre distance, a centre and a line the
+    perpendicular distance, two lines the perpendicular distance of the second
+    line's centroid from the first line.
+
+    Args:
+        a (dict): Evaluation result of the first feature
+        b (dict): Evaluation result of the second feature
+
+    Returns:
+        dict: 'distance' and, for centre-to-centre distances, 'dx' and 'dy'
+    """
+    if a['kind'] != 'line' and b['kind'] == 'line':
+        a, b = b, a
+    pa, pb = _location(a), _location(b)
+    if a['kind'] == 'line':
+        normal = np.array([-a['direction']['y'], a['direction']['x']])
+        return {'distance': float(abs((pb - pa) @ normal))}
+    delta = pb - pa
+    return {'distance': float(math.hypot(*delta)), 'dx': float(delta[0]), 'dy': float(delta[1])}
+
+
+def line_angle(a, b):
+    """
+    Angle between two evaluated lines
+
+    Returns:
+        dict: 'angle' from a to b (degrees, counter-clockwise, -180..180 along the
+            digitizing directions) and the 'acute' angle between the lines (0..90)
+    """
+    if a['kind'] != 'line' or b['kind'] != 'line':
+        raise ValueError("Angles are only defined between lines")
+    _location(a), _location(b)
+    da = np.array([a['direction']['x'], a['direction']['y']])
+    db = np.array([b['direction']['x'], b['direction']['y']])
+    angle = math.degrees(math.atan2(da[0] * db[1] - da[1] * db[0], da @ db))
+    acute = abs(angle) % 180.0
+    return {'angle': angle, 'acute': min(acute, 180.0 - acute)}
+
+
+def true_position(result, nominal_x, nominal_y, tolerance=None):
+    """
+    True position of a point or circle feature
+
+    Args:
+        result (dict): Evaluation result
+        nominal_x (float): Nominal X of the feature centre
+        nominal_y (float): Nominal Y of the feature centre
+        tolerance (float): Positional tolerance zone diameter, optional
+
+    Returns:
+        dict: 'dx', 'dy', 'position' (diameter of the zone through the actual centre)
+            and 'in_tolerance' (None without a tolerance)
+    """
+    if result['kind'] == 'line':
+        raise ValueError("True position needs a point or circle feature")
+    dx, dy = _location(result) - (nominal_x, nominal_y)
+    position = 2.0 * math.hypot(dx, dy)
+    return {'dx': float(dx), 'dy': float(dy), 'position': position,
+            'in_tolerance': None if tolerance is None else position <= tolerance}
+
+
+class EvaluationEngine:
+    """
+    Class managing the named point groups of one station
+
+    Recorded points go to the active group; results of groups and of relations
+    between groups (distance, angle, true position) are cached by the group
+    versions, so repeated UI polls cost nothing until a new point arrives.
+    """
+
+    RELATIONS = ('distance', 'angle', 'position')
+
+    def __init__(self):
+        self.groups = {}
+        self.active = None
+        self._relations = {}
+        self._lock = threading.Lock()
+
+    def create_group(self, name, kind='line', activate=True):
+        """
+        Create (or replace) a group
+
+        Args:
+            name (str): Group name
+            kind (str): Feature type, see FEATURE_KINDS
+            activate (bool): Send the following recorded points to this group
+
+        Returns:
+            dict: Evaluation of the empty group
+        """
+        name = str(name).strip()
+        if not name:
+            raise ValueError("Group name must not be empty")
+        group = FeatureGroup(name, kind)
+        with self._lock:
+            self.groups[name] = group
+            self._relations.clear()  # A replaced group restarts its version count
+            if activate:
+                self.active = name
+            return group.evaluate()
+
+    def remove_group(self, name):
+        """Delete a group; returns False if it does not exist"""
+        with self._lock:
+            if self.groups.pop(name, None) is None:
+                return False
+            self._relations.clear()
+            if self.active == name:
+                self.active = None
+            return True
+
+    def set_active(self, name):
+        """Select the group receiving recorded points (None to stop)"""
+        if name is not None and name not in self.groups:
+            raise KeyError(name)
+        self.active = name
+
+    def add_points(self, name, points):
+        """
+        Add points to a group
+
+        Returns:
+            dict: Updated evaluation of the group
+        """
+        with self._lock:
+            group = self.groups[name]
+            group.add_points(points)
+            return group.evaluate()
+
+    def add_point(self, x, y):
+        """
+        Add a recorded point to the active group
+
+        Returns:
+            dict: Updated evaluation of the active group, None if no group is active
+        """
+        name = self.active
+        if name is None or name not in self.groups:
+            return None
+        return self.add_points(name, [(x, y)])
+
+    def evaluate(self, name):
+        """Evaluation of one group (KeyError if unknown)"""
+        with self._lock:
+            return self.groups[name].evaluate()
+
+    def evaluate_all(self):
+        """Evaluations of all groups in creation order"""
+        with self._lock:
+            return [group.evaluate() for group in self.groups.values()]
+
+    def relation(self, kind, a, b=None, nominal=None, tolerance=None):
+        """
+        Evaluate a relation between groups
+
+        Args:
+            kind (str): 'distance' or 'angle' (between a and b) or 'position' (of a)
+            a (str): First group
+            b (str): Second group for distance and angle
+            nominal (tuple): (x, y) nominal centre for position
+            tolerance (float): Positional tolerance for position
+
+        Returns:
+            dict: Relation result with the group names
+        """
+        if kind not in self.RELATIONS:
+            raise ValueError(f"Unknown relation {kind!r}, expected one of {', '.join(self.RELATIONS)}")
+        with self._lock:
+            first = self.groups[a]
+            second = self.groups[b] if kind != 'position' else None
+            key = (kind, a, b, tuple(nominal) if nominal is not None else None, tolerance)
+            versions = (first.version, second.version if second else None)
+            cached = self._relations.get(key)
+            if cached is not None and cached[0] == versions:
+                return cached[1]
+            if kind == 'distance':
+                result = feature_distance(first.evaluate(), second.evaluate())
+            elif kind == 'angle':
+                result = line_angle(first.evaluate(), second.evaluate())
+            else:
+                if nominal is None:
+                    raise ValueError("True position needs the nominal centre")
+                result = true_position(first.evaluate(), float(nominal[0]), float(nominal[1]), tolerance)
+            result = dict(result, relation=kind, a=a, b=b)
+            self._relations[key] = (versions, result)
+            return result
+
+    def clear(self):
+        """Remove all groups"""
+        with self._lock:
+            self.groups.clear()
+            self._relations.clear()
+            self.active = None
+
+
+if __name__ == "__main__":
+    # Digitize a noisy edge and hole point by point and watch the live results
+    rng = np.random.default_rng(0)
+    engine = EvaluationEngine()
+    engine.create_group('edge', 'line')
+    for x in np.linspace(0, 50, 200):
+        live = engine.add_point(x, 0.5 + 0.01 * x + rng.normal(0, 0.002))
+    print(f"Edge: angle {live['angle']:.4f} deg, straightness LS {live['straightness_ls'] * 1000:.1f} um, "
+          f"MZ {live['straightness_mz'] * 1000:.1f} um ({live['seconds'] * 1000:.2f} ms per update)")
+    engine.create_group('hole', 'circle')
+    for a in np.linspace(0, 2 * math.pi, 360, endpoint=False):
+        live = engine.add_point(20 + 5 * math.cos(a) + 0.003 * math.cos(3 * a), 10 + 5 * math.sin(a))
+    print(f"Hole: diameter {live['diameter']:.4f}, roundness LS {live['roundness_ls'] * 1000:.2f} um, "
+          f"MZ {live['roundness_mz'] * 1000:.2f} um ({live['seconds'] * 1000:.2f} ms per update)")
+    print(engine.relation('distance', 'edge', 'hole'))
+    print(engine.relation('position', 'hole', nominal=(20.0, 10.0), tolerance=0.05))
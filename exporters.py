@@ -0,0 +1,455 @@
+"""
+Export Module for Comparatron
+Pluggable exporters (SVG, CSV, NumPy, G-code, DXF) reading from the DXFHandler point store
+"""
+
+import math
+import logging
+import numpy as np
+from geometry_fit import bulge_centre
+from profiling import timed
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Registry of exporter classes keyed by format name
+EXPORTERS = {}
+
+
+def register_exporter(cls):
+    """
+    Class decorator that adds an exporter to the registry
+
+    Args:
+        cls (type): Exporter class with a format_name attribute
+
+    Returns:
+        type: The class, unchanged
+    """
+    EXPORTERS[cls.format_name] = cls
+    return cls
+
+
+def get_exporter(format_name, **options):
+    """
+    Create an exporter instance for a format name or file extension
+
+    Args:
+        format_name (str): Format name ('svg', 'csv', ...) or extension ('.svg')
+        **options: Keyword arguments passed to the exporter
+
+    Returns:
+        BaseExporter: Exporter instance, or None if the format is unknown
+    """
+    key = format_name.lower().lstrip('.')
+    if key in EXPORTERS:
+        return EXPORTERS[key](**options)
+    for cls in EXPORTERS.values():
+        if key in cls.extensions:
+            return cls(**options)
+    return None
+
+
+def available_formats():
+    """
+    List the registered export formats
+
+    Returns:
+        list: Dictionaries with name, extensions and description
+    """
+    return [{"name": cls.format_name, "extensions": list(cls.extensions), "description": cls.description}
+            for cls in EXPORTERS.values()]
+
+
+class ExportTransform:
+    """
+    Common bounds/transform pipeline shared by all exporters
+    """
+
+    def __init__(self, offset=(0.0, 0.0), scale=1.0, flip_y=False, normalize=False, stages=None):
+        """
+        Initialize the transform
+
+        Args:
+            offset (tuple): (dx, dy) added after scaling, in output units
+            scale (float): Multiplier applied to all coordinates (e.g. 1/25.4 for inches)
+            flip_y (bool): Mirror the Y axis
+            normalize (bool): Move the lower-left corner of the bounds to the origin (see fit())
+            stages (list): Extra callables taking and returning an (N, 2) array,
+                applied before scaling (e.g. error compensation)
+        """
+        self.offset = np.asarray(offset, dtype=np.float64)
+        self.scale = float(scale)
+        self.flip_y = flip_y
+        self.normalize = normalize
+        self.stages = list(stages or [])
+        self.origin = None  # Lower-left corner removed by normalize, fixed by fit()
+
+    def _transform(self, points):
+        """Stages, scaling and mirroring: everything up to normalization"""
+        pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        for stage in self.stages:
+            pts = stage(pts)
+        pts = pts * self.scale
+        if self.flip_y:
+            pts[:, 1] *= -1.0
+        return pts
+
+    def fit(self, points, shapes=()):
+        """
+        Fix the normalization offset from the bounds of everything exported
+
+        Points and shapes then share one origin, so circles and polylines keep
+        their position relative to the points.
+
+        Args:
+            points (numpy.ndarray): (N, 2) points in machine coordinates
+            shapes (list): Shape dictionaries (circle centres and polyline vertices count)
+        """
+        coords = [np.asarray(points, dtype=np.float64).reshape(-1, 2)]
+        for shape in shapes:
+            if shape["type"] == "circle":
+                coords.append(np.asarray([shape["center"]], dtype=np.float64))
+            elif shape["type"] == "polyline" and shape["vertices"]:
+                coords.append(np.asarray([v[:2] for v in shape["vertices"]], dtype=np.float64))
+        pts = self._transform(np.vstack(coords))
+        self.origin = pts.min(axis=0) if len(pts) else np.zeros(2)
+
+    def apply(self, points):
+        """
+        Apply the transform to an (N, 2) array
+
+        Args:
+            points (numpy.ndarray): Input points in machine coordinates
+
+        Returns:
+            numpy.ndarray: Transformed copy of the points
+        """
+        pts = self._transform(points)
+        if self.normalize and len(pts):
+            # Without fit() the points normalize on their own bounds
+            pts -= self.origin if self.origin is not None else pts.min(axis=0)
+        return pts + self.offset
+
+    def apply_length(self, length):
+        """Scale a length (e.g. a circle radius) into output units"""
+        return length * abs(self.scale)
+
+    def apply_shape(self, shape):
+        """Return a copy of a shape dictionary in output coordinates"""
+        out = {k: v for k, v in shape.items() if k != "entity"}
+        if shape["type"] == "circle":
+            out["center"] = tuple(self.apply([shape["center"]])[0])
+            out["radius"] = self.apply_length(shape["radius"])
+        elif shape["type"] == "polyline":
+            xy = self.apply([v[:2] for v in shape["vertices"]])
+            # Mirroring reverses the arc direction, so the bulge sign flips too
+            sign = -1.0 if self.flip_y != (self.scale < 0) else 1.0
+            out["vertices"] = [(x, y, sign * v[2]) for (x, y), v in zip(xy, shape["vertices"])]
+        return out
+
+    @property
+    def is_identity(self):
+        return (not self.stages and self.scale == 1.0 and not self.flip_y and not self.normalize
+                and not self.offset.any())
+
+    @staticmethod
+    def bounds(points):
+        """
+        Compute the bounding box of an (N, 2) array
+
+        Returns:
+            dict: Dictionary with min_x, min_y, max_x, max_y values
+        """
+        if len(points) == 0:
+            return {"min_x": 0.0, "min_y": 0.0, "max_x": 0.0, "max_y": 0.0}
+        lo = points.min(axis=0)
+        hi = points.max(axis=0)
+        return {"min_x": float(lo[0]), "min_y": float(lo[1]), "max_x": float(hi[0]), "max_y": float(hi[1])}
+
+
+class BaseExporter:
+    """
+    Base class for exporters; subclasses implement write()
+    """
+
+    format_name = None
+    extensions = ()
+    description = ""
+    binary = False
+
+    def __init__(self, transform=None, chunk_size=4096, **options):
+        """
+        Initialize the exporter
+
+        Args:
+            transform (ExportTransform): Transform pipeline, identity if None
+            chunk_size (int): Number of points written per chunk
+            **options: Format specific options
+        """
+        self.transform = transform or ExportTransform()
+        self.chunk_size = max(1, int(chunk_size))
+        self.options = options
+
+    def export(self, source, filename):
+        """
+        Export the points held by a DXFHandler to a file
+
+        Args:
+            source (DXFHandler): Point store to read from
+            filename (str): Output path
+
+        Returns:
+            bool: True if export successful, False otherwise
+        """
+        try:
+            points = source.get_point_array()
+            shapes = getattr(source, "shapes", [])
+            self.transform.fit(points, shapes)
+            points = self.transform.apply(points)
+            shapes = [self.transform.apply_shape(s) for s in shapes]
+            with open(filename, "wb" if self.binary else "w") as f:
+                self.write(f, points, shapes, source)
+            print(f"{self.format_name.upper()} exported to: {filename}")
+            return True
+        except Exception as e:
+            logging.error(f"Error exporting {self.format_name} to {filename}: {e}")
+            print(f"Error exporting {self.format_name} to {filename}: {e}")
+            return False
+
+    def iter_chunks(self, points):
+        """Yield consecutive slices (views) of the point array"""
+        for start in range(0, len(points), self.chunk_size):
+            yield start, points[start:start + self.chunk_size]
+
+    def write(self, f, points, shapes, source):
+        """Write the transformed data to an open file"""
+        raise NotImplementedError
+
+
+@register_exporter
+class CSVExporter(BaseExporter):
+    """Comma separated index,x,y rows"""
+
+    format_name = "csv"
+    extensions = ("csv",)
+    description = "Comma separated values (index, x, y)"
+
+    def write(self, f, points, shapes, source):
+        precision = int(self.options.get("precision", 4))
+        f.write("index,x,y\n")
+        for start, chunk in self.iter_chunks(points):
+            block = np.column_stack((np.arange(start, start + len(chunk)), chunk))
+            np.savetxt(f, block, fmt=["%d", f"%.{precision}f", f"%.{precision}f"], delimiter=",")
+
+
+@register_exporter
+class NumpyExporter(BaseExporter):
+    """Raw (N, 2) float64 array, loadable zero-copy with np.load(mmap_mode='r')"""
+
+    format_name = "npy"
+    extensions = ("npy",)
+    description = "NumPy array (N x 2 float64)"
+    binary = True
+
+    def write(self, f, points, shapes, source):
+        np.save(f, np.ascontiguousarray(points, dtype=np.float64))
+
+
+@register_exporter
+class NumpyArchiveExporter(BaseExporter):
+    """NumPy archive with the points, bounds and circle shapes"""
+
+    format_name = "npz"
+    extensions = ("npz",)
+    description = "NumPy archive (points, bounds, circles)"
+    binary = True
+
+    def write(self, f, points, shapes, source):
+        b = ExportTransform.bounds(points)
+        circles = np.array([(s["center"][0], s["center"][1], s["radius"]) for s in shapes if s["type"] == "circle"],
+                           dtype=np.float64).reshape(-1, 3)
+        np.savez(f, points=points, bounds=np.array([b["min_x"], b["min_y"], b["max_x"], b["max_y"]]),
+                 circles=circles)
+
+
+@register_exporter
+class SVGExporter(BaseExporter):
+    """SVG drawing for browser preview"""
+
+    format_name = "svg"
+    extensions = ("svg",)
+    description = "Scalable Vector Graphics preview"
+
+    def write(self, f, points, shapes, source):
+        margin = float(self.options.get("margin", 2.0))
+        marker = float(self.options.get("marker_radius", 0.2))
+        connect = self.options.get("connect", True)
+        # SVG has Y pointing down: mirror about the bounds so the drawing is upright
+        b = ExportTransform.bounds(points)
+        for s in shapes:
+            if s["type"] == "circle":
+                (cx, cy), r = s["center"], s["radius"]
+                b = {"min_x": min(b["min_x"], cx - r), "min_y": min(b["min_y"], cy - r),
+                     "max_x": max(b["max_x"], cx + r), "max_y": max(b["max_y"], cy + r)}
+        width = b["max_x"] - b["min_x"] + 2 * margin
+        height = b["max_y"] - b["min_y"] + 2 * margin
+        x0, y1 = b["min_x"] - margin, b["max_y"] + margin
+
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{width:.4f}mm" height="{height:.4f}mm" '
+                f'viewBox="0 0 {width:.4f} {height:.4f}">\n')
+        f.write(f'<g transform="matrix(1 0 0 -1 {-x0:.4f} {y1:.4f})" fill="none" stroke="#0050c8" '
+                f'stroke-width="{marker / 2:.4f}">\n')
+        if connect and len(points) > 1:
+            f.write('<polyline points="')
+            for _, chunk in self.iter_chunks(points):
+                f.write(" ".join(f"{x:.4f},{y:.4f}" for x, y in chunk))
+                f.write(" ")
+            f.write('"/>\n')
+        for _, chunk in self.iter_chunks(points):
+            f.write("".join(f'<circle cx="{x:.4f}" cy="{y:.4f}" r="{marker:.4f}" fill="#c80000" stroke="none"/>\n'
+                            for x, y in chunk))
+        for s in shapes:
+            if s["type"] == "circle":
+                f.write(f'<circle cx="{s["center"][0]:.4f}" cy="{s["center"][1]:.4f}" r="{s["radius"]:.4f}"/>\n')
+            elif s["type"] == "polyline":
+                f.write(f'<path d="{svg_path_from_vertices(s["vertices"], s["closed"])}"/>\n')
+        f.write('</g>\n</svg>\n')
+
+
+@register_exporter
+class GCodeExporter(BaseExporter):
+    """G-code toolpath tracing the recorded outline"""
+
+    format_name = "gcode"
+    extensions = ("gcode", "nc", "ngc")
+    description = "G-code outline toolpath"
+
+    def write(self, f, points, shapes, source):
+        feed = float(self.options.get("feed_rate", 200))
+        safe_z = self.options.get("safe_z")
+        fit_tolerance = self.options.get("fit_tolerance")
+
+        f.write("(Comparatron outline export)\nG21\nG90\n")
+        if fit_tolerance:
+            # Reuse the fitted geometry so arcs become native G2/G3 moves
+            from geometry_fit import fit_geometry
+            entities = fit_geometry(points, tolerance=float(fit_tolerance))
+        else:
+            entities = [{"type": "trace", "points": points}]
+        for entity in entities + shapes:
+            self._write_entity(f, entity, feed, safe_z)
+        f.write("M2\n")
+
+    def _rapid(self, f, x, y, safe_z):
+        if safe_z is not None:
+            f.write(f"G0Z{float(safe_z):.3f}\n")
+        f.write(f"G0X{x:.4f}Y{y:.4f}\n")
+
+    def _write_entity(self, f, entity, feed, safe_z):
+        kind = entity["type"]
+        if kind == "trace":
+            pts = entity["points"]
+            if len(pts) == 0:
+                return
+            self._rapid(f, pts[0, 0], pts[0, 1], safe_z)
+            f.write(f"G1F{feed:g}\n")
+            for _, chunk in self.iter_chunks(pts[1:]):
+                f.write("".join(f"G1X{x:.4f}Y{y:.4f}\n" for x, y in chunk))
+        elif kind == "point":
+            self._rapid(f, entity["x"], entity["y"], safe_z)
+        elif kind == "circle":
+            (cx, cy), r = entity["center"], entity["radius"]
+            self._rapid(f, cx + r, cy, safe_z)
+            f.write(f"G3X{cx + r:.4f}Y{cy:.4f}I{-r:.4f}J0F{feed:g}\n")
+        elif kind == "polyline":
+            verts = list(entity["vertices"])
+            if not verts:
+                return
+            self._rapid(f, verts[0][0], verts[0][1], safe_z)
+            f.write(f"G1F{feed:g}\n")
+            targets = verts[1:] + (verts[:1] if entity["closed"] else [])
+            for (x0, y0, bulge), (x1, y1, _) in zip(verts, targets):
+                if abs(bulge) < 1e-9:
+                    f.write(f"G1X{x1:.4f}Y{y1:.4f}\n")
+                else:
+                    cx, cy = bulge_centre(x0, y0, x1, y1, bulge)
+                    code = "G3" if bulge > 0 else "G2"
+                    f.write(f"{code}X{x1:.4f}Y{y1:.4f}I{cx - x0:.4f}J{cy - y0:.4f}\n")
+
+
+@register_exporter
+class DXFExporter(BaseExporter):
+    """DXF through DXFHandler (points, or fitted geometry)"""
+
+    format_name = "dxf"
+    extensions = ("dxf",)
+    description = "AutoCAD DXF"
+
+    def export(self, source, filename):
+        return source.export_dxf(filename,
+                                 fit_geometry=bool(self.options.get("fit_geometry", False)),
+                                 tolerance=float(self.options.get("tolerance", 0.01)),
+                                 transform=None if self.transform.is_identity else self.transform)
+
+
+def svg_path_from_vertices(vertices, closed):
+    """
+    Build an SVG path string for polyline vertices with bulges
+
+    Returns:
+        str: SVG path data
+    """
+    verts = list(vertices)
+    parts = [f"M{verts[0][0]:.4f},{verts[0][1]:.4f}"]
+    targets = verts[1:] + (verts[:1] if closed else [])
+    for (x0, y0, bulge), (x1, y1, _) in zip(verts, targets):
+        if abs(bulge) < 1e-9:
+            parts.append(f"L{x1:.4f},{y1:.4f}")
+        else:
+            sweep = 4.0 * math.atan(bulge)
+            r = math.hypot(x1 - x0, y1 - y0) / (2.0 * abs(math.sin(sweep / 2.0)))
+            large = 1 if abs(sweep) > math.pi else 0
+            # SVG sweep-flag 1 is the positive-angle direction of the user coordinate system
+            parts.append(f"A{r:.4f},{r:.4f} 0 {large} {1 if bulge > 0 else 0} {x1:.4f},{y1:.4f}")
+    if closed:
+        parts.append("Z")
+    return " ".join(parts)
+
+
+@timed('export.points')
+def export_points(source, filename, format_name=None, transform=None, **options):
+    """
+    Export a point store using the exporter registered for a format
+
+    Args:
+        source (DXFHandler): Point store
+        filename (str): Output path; its extension selects the format if format_name is None
+        format_name (str): Explicit format name
+        transform (ExportTransform): Shared transform pipeline
+        **options: Format specific options
+
+    Returns:
+        bool: True if export successful, False otherwise
+    """
+    if format_name is None:
+        format_name = filename.rsplit(".", 1)[-1] if "." in filename else ""
+    exporter = get_exporter(format_name, transform=transform, **options)
+    if exporter is None:
+        print(f"Unknown export format: {format_name}")
+        return False
+    return exporter.export(source, filename)
+
+
+if __name__ == "__main__":
+    # Test the exporters with a few points
+    from dxf_handler import DXFHandler
+
+    handler = DXFHandler()
+    handler.add_points_from_list([(0, 0), (10, 0), (10, 10), (0, 10)])
+    handler.add_circle(5, 5, 2)
+    print(f"Formats: {[f['name'] for f in available_formats()]}")
+    # Exports are commented out to avoid creating files during testing
+    # for name in EXPORTERS:
+    #     export_points(handler, f"test_output.{name}")
@@ -0,0 +1,333 @@
+"""
+Focus Stack Module for Comparatron
+Handles extended depth of field capture: a Z sweep fused into an all-in-focus image and a coarse height map
+"""
+
+import logging
+import time
+import cv2 as cv
+import numpy as np
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Frame rate assumed when too few frames arrive before the sweep to measure it
+DEFAULT_FPS = 15.0
+
+# Most frames one sweep may collect; every frame is kept until fusion (640x480 BGR: ~0.9 MB each)
+MAX_FRAMES = 300
+
+
+def focus_energy(frame, block=16):
+    """
+    Laplacian energy (mean squared Laplacian) of every block of a frame
+
+    Args:
+        frame (numpy.ndarray): BGR or grayscale frame
+        block (int): Block size in pixels
+
+    Returns:
+        numpy.ndarray: (rows, cols) float32 energy, one value per whole block
+    """
+    gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    rows, cols = gray.shape[0] // block, gray.shape[1] // block
+    laplacian = cv.Laplacian(gray[:rows * block, :cols * block], cv.CV_32F, ksize=3)
+    # INTER_AREA with an integer factor is the block mean
+    return cv.resize(laplacian * laplacian, (cols, rows), interpolation=cv.INTER_AREA)
+
+
+def _peak_index(energy):
+    """
+    Sub-frame index of the energy maximum of every block
+
+    A parabola through the log energy of the best frame and its neighbours
+    (exact for a Gaussian focus curve) refines the index between frames.
+
+    Args:
+        energy (numpy.ndarray): (frames, rows, cols) block energies
+
+    Returns:
+        tuple: (index, confidence) maps; confidence is 1 - median/peak energy
+    """
+    count = energy.shape[0]
+    best = energy.argmax(axis=0)
+    log = np.log(energy + 1e-3)
+    inner = np.clip(best, 1, max(count - 2, 1))
+    if count >= 3:
+        below, at, above = (np.take_along_axis(log, (inner + d)[None], axis=0)[0] for d in (-1, 0, 1))
+        curvature = below - 2 * at + above
+        with np.errstate(divide='ignore', invalid='ignore'):
+            offset = np.where(curvature < 0, 0.5 * (below - above) / curvature, 0.0)
+        # Peaks on the first or last frame are not bracketed; keep them on that frame
+        offset = np.where(inner == best, np.clip(offset, -0.5, 0.5), 0.0)
+    else:
+        offset = np.zeros(best.shape)
+    peak = np.take_along_axis(energy, best[None], axis=0)[0]
+    confidence = 1.0 - np.median(energy, axis=0) / np.maximum(peak, 1e-6)
+    return (best + offset).astype(np.float32), confidence.astype(np.float32)
+
+
+def smooth_index(index, confidence, min_confidence=0.3, sigma=2.0):
+    """
+    Smooth the sharpest-frame index map
+
+    A 3x3 median removes single-block outliers without rounding off height
+    steps; blocks without enough texture to judge focus take a
+    confidence-weighted Gaussian average of their neighbours.
+
+    Args:
+        index (numpy.ndarray): Sub-frame index per block
+        confidence (numpy.ndarray): Focus confidence per block (0-1)
+        min_confidence (float): Confidence below which a block is filled in from its neighbours
+        sigma (float): Width of the fill-in average in blocks
+
+    Returns:
+        numpy.ndarray: Smoothed float32 index map
+    """
+    median = cv.medianBlur(index.astype(np.float32), 3) if min(index.shape) >= 3 else index.astype(np.float32)
+    weight = np.where(confidence >= min_confidence, confidence, 0.0).astype(np.float32)
+    if not weight.any():
+        return median
+    weighted = cv.GaussianBlur(median * weight, (0, 0), sigma)
+    total = cv.GaussianBlur(weight, (0, 0), sigma)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        filled = np.where(total > 1e-6, weighted / total, median)
+    return np.where(weight > 0, median, filled).astype(np.float32)
+
+
+def fuse_stack(frames, z_values, block=16, min_confidence=0.3, sigma=2.0, energies=None):
+    """
+    Fuse a focus stack into an all-in-focus image and a height map
+
+    Every block takes the frame with the highest Laplacian energy; the
+    smoothed, sub-frame index map is interpolated to pixels and each pixel
+    blends the two frames around its index. Pixels are gathered frame by
+    frame, so the frames are never copied into one stack array.
+
+    Args:
+        frames (list): Frames of equal shape
+        z_values (list): Z position of every frame in mm
+        block (int): Block size of the focus measure and height map in pixels
+        min_confidence (float): Blocks below this confidence are filled in from their neighbours
+        sigma (float): Width of the fill-in average in blocks
+        energies (list): focus_energy of every frame if already computed (e.g. during the sweep)
+
+    Returns:
+        dict: 'image' (fused frame), 'height' (Z of best focus per block, mm),
+            'confidence' per block, 'block', 'frames' and 'z_range'
+    """
+    if len(frames) < 2:
+        raise ValueError("A focus stack needs at least two frames")
+    z_values = np.asarray(z_values, dtype=np.float64)
+    order = np.argsort(z_values, kind='stable')
+    z_sorted = z_values[order]
+    if energies is None:
+        energies = [focus_energy(frame, block) for frame in frames]
+    index, confidence = _peak_index(np.stack([energies[i] for i in order]))
+    index = smooth_index(index, confidence, min_confidence, sigma)
+    height = np.interp(index, np.arange(len(z_sorted)), z_sorted).astype(np.float32)
+
+    # Block centres sit at pixel centres of the upsampled map, the uncovered border repeats the edge
+    h, w = frames[0].shape[:2]
+    rows, cols = index.shape
+    pixel_index = cv.resize(index, (cols * block, rows * block), interpolation=cv.INTER_LINEAR)
+    pixel_index = cv.copyMakeBorder(pixel_index, 0, h - rows * block, 0, w - cols * block, cv.BORDER_REPLICATE)
+    lower = np.clip(np.floor(pixel_index).astype(np.intp), 0, len(frames) - 1).ravel()
+    upper = np.minimum(lower + 1, len(frames) - 1)
+    fraction = (pixel_index.ravel() - lower).astype(np.float32)[:, None]
+    fused = np.zeros((h * w, frames[0].size // (h * w)), dtype=np.float32)
+    # Pixel indices grouped by the sorted frame they read from
+    for neighbour, weight in ((lower, 1.0 - fraction), (upper, fraction)):
+        pixels = np.argsort(neighbour, kind='stable')
+        bounds = np.concatenate(([0], np.cumsum(np.bincount(neighbour, minlength=len(frames)))))
+        for k, i in enumerate(order):
+            group = pixels[bounds[k]:bounds[k + 1]]
+            if len(group):
+                fused[group] += frames[i].reshape(h * w, -1)[group] * weight[group]
+    image = np.clip(fused + 0.5, 0, 255).astype(np.uint8).reshape(frames[0].shape)
+    return {
+        'image': image,
+        'height': height,
+        'confidence': confidence,
+        'block': block,
+        'frames': len(frames),
+        'z_range': (float(z_sorted[0]), float(z_sorted[-1]))
+    }
+
+
+class FocusStack:
+    """
+    Class capturing a focus stack with one continuous Z sweep
+
+    The sweep is a single streamed G1 move; while it runs, status reports are
+    polled and every new camera frame is collected. Each frame gets the Z
+    interpolated from the reports at its capture time, so no stop-and-settle
+    per slice is needed.
+    """
+
+    def __init__(self, controller, grab_frames, poll_interval=0.02):
+        """
+        Initialize
+
+        Args:
+            controller (MachineController): Machine to sweep
+            grab_frames (callable): grab_frames(after) -> [(capture time, frame copy), ...] newer than after
+            poll_interval (float): Delay between status reports during the sweep (s)
+        """
+        self.controller = controller
+        self.grab_frames = grab_frames
+        self.poll_interval = poll_interval
+
+    def _sample(self, samples):
+        """Query the position and remember (time, z) at the middle of the round trip"""
+        before = time.time()
+        status = self.controller.get_current_position()
+        after = time.time()
+        if status and 'z' in status:
+            samples.append((0.5 * (before + after), status['z']))
+        return status
+
+    def measure_fps(self, duration=0.3):
+        """
+        Frame rate of the camera, measured from the frames of a short wait
+
+        Args:
+            duration (float): Collection time in seconds
+
+        Returns:
+            float: Frames per second, DEFAULT_FPS if too few frames arrived
+        """
+        times = []
+        after = time.time()
+        deadline = after + duration
+        while time.time() < deadline:
+            for frame_time, _ in self.grab_frames(after):
+                times.append(frame_time)
+                after = frame_time
+            time.sleep(self.poll_interval)
+        if len(times) < 3:
+            return DEFAULT_FPS
+        return (len(times) - 1) / (times[-1] - times[0])
+
+    def sweep(self, z_start, z_end, feed_rate, job=None, latency=0.0, timeout=None, block=16):
+        """
+        Run one Z sweep and collect frames stamped with their Z
+
+        The focus energy of every frame is computed as it arrives.
+
+        Args:
+            z_start (float): Sweep start Z in work coordinates (mm), moved to first
+            z_end (float): Sweep end Z in mm
+            feed_rate (float): Sweep feed rate in mm/min
+            job (Job): Job whose cancellation stops the collection (optional)
+            latency (float): Time from a frame's capture stamp to its exposure (s)
+            timeout (float): Longest sweep time, defaults to twice the nominal duration plus 5 s
+            block (int): Block size of the focus measure in pixels
+
+        Returns:
+            tuple: (frames, z values, focus energies) ordered by capture time
+        """
+        if not self.controller.execute(['G90', f'G0Z{z_start:.4f}']):
+            raise RuntimeError("Move to the sweep start was not accepted")
+        if self.controller.wait_for_idle() is None:
+            raise RuntimeError("Machine did not reach the sweep start")
+
+        samples = []
+        frames = []
+        self._sample(samples)
+        after = samples[-1][0] if samples else time.time()
+        if timeout is None:
+            timeout = 2 * abs(z_end - z_start) / feed_rate * 60 + 5
+        if not self.controller.execute([f'G1Z{z_end:.4f}F{feed_rate:.1f}']):
+            raise RuntimeError("Sweep move was not accepted")
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            status = self._sample(samples)
+            for frame_time, frame in self.grab_frames(after):
+                if len(frames) >= MAX_FRAMES:
+                    raise RuntimeError(f"Focus sweep exceeded {MAX_FRAMES} frames; raise the Z step or feed rate")
+                frames.append((frame_time, frame, focus_energy(frame, block)))
+                after = frame_time
+            if job is not None and job.cancelled:
+                break
+            if status and status['state'].startswith('Alarm'):
+                raise RuntimeError("Machine alarm during the focus sweep")
+            if status and status['state'].startswith('Idle') and abs(status['z'] - z_end) < 1e-3:
+                break
+            time.sleep(self.poll_interval)
+        else:
+            logging.warning("Focus sweep timed out")
+
+        if len(samples) < 2:
+            raise RuntimeError("No position reports during the focus sweep")
+        times, zs = np.array(samples).T
+        # Only frames exposed while the position was known; interpolation is linear between reports
+        stamped = [(t + latency, frame, energy) for t, frame, energy in frames
+                   if times[0] <= t + latency <= times[-1]]
+        return ([frame for _, frame, _ in stamped], np.interp([t for t, _, _ in stamped], times, zs).tolist(),
+                [energy for _, _, energy in stamped])
+
+    def run(self, job, z_start, z_end, z_step=0.02, feed_rate=None, block=16, min_confidence=0.3,
+            sigma=2.0, latency=0.0):
+        """
+        Job function: sweep Z and fuse the frames
+
+        Args:
+            job (Job): Job receiving one result per captured frame; its summary describes the stack
+            z_start (float): Sweep start Z (mm)
+            z_end (float): Sweep end Z (mm)
+            z_step (float): Z travel per camera frame, sets the feed rate when none is given (mm)
+            feed_rate (float): Sweep feed rate in mm/min (optional)
+            block (int): Block size of the focus measure in pixels
+            min_confidence (float): Blocks below this confidence are filled in from their neighbours
+            sigma (float): Width of the fill-in average in blocks
+            latency (float): Time from a frame's capture stamp to its exposure (s)
+
+        Returns:
+            dict: fuse_stack result, None if cancelled
+        """
+        fps = self.measure_fps()
+        if feed_rate is None:
+            feed_rate = abs(z_step) * fps * 60
+        expected = abs(z_end - z_start) / feed_rate * 60 * fps
+        if expected > MAX_FRAMES:
+            raise ValueError(f"The sweep would capture about {expected:.0f} frames (limit {MAX_FRAMES}); "
+                             f"raise the Z step or feed rate")
+        frames, z_values, energies = self.sweep(z_start, z_end, feed_rate, job, latency, block=block)
+        if job.cancelled:
+            return None
+        for z in z_values:
+            job.add_result({'z': z})
+        if len(frames) < 2:
+            raise RuntimeError(f"Only {len(frames)} frame(s) captured during the sweep; lower the feed rate")
+        result = fuse_stack(frames, z_values, block, min_confidence, sigma, energies)
+        result.update(feed_rate=feed_rate, fps=fps)
+        job.summary = {
+            'frames': result['frames'], 'z_range': result['z_range'], 'feed_rate': feed_rate, 'fps': fps,
+            'block': block, 'confident_blocks': float((result['confidence'] >= min_confidence).mean())
+        }
+        return result
+
+
+if __name__ == "__main__":
+    # Fuse a synthetic stack of a textured part with a 0.3 mm step, then compare heights and timing
+    rng = np.random.default_rng(0)
+    texture = cv.GaussianBlur(rng.uniform(0, 255, (480, 640, 3)).astype(np.float32), (0, 0), 1.5)
+    surface = np.where(np.arange(640) < 320, 0.0, 0.3)[None, :].repeat(480, axis=0)
+    z_values = np.linspace(-0.2, 0.5, 36)
+    frames = []
+    for z in z_values:
+        frame = np.empty_like(texture)
+        for level in (0.0, 0.3):
+            blurred = cv.GaussianBlur(texture, (0, 0), 0.3 + 20 * abs(z - level))
+            frame = np.where((surface == level)[..., None], blurred, frame)
+        frames.append(np.clip(frame, 0, 255).astype(np.uint8))
+    start = time.perf_counter()
+    stacked = fuse_stack(frames, z_values)
+    elapsed = (time.perf_counter() - start) * 1000
+    height = stacked['height']
+    print(f"Fused {stacked['frames']} frames in {elapsed:.1f} ms, height map {height.shape}")
+    print(f"Left height: {np.median(height[:, :18]):.4f} mm (expected 0.0), "
+          f"right: {np.median(height[:, 22:]):.4f} mm (expected 0.3)")
+    sharp = focus_energy(stacked['image']).mean()
+    print(f"Focus energy: fused {sharp:.1f}, best single frame {max(focus_energy(f).mean() for f in frames):.1f}")
@@ -0,0 +1,368 @@
+"""
+Geometry Fitting Module for Comparatron
+Groups ordered measurement points into lines, arcs and circles for compact DXF output
+"""
+
+import math
+import logging
+import numpy as np
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def as_point_array(points):
+    """
+    Convert a list of points to an (N, 2) float array
+
+    Args:
+        points: (N, 2) array, list of (x, y) tuples or list of {'x', 'y'} dicts
+
+    Returns:
+        numpy.ndarray: (N, 2) float64 array
+    """
+    if isinstance(points, np.ndarray):
+        return np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if points and isinstance(points[0], dict):
+        return np.array([(p['x'], p['y']) for p in points], dtype=np.float64).reshape(-1, 2)
+    return np.asarray(points, dtype=np.float64).reshape(-1, 2)
+
+
+def fit_line(points):
+    """
+    Total least-squares line fit
+
+    Args:
+        points: (N, 2) array of points
+
+    Returns:
+        tuple: (centroid, unit direction, max perpendicular residual)
+    """
+    pts = as_point_array(points)
+    centroid = pts.mean(axis=0)
+    centered = pts - centroid
+    # The principal axis of the point cloud is the best-fit direction
+    _, _, vt = np.linalg.svd(centered, full_matrices=False)
+    direction = vt[0]
+    normal = np.array([-direction[1], direction[0]])
+    residual = float(np.abs(centered @ normal).max()) if len(pts) else 0.0
+    return centroid, direction, residual
+
+
+def fit_circle(points):
+    """
+    Algebraic least-squares (Kasa) circle fit
+
+    Args:
+        points: (N, 2) array of points, N >= 3
+
+    Returns:
+        tuple: (cx, cy, radius) or None if the points are degenerate
+    """
+    pts = as_point_array(points)
+    if len(pts) < 3:
+        return None
+    # Work relative to the mean to keep the normal equations well conditioned
+    mean = pts.mean(axis=0)
+    u = pts[:, 0] - mean[0]
+    v = pts[:, 1] - mean[1]
+    w = u * u + v * v
+    # Normal equations of [u v 1] @ [2cu 2cv c] = u^2 + v^2; mean centring makes the
+    # cross terms with the constant column vanish
+    suu, svv, suv = u @ u, v @ v, u @ v
+    det = suu * svv - suv * suv
+    if det <= 1e-18 * max(suu * svv, 1e-300):
+        return None
+    suw, svw = u @ w, v @ w
+    cu = (svv * suw - suv * svw) / (2.0 * det)
+    cv = (suu * svw - suv * suw) / (2.0 * det)
+    r_sq = w.mean() + cu * cu + cv * cv
+    if not np.isfinite(r_sq) or r_sq <= 0:
+        return None
+    return float(cu + mean[0]), float(cv + mean[1]), float(math.sqrt(r_sq))
+
+
+def fit_circle_geometric(points, initial=None, iterations=20):
+    """
+    Geometric (orthogonal distance) least-squares circle fit
+
+    Refines an algebraic fit with Gauss-Newton steps on the point-to-circle
+    distances; unlike the Kasa fit it is not biased towards smaller circles
+    when the points only cover part of the circumference.
+
+    Args:
+        points: (N, 2) array of points, N >= 3
+        initial (tuple): Starting (cx, cy, radius), the Kasa fit if None
+        iterations (int): Maximum number of Gauss-Newton steps
+
+    Returns:
+        tuple: (cx, cy, radius) or None if the points are degenerate
+    """
+    pts = as_point_array(points)
+    circle = initial or fit_circle(pts)
+    if circle is None or len(pts) < 3:
+        return None
+    cx, cy, r = circle
+    for _ in range(iterations):
+        dx = pts[:, 0] - cx
+        dy = pts[:, 1] - cy
+        dist = np.hypot(dx, dy)
+        if dist.min() < 1e-12:
+            break
+        jacobian = np.column_stack((-dx / dist, -dy / dist, -np.ones_like(dist)))
+        step = np.linalg.lstsq(jacobian, r - dist, rcond=None)[0]
+        cx, cy, r = cx + step[0], cy + step[1], r + step[2]
+        if np.abs(step).max() <= 1e-12 * max(1.0, abs(r)):
+            break
+    if not np.all(np.isfinite((cx, cy, r))) or r == 0:
+        return None
+    return float(cx), float(cy), float(abs(r))
+
+
+def bulge_centre(x0, y0, x1, y1, bulge):
+    """
+    Centre of the arc described by a polyline bulge between two vertices
+
+    Returns:
+        tuple: (cx, cy)
+    """
+    sweep = 4.0 * math.atan(bulge)
+    dx, dy = x1 - x0, y1 - y0
+    chord = math.hypot(dx, dy)
+    h = chord / (2.0 * math.tan(sweep / 2.0))
+    return (x0 + x1) / 2.0 - dy / chord * h, (y0 + y1) / 2.0 + dx / chord * h
+
+
+class GeometryFitter:
+    """
+    Class to segment ordered points into polylines with arc bulges and circles
+    """
+
+    def __init__(self, tolerance=0.01, min_arc_points=5, max_gap=None, max_radius=1.0e4):
+        """
+        Initialize the fitter
+
+        Args:
+            tolerance (float): Maximum allowed deviation of any point from its fitted entity (mm)
+            min_arc_points (int): Minimum number of points needed before an arc is considered
+            max_gap (float): Start a new entity when consecutive points are further apart (mm)
+            max_radius (float): Arcs with a larger radius are treated as straight lines (mm)
+        """
+        self.tolerance = float(tolerance)
+        self.min_arc_points = max(3, int(min_arc_points))
+        self.max_gap = max_gap
+        self.max_radius = max_radius
+
+    def fit(self, points):
+        """
+        Fit geometry to an ordered list of points
+
+        Args:
+            points: Ordered points as (N, 2) array, tuples or point dicts
+
+        Returns:
+            list: Entity dictionaries of type 'polyline', 'circle' or 'point'
+        """
+        pts = as_point_array(points)
+        entities = []
+        for chain in self._split_chains(pts):
+            entities.extend(self._fit_chain(chain))
+        return entities
+
+    def _split_chains(self, pts):
+        """Split the point list wherever the gap between neighbours exceeds max_gap"""
+        if len(pts) == 0:
+            return []
+        # Drop consecutive duplicates, they carry no shape information
+        keep = np.ones(len(pts), dtype=bool)
+        keep[1:] = np.any(np.abs(np.diff(pts, axis=0)) > 1e-12, axis=1)
+        pts = pts[keep]
+        if self.max_gap is None or len(pts) < 2:
+            return [pts]
+        gaps = np.hypot(*np.diff(pts, axis=0).T)
+        breaks = np.nonzero(gaps > self.max_gap)[0] + 1
+        return np.split(pts, breaks)
+
+    def _fit_chain(self, pts):
+        """Fit a single connected chain of points"""
+        n = len(pts)
+        if n == 1:
+            return [{"type": "point", "x": float(pts[0, 0]), "y": float(pts[0, 1])}]
+
+        closed = n > 3 and math.hypot(*(pts[-1] - pts[0])) <= self.tolerance
+        if closed and n >= self.min_arc_points:
+            circle = self._full_circle(pts)
+            if circle is not None:
+                return [circle]
+
+        vertices = []
+        i = 0
+        while i < n - 1:
+            j_line = self._extend(pts, i, self._line_ok, i + 1)
+            j_arc, bulge = i, 0.0
+            # Only an arc that reaches beyond the straight run is worth emitting
+            first_arc = max(i + self.min_arc_points - 1, j_line + 1)
+            if first_arc < n:
+                j_arc = self._extend(pts, i, self._arc_ok, first_arc)
+            if j_arc > j_line:
+                bulge = self._arc_bulge(pts[i:j_arc + 1])
+                end = j_arc
+            else:
+                end = j_line
+            vertices.append((float(pts[i, 0]), float(pts[i, 1]), float(bulge)))
+            i = end
+
+        if closed:
+            # The closing segment is implied by the LWPOLYLINE closed flag
+            return [{"type": "polyline", "vertices": vertices, "closed": True}]
+        vertices.append((float(pts[-1, 0]), float(pts[-1, 1]), 0.0))
+        return [{"type": "polyline", "vertices": vertices, "closed": False}]
+
+    def _extend(self, pts, i, predicate, first):
+        """
+        Find the furthest end index j such that predicate(pts[i:j+1]) holds,
+        using an exponential probe followed by a binary search
+
+        Returns:
+            int: Best end index, or i if even the first candidate fails
+        """
+        n = len(pts)
+        if first >= n or not predicate(pts[i:first + 1]):
+            return i
+        good, step = first, 1
+        bad = n
+        while True:
+            probe = first + step
+            if probe >= n:
+                probe = n - 1
+                if probe == good:
+                    return good
+                if predicate(pts[i:probe + 1]):
+                    return probe
+                bad = probe
+                break
+            if predicate(pts[i:probe + 1]):
+                good = probe
+                step *= 2
+            else:
+                bad = probe
+                break
+        while bad - good > 1:
+            mid = (good + bad) // 2
+            if predicate(pts[i:mid + 1]):
+                good = mid
+            else:
+                bad = mid
+        return good
+
+    def _line_ok(self, seg):
+        """Check that all points lie within tolerance of the chord between the ends"""
+        if len(seg) <= 2:
+            return True
+        p0 = seg[0]
+        d = seg[-1] - p0
+        length_sq = float(d @ d)
+        rel = seg - p0
+        if length_sq < 1e-24:
+            return bool(np.hypot(rel[:, 0], rel[:, 1]).max() <= self.tolerance)
+        # Distance to the segment (not the infinite line) so back-tracking is rejected
+        t = np.clip((rel @ d) / length_sq, 0.0, 1.0)
+        off = rel - t[:, None] * d
+        return bool((off[:, 0] ** 2 + off[:, 1] ** 2).max() <= self.tolerance ** 2)
+
+    def _arc_sweep(self, seg):
+        """Return the signed sweep of the fitted arc, or None if not a monotonic arc"""
+        circle = fit_circle(seg)
+        if circle is None:
+            return None
+        cx, cy, r = circle
+        if r > self.max_radius:
+            return None
+        angles = np.unwrap(np.arctan2(seg[:, 1] - cy, seg[:, 0] - cx))
+        sweep = float(angles[-1] - angles[0])
+        if not self._monotonic(angles, sweep, r) or abs(sweep) >= 2 * math.pi - 1e-6:
+            return None
+        return sweep
+
+    def _monotonic(self, angles, sweep, radius):
+        """Check that points progress along the arc, allowing jitter within tolerance"""
+        slack = self.tolerance / radius
+        return bool((np.diff(angles) * math.copysign(1.0, sweep)).min() >= -slack)
+
+    def _arc_ok(self, seg):
+        """Check that the bulge arc through the end points fits all points"""
+        sweep = self._arc_sweep(seg)
+        if sweep is None:
+            return False
+        p0, p1 = seg[0], seg[-1]
+        chord_vec = p1 - p0
+        chord = math.hypot(*chord_vec)
+        if chord < 1e-12:
+            return False
+        # Rebuild the exact arc a bulge value encodes: it passes through both end points
+        radius = chord / (2.0 * abs(math.sin(sweep / 2.0)))
+        normal = np.array([-chord_vec[1], chord_vec[0]]) / chord
+        centre = (p0 + p1) / 2.0 + normal * (chord / (2.0 * math.tan(sweep / 2.0)))
+        dist = np.hypot(seg[:, 0] - centre[0], seg[:, 1] - centre[1])
+        return bool(np.abs(dist - radius).max() <= self.tolerance)
+
+    def _arc_bulge(self, seg):
+        """DXF bulge (tan of a quarter of the included angle, positive = CCW)"""
+        sweep = self._arc_sweep(seg)
+        return math.tan(sweep / 4.0) if sweep is not None else 0.0
+
+    def _full_circle(self, pts):
+        """Return a circle entity if a closed chain is a circle within tolerance"""
+        circle = fit_circle(pts)
+        if circle is None:
+            return None
+        cx, cy, r = circle
+        if r > self.max_radius:
+            return None
+        dist = np.hypot(pts[:, 0] - cx, pts[:, 1] - cy)
+        if np.abs(dist - r).max() > self.tolerance:
+            return None
+        angles = np.unwrap(np.arctan2(pts[:, 1] - cy, pts[:, 0] - cx))
+        sweep = float(angles[-1] - angles[0])
+        if not self._monotonic(angles, sweep, r) or abs(sweep) < math.pi:
+            return None
+        return {"type": "circle", "center": (cx, cy), "radius": r}
+
+
+def fit_geometry(points, tolerance=0.01, min_arc_points=5, max_gap=None):
+    """
+    Convenience wrapper around GeometryFitter.fit
+
+    Args:
+        points: Ordered points as (N, 2) array, tuples or point dicts
+        tolerance (float): Maximum deviation of a point from its entity (mm)
+        min_arc_points (int): Minimum number of points for an arc
+        max_gap (float): Gap (mm) that splits the points into separate entities
+
+    Returns:
+        list: Entity dictionaries
+    """
+    return GeometryFitter(tolerance, min_arc_points, max_gap).fit(points)
+
+
+if __name__ == "__main__":
+    # Test the fitter on a slot outline: two straight edges joined by half circles
+    import time
+
+    t = np.linspace(-np.pi / 2, np.pi / 2, 2500)
+    right = np.column_stack((20 + 5 * np.cos(t), 5 * np.sin(t)))
+    top = np.column_stack((np.linspace(20, 0, 2500), np.full(2500, 5.0)))
+    left = np.column_stack((-5 * np.cos(t), -5 * np.sin(t)))
+    bottom = np.column_stack((np.linspace(0, 20, 2500), np.full(2500, -5.0)))
+    outline = np.vstack((right, top[1:], left[1:], bottom[1:]))
+    outline += np.random.default_rng(0).normal(0, 0.001, outline.shape)
+
+    start = time.perf_counter()
+    result = fit_geometry(outline, tolerance=0.01)
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"Fitted {len(outline)} points in {elapsed:.1f} ms")
+    for entity in result:
+        if entity["type"] == "polyline":
+            print(f"  polyline: {len(entity['vertices'])} vertices, closed={entity['closed']}")
+        else:
+            print(f"  {entity}")
@@ -0,0 +1,274 @@
+"""
+GRBL Settings Module for Comparatron
+Caches the machine settings ($$) and writes only the values that changed
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from serial_comm import parse_settings
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Default location of saved settings profiles
+DEFAULT_PROFILE_DIR = os.path.expanduser('~/.comparatron/settings_profiles')
+
+# Descriptions of the GRBL 1.1 settings, keyed by setting number
+PARAM_DESCRIPTIONS = {
+    "0": {"description": "Step pulse time", "options": "Range: 3-20 microseconds. Sets time for step pulse in microseconds. Set to zero to enable step pulse invert."},
+    "1": {"description": "Step idle delay", "options": "Range: 25-255 milliseconds. Time length for step pulse to be held after the step is complete. A value of 255 sets the delay to 255 milliseconds, though this isn't typically needed."},
+    "2": {"description": "Step port invert mask", "options": "Bitmask: bit0=X, bit1=Y, bit2=Z. Inverts step signal for axes. Each bit controls the respective axis."},
+    "3": {"description": "Direction port invert mask", "options": "Bitmask: bit0=X, bit1=Y, bit2=Z. Inverts direction signal for axes. Each bit controls the respective axis."},
+    "4": {"description": "Step enable invert", "options": "0=normal, 1=inverted. Inverts the step enable pin signal."},
+    "5": {"description": "Limit pins invert", "options": "0=normal, 1=inverted. Inverts the limit pins signal, active low or active high."},
+    "6": {"description": "Probe pin invert", "options": "0=normal, 1=inverted. Inverts the probe pin signal, active low or active high."},
+    "10": {"description": "Status report mask", "options": "Bitmask: bit0=position, bit1=buffer, bit2=limit pins. Controls what is reported in status reports. Set bit 0 for machine position, bit 1 for real-time feed rate, bit 2 for pin states."},
+    "11": {"description": "Junction deviation", "options": "Range: 0.01-5.0mm. Controls the path planning and cornering speed. Lower values result in more exact path following but can cause stops to maintain acceleration limits."},
+    "12": {"description": "Arc tolerance", "options": "Range: 0.001-0.5mm. Controls accuracy of arc motion. Lower values result in more exact path following but much longer compile times."},
+    "13": {"description": "Report inches", "options": "0=mm, 1=inches. Units for all reports. 0=mm, 1=inches. This only affects the reports, not the motion commands."},
+    "20": {"description": "Soft limits enable", "options": "0=disable, 1=enable. Enable soft limits. Requires homing to be enabled as well. Provides software-based travel limits."},
+    "21": {"description": "Hard limits enable", "options": "0=disable, 1=enable. Enable hard limits. Provides hardware-based travel limits using limit switches."},
+    "22": {"description": "Homing cycle enable", "options": "0=disable, 1=enable. Enable homing cycle. Requires limit switches to be configured properly."},
+    "23": {"description": "Homing direction invert mask", "options": "Bitmask: bit0=X, bit1=Y, bit2=Z. Sets homing search direction. Each bit controls the respective axis."},
+    "24": {"description": "Homing locate feed rate", "options": "Range: 1-1000mm/min. Feed rate used during homing locate cycle. Rate at which the limit switches are approached during homing."},
+    "25": {"description": "Homing search seek rate", "options": "Range: 1-5000mm/min. Seek rate used during homing search cycle. Rate at which the limit switches are searched during homing."},
+    "26": {"description": "Homing switch debounce delay", "options": "Range: 1-100ms. Delay for homing switch to debounce. Time to wait after switch is triggered before continuing."},
+    "27": {"description": "Homing switch pull-off distance", "options": "Range: 0.1-20mm. Distance to move off homing switch after triggering. Ensures switch is released after homing."},
+    "30": {"description": "Maximum spindle speed", "options": "Range: 0-20000 RPM. Maximum spindle speed in RPM. Used for S-value in M3/M4 commands."},
+    "31": {"description": "Minimum spindle speed", "options": "Range: 0-20000 RPM. Minimum spindle speed in RPM. Used for S-value in M3/M4 commands."},
+    "32": {"description": "Laser mode enable", "options": "0=disable, 1=enable. Enable laser mode. Enables dynamic laser power control based on feed rate."},
+    "100": {"description": "X-axis travel resolution", "options": "Range: 1.0-999.999 steps/mm. Steps per millimeter for X axis. Critical for proper movement. Calculate: (steps per revolution) / (mm per revolution)."},
+    "101": {"description": "Y-axis travel resolution", "options": "Range: 1.0-999.999 steps/mm. Steps per millimeter for Y axis. Critical for proper movement. Calculate: (steps per revolution) / (mm per revolution)."},
+    "102": {"description": "Z-axis travel resolution", "options": "Range: 1.0-999.999 steps/mm. Steps per millimeter for Z axis. Critical for proper movement. Calculate: (steps per revolution) / (mm per revolution)."},
+    "110": {"description": "X-axis maximum rate", "options": "Range: 1.0-60000.0 mm/min. Maximum rate for X axis. Determines the maximum feed rate for this axis."},
+    "111": {"description": "Y-axis maximum rate", "options": "Range: 1.0-60000.0 mm/min. Maximum rate for Y axis. Determines the maximum feed rate for this axis."},
+    "112": {"description": "Z-axis maximum rate", "options": "Range: 1.0-60000.0 mm/min. Maximum rate for Z axis. Determines the maximum feed rate for this axis."},
+    "120": {"description": "X-axis acceleration", "options": "Range: 1.0-10000.0 mm/sec^2. Acceleration for X axis. Affects how quickly the axis accelerates and decelerates."},
+    "121": {"description": "Y-axis acceleration", "options": "Range: 1.0-10000.0 mm/sec^2. Acceleration for Y axis. Affects how quickly the axis accelerates and decelerates."},
+    "122": {"description": "Z-axis acceleration", "options": "Range: 1.0-10000.0 mm/sec^2. Acceleration for Z axis. Affects how quickly the axis accelerates and decelerates."},
+    "130": {"description": "X-axis maximum travel", "options": "Range: 1.0-2000.0 mm. Maximum travel for X axis. Used for soft limits and coordinate system calculations."},
+    "131": {"description": "Y-axis maximum travel", "options": "Range: 1.0-2000.0 mm. Maximum travel for Y axis. Used for soft limits and coordinate system calculations."},
+    "132": {"description": "Z-axis maximum travel", "options": "Range: 1.0-2000.0 mm. Maximum travel for Z axis. Used for soft limits and coordinate system calculations."},}
+
+_SETTING_WRITE = re.compile(r'^\s*\$(\d+)\s*=\s*(\S+)\s*$')
+
+
+def _same_value(a, b):
+    """Compare two setting values numerically where possible (GRBL reformats e.g. '80' as '80.000')"""
+    try:
+        return abs(float(a) - float(b)) < 5e-4
+    except (TypeError, ValueError):
+        return str(a).strip() == str(b).strip()
+
+
+class GRBLSettingsManager:
+    """
+    Class keeping a cached copy of the GRBL settings of the connected machine
+
+    $$ is only sent on the first request after a (re)connection or an explicit
+    refresh. Successful $n=v writes update the cache in place, and writes of
+    values equal to the cached ones are skipped, which saves EEPROM cycles and
+    the serial round trip.
+    """
+
+    def __init__(self, serial_communicator, profile_dir=DEFAULT_PROFILE_DIR):
+        """
+        Initialize the settings manager
+
+        Args:
+            serial_communicator (SerialCommunicator): Serial communicator instance
+            profile_dir (str): Directory of saved settings profiles
+        """
+        self.comm = serial_communicator
+        self.profile_dir = profile_dir
+        self._settings = None
+        self._port = None  # Serial object the cache was read from
+        self._read_time = None
+        self._lock = threading.Lock()
+
+    def _valid(self):
+        """True if the cache belongs to the currently open connection"""
+        ser = self.comm.ser
+        return self._settings is not None and ser is self._port and ser is not None and ser.is_open
+
+    def invalidate(self):
+        """Drop the cache so the next request reads $$ again"""
+        with self._lock:
+            self._settings = None
+
+    def get_settings(self, refresh=False):
+        """
+        Return all settings, reading them from the machine only when needed
+
+        Args:
+            refresh (bool): Force a new $$ read
+
+        Returns:
+            dict: {setting number (int): value (str)}, or None if the settings could not be read
+        """
+        with self._lock:
+            if refresh or not self._valid():
+                settings = parse_settings(self.comm.get_settings_list())
+                if not settings:
+                    return None
+                self._settings = settings
+                self._port = self.comm.ser
+                self._read_time = time.time()
+            return dict(self._settings)
+
+    @property
+    def read_time(self):
+        """time.time() of the last $$ read, None before the first one"""
+        return self._read_time
+
+    def get(self, number, default=None):
+        """Return one setting value (str) from the cache"""
+        settings = self.get_settings()
+        if settings is None:
+            return default
+        return settings.get(int(number), default)
+
+    def observe(self, command, response):
+        """
+        Keep the cache in sync with a command sent outside the manager (e.g. raw commands)
+
+        Args:
+            command (str): Command that was sent
+            response (str): Machine response
+        """
+        command = (command or '').strip()
+        if command.upper().startswith('$RST'):
+            self.invalidate()
+            return
+        match = _SETTING_WRITE.match(command)
+        if match and response and 'ok' in response:
+            with self._lock:
+                if self._settings is not None:
+                    self._settings[int(match.group(1))] = match.group(2)
+
+    def write(self, number, value):
+        """
+        Write one setting if it differs from the cached value
+
+        Args:
+            number (int): Setting number, e.g. 100
+            value: New value
+
+        Returns:
+            bool: True if the machine holds the value afterwards (written or unchanged)
+        """
+        number = int(number)
+        value = str(value).strip()
+        current = self.get(number)
+        if current is not None and _same_value(current, value):
+            return True
+        response = self.comm.send_command(f"${number}={value}")
+        if not response or 'ok' not in response:
+            logging.error(f"Writing ${number}={value} failed: {response}")
+            print(f"Writing ${number}={value} failed: {response}")
+            return False
+        self.observe(f"${number}={value}", response)
+        return True
+
+    def apply(self, values):
+        """
+        Write a set of settings, skipping the unchanged ones
+
+        Args:
+            values (dict): {setting number: value}
+
+        Returns:
+            dict: {'written': [numbers], 'unchanged': [numbers], 'failed': [numbers]}
+        """
+        current = self.get_settings() or {}
+        result = {'written': [], 'unchanged': [], 'failed': []}
+        for number, value in sorted(values.items(), key=lambda item: int(item[0])):
+            number = int(number)
+            if number in current and _same_value(current[number], value):
+                result['unchanged'].append(number)
+            elif self.write(number, value):
+                result['written'].append(number)
+            else:
+                result['failed'].append(number)
+        if result['written']:
+            logging.info(f"Wrote {len(result['written'])} GRBL settings, {len(result['unchanged'])} unchanged")
+        return result
+
+    def snapshot(self):
+        """
+        Capture the whole settings profile
+
+        Returns:
+            dict: {'timestamp', 'settings': {number (str): value}}, or None if unavailable
+        """
+        settings = self.get_settings()
+        if settings is None:
+            return None
+        return {'timestamp': time.time(), 'settings': {str(n): v for n, v in sorted(settings.items())}}
+
+    def restore(self, profile):
+        """
+        Restore a snapshot with the minimum number of EEPROM writes
+
+        Args:
+            profile (dict): Snapshot as returned by snapshot()
+
+        Returns:
+            dict: See apply()
+        """
+        return self.apply(profile.get('settings', {}))
+
+    @staticmethod
+    def _safe_name(name):
+        cleaned = re.sub(r'[^A-Za-z0-9_.-]+', '_', str(name)).strip('._')
+        if not cleaned:
+            raise ValueError(f"Invalid profile name: {name!r}")
+        return cleaned
+
+    def list_profiles(self):
+        """Return the names of all saved profiles"""
+        if not os.path.isdir(self.profile_dir):
+            return []
+        return sorted(f[:-5] for f in os.listdir(self.profile_dir) if f.endswith('.json'))
+
+    def save_profile(self, name):
+        """
+        Save a snapshot of the current settings under a name
+
+        Returns:
+            dict: The saved profile, or None if the settings could not be read
+        """
+        profile = self.snapshot()
+        if profile is None:
+            return None
+        profile['name'] = self._safe_name(name)
+        os.makedirs(self.profile_dir, exist_ok=True)
+        with open(os.path.join(self.profile_dir, profile['name'] + '.json'), 'w') as f:
+            json.dump(profile, f, indent=2)
+        logging.info(f"Saved GRBL settings profile {profile['name']}")
+        return profile
+
+    def load_profile(self, name):
+        """Load a saved profile, or None if it does not exist"""
+        path = os.path.join(self.profile_dir, self._safe_name(name) + '.json')
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+
+if __name__ == "__main__":
+    # Test the diff logic on a cache filled from a sample $$ response
+    class _OfflineComm:
+        ser = None
+
+    manager = GRBLSettingsManager(_OfflineComm())
+    manager._settings = parse_settings("$100=80.000\n$101=80.000\n$110=500.000\nok")
+    current = manager._settings
+    profile = {'settings': {'100': '80', '101': '79.5', '110': '500.000'}}
+    changed = [n for n, v in profile['settings'].items() if not _same_value(current[int(n)], v)]
+    print(f"Settings to write for restore: {changed}")
@@ -3,59 +3,150 @@ Flask GUI Module for Comparatron
 Provides a web interface that works locally and can be accessed from any device on the same network
 """
 
-from flask import Flask, render_template, request, jsonify, Response
+from flask import Flask, render_template, request, jsonify, Response, g, abort, has_request_context, stream_with_context
 import cv2 as cv
 import numpy as np
-from PIL import Image
 import threading
 import time
 import logging
-import serial.tools.list_ports
-from camera_manager import find_available_cameras, initialize_camera
-from serial_comm import SerialCommunicator
-from machine_control import MachineController
-from dxf_handler import DXFHandler
+import re
+import socket
+from camera_manager import pixel_to_stage
+from serial_comm import parse_status_report
+from dxf_handler import NominalGeometry
+from exporters import export_points, available_formats, ExportTransform
+from jobs import JobManager
+from inspection import InspectionProgram, ProgramStore, compare_runs
+from path_planner import plan_route, compile_moves, route_length
+from compensation import CompensationMap
+from vision import refine_edge_point, extract_silhouette
+from calibration import CalibrationRunner, reference_points
+from grbl_settings import PARAM_DESCRIPTIONS
+from precision import PrecisionBenchmark, save_backlash
+from stations import StationRegistry, FrameEncoder, VideoSubscriber, VIDEO_SEND_BUFFER, socket_backlog, DEFAULT_STATION
+from discovery import DeviceDiscovery
+from services import ServiceMonitor, COMPARATRON_SERVICE
+from profiling import profiler, span, sample_stacks
+from analysis import AnalysisService, available_operations
+from capture import CaptureProcess
+from registration import RegistrationStore, PartRegistration
+from focus_stack import FocusStack
+from bestfit import best_fit, fit_summary, export_deviation_map
+from evaluation import FEATURE_KINDS
 import json
 
 
+class StationPrefixMiddleware:
+    """
+    WSGI middleware moving a leading /stations/<id> from the path into SCRIPT_NAME
+    """
+
+    ENVIRON_KEY = 'comparatron.station'
+    PREFIX = re.compile(r'/stations/([A-Za-z0-9_-]+)(/.*)?$')
+
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        match = self.PREFIX.match(environ.get('PATH_INFO', ''))
+        if match:
+            environ[self.ENVIRON_KEY] = match.group(1)
+            environ['SCRIPT_NAME'] = environ.get('SCRIPT_NAME', '') + '/stations/' + match.group(1)
+            environ['PATH_INFO'] = match.group(2) or '/'
+        return self.app(environ, start_response)
+
+
 class ComparatronFlaskGUI:
     """
     Flask-based GUI class for the Comparatron application
     """
     
-    def __init__(self):
+    def __init__(self, stations=None):
+        """
+        Initialize the GUI
+
+        Args:
+            stations (StationRegistry): Stations to serve, the saved registry if None
+        """
         self.app = Flask(__name__)
         self.setup_routes()
-        
-        # Initialize components
-        self.serial_comm = SerialCommunicator()
-        self.controller = MachineController(self.serial_comm)
-        self.dxf_handler = DXFHandler()
-        
-        # State variables
-        self.camera = None
-        self.camera_index = None
-        self.prev_point_x = 0.0
-        self.prev_point_y = 0.0
-        self.difference_x = 0.0
-        self.difference_y = 0.0
-        self.difference_distance = 0.0
-        self.data_acq_status = "ready"
-        self.jog_distance = 10.0
-        
-        # Store recorded points for visualization
-        self.recorded_points = []
-        
-        # Camera thread variables
-        self.camera_thread = None
-        self.current_frame = np.zeros((480, 640, 3), dtype=np.uint8)
-        self.frame_lock = threading.Lock()
-        self.running = False
-        
-        # Available ports
-        self.ports = self.serial_comm.get_available_ports()
-        self.port_names = [str(port) for port in self.ports]
-    
+        self.setup_station_routes()
+
+        # Machine, camera and measurement state lives in the stations; the
+        # attributes in STATION_ATTRIBUTES resolve to the station of the request
+        self.stations = stations or StationRegistry()
+        self.encoder = FrameEncoder()  # JPEG encoding shared by all stations and viewers
+        self.jobs = JobManager()  # One pool, jobs serialized per station
+        self.program_store = ProgramStore()
+        self.registration_store = RegistrationStore()
+
+        # Available ports and cameras, scanned in the background so startup does not wait
+        self.discovery = DeviceDiscovery(self.stations.default.serial_comm)
+        self.discovery.start()
+        # systemd unit state and board model, served from memory by the status routes
+        self.services = ServiceMonitor()
+        self.services.refresh(wait=False)
+        # Image analysis on worker processes (started with the first job)
+        self.analysis = AnalysisService()
+
+    @property
+    def station(self):
+        """
+        The station the current code works on
+
+        A job thread uses the station it was submitted for, a request the one in its
+        /stations/<id> prefix, everything else the default station.
+        """
+        station = self.stations.bound()
+        if station is None and has_request_context():
+            station = g.get('station')
+        return station or self.stations.default
+
+    def submit_job(self, kind, func, *args, **kwargs):
+        """
+        Queue a job on the current station
+
+        Args:
+            kind (str): Job type name
+            func (callable): Job function, run with the station bound to its thread
+            *args, **kwargs: Passed on to JobManager.submit
+
+        Returns:
+            Job: The queued job
+        """
+        station = self.station
+        return self.jobs.submit(kind, self.stations.bind(station, func), *args, lane=station.id, **kwargs)
+
+    def setup_station_routes(self):
+        """
+        Serve every route also under /stations/<station_id>
+
+        The prefix is stripped before routing (it becomes part of SCRIPT_NAME, so
+        generated URLs keep it) and the station is looked up before the view runs.
+        Rewriting the path is much cheaper than registering every rule twice.
+        """
+        self.app.wsgi_app = StationPrefixMiddleware(self.app.wsgi_app)
+
+        @self.app.before_request
+        def start_request_timer():
+            if profiler.enabled:
+                g.request_start = time.perf_counter()
+
+        @self.app.teardown_request
+        def record_request_time(exc):
+            start = g.get('request_start')
+            if start is not None:
+                profiler.record(f'http.{request.endpoint}', time.perf_counter() - start)
+
+        @self.app.before_request
+        def select_station():
+            station_id = request.environ.get(StationPrefixMiddleware.ENVIRON_KEY)
+            if station_id is not None:
+                station = self.stations.get(station_id)
+                if station is None:
+                    abort(404)
+                g.station = station
+
     def setup_routes(self):
         """Setup Flask routes"""
         @self.app.route('/')
@@ -64,19 +155,41 @@ class ComparatronFlaskGUI:
         
         @self.app.route('/video_feed')
         def video_feed():
-            return Response(self.generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+            """
+            MJPEG stream adapted to the viewer's link; ?quality=1-100, ?fps= and ?scale=0.1-1
+            fix the JPEG quality, maximum frame rate and size instead
+            """
+            quality = request.args.get('quality', type=int)
+            fps = request.args.get('fps', type=float)
+            scale = request.args.get('scale', type=float)
+            if (quality is not None and not 1 <= quality <= 100) or (fps is not None and fps <= 0) \
+                    or (scale is not None and not 0.1 <= scale <= 1.0):
+                abort(400)
+            # The send queue of the viewer's socket tells how far behind it is; where it cannot be
+            # read, a small send buffer makes a slow link block the writes instead
+            sock = request.environ.get('werkzeug.socket')
+            queued = None
+            if sock is not None:
+                if socket_backlog(sock) is not None:
+                    queued = lambda: socket_backlog(sock)
+                else:
+                    try:
+                        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, VIDEO_SEND_BUFFER)
+                    except OSError as e:
+                        logging.warning(f"Could not limit the video send buffer: {e}")
+            subscriber = VideoSubscriber(quality=quality, fps=fps, scale=scale, queued=queued)
+            return Response(stream_with_context(self.generate_frames(subscriber)),
+                            mimetype='multipart/x-mixed-replace; boundary=frame')
         
         @self.app.route('/api/cameras')
         def get_cameras():
-            cameras = find_available_cameras()
-            return jsonify(cameras)
+            return jsonify(self.discovery.get_cameras())
 
         @self.app.route('/api/refresh_cameras', methods=['POST'])
         def refresh_cameras():
             """Endpoint to refresh camera detection and find newly connected cameras."""
             try:
-                from camera_manager import refresh_camera_detection
-                cameras = refresh_camera_detection()
+                cameras = self.discovery.scan_cameras()
                 logging.info(f"Camera refresh completed: {cameras}")
                 return jsonify({
                     'success': True,
@@ -94,35 +207,28 @@ class ComparatronFlaskGUI:
         @self.app.route('/api/initialize_camera', methods=['POST'])
         def initialize_camera_endpoint():
             camera_idx = int(request.json.get('camera_index', 0))
-            self.camera = initialize_camera(camera_idx)
-            if self.camera is not None:
-                self.camera_index = camera_idx
-                # Start camera thread if not already running
-                if not self.running:
-                    self.running = True
-                    self.camera_thread = threading.Thread(target=self.update_frames)
-                    self.camera_thread.daemon = True
-                    self.camera_thread.start()
+            owner = self.stations.owner_of_camera(camera_idx)
+            if owner is not None and owner is not self.station:
+                return jsonify({'success': False, 'message': f'Camera {camera_idx} is used by station {owner.id}'}), 409
+            if self.station.start_camera(camera_idx):
                 return jsonify({'success': True, 'message': f'Camera {camera_idx} initialized'})
             else:
                 return jsonify({'success': False, 'message': f'Failed to initialize camera {camera_idx}'}), 400
         
         @self.app.route('/api/ports')
         def get_ports():
-            return jsonify(self.port_names)
+            return jsonify(self.discovery.get_ports())
 
         @self.app.route('/api/refresh_ports', methods=['POST'])
         def refresh_ports():
             """Endpoint to refresh serial port detection and find newly connected devices."""
             try:
-                # Refresh the available ports by calling the serial_comm's method
-                self.ports = self.serial_comm.get_available_ports()
-                self.port_names = [str(port) for port in self.ports]
-                logging.info(f"Port refresh completed: {self.port_names}")
+                port_names = self.discovery.scan_ports()
+                logging.info(f"Port refresh completed: {port_names}")
                 return jsonify({
                     'success': True,
-                    'ports': self.port_names,
-                    'message': f'Found {len(self.port_names)} port(s) after refresh'
+                    'ports': port_names,
+                    'message': f'Found {len(port_names)} port(s) after refresh'
                 })
             except Exception as e:
                 logging.error(f"Error refreshing ports: {e}")
@@ -135,6 +241,9 @@ class ComparatronFlaskGUI:
         @self.app.route('/api/connect_serial', methods=['POST'])
         def connect_serial():
             port_name = request.json.get('port_name', '').split(' ')[0]  # Get just the port name
+            owner = self.stations.owner_of_port(port_name)
+            if owner is not None and owner is not self.station:
+                return jsonify({'success': False, 'message': f'{port_name} is used by station {owner.id}'}), 409
             success = self.serial_comm.connect_to_com(port_name)
             if success:
                 return jsonify({'success': True, 'message': f'Connected to {port_name}'})
@@ -170,6 +279,9 @@ class ComparatronFlaskGUI:
                     dist = min(distance, 10.00)
                     self.controller.set_jog_distance(dist)
                     self.controller.jog_z_negative()
+
+            if self.recording is not None and axis in ('x', 'y', 'z'):
+                self.recording.add_jog(axis, self.controller.jog_distance * (1 if direction == 'positive' else -1))
             
             return jsonify({'success': True})
         
@@ -191,12 +303,16 @@ class ComparatronFlaskGUI:
                 self.serial_comm.set_feed(2000)
             elif command == 'set_origin':
                 self.serial_comm.set_origin()
+                self.registration = None  # The manual origin replaces a registered part origin
             elif command == 'set_relative':
                 self.serial_comm.set_relative_mode()
+                self.controller.track_motion(['G91'])
             elif command == 'send_command':
                 # Allow sending of arbitrary GRBL commands (for advanced users)
                 raw_command = request.json.get('raw_command', '')
                 if raw_command:
+                    # Manual jog moves come through here; keep the backlash direction current
+                    self.controller.track_motion([raw_command])
                     response = self.serial_comm.send_command(raw_command)
                     return jsonify({'success': True, 'response': response, 'command_sent': raw_command})
             elif command == 'reset_alarm':
@@ -213,7 +329,9 @@ class ComparatronFlaskGUI:
             if raw_command:
                 # Determine if this is a command that expects multiple responses
                 multi_line = raw_command.strip() in ['$$', '$#']
+                self.controller.track_motion([raw_command])
                 response = self.serial_comm.send_command(raw_command + '\r', multi_line_response=multi_line)
+                self.settings.observe(raw_command, response)
                 return jsonify({
                     'success': True,
                     'response': response,
@@ -228,15 +346,20 @@ class ComparatronFlaskGUI:
             try:
                 # Handle both GET (for direct API access) and POST (for API access from UI)
                 if request.method == 'POST':
-                    params = request.json
+                    params = request.json or {}
                 else:
-                    params = {}
+                    params = request.args
+                refresh = str(params.get('refresh', '')).lower() in ('1', 'true')
 
-                response = self.serial_comm.get_settings_list()
-                if response is not None:
+                settings = self.settings.get_settings(refresh=refresh)
+                if settings is not None:
+                    # Rebuilt in the $$ format so existing clients can parse it unchanged
+                    response = '\n'.join(f'${n}={v}' for n, v in sorted(settings.items())) + '\nok'
                     return jsonify({
                         'success': True,
                         'response': response,
+                        'settings': {str(n): v for n, v in settings.items()},
+                        'read_time': self.settings.read_time,
                         'command_sent': '$$'
                     })
                 else:
@@ -244,6 +367,46 @@ class ComparatronFlaskGUI:
             except Exception as e:
                 return jsonify({'success': False, 'error': str(e)})
 
+        @self.app.route('/api/settings', methods=['POST'])
+        def write_settings():
+            """Write GRBL settings ({"settings": {"100": "80.0", ...}}); unchanged values are skipped"""
+            values = (request.json or {}).get('settings') or {}
+            try:
+                values = {int(str(n).lstrip('$')): str(v) for n, v in values.items()}
+            except (AttributeError, ValueError):
+                return jsonify({'success': False, 'message': 'Settings must map setting numbers to values'}), 400
+            if not self.serial_comm.ser or not self.serial_comm.ser.is_open:
+                return jsonify({'success': False, 'message': 'No active serial connection'}), 400
+            result = self.settings.apply(values)
+            return jsonify(dict(result, success=not result['failed']))
+
+        @self.app.route('/api/settings/profiles', methods=['GET', 'POST'])
+        def settings_profiles():
+            """List saved settings profiles, or snapshot the current settings ({"name": ...})"""
+            if request.method == 'GET':
+                return jsonify({'success': True, 'profiles': self.settings.list_profiles()})
+            try:
+                profile = self.settings.save_profile((request.json or {}).get('name', ''))
+            except ValueError as e:
+                return jsonify({'success': False, 'message': str(e)}), 400
+            if profile is None:
+                return jsonify({'success': False, 'message': 'Could not read the machine settings'}), 400
+            return jsonify({'success': True, 'profile': profile})
+
+        @self.app.route('/api/settings/profiles/<name>/restore', methods=['POST'])
+        def restore_settings_profile(name):
+            """Restore a saved profile, writing only the settings that differ"""
+            try:
+                profile = self.settings.load_profile(name)
+            except ValueError as e:
+                return jsonify({'success': False, 'message': str(e)}), 400
+            if profile is None:
+                return jsonify({'success': False, 'message': f'Profile {name} not found'}), 404
+            if not self.serial_comm.ser or not self.serial_comm.ser.is_open:
+                return jsonify({'success': False, 'message': 'No active serial connection'}), 400
+            result = self.settings.restore(profile)
+            return jsonify(dict(result, success=not result['failed']))
+
         @self.app.route('/api/parameters_list', methods=['POST'])
         def get_parameters_list():
             """Route for getting all GRBL parameters ($# command)"""
@@ -266,62 +429,819 @@ class ComparatronFlaskGUI:
             try:
                 # Send '?' command to get machine status
                 response = self.serial_comm.send_command('?')
-                return jsonify({'status': 'success', 'response': response})
+                parsed = parse_status_report(response, self.controller.work_offset)
+                self.controller.update_position(parsed)
+                return jsonify({'status': 'success', 'response': response, 'position': parsed})
             except Exception as e:
                 return jsonify({'status': 'error', 'message': str(e)})
         
         @self.app.route('/api/create_point', methods=['POST'])
         def create_point():
             pos = self.controller.get_current_position()
+            settle = None
+            if pos and (self.camera is not None or not pos['state'].startswith('Idle')):
+                # Record only once the stage has stopped and the image is still
+                pos, _, _, settle = self.settle.wait(timeout=10.0)
             if pos and 'x' in pos and 'y' in pos:
-                point_x = pos['x']
-                point_y = pos['y']
-                
-                # Calculate differences
-                if self.prev_point_x != 0.0 or self.prev_point_y != 0.0:
-                    self.difference_x = point_x - self.prev_point_x
-                    self.difference_y = point_y - self.prev_point_y
-                    self.difference_distance = ((self.difference_x ** 2) + (self.difference_y ** 2)) ** 0.5
-                else:
-                    self.difference_x = 0.0
-                    self.difference_y = 0.0
-                    self.difference_distance = 0.0
-                
-                # Update previous point
-                self.prev_point_x = point_x
-                self.prev_point_y = point_y
-                
-                # Add to recorded points list
-                self.recorded_points.append({'x': point_x, 'y': point_y})
-                
-                # Add to DXF
-                self.dxf_handler.add_point(point_x, point_y)
-                
-                return jsonify({
-                    'success': True, 
-                    'point': {'x': point_x, 'y': point_y},
-                    'differences': {
-                        'x': self.difference_x,
-                        'y': self.difference_y,
-                        'distance': self.difference_distance
-                    }
-                })
+                if self.recording is not None:
+                    self.recording.add_measure(pos['x'], pos['y'], pos.get('z'))
+                return jsonify(dict(success=True, settle=settle, **self.record_point(pos['x'], pos['y'])))
             else:
                 return jsonify({'success': False, 'message': 'Could not get current position'}), 400
+
+        @self.app.route('/api/measure_batch', methods=['POST'])
+        def measure_batch():
+            """Queue a batch measurement job over a list of target coordinates"""
+            data = request.json or {}
+            try:
+                targets = [(float(t['x']), float(t['y'])) if isinstance(t, dict) else (float(t[0]), float(t[1]))
+                           for t in data.get('targets', [])]
+            except (KeyError, IndexError, TypeError, ValueError):
+                return jsonify({'success': False, 'message': 'Targets must be [x, y] pairs or {x, y} objects'}), 400
+            if not targets:
+                return jsonify({'success': False, 'message': 'No targets given'}), 400
+            if not self.serial_comm.ser or not self.serial_comm.ser.is_open:
+                return jsonify({'success': False, 'message': 'No active serial connection'}), 400
+            job = self.submit_job('measure_batch', self.run_measure_batch, targets, total=len(targets),
+                                   feed_rate=data.get('feed_rate'),
+                                   refine=bool(data.get('refine', False)),
+                                   search_radius=int(data.get('search_radius', 40)),
+                                   settle_time=float(data.get('settle_time', 0.0)),
+                                   optimize=bool(data.get('optimize', True)),
+                                   approach_distance=float(data.get('approach_distance', 1.0)))
+            return jsonify({'success': True, 'job_id': job.id, 'total': len(targets)})
+
+        @self.app.route('/api/jobs')
+        def list_jobs():
+            # Plain /api/jobs lists every station's jobs, a prefixed route only its own
+            return jsonify(self.jobs.list_jobs(g.station.id if 'station' in g else None))
+
+        @self.app.route('/api/jobs/<job_id>')
+        def get_job(job_id):
+            """Job status with the results from index `since` on (poll with the last `completed`)"""
+            job = self.jobs.get(job_id)
+            if job is None:
+                return jsonify({'success': False, 'message': f'Unknown job {job_id}'}), 404
+            return jsonify(job.snapshot(int(request.args.get('since', 0))))
+
+        @self.app.route('/api/jobs/<job_id>/stream')
+        def stream_job(job_id):
+            """Stream job results as newline-delimited JSON while the job runs"""
+            job = self.jobs.get(job_id)
+            if job is None:
+                return jsonify({'success': False, 'message': f'Unknown job {job_id}'}), 404
+
+            since = int(request.args.get('since', 0))
+
+            def generate():
+                seen = since
+                while True:
+                    new = job.wait_for_results(seen)
+                    for result in new:
+                        yield json.dumps(result) + '\n'
+                    seen += len(new)
+                    if job.done and seen >= len(job.results):
+                        info = job.snapshot(seen)
+                        del info['results']
+                        yield json.dumps(info) + '\n'
+                        return
+
+            return Response(generate(), mimetype='application/x-ndjson')
+
+        @self.app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+        def cancel_job(job_id):
+            if self.jobs.cancel(job_id):
+                return jsonify({'success': True})
+            return jsonify({'success': False, 'message': f'Unknown job {job_id}'}), 404
         
+        @self.app.route('/api/analysis', methods=['GET', 'POST'])
+        def analysis_api():
+            """
+            List the analysis jobs, or queue one:
+            {"operation": "focus", "roi": [x, y, w, h], "seq": n, "params": {...}, "wait": seconds}
+            """
+            if request.method == 'GET':
+                return jsonify({'success': True, 'operations': available_operations(),
+                                'stats': self.analysis.stats(), 'jobs': self.analysis.list_jobs()})
+            data = request.json or {}
+            try:
+                job = self.analysis.submit(data.get('operation', ''), data.get('params'), data.get('roi'),
+                                           **self.analysis_frame(data.get('seq')))
+            except ValueError as e:
+                return jsonify({'success': False, 'message': str(e)}), 400
+            if job is None:
+                return jsonify({'success': False, 'message': 'Analysis queue is full, try again later'}), 429
+            wait = float(data.get('wait', 0))
+            if wait > 0:
+                job.wait(min(wait, 30.0))
+            return jsonify({'success': True, 'job': job.snapshot()}), 200 if job.done else 202
+
+        @self.app.route('/api/analysis/<job_id>')
+        def get_analysis(job_id):
+            """Analysis job status and result (wait=seconds blocks until it is done)"""
+            job = self.analysis.get(job_id)
+            if job is None:
+                return jsonify({'success': False, 'message': f'Unknown analysis job {job_id}'}), 404
+            wait = float(request.args.get('wait', 0))
+            if wait > 0:
+                job.wait(min(wait, 30.0))
+            return jsonify({'success': True, 'job': job.snapshot()})
+
+        @self.app.route('/api/analysis/<job_id>/cancel', methods=['POST'])
+        def cancel_analysis(job_id):
+            if self.analysis.cancel(job_id):
+                return jsonify({'success': True})
+            return jsonify({'success': False, 'message': f'Unknown analysis job {job_id}'}), 404
+
+        @self.app.route('/api/program/record', methods=['POST'])
+        def record_program():
+            """Start, stop (and save) or discard recording of jogs and create_point into a program"""
+            data = request.json or {}
+            action = data.get('action', 'start')
+            if action == 'start':
+                try:
+                    name = ProgramStore.safe_name(data.get('name') or time.strftime('program-%Y%m%d-%H%M%S'))
+                except ValueError as e:
+                    return jsonify({'success': False, 'message': str(e)}), 400
+                self.recording = InspectionProgram(name, feed_rate=float(data.get('feed_rate', 1000)))
+                return jsonify({'success': True, 'message': f'Recording program {name}'})
+            if self.recording is None:
+                return jsonify({'success': False, 'message': 'Not recording'}), 400
+            program, self.recording = self.recording, None
+            if action == 'discard':
+                return jsonify({'success': True, 'message': f'Discarded program {program.name}'})
+            if not program.measure_points():
+                return jsonify({'success': False, 'message': 'Program has no measurement points, not saved'}), 400
+            self.program_store.save(program)
+            return jsonify({'success': True, 'message': f'Saved program {program.name}',
+                            'program': program.to_dict()})
+
+        @self.app.route('/api/program/current')
+        def current_program():
+            if self.recording is None:
+                return jsonify({'recording': False})
+            return jsonify({'recording': True, 'program': self.recording.to_dict()})
+
+        @self.app.route('/api/programs')
+        def list_programs():
+            return jsonify(self.program_store.list_programs())
+
+        @self.app.route('/api/programs/<name>')
+        def get_program(name):
+            program = self.program_store.load(name)
+            if program is None:
+                return jsonify({'success': False, 'message': f'Unknown program {name}'}), 404
+            return jsonify({'success': True, 'program': program.to_dict(),
+                            'runs': self.program_store.list_runs(name)})
+
+        @self.app.route('/api/programs/<name>/gcode')
+        def program_gcode(name):
+            program = self.program_store.load(name)
+            if program is None:
+                return jsonify({'success': False, 'message': f'Unknown program {name}'}), 404
+            return Response(program.to_gcode(request.args.get('feed_rate', type=float),
+                                             request.args.get('optimize', '0') == '1',
+                                             request.args.get('approach_distance', 0.0, type=float)),
+                            mimetype='text/plain')
+
+        @self.app.route('/api/plan_route', methods=['POST'])
+        def plan_route_api():
+            """Preview the optimized visiting order of a list of targets"""
+            data = request.json or {}
+            try:
+                targets = [(float(t['x']), float(t['y'])) if isinstance(t, dict) else (float(t[0]), float(t[1]))
+                           for t in data.get('targets', [])]
+            except (KeyError, IndexError, TypeError, ValueError):
+                return jsonify({'success': False, 'message': 'Targets must be [x, y] pairs or {x, y} objects'}), 400
+            start = data.get('start', (0.0, 0.0))
+            start_time = time.perf_counter()
+            order = plan_route(targets, start)
+            elapsed = time.perf_counter() - start_time
+            return jsonify({
+                'success': True,
+                'order': order,
+                'original_length': route_length(targets, range(len(targets)), start),
+                'planned_length': route_length(targets, order, start),
+                'planning_time': elapsed
+            })
+
+        @self.app.route('/api/programs/<name>/run', methods=['POST'])
+        def run_program(name):
+            """Replay a saved program as a batch job; the result set is stored when the job ends"""
+            program = self.program_store.load(name)
+            if program is None:
+                return jsonify({'success': False, 'message': f'Unknown program {name}'}), 404
+            if not self.serial_comm.ser or not self.serial_comm.ser.is_open:
+                return jsonify({'success': False, 'message': 'No active serial connection'}), 400
+            data = request.json or {}
+            job = self.submit_job('program', self.run_program, program,
+                                   total=len(program.measure_points()),
+                                   feed_rate=data.get('feed_rate'),
+                                   refine=bool(data.get('refine', False)),
+                                   search_radius=int(data.get('search_radius', 40)),
+                                   settle_time=float(data.get('settle_time', 0.0)),
+                                   optimize=bool(data.get('optimize', True)),
+                                   approach_distance=float(data.get('approach_distance', 1.0)))
+            return jsonify({'success': True, 'job_id': job.id, 'total': job.total})
+
+        @self.app.route('/api/programs/<name>/runs/<run_id>')
+        def get_program_run(name, run_id):
+            run = self.program_store.load_run(name, run_id)
+            if run is None:
+                return jsonify({'success': False, 'message': f'Unknown run {run_id}'}), 404
+            return jsonify(run)
+
+        @self.app.route('/api/programs/<name>/compare')
+        def compare_program_runs(name):
+            """Compare two stored runs (?reference=<run id>&run=<run id>, default: first vs. latest)"""
+            runs = self.program_store.list_runs(name)
+            if not runs:
+                return jsonify({'success': False, 'message': f'No runs for program {name}'}), 404
+            run_a = self.program_store.load_run(name, request.args.get('reference', runs[0]))
+            run_b = self.program_store.load_run(name, request.args.get('run', runs[-1]))
+            if run_a is None or run_b is None:
+                return jsonify({'success': False, 'message': 'Unknown run id'}), 404
+            return jsonify(dict(success=True, **compare_runs(run_a, run_b)))
+
         @self.app.route('/api/recorded_points')
         def get_recorded_points():
             return jsonify(self.recorded_points)
+
+        @self.app.route('/api/recorded_circles')
+        def get_recorded_circles():
+            return jsonify(self.recorded_circles)
+
+        @self.app.route('/api/measure_circle', methods=['POST'])
+        def measure_circle_api():
+            """
+            Measure the hole or circle under the crosshair and record it
+            ({"search_radius": px, "min_radius": px, "max_radius": px, "record": true})
+            """
+            data = request.json or {}
+            if self.camera is None:
+                return jsonify({'success': False, 'message': 'No camera active'}), 400
+            pos, frame, _, settle = self.settle.wait(timeout=10.0)
+            if pos is None or frame is None or 'x' not in pos:
+                return jsonify({'success': False, 'message': 'Could not get a settled position and frame'}), 400
+            try:
+                params = {key: int(data[key]) for key in ('search_radius', 'min_radius', 'max_radius')
+                          if data.get(key) is not None}
+            except (TypeError, ValueError):
+                return jsonify({'success': False, 'message': 'Radii must be integers (pixels)'}), 400
+            job = self.analysis.submit('circle', params, image=frame)
+            if job is None:
+                return jsonify({'success': False, 'message': 'Analysis queue is full, try again later'}), 429
+            job.wait(10.0)
+            info = job.snapshot()
+            if info['status'] != 'finished':
+                return jsonify({'success': False, 'message': info['error'] or 'Circle measurement timed out'}), 500
+            found = info['result']
+            if not found['found']:
+                return jsonify({'success': False, 'message': 'No circle found around the crosshair'}), 400
+            center_x, center_y = pixel_to_stage(found['x'], found['y'], pos['x'], pos['y'],
+                                                self.mm_per_pixel, frame.shape)
+            diameter = 2.0 * found['radius'] * self.mm_per_pixel
+            result = {'success': True, 'settle': settle, 'pixels': found, 'timing_ms': info['timing_ms']}
+            if data.get('record', True):
+                result.update(self.record_circle(center_x, center_y, diameter))
+            else:
+                result.update(center={'x': center_x, 'y': center_y}, diameter=diameter)
+            return jsonify(result)
         
         @self.app.route('/api/export_dxf', methods=['POST'])
         def export_dxf():
             filename = request.json.get('filename', 'comparatron.dxf')
-            success = self.dxf_handler.export_dxf(filename)
+            fit = bool(request.json.get('fit_geometry', False))
+            tolerance = float(request.json.get('tolerance', 0.01))
+            max_gap = request.json.get('max_gap')
+            transform = self.export_transform()
+            success = self.dxf_handler.export_dxf(filename, fit_geometry=fit, tolerance=tolerance,
+                                                  max_gap=float(max_gap) if max_gap else None,
+                                                  transform=None if transform.is_identity else transform)
             if success:
                 return jsonify({'success': True, 'message': f'DXF exported to {filename}'})
             else:
                 return jsonify({'success': False, 'message': 'Failed to export DXF'}), 400
         
+        @self.app.route('/api/export_formats')
+        def export_formats():
+            """List the registered export formats"""
+            return jsonify(available_formats())
+
+        @self.app.route('/api/export', methods=['POST'])
+        def export_file():
+            """Export recorded points in any registered format (svg, csv, npy, npz, gcode, dxf)"""
+            data = request.json or {}
+            filename = data.get('filename', 'comparatron.svg')
+            transform = self.export_transform(offset=data.get('offset', (0.0, 0.0)),
+                                              scale=float(data.get('scale', 1.0)),
+                                              flip_y=bool(data.get('flip_y', False)),
+                                              normalize=bool(data.get('normalize', False)))
+            options = data.get('options', {})
+            success = export_points(self.dxf_handler, filename, format_name=data.get('format'),
+                                    transform=transform, **options)
+            if success:
+                return jsonify({'success': True, 'message': f'Exported to {filename}'})
+            else:
+                return jsonify({'success': False, 'message': f'Failed to export {filename}'}), 400
+
+        @self.app.route('/api/compensation', methods=['GET', 'POST', 'DELETE'])
+        def compensation_map():
+            """Get, replace (JSON map in the body) or remove the axis error compensation map"""
+            import os
+            if request.method == 'POST':
+                try:
+                    comp = CompensationMap.from_dict(request.json or {})
+                except (TypeError, ValueError) as e:
+                    return jsonify({'success': False, 'message': f'Invalid compensation map: {e}'}), 400
+                if not comp.save(self.compensation_file):
+                    return jsonify({'success': False, 'message': 'Failed to save compensation map'}), 500
+                self.compensation = comp
+            elif request.method == 'DELETE':
+                if os.path.exists(self.compensation_file):
+                    os.remove(self.compensation_file)
+                self.compensation = None
+            if self.compensation is None:
+                return jsonify({'success': True, 'active': False})
+            return jsonify({'success': True, 'active': True, 'map': self.compensation.to_dict()})
+
+        @self.app.route('/api/compensation/fit', methods=['POST'])
+        def fit_compensation():
+            """Fit a map from reference artifact coordinates and the matching measured positions"""
+            data = request.json or {}
+            try:
+                comp = CompensationMap.from_reference(data['nominal'], data['measured'],
+                                                      grid_spacing=data.get('grid_spacing'))
+            except (KeyError, TypeError, ValueError) as e:
+                return jsonify({'success': False, 'message': f'Cannot fit compensation: {e}'}), 400
+            if data.get('apply', True):
+                comp.save(self.compensation_file)
+                self.compensation = comp
+            return jsonify({'success': True, 'map': comp.to_dict()})
+
+        @self.app.route('/api/calibration/run', methods=['POST'])
+        def run_calibration():
+            """Queue a guided calibration job over a reference scale or square"""
+            data = request.json or {}
+            try:
+                if data.get('nominal'):
+                    nominal = [(float(p[0]), float(p[1])) for p in data['nominal']]
+                else:
+                    length_x = float(data['length_x'])
+                    nominal = reference_points(length_x, float(data.get('length_y') or length_x))
+            except (KeyError, IndexError, TypeError, ValueError):
+                return jsonify({'success': False, 'message': 'Give length_x (and length_y) or nominal [x, y] points'}), 400
+            if len(nominal) < 3:
+                return jsonify({'success': False, 'message': 'At least 3 reference points are needed'}), 400
+            if not self.serial_comm.ser or not self.serial_comm.ser.is_open:
+                return jsonify({'success': False, 'message': 'No active serial connection'}), 400
+            if self.camera is None:
+                return jsonify({'success': False, 'message': 'Camera not initialized'}), 400
+            repeats = max(1, int(data.get('repeats', 1)))
+            job = self.submit_job('calibration', self.run_calibration, nominal, total=len(nominal),
+                                   feed_rate=float(data.get('feed_rate', 200)),
+                                   repeats=repeats,
+                                   approach=float(data.get('approach', 0.5)),
+                                   mode=data.get('mode', 'blob'),
+                                   settle_time=float(data.get('settle_time', 0.0)),
+                                   write_back=bool(data.get('write_back', False)),
+                                   apply=bool(data.get('apply', True)))
+            return jsonify({'success': True, 'job_id': job.id, 'total': len(nominal)})
+
+        @self.app.route('/api/registration')
+        def list_registration_parts():
+            """Saved parts and the registration of the current station"""
+            return jsonify({'parts': self.registration_store.list_parts(), 'current': self.registration})
+
+        @self.app.route('/api/registration/teach', methods=['POST'])
+        def teach_registration_datum():
+            """
+            Store the feature under the crosshair as datum 1 or 2 of a part
+            ({"name": part, "datum": 1, "size": template side in pixels})
+            """
+            data = request.json or {}
+            if self.camera is None:
+                return jsonify({'success': False, 'message': 'No camera active'}), 400
+            try:
+                index = int(data.get('datum', 1))
+                size = int(data.get('size', 96))
+            except (TypeError, ValueError):
+                return jsonify({'success': False, 'message': 'datum and size must be integers'}), 400
+            pos, frame, _, _ = self.settle.wait(timeout=10.0)
+            if pos is None or frame is None or 'x' not in pos:
+                return jsonify({'success': False, 'message': 'Could not get a settled position and frame'}), 400
+            template = PartRegistration.cut_template(frame, size)
+            if float(template.std()) < 2.0:
+                return jsonify({'success': False, 'message': 'The feature has no contrast to match on'}), 400
+            try:
+                part = self.registration_store.save_datum(data.get('name', ''), index, template,
+                                                          pos['x'], pos['y'], self.mm_per_pixel)
+            except (ValueError, OSError) as e:
+                return jsonify({'success': False, 'message': str(e)}), 400
+            return jsonify({'success': True, 'part': part})
+
+        @self.app.route('/api/registration/locate', methods=['POST'])
+        def locate_registration_datum():
+            """Find a taught datum in the live frame without moving ({"name": part, "datum": 1})"""
+            data = request.json or {}
+            part = self.registration_store.load(data.get('name', ''))
+            if part is None:
+                return jsonify({'success': False, 'message': f"Unknown part {data.get('name')}"}), 404
+            try:
+                datum = part['datums'][int(data.get('datum', 1)) - 1]
+            except (IndexError, TypeError, ValueError):
+                datum = None
+            if datum is None or datum['template'] is None:
+                return jsonify({'success': False, 'message': 'Datum not taught'}), 400
+            if self.camera is None:
+                return jsonify({'success': False, 'message': 'No camera active'}), 400
+            pos, frame, _, _ = self.settle.wait(timeout=10.0)
+            if pos is None or frame is None or 'x' not in pos:
+                return jsonify({'success': False, 'message': 'Could not get a settled position and frame'}), 400
+            registration = PartRegistration(self.controller, self.wait_for_frame, self.mm_per_pixel)
+            try:
+                found = registration.find(frame, datum['template'], pos, float(data.get('min_score', 0.6)))
+            except RuntimeError as e:
+                return jsonify({'success': False, 'message': str(e)}), 400
+            return jsonify(dict(success=True, **found))
+
+        @self.app.route('/api/registration/run', methods=['POST'])
+        def run_registration():
+            """
+            Queue a registration job: visit both datums, then set the work offset to the part origin
+            ({"name": part, "apply": true, "feed_rate": mm/min, "min_score": 0.6})
+            """
+            data = request.json or {}
+            part = self.registration_store.load(data.get('name', ''))
+            if part is None:
+                return jsonify({'success': False, 'message': f"Unknown part {data.get('name')}"}), 404
+            if len(part['datums']) < 2 or any(d is None or d['template'] is None for d in part['datums'][:2]):
+                return jsonify({'success': False, 'message': 'Teach datum 1 and 2 first'}), 400
+            if not self.serial_comm.ser or not self.serial_comm.ser.is_open:
+                return jsonify({'success': False, 'message': 'No active serial connection'}), 400
+            if self.camera is None:
+                return jsonify({'success': False, 'message': 'Camera not initialized'}), 400
+            job = self.submit_job('registration', self.run_registration, part, total=2,
+                                   feed_rate=float(data.get('feed_rate', 1000)),
+                                   min_score=float(data.get('min_score', 0.6)),
+                                   settle_time=float(data.get('settle_time', 0.0)),
+                                   apply=bool(data.get('apply', True)))
+            return jsonify({'success': True, 'job_id': job.id, 'total': 2})
+
+        @self.app.route('/api/focus_stack', methods=['GET', 'POST'])
+        def focus_stack():
+            """
+            Queue a focus stack sweep ({"z_start": mm, "z_end": mm, "z_step": mm per frame,
+            "feed_rate": mm/min, "block": px, "latency": s}), or get the last height map
+            """
+            if request.method == 'GET':
+                stacked = self.focus_stack
+                if stacked is None:
+                    return jsonify({'success': False, 'message': 'No focus stack captured'}), 404
+                height = stacked['height']
+                rows, cols = height.shape
+                block = stacked['block']
+                # Stage coordinates of the block centres at the position the stack was taken
+                xs, _ = pixel_to_stage((np.arange(cols) + 0.5) * block, 0, stacked['x'], stacked['y'],
+                                       stacked['mm_per_pixel'], stacked['image'].shape)
+                _, ys = pixel_to_stage(0, (np.arange(rows) + 0.5) * block, stacked['x'], stacked['y'],
+                                       stacked['mm_per_pixel'], stacked['image'].shape)
+                return jsonify({'success': True, 'frames': stacked['frames'], 'z_range': stacked['z_range'],
+                                'feed_rate': stacked['feed_rate'], 'block': block,
+                                'x': xs.round(4).tolist(), 'y': ys.round(4).tolist(),
+                                'height': height.round(4).tolist(),
+                                'confidence': stacked['confidence'].round(3).tolist()})
+            data = request.json or {}
+            try:
+                z_start, z_end = float(data['z_start']), float(data['z_end'])
+                z_step = float(data.get('z_step', 0.02))
+                feed_rate = float(data['feed_rate']) if data.get('feed_rate') else None
+                block = int(data.get('block', 16))
+                latency = float(data.get('latency', 0.0))
+            except (KeyError, TypeError, ValueError):
+                return jsonify({'success': False, 'message': 'z_start and z_end (mm) are required'}), 400
+            if z_start == z_end or z_step <= 0 or block < 4:
+                return jsonify({'success': False, 'message': 'Need z_start != z_end, z_step > 0 and block >= 4'}), 400
+            if not self.serial_comm.ser or not self.serial_comm.ser.is_open:
+                return jsonify({'success': False, 'message': 'No active serial connection'}), 400
+            if self.camera is None:
+                return jsonify({'success': False, 'message': 'Camera not initialized'}), 400
+            total = int(abs(z_end - z_start) / z_step) + 1
+            job = self.submit_job('focus_stack', self.run_focus_stack, z_start, z_end, total=total, z_step=z_step,
+                                   feed_rate=feed_rate, block=block, latency=latency)
+            return jsonify({'success': True, 'job_id': job.id, 'total': total})
+
+        @self.app.route('/api/focus_stack/image')
+        def focus_stack_image():
+            """The all-in-focus image of the last focus stack (PNG)"""
+            stacked = self.focus_stack
+            if stacked is None:
+                return jsonify({'success': False, 'message': 'No focus stack captured'}), 404
+            ok, data = cv.imencode('.png', stacked['image'])
+            if not ok:
+                return jsonify({'success': False, 'message': 'Could not encode the image'}), 500
+            return Response(data.tobytes(), mimetype='image/png')
+
+        @self.app.route('/api/precision/benchmark', methods=['POST'])
+        def precision_benchmark():
+            """Queue a repeatability/backlash benchmark around the fiducial under the crosshair"""
+            data = request.json or {}
+            try:
+                feeds = [float(f) for f in data.get('feeds', [200, 1000])]
+                cycles = max(1, int(data.get('cycles', 5)))
+                distance = float(data.get('distance', 2.0))
+                tolerance = float(data.get('tolerance', 0.1))
+            except (TypeError, ValueError):
+                return jsonify({'success': False, 'message': 'Invalid benchmark parameters'}), 400
+            if not feeds:
+                return jsonify({'success': False, 'message': 'No feed rates given'}), 400
+            if not self.serial_comm.ser or not self.serial_comm.ser.is_open:
+                return jsonify({'success': False, 'message': 'No active serial connection'}), 400
+            if self.camera is None:
+                return jsonify({'success': False, 'message': 'Camera not initialized'}), 400
+            benchmark = PrecisionBenchmark(self.controller, self.wait_for_frame, self.mm_per_pixel)
+            total = len(feeds) * cycles * 4
+            job = self.submit_job('precision_benchmark', benchmark.run, total=total, feeds=feeds, cycles=cycles,
+                                   distance=distance, mode=data.get('mode', 'blob'), tolerance=tolerance,
+                                   apply_backlash=bool(data.get('apply_backlash', False)),
+                                   backlash_file=self.backlash_file)
+            return jsonify({'success': True, 'job_id': job.id, 'total': total})
+
+        @self.app.route('/api/backlash', methods=['GET', 'POST', 'DELETE'])
+        def backlash_settings():
+            """Get, set ({"x": mm, "y": mm}) or clear the approach-direction backlash compensation"""
+            import os
+            if request.method == 'POST':
+                data = request.json or {}
+                try:
+                    backlash = {axis: float(data.get(axis, self.controller.backlash[axis])) for axis in ('x', 'y')}
+                except (TypeError, ValueError):
+                    return jsonify({'success': False, 'message': 'Backlash values must be numbers (mm)'}), 400
+                if not save_backlash(backlash, self.backlash_file):
+                    return jsonify({'success': False, 'message': 'Failed to save backlash values'}), 500
+                self.controller.backlash = backlash
+            elif request.method == 'DELETE':
+                if os.path.exists(self.backlash_file):
+                    os.remove(self.backlash_file)
+                self.controller.backlash = {'x': 0.0, 'y': 0.0}
+            return jsonify({'success': True, 'backlash': self.controller.backlash,
+                            'approach_direction': self.controller.approach_direction})
+
+        @self.app.route('/api/nominal/import', methods=['POST'])
+        def import_nominal():
+            """Import a nominal DXF drawing (uploaded file or server-side path)"""
+            import os
+            import tempfile
+            try:
+                if 'file' in request.files:
+                    upload = request.files['file']
+                    chord_tolerance = float(request.form.get('chord_tolerance', 0.001))
+                    fd, path = tempfile.mkstemp(suffix='.dxf')
+                    os.close(fd)
+                    try:
+                        upload.save(path)
+                        nominal = NominalGeometry.from_dxf(path, chord_tolerance=chord_tolerance)
+                    finally:
+                        os.remove(path)
+                    source = upload.filename
+                else:
+                    data = request.json or {}
+                    source = data.get('filename', '')
+                    nominal = NominalGeometry.from_dxf(source, chord_tolerance=float(data.get('chord_tolerance', 0.001)))
+                self.nominal = nominal
+                self._overlay_cache = None
+                self.best_fit = None
+                return jsonify({
+                    'success': True,
+                    'message': f'Imported {nominal.get_entity_count()} entities from {source}',
+                    'bounds': nominal.get_bounds()
+                })
+            except Exception as e:
+                logging.error(f"Error importing nominal DXF: {e}")
+                return jsonify({'success': False, 'message': f'Failed to import DXF: {e}'}), 400
+
+        @self.app.route('/api/nominal')
+        def get_nominal():
+            """Describe the loaded nominal geometry"""
+            if self.nominal is None:
+                return jsonify({'loaded': False})
+            return jsonify({
+                'loaded': True,
+                'entities': self.nominal.get_entity_count(),
+                'lines': len(self.nominal.lines),
+                'arcs': len(self.nominal.arcs),
+                'bounds': self.nominal.get_bounds()
+            })
+
+        @self.app.route('/api/nominal/clear', methods=['POST'])
+        def clear_nominal():
+            self.nominal = None
+            self._overlay_cache = None
+            self.best_fit = None
+            return jsonify({'success': True})
+
+        @self.app.route('/api/nominal/deviation', methods=['POST'])
+        def nominal_deviation():
+            """Deviation from nominal for one point ({x, y}) or many ({points: [[x, y], ...]})"""
+            if self.nominal is None:
+                return jsonify({'success': False, 'message': 'No nominal DXF loaded'}), 400
+            data = request.json or {}
+            if 'points' in data:
+                dist, nearest, entities = self.nominal.deviations(np.asarray(data['points'], dtype=np.float64))
+                return jsonify({'success': True, 'distances': dist.tolist(),
+                                'nearest': nearest.tolist(), 'entities': entities.tolist()})
+            return jsonify({'success': True, 'deviation': self.nominal.deviation(float(data['x']), float(data['y']))})
+
+        @self.app.route('/api/bestfit', methods=['GET', 'POST'])
+        def nominal_best_fit():
+            """
+            Align the recorded (compensated) points to the nominal geometry by ICP, or get the last fit
+            ({"outlier_sigma": 3.0, "max_distance": mm, "details": true})
+            """
+            if request.method == 'GET':
+                if self.best_fit is None:
+                    return jsonify({'success': False, 'message': 'No best fit computed'}), 404
+                return jsonify(dict(success=True, **fit_summary(self.best_fit)))
+            if self.nominal is None:
+                return jsonify({'success': False, 'message': 'No nominal DXF loaded'}), 400
+            data = request.json or {}
+            points = self.export_transform().apply(self.dxf_handler.get_point_array())
+            if len(points) < 2:
+                return jsonify({'success': False, 'message': 'Record at least two points first'}), 400
+            try:
+                sigma = data.get('outlier_sigma', 3.0)
+                max_distance = data.get('max_distance')
+                result = best_fit(self.nominal, points,
+                                  outlier_sigma=None if sigma is None else float(sigma),
+                                  max_distance=None if max_distance is None else float(max_distance))
+            except (TypeError, ValueError, RuntimeError) as e:
+                return jsonify({'success': False, 'message': f'Best fit failed: {e}'}), 400
+            self.best_fit = result
+            response = dict(success=True, **fit_summary(result))
+            if data.get('details', True):
+                response.update(deviations=result['deviations'].tolist(), aligned=result['aligned'].tolist(),
+                                entities=result['entities'].tolist())
+            return jsonify(response)
+
+        @self.app.route('/api/bestfit/export', methods=['POST'])
+        def export_best_fit():
+            """Export the last best fit as colour-mapped deviation SVG or DXF ({"filename", "tolerance"})"""
+            if self.best_fit is None:
+                return jsonify({'success': False, 'message': 'No best fit computed'}), 400
+            data = request.json or {}
+            filename = data.get('filename', 'deviation.svg')
+            tolerance = data.get('tolerance')
+            options = {}
+            if data.get('marker_radius'):
+                options['marker_radius'] = float(data['marker_radius'])
+            if export_deviation_map(filename, self.best_fit, self.nominal,
+                                    float(tolerance) if tolerance else None, **options):
+                return jsonify({'success': True, 'message': f'Deviation map exported to {filename}'})
+            return jsonify({'success': False, 'message': f'Failed to export {filename}'}), 400
+
+        @self.app.route('/api/evaluation')
+        def list_evaluation_groups():
+            """Live results of all point groups and the name of the active one"""
+            return jsonify({'active': self.evaluation.active, 'kinds': list(FEATURE_KINDS),
+                            'groups': self.evaluation.evaluate_all()})
+
+        @self.app.route('/api/evaluation/groups', methods=['POST'])
+        def create_evaluation_group():
+            """
+            Create a point group; recorded points go to it while it is active
+            ({"name": "edge A", "kind": "line" | "circle" | "point", "activate": true, "points": [[x, y], ...]})
+            """
+            data = request.json or {}
+            try:
+                result = self.evaluation.create_group(data.get('name', ''), data.get('kind', 'line'),
+                                                      bool(data.get('activate', True)))
+                if data.get('points'):
+                    result = self.evaluation.add_points(result['name'], data['points'])
+            except (TypeError, ValueError) as e:
+                return jsonify({'success': False, 'message': str(e)}), 400
+            return jsonify({'success': True, 'active': self.evaluation.active, 'group': result})
+
+        @self.app.route('/api/evaluation/groups/<name>', methods=['GET', 'DELETE'])
+        def evaluation_group(name):
+            if request.method == 'DELETE':
+                if not self.evaluation.remove_group(name):
+                    return jsonify({'success': False, 'message': f'Unknown group {name}'}), 404
+                return jsonify({'success': True, 'active': self.evaluation.active})
+            try:
+                return jsonify({'success': True, 'group': self.evaluation.evaluate(name)})
+            except KeyError:
+                return jsonify({'success': False, 'message': f'Unknown group {name}'}), 404
+
+        @self.app.route('/api/evaluation/groups/<name>/points', methods=['POST'])
+        def add_evaluation_points(name):
+            """Add points to a group ({"points": [[x, y], ...]} or {"recorded": [index, ...]})"""
+            data = request.json or {}
+            try:
+                if 'recorded' in data:
+                    points = [(self.recorded_points[i]['x'], self.recorded_points[i]['y'])
+                              for i in data['recorded']]
+                else:
+                    points = data.get('points', [])
+                return jsonify({'success': True, 'group': self.evaluation.add_points(name, points)})
+            except KeyError:
+                return jsonify({'success': False, 'message': f'Unknown group {name}'}), 404
+            except (IndexError, TypeError, ValueError) as e:
+                return jsonify({'success': False, 'message': f'Invalid points: {e}'}), 400
+
+        @self.app.route('/api/evaluation/active', methods=['POST'])
+        def set_active_evaluation_group():
+            """Select the group receiving recorded points ({"name": group or null})"""
+            name = (request.json or {}).get('name')
+            try:
+                self.evaluation.set_active(name)
+            except KeyError:
+                return jsonify({'success': False, 'message': f'Unknown group {name}'}), 404
+            return jsonify({'success': True, 'active': name})
+
+        @self.app.route('/api/evaluation/relation', methods=['POST'])
+        def evaluation_relation():
+            """
+            Distance or angle between two groups, or true position of one
+            ({"relation": "distance" | "angle", "a": group, "b": group} or
+             {"relation": "position", "a": group, "nominal": [x, y], "tolerance": mm})
+            """
+            data = request.json or {}
+            tolerance = data.get('tolerance')
+            try:
+                result = self.evaluation.relation(data.get('relation', 'distance'), data.get('a'), data.get('b'),
+                                                  nominal=data.get('nominal'),
+                                                  tolerance=float(tolerance) if tolerance is not None else None)
+            except KeyError as e:
+                return jsonify({'success': False, 'message': f'Unknown group {e}'}), 404
+            except (TypeError, ValueError) as e:
+                return jsonify({'success': False, 'message': str(e)}), 400
+            return jsonify(dict(success=True, **result))
+
+        @self.app.route('/api/overlay', methods=['GET', 'POST'])
+        def overlay_settings():
+            """Get or set the nominal overlay settings"""
+            if request.method == 'POST':
+                data = request.json or {}
+                if 'enabled' in data:
+                    self.overlay_enabled = bool(data['enabled'])
+                if 'mm_per_pixel' in data and float(data['mm_per_pixel']) > 0:
+                    self.mm_per_pixel = float(data['mm_per_pixel'])
+                self._overlay_cache = None
+            return jsonify({'enabled': self.overlay_enabled, 'mm_per_pixel': self.mm_per_pixel,
+                            'loaded': self.nominal is not None})
+
+        @self.app.route('/api/silhouette', methods=['GET', 'POST'])
+        def silhouette_mode():
+            """
+            Get the outlines of the current frame in stage mm, or switch silhouette mode
+            ({"enabled": true, "threshold": 0-255 or null for Otsu, "decimate": 4, "min_area": px})
+            """
+            if request.method == 'POST':
+                data = request.json or {}
+                try:
+                    options = dict(self.silhouette_options)
+                    for key, cast in (('threshold', int), ('decimate', int), ('min_area', float)):
+                        if key in data:
+                            options[key] = cast(data[key]) if data[key] is not None else None
+                except (TypeError, ValueError):
+                    return jsonify({'success': False, 'message': 'Invalid silhouette options'}), 400
+                if options.get('decimate') is not None and options['decimate'] < 1:
+                    return jsonify({'success': False, 'message': 'decimate must be at least 1'}), 400
+                self.silhouette_options = {key: value for key, value in options.items() if value is not None}
+                if 'enabled' in data:
+                    self.silhouette_enabled = bool(data['enabled'])
+                    self.silhouette = None
+            result = {'success': True, 'enabled': self.silhouette_enabled, 'options': self.silhouette_options}
+            current = self.silhouette if self.silhouette_enabled else None
+            pos = self.controller.last_position if self.controller else None
+            if current is not None and pos and 'x' in pos:
+                result.update(self.silhouette_outlines(current, pos, current['shape'],
+                                                       with_points=request.args.get('points') != '0'))
+            return jsonify(result)
+
+        @self.app.route('/api/silhouette/record', methods=['POST'])
+        def record_silhouette():
+            """Record the complete outlines of a settled frame as closed DXF polylines"""
+            if self.camera is None:
+                return jsonify({'success': False, 'message': 'No camera active'}), 400
+            pos, frame, frame_time, settle = self.settle.wait(timeout=10.0)
+            if pos is None or frame is None or 'x' not in pos:
+                return jsonify({'success': False, 'message': 'Could not get a settled position and frame'}), 400
+            try:
+                found = extract_silhouette(frame, **self.silhouette_options)
+            except Exception as e:
+                logging.error(f"Silhouette extraction failed: {e}")
+                return jsonify({'success': False, 'message': f'Silhouette extraction failed: {e}'}), 500
+            found['frame_time'] = frame_time
+            outlines = self.silhouette_outlines(found, pos, frame.shape)
+            recorded = [c for c in outlines['contours'] if c['complete']]
+            if not recorded:
+                return jsonify({'success': False, 'message': 'No complete outline in view'}), 400
+            for contour in recorded:
+                self.dxf_handler.add_polyline(contour['points'], closed=True)
+            return jsonify({'success': True, 'message': f'Recorded {len(recorded)} outline(s)',
+                            'settle': settle, 'contours': recorded})
+
         @self.app.route('/api/test_camera', methods=['POST'])
         def test_camera():
             camera_index = int(request.json.get('camera_index', -1))
@@ -346,15 +1266,8 @@ class ComparatronFlaskGUI:
         @self.app.route('/api/auto_start_status')
         def get_auto_start_status():
             """Check if auto-start is enabled on boot"""
-            import subprocess
-            try:
-                result = subprocess.run(['systemctl', 'is-enabled', 'comparatron.service'],
-                                      capture_output=True, text=True)
-                is_enabled = result.returncode == 0
-                return jsonify({'enabled': is_enabled})
-            except:
-                # If systemctl is not available or service doesn't exist, return False
-                return jsonify({'enabled': False})
+            # Cached; False if systemctl is not available or the service doesn't exist
+            return jsonify({'enabled': self.services.is_enabled(COMPARATRON_SERVICE)})
 
         @self.app.route('/api/toggle_auto_start', methods=['POST'])
         def toggle_auto_start():
@@ -394,6 +1307,7 @@ class ComparatronFlaskGUI:
                         result = subprocess.run(['systemctl', 'disable', 'comparatron.service'],
                                               capture_output=True, text=True)
 
+                self.services.refresh(force=True)
                 if enable and result.returncode != 0 and 'enabled' not in getattr(result, 'stdout', ''):
                     return jsonify({'success': False, 'message': 'Failed to enable auto-start'}), 500
                 elif not enable and result.returncode != 0 and 'disabled' not in getattr(result, 'stdout', ''):
@@ -459,24 +1373,8 @@ class ComparatronFlaskGUI:
             import platform
 
             try:
-                # Check if this is a Raspberry Pi by checking hardware
-                is_raspberry_pi = False
-                try:
-                    with open('/proc/cpuinfo', 'r') as f:
-                        cpuinfo = f.read()
-                        if 'Raspberry Pi' in cpuinfo or 'BCM' in cpuinfo:
-                            is_raspberry_pi = True
-                except:
-                    # Alternative check
-                    try:
-                        result = subprocess.run(['cat', '/sys/firmware/devicetree/base/model'],
-                                              capture_output=True, text=True)
-                        if 'Raspberry' in result.stdout:
-                            is_raspberry_pi = True
-                    except:
-                        pass
-
-                if not is_raspberry_pi:
+                # Board model detected once at startup
+                if not self.services.is_raspberry_pi:
                     return jsonify({'success': False, 'message': 'This system does not appear to be a Raspberry Pi'}), 400
 
                 # Check if user has sudo access
@@ -499,27 +1397,18 @@ class ComparatronFlaskGUI:
         @self.app.route('/api/laserweb_status', methods=['GET'])
         def laserweb_status():
             """Check the status of the LaserWeb service"""
-            import subprocess
+            # Cached state of the service and of its unit file
+            laserweb = self.services.laserweb_status()
+            if laserweb['error']:
+                return jsonify({'success': False, 'message': laserweb['error']}), 500
+            status = laserweb['status']
 
-            try:
-                # Check if LaserWeb service exists and its status
-                result = subprocess.run(['systemctl', 'is-active', 'laserweb.service'],
-                                      capture_output=True, text=True)
-
-                status = result.stdout.strip()
-
-                # Also check if the service file exists
-                service_exists = subprocess.run(['test', '-f', '/etc/systemd/system/laserweb.service'],
-                                              capture_output=True).returncode == 0
-
-                return jsonify({
-                    'success': True,
-                    'status': status if status else 'unknown',
-                    'service_exists': service_exists,
-                    'message': f'LaserWeb service status: {status}'
-                })
-            except Exception as e:
-                return jsonify({'success': False, 'message': str(e)}), 500
+            return jsonify({
+                'success': True,
+                'status': status if status else 'unknown',
+                'service_exists': laserweb['service_exists'],
+                'message': f'LaserWeb service status: {status}'
+            })
 
         @self.app.route('/api/control_laserweb', methods=['POST'])
         def control_laserweb():
@@ -543,6 +1432,8 @@ class ComparatronFlaskGUI:
                     # Already running as sudo/root
                     result = subprocess.run(['systemctl', action, 'laserweb.service'],
                                           capture_output=True, text=True)
+                if action != 'status':
+                    self.services.refresh(force=True)
 
                 if result.returncode == 0:
                     return jsonify({
@@ -560,100 +1451,426 @@ class ComparatronFlaskGUI:
         @self.app.route('/api/param_info/<param_num>', methods=['GET'])
         def get_param_info(param_num):
             """Get detailed information about a specific GRBL parameter"""
-            # Dictionary of GRBL parameter descriptions and options
-            param_descriptions = {
-                "0": {"description": "Step pulse time", "options": "Range: 3-20 microseconds. Sets time for step pulse in microseconds. Set to zero to enable step pulse invert."},
-                "1": {"description": "Step idle delay", "options": "Range: 25-255 milliseconds. Time length for step pulse to be held after the step is complete. A value of 255 sets the delay to 255 milliseconds, though this isn't typically needed."},
-                "2": {"description": "Step port invert mask", "options": "Bitmask: bit0=X, bit1=Y, bit2=Z. Inverts step signal for axes. Each bit controls the respective axis."},
-                "3": {"description": "Direction port invert mask", "options": "Bitmask: bit0=X, bit1=Y, bit2=Z. Inverts direction signal for axes. Each bit controls the respective axis."},
-                "4": {"description": "Step enable invert", "options": "0=normal, 1=inverted. Inverts the step enable pin signal."},
-                "5": {"description": "Limit pins invert", "options": "0=normal, 1=inverted. Inverts the limit pins signal, active low or active high."},
-                "6": {"description": "Probe pin invert", "options": "0=normal, 1=inverted. Inverts the probe pin signal, active low or active high."},
-                "10": {"description": "Status report mask", "options": "Bitmask: bit0=position, bit1=buffer, bit2=limit pins. Controls what is reported in status reports. Set bit 0 for machine position, bit 1 for real-time feed rate, bit 2 for pin states."},
-                "11": {"description": "Junction deviation", "options": "Range: 0.01-5.0mm. Controls the path planning and cornering speed. Lower values result in more exact path following but can cause stops to maintain acceleration limits."},
-                "12": {"description": "Arc tolerance", "options": "Range: 0.001-0.5mm. Controls accuracy of arc motion. Lower values result in more exact path following but much longer compile times."},
-                "13": {"description": "Report inches", "options": "0=mm, 1=inches. Units for all reports. 0=mm, 1=inches. This only affects the reports, not the motion commands."},
-                "20": {"description": "Soft limits enable", "options": "0=disable, 1=enable. Enable soft limits. Requires homing to be enabled as well. Provides software-based travel limits."},
-                "21": {"description": "Hard limits enable", "options": "0=disable, 1=enable. Enable hard limits. Provides hardware-based travel limits using limit switches."},
-                "22": {"description": "Homing cycle enable", "options": "0=disable, 1=enable. Enable homing cycle. Requires limit switches to be configured properly."},
-                "23": {"description": "Homing direction invert mask", "options": "Bitmask: bit0=X, bit1=Y, bit2=Z. Sets homing search direction. Each bit controls the respective axis."},
-                "24": {"description": "Homing locate feed rate", "options": "Range: 1-1000mm/min. Feed rate used during homing locate cycle. Rate at which the limit switches are approached during homing."},
-                "25": {"description": "Homing search seek rate", "options": "Range: 1-5000mm/min. Seek rate used during homing search cycle. Rate at which the limit switches are searched during homing."},
-                "26": {"description": "Homing switch debounce delay", "options": "Range: 1-100ms. Delay for homing switch to debounce. Time to wait after switch is triggered before continuing."},
-                "27": {"description": "Homing switch pull-off distance", "options": "Range: 0.1-20mm. Distance to move off homing switch after triggering. Ensures switch is released after homing."},
-                "30": {"description": "Maximum spindle speed", "options": "Range: 0-20000 RPM. Maximum spindle speed in RPM. Used for S-value in M3/M4 commands."},
-                "31": {"description": "Minimum spindle speed", "options": "Range: 0-20000 RPM. Minimum spindle speed in RPM. Used for S-value in M3/M4 commands."},
-                "32": {"description": "Laser mode enable", "options": "0=disable, 1=enable. Enable laser mode. Enables dynamic laser power control based on feed rate."},
-                "100": {"description": "X-axis travel resolution", "options": "Range: 1.0-999.999 steps/mm. Steps per millimeter for X axis. Critical for proper movement. Calculate: (steps per revolution) / (mm per revolution)."},
-                "101": {"description": "Y-axis travel resolution", "options": "Range: 1.0-999.999 steps/mm. Steps per millimeter for Y axis. Critical for proper movement. Calculate: (steps per revolution) / (mm per revolution)."},
-                "102": {"description": "Z-axis travel resolution", "options": "Range: 1.0-999.999 steps/mm. Steps per millimeter for Z axis. Critical for proper movement. Calculate: (steps per revolution) / (mm per revolution)."},
-                "110": {"description": "X-axis maximum rate", "options": "Range: 1.0-60000.0 mm/min. Maximum rate for X axis. Determines the maximum feed rate for this axis."},
-                "111": {"description": "Y-axis maximum rate", "options": "Range: 1.0-60000.0 mm/min. Maximum rate for Y axis. Determines the maximum feed rate for this axis."},
-                "112": {"description": "Z-axis maximum rate", "options": "Range: 1.0-60000.0 mm/min. Maximum rate for Z axis. Determines the maximum feed rate for this axis."},
-                "120": {"description": "X-axis acceleration", "options": "Range: 1.0-10000.0 mm/sec^2. Acceleration for X axis. Affects how quickly the axis accelerates and decelerates."},
-                "121": {"description": "Y-axis acceleration", "options": "Range: 1.0-10000.0 mm/sec^2. Acceleration for Y axis. Affects how quickly the axis accelerates and decelerates."},
-                "122": {"description": "Z-axis acceleration", "options": "Range: 1.0-10000.0 mm/sec^2. Acceleration for Z axis. Affects how quickly the axis accelerates and decelerates."},
-                "130": {"description": "X-axis maximum travel", "options": "Range: 1.0-2000.0 mm. Maximum travel for X axis. Used for soft limits and coordinate system calculations."},
-                "131": {"description": "Y-axis maximum travel", "options": "Range: 1.0-2000.0 mm. Maximum travel for Y axis. Used for soft limits and coordinate system calculations."},
-                "132": {"description": "Z-axis maximum travel", "options": "Range: 1.0-2000.0 mm. Maximum travel for Z axis. Used for soft limits and coordinate system calculations."},
-            }
-
-            if param_num in param_descriptions:
-                return jsonify(param_descriptions[param_num])
+            if param_num in PARAM_DESCRIPTIONS:
+                return jsonify(PARAM_DESCRIPTIONS[param_num])
             else:
                 return jsonify({
                     "description": f"Parameter ${param_num} - Description not available in database",
                     "options": "Check GRBL documentation for more details"
                 })
 
+        @self.app.route('/api/stations', methods=['GET', 'POST'])
+        def stations_api():
+            """List the stations, or add one ({"id": ..., "name": ...})"""
+            if request.method == 'POST':
+                data = request.json or {}
+                try:
+                    station = self.stations.add(data.get('id', ''), data.get('name'))
+                except ValueError as e:
+                    return jsonify({'success': False, 'message': str(e)}), 400
+                return jsonify({'success': True, 'station': station.describe()})
+            return jsonify({'success': True, 'current': self.station.id, 'stations': self.stations.list_stations()})
+
+        @self.app.route('/api/stations/<remove_id>', methods=['DELETE'])
+        def remove_station(remove_id):
+            """Disconnect and remove a station (its saved calibration files are kept)"""
+            if remove_id == DEFAULT_STATION:
+                return jsonify({'success': False, 'message': 'The default station cannot be removed'}), 400
+            if not self.stations.remove(remove_id):
+                return jsonify({'success': False, 'message': f'Unknown station {remove_id}'}), 404
+            self.encoder.forget(remove_id)
+            return jsonify({'success': True})
+
+        @self.app.route('/api/debug/timings', methods=['GET', 'POST'])
+        def debug_timings():
+            """Per-stage timing counters; POST {"enabled": bool, "reset": bool} to switch them"""
+            if request.method == 'POST':
+                data = request.json or {}
+                if 'enabled' in data:
+                    profiler.enabled = bool(data['enabled'])
+                if data.get('reset'):
+                    profiler.reset()
+            return jsonify(profiler.snapshot())
+
+        @self.app.route('/api/debug/profile')
+        def debug_profile():
+            """Sample all threads for ?seconds=N and return flame graph collapsed stacks"""
+            try:
+                seconds = min(60.0, max(0.1, float(request.args.get('seconds', 5))))
+                interval = min(1.0, max(0.001, float(request.args.get('interval', 0.005))))
+            except ValueError:
+                return jsonify({'success': False, 'message': 'seconds and interval must be numbers'}), 400
+            collapsed, samples = sample_stacks(seconds, interval, request.args.get('idle', '0') == '1')
+            response = Response(collapsed, mimetype='text/plain')
+            response.headers['X-Profile-Samples'] = str(samples)
+            response.headers['Content-Disposition'] = 'attachment; filename=comparatron-profile.collapsed'
+            return response
+
         @self.app.route('/calibration')
         def calibration():
             """Route for the calibration/settings page"""
             return render_template('calibration.html')
 
-    def update_frames(self):
-        """Continuously update frames from camera"""
-        while self.running:
-            if self.camera is not None and self.camera.isOpened():
-                ret, frame = self.camera.read()
-                if ret:
-                    with self.frame_lock:
-                        # Resize frame to desired resolution for performance
-                        if frame.shape[0] != 480 or frame.shape[1] != 640:
-                            frame = cv.resize(frame, (640, 480))
-                        self.current_frame = frame
-            else:
-                # Use a dummy frame if no camera is available
-                with self.frame_lock:
-                    self.current_frame = np.zeros((480, 640, 3), dtype=np.uint8)
-            time.sleep(1/15)  # 15 FPS
-    
-    def generate_frames(self):
-        """Generate frames for the video feed"""
-        while True:
-            with self.frame_lock:
-                frame = self.current_frame.copy()
-            
-            # Draw crosshair for target
-            h, w = frame.shape[:2]
-            center_x, center_y = w // 2, h // 2
-            
-            # Draw crosshair
-            cv.line(frame, (center_x - 20, center_y), (center_x + 20, center_y), (0, 0, 255), 1)
-            cv.line(frame, (center_x, center_y - 20), (center_x, center_y + 20), (0, 0, 255), 1)
-            
-            # Encode frame as JPEG
-            ret, buffer = cv.imencode('.jpg', frame)
-            if ret:
-                frame_bytes = buffer.tobytes()
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-            time.sleep(0.03)  # ~30 FPS cap to prevent overwhelming the client
-    
+    def export_transform(self, **kwargs):
+        """
+        Build the export transform, with the compensation map as first stage when calibrated
+
+        Args:
+            **kwargs: ExportTransform arguments (offset, scale, flip_y, normalize)
+
+        Returns:
+            ExportTransform: Transform pipeline for exporters
+        """
+        stages = []
+        if self.compensation is not None and not self.compensation.is_identity:
+            stages.append(self.compensation.apply)
+        return ExportTransform(stages=stages, **kwargs)
+
+    def record_point(self, point_x, point_y):
+        """
+        Record a measured point and update the point-to-point differences
+
+        The reported position is first corrected for backlash according to the
+        direction the stage arrived from (that depends on the motion history, so it
+        cannot be redone later). The DXF handler keeps these raw machine coordinates
+        so exports can apply the current compensation map; everything reported here
+        is compensated.
+
+        Args:
+            point_x (float): Reported X coordinate in mm
+            point_y (float): Reported Y coordinate in mm
+
+        Returns:
+            dict: Point, raw point, differences, deviation from nominal (if loaded) and the
+                live evaluation of the active point group (if any)
+        """
+        raw_x, raw_y = self.controller.compensate_backlash(point_x, point_y)
+        if self.compensation is not None:
+            point_x, point_y = self.compensation.apply_point(raw_x, raw_y)
+        self.update_differences(point_x, point_y)
+
+        # Add to recorded points list
+        self.recorded_points.append({'x': point_x, 'y': point_y})
+
+        # Add to DXF
+        self.dxf_handler.add_point(raw_x, raw_y)
+        evaluation = self.evaluation.add_point(point_x, point_y)
+
+        return {
+            'point': {'x': point_x, 'y': point_y},
+            'raw': {'x': raw_x, 'y': raw_y},
+            'differences': {
+                'x': self.difference_x,
+                'y': self.difference_y,
+                'distance': self.difference_distance
+            },
+            'deviation': self.nominal.deviation(point_x, point_y) if self.nominal else None,
+            'evaluation': evaluation
+        }
+
+    def update_differences(self, point_x, point_y):
+        """
+        Update the point-to-point differences with a new (compensated) measurement
+
+        Args:
+            point_x (float): X coordinate in mm
+            point_y (float): Y coordinate in mm
+        """
+        # Calculate differences
+        if self.prev_point_x != 0.0 or self.prev_point_y != 0.0:
+            self.difference_x = point_x - self.prev_point_x
+            self.difference_y = point_y - self.prev_point_y
+            self.difference_distance = ((self.difference_x ** 2) + (self.difference_y ** 2)) ** 0.5
+        else:
+            self.difference_x = 0.0
+            self.difference_y = 0.0
+            self.difference_distance = 0.0
+
+        # Update previous point
+        self.prev_point_x = point_x
+        self.prev_point_y = point_y
+
+    def silhouette_outlines(self, result, pos, shape, with_points=True):
+        """
+        Convert silhouette outlines from pixels to stage mm
+
+        The stage position is backlash corrected once for the whole frame;
+        points stay raw machine coordinates like recorded DXF entities.
+
+        Args:
+            result (dict): extract_silhouette result
+            pos (dict): Reported stage position when the frame was taken
+            shape (tuple): Frame shape
+            with_points (bool): Include the outline points
+
+        Returns:
+            dict: 'threshold', 'frame_time', 'seconds' and 'contours' with area (mm²),
+                perimeter (mm), centroid, hole/complete flags and optionally points
+        """
+        raw_x, raw_y = self.controller.compensate_backlash(pos['x'], pos['y'])
+        mmpp = self.mm_per_pixel
+        contours = []
+        for contour in result['contours']:
+            cx, cy = pixel_to_stage(contour['centroid'][0], contour['centroid'][1], raw_x, raw_y, mmpp, shape)
+            item = {'area': contour['area'] * mmpp * mmpp, 'perimeter': contour['perimeter'] * mmpp,
+                    'centroid': {'x': cx, 'y': cy}, 'hole': contour['hole'], 'complete': contour['complete']}
+            if with_points:
+                points = np.asarray(contour['points'])
+                xs, ys = pixel_to_stage(points[:, 0], points[:, 1], raw_x, raw_y, mmpp, shape)
+                item['points'] = np.column_stack((xs, ys)).round(5).tolist()
+            contours.append(item)
+        return {'threshold': result['threshold'], 'frame_time': result.get('frame_time'),
+                'seconds': result.get('seconds'), 'contours': contours}
+
+    def record_circle(self, center_x, center_y, diameter):
+        """
+        Record a measured hole or circle
+
+        The centre is corrected like a recorded point (backlash, then the
+        compensation map) and becomes the reference of the point-to-point
+        differences, so hole-to-hole distances can be read directly. The DXF
+        handler gets a CIRCLE entity at the raw machine position.
+
+        Args:
+            center_x (float): Reported centre X coordinate in mm
+            center_y (float): Reported centre Y coordinate in mm
+            diameter (float): Diameter in mm
+
+        Returns:
+            dict: Centre, raw centre, diameter and differences
+        """
+        raw_x, raw_y = self.controller.compensate_backlash(center_x, center_y)
+        if self.compensation is not None:
+            center_x, center_y = self.compensation.apply_point(raw_x, raw_y)
+        else:
+            center_x, center_y = raw_x, raw_y
+        self.update_differences(center_x, center_y)
+        self.recorded_circles.append({'x': center_x, 'y': center_y, 'diameter': diameter})
+        self.dxf_handler.add_circle(raw_x, raw_y, diameter / 2.0)
+        return {
+            'center': {'x': center_x, 'y': center_y},
+            'raw': {'x': raw_x, 'y': raw_y},
+            'diameter': diameter,
+            'differences': {
+                'x': self.difference_x,
+                'y': self.difference_y,
+                'distance': self.difference_distance
+            }
+        }
+
+    def analysis_frame(self, seq=None):
+        """
+        Frame reference of an analysis job for the current station
+
+        With a capture process the job names the frame ring and the sequence
+        number (the newest frame if seq is None), so workers read it in place;
+        otherwise a copy of the current frame is sent along.
+
+        Returns:
+            dict: ring_name and seq, or image
+        """
+        camera = self.camera
+        if isinstance(camera, CaptureProcess) and camera.ring is not None:
+            ring = camera.ring
+            return {'ring_name': ring.name, 'seq': int(seq) if seq is not None else ring.latest_seq}
+        station = self.station
+        with station.frame_lock:
+            return {'image': station.current_frame.copy()}
+
+    def wait_for_frame(self, after, timeout=1.0):
+        """Return the first camera frame of the current station captured after a given time"""
+        return self.station.wait_for_frame(after, timeout)
+
+    def run_measure_batch(self, job, targets, feed_rate=None, refine=False, search_radius=40, settle_time=0.0,
+                          moves=None, optimize=False, approach_distance=0.0):
+        """
+        Job function: move to each target, wait for Idle, grab a fresh frame and record the point
+
+        Args:
+            job (Job): Job receiving one result per target
+            targets (list): (x, y) target coordinates in mm
+            feed_rate (float): Feed rate for the measuring moves, defaults to the current feed rate
+            refine (bool): Snap to the edge nearest the crosshair in the captured frame
+            search_radius (int): Edge search radius in pixels
+            settle_time (float): Extra delay after Idle before the image settle check (s)
+            moves (list): Precompiled moves (see path_planner.compile_moves); built from targets if None
+            optimize (bool): Reorder the targets to minimise travel
+            approach_distance (float): Rapid (G0) to this distance short of each target, then feed in (mm)
+        """
+        if moves is None:
+            current = self.controller.get_current_position()
+            start = (current['x'], current['y']) if current else None
+            order = plan_route(targets, start) if optimize else None
+            moves = compile_moves(targets, order, feed_rate or self.controller.current_feed_rate,
+                                  approach_distance, start=start)
+        job.summary = {'order': [move['index'] for move in moves],
+                       'travel': route_length([(m['x'], m['y']) for m in moves], range(len(moves)))}
+
+        for move in moves:
+            if job.cancelled:
+                return
+            x, y = move['x'], move['y']
+            result = {'index': move['index'], 'target': {'x': x, 'y': y}}
+            if not self.controller.execute(move['gcode']):
+                raise RuntimeError(f"Move to ({x}, {y}) was not accepted by the machine")
+            status = self.controller.wait_for_idle()
+            if status is None:
+                raise RuntimeError(f"Machine did not reach Idle at ({x}, {y})")
+            if settle_time > 0:
+                time.sleep(settle_time)
+
+            point_x, point_y = status['x'], status['y']
+            result['refined'] = False
+            if self.camera is not None:
+                frame, frame_time, result['settle'] = self.settle.wait_for_settled_frame(time.time())
+                result['frame_time'] = frame_time
+                if refine and frame is not None:
+                    edge = refine_edge_point(frame, search_radius)
+                    if edge is not None:
+                        point_x, point_y = pixel_to_stage(edge[0], edge[1], status['x'], status['y'],
+                                                          self.mm_per_pixel, frame.shape)
+                        result['refined'] = True
+            result.update(self.record_point(point_x, point_y))
+            job.add_result(result)
+
+    def run_program(self, job, program, feed_rate=None, optimize=False, approach_distance=0.0, **options):
+        """
+        Job function: replay a compiled inspection program and store its result set
+
+        Args:
+            job (Job): Job receiving one result per measurement point
+            program (InspectionProgram): Program to replay
+            feed_rate (float): Override of the program feed rate
+            optimize (bool): Reorder the points to minimise travel
+            approach_distance (float): Length of the final feed approach (mm)
+            **options: Passed on to run_measure_batch (refine, search_radius, settle_time)
+        """
+        current = self.controller.get_current_position()
+        start = (current['x'], current['y']) if current else None
+        rotation = self.registration['rotation'] if self.registration else 0.0
+        compiled = program.compile(feed_rate, optimize, approach_distance, start, rotation)
+        try:
+            self.run_measure_batch(job, None, moves=compiled, **options)
+        finally:
+            if job.results:
+                run = self.program_store.save_run(program.name, list(job.results), {
+                    'feed_rate': feed_rate or program.feed_rate,
+                    'complete': len(job.results) == len(compiled),
+                    'options': dict(options, optimize=optimize, approach_distance=approach_distance,
+                                    rotation=rotation)
+                })
+                job.summary = dict(job.summary or {}, program=program.name, run_id=run['id'])
+
+    def run_calibration(self, job, nominal, apply=True, **options):
+        """
+        Job function: run the guided calibration and activate the resulting compensation map
+
+        Args:
+            job (Job): Job receiving one result per reference fiducial
+            nominal (list): Reference fiducial positions relative to the first one
+            apply (bool): Save the fitted map as the active compensation
+            **options: Passed on to CalibrationRunner.run
+        """
+        runner = CalibrationRunner(self.controller, self.wait_for_frame, self.mm_per_pixel, self.settings)
+        runner.run(job, nominal, **options)
+        if apply and job.summary and not job.cancelled:
+            comp = CompensationMap.from_dict(job.summary['map'])
+            if comp.save(self.compensation_file):
+                self.compensation = comp
+            job.summary['applied'] = self.compensation is comp
+
+    def run_registration(self, job, part, **options):
+        """
+        Job function: register a part from its two datums and remember its offset and rotation
+
+        Args:
+            job (Job): Job receiving one result per datum
+            part (dict): Part loaded with RegistrationStore.load
+            **options: Passed on to PartRegistration.run
+        """
+        registration = PartRegistration(self.controller, self.wait_for_frame, self.mm_per_pixel)
+        registration.run(job, part, **options)
+        if job.summary and job.summary['applied']:
+            self.registration = job.summary
+
+    def run_focus_stack(self, job, z_start, z_end, **options):
+        """
+        Job function: sweep Z, fuse the frames and keep the result with the stage position
+
+        Args:
+            job (Job): Job receiving one result per captured frame
+            z_start (float): Sweep start Z (mm)
+            z_end (float): Sweep end Z (mm)
+            **options: Passed on to FocusStack.run
+        """
+        pos = self.controller.get_current_position()
+        if pos is None or 'x' not in pos:
+            raise RuntimeError("Could not read the stage position")
+        stacked = FocusStack(self.controller, self.station.frames_since).run(job, z_start, z_end, **options)
+        if stacked is not None:
+            x, y = self.controller.compensate_backlash(pos['x'], pos['y'])
+            stacked.update(x=x, y=y, mm_per_pixel=self.mm_per_pixel)
+            self.focus_stack = stacked
+
+    def generate_frames(self, subscriber=None):
+        """
+        Generate frames for the video feed of the current station
+
+        Args:
+            subscriber (VideoSubscriber): Adaptation state of this viewer, a default one if None
+        """
+        station = self.station
+        subscriber = subscriber or VideoSubscriber()
+        sent = None
+        while self.stations.get(station.id) is station:
+            # Frames arriving before the viewer's next slot, or while it is behind, are skipped
+            delay = subscriber.ready_in()
+            if delay > 0:
+                time.sleep(min(delay, 0.5))
+                continue
+            # Wait for a new frame instead of polling; idle stations still refresh slowly
+            with station.frame_ready:
+                station.frame_ready.wait_for(lambda: station.current_frame_time != sent, 0.5)
+                sent = station.current_frame_time
+            with span('video.frame'):
+                frame_bytes = self.encoder.jpeg(station, *subscriber.profile())
+            if frame_bytes:
+                chunk = (b'--frame\r\n'
+                         b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+                start = time.monotonic()
+                yield chunk  # Resumes once the server has written the chunk to the socket
+                subscriber.sent(len(chunk), time.monotonic() - start)
+
     def run(self, host='0.0.0.0', port=5000, debug=False):
         """Run the Flask application"""
         # Run the Flask app
-        self.app.run(host=host, port=port, debug=debug, threaded=True)
+        try:
+            self.app.run(host=host, port=port, debug=debug, threaded=True)
+        finally:
+            self.analysis.close()
+            self.stations.close()
+
+
+# Attributes of ComparatronFlaskGUI that belong to the current station
+STATION_ATTRIBUTES = (
+    'serial_comm', 'controller', 'settings', 'dxf_handler', 'recording', 'compensation',
+    'compensation_file', 'backlash_file', 'camera', 'camera_index', 'settle',
+    'prev_point_x', 'prev_point_y', 'difference_x', 'difference_y', 'difference_distance',
+    'data_acq_status', 'jog_distance', 'recorded_points', 'recorded_circles', 'registration', 'best_fit',
+    'evaluation', 'silhouette_enabled', 'silhouette_options', 'silhouette', 'focus_stack',
+    'nominal', 'overlay_enabled', 'mm_per_pixel', '_overlay_cache'
+)
+
+
+def _station_attribute(name):
+    """Property forwarding an attribute to ComparatronFlaskGUI.station"""
+    return property(lambda self: getattr(self.station, name),
+                    lambda self, value: setattr(self.station, name, value),
+                    doc=f"{name} of the current station")
+
+
+for _name in STATION_ATTRIBUTES:
+    setattr(ComparatronFlaskGUI, _name, _station_attribute(_name))
 
 
 def main():
@@ -0,0 +1,247 @@
+"""
+Inspection Program Module for Comparatron
+Records jog and measurement sessions as programs, compiles them to G-code and stores replay results
+"""
+
+import json
+import logging
+import math
+import os
+import re
+import time
+from path_planner import plan_route, compile_moves
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Default location of saved programs and their runs
+DEFAULT_PROGRAM_DIR = os.path.expanduser('~/.comparatron/programs')
+
+
+class InspectionProgram:
+    """
+    Class holding an ordered list of recorded steps
+
+    Measurement positions are stored in work coordinates, i.e. relative to the
+    fixture origin set with set_origin (G92X0Y0), so a program can be replayed
+    on another part after setting the origin on it.
+    """
+
+    def __init__(self, name, steps=None, created=None, feed_rate=1000):
+        """
+        Initialize the program
+
+        Args:
+            name (str): Program name, also used as the file name
+            steps (list): Recorded steps ({'type': 'jog'|'measure', ...})
+            created (float): Creation time stamp
+            feed_rate (float): Feed rate used for replay moves (mm/min)
+        """
+        self.name = name
+        self.steps = steps or []
+        self.created = created or time.time()
+        self.feed_rate = feed_rate
+
+    def add_jog(self, axis, distance):
+        """
+        Record a manual jog (kept for reference, replay moves directly between points)
+
+        Args:
+            axis (str): 'x', 'y' or 'z'
+            distance (float): Signed jog distance in mm
+        """
+        self.steps.append({'type': 'jog', 'axis': axis, 'distance': float(distance)})
+
+    def add_measure(self, x, y, z=None):
+        """
+        Record a measurement position in work coordinates
+
+        Args:
+            x (float): X position in mm
+            y (float): Y position in mm
+            z (float): Z (focus) position in mm, if known
+        """
+        self.steps.append({'type': 'measure', 'x': float(x), 'y': float(y),
+                           'z': None if z is None else float(z)})
+
+    def measure_points(self):
+        """Return the measurement steps in recorded order"""
+        return [step for step in self.steps if step['type'] == 'measure']
+
+    def compile(self, feed_rate=None, optimize=False, approach_distance=0.0, start=None, rotation=0.0):
+        """
+        Compile the program into one move per measurement point
+
+        Intermediate jogs are dropped, G90 and the feed word are emitted once (both
+        are modal) and Z is only included when the focus height changes.
+
+        Args:
+            feed_rate (float): Override of the program feed rate (mm/min)
+            optimize (bool): Reorder the points to minimise travel
+            approach_distance (float): Rapid to this distance short of each point, then feed in (mm)
+            start (tuple): Current stage position, used as the start of the optimized route
+            rotation (float): Part rotation found by registration (degrees counter-clockwise
+                about the work origin), applied to every point
+
+        Returns:
+            list: One entry per measurement in visiting order:
+                {'index', 'x', 'y', 'z', 'gcode': [lines]}, index being the recorded order
+        """
+        steps = self.measure_points()
+        points = [(step['x'], step['y']) for step in steps]
+        if rotation:
+            c, s = math.cos(math.radians(rotation)), math.sin(math.radians(rotation))
+            points = [(c * x - s * y, s * x + c * y) for x, y in points]
+        order = plan_route(points, start) if optimize and points else None
+        return compile_moves(points, order, feed_rate or self.feed_rate, approach_distance,
+                             zs=[step.get('z') for step in steps], start=start)
+
+    def to_gcode(self, feed_rate=None, optimize=False, approach_distance=0.0):
+        """Return the compiled program as G-code text"""
+        lines = [f"; Comparatron inspection program {self.name}"]
+        for move in self.compile(feed_rate, optimize, approach_distance):
+            lines.extend(move['gcode'])
+        return '\n'.join(lines) + '\n'
+
+    def to_dict(self):
+        return {'name': self.name, 'created': self.created, 'feed_rate': self.feed_rate, 'steps': self.steps}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['name'], data.get('steps', []), data.get('created'), data.get('feed_rate', 1000))
+
+
+def compare_runs(run_a, run_b):
+    """
+    Compare two runs of the same program point by point
+
+    Args:
+        run_a (dict): Reference run as stored by ProgramStore.save_run
+        run_b (dict): Run to compare
+
+    Returns:
+        dict: Per-point differences (b - a) and summary statistics
+    """
+    points_a = {r['index']: r['point'] for r in run_a.get('results', [])}
+    differences = []
+    for result in run_b.get('results', []):
+        a = points_a.get(result['index'])
+        if a is None:
+            continue
+        dx = result['point']['x'] - a['x']
+        dy = result['point']['y'] - a['y']
+        differences.append({'index': result['index'], 'dx': dx, 'dy': dy, 'distance': math.hypot(dx, dy)})
+    distances = [d['distance'] for d in differences]
+    return {
+        'reference': run_a.get('id'),
+        'run': run_b.get('id'),
+        'points': differences,
+        'max_distance': max(distances) if distances else None,
+        'mean_distance': sum(distances) / len(distances) if distances else None
+    }
+
+
+class ProgramStore:
+    """
+    Class to save programs and their run result sets as JSON files
+
+    Layout: <directory>/<name>.json and <directory>/<name>/runs/<run id>.json
+    """
+
+    def __init__(self, directory=DEFAULT_PROGRAM_DIR):
+        self.directory = directory
+
+    @staticmethod
+    def safe_name(name):
+        """Restrict a program name to characters that are safe in file names"""
+        cleaned = re.sub(r'[^A-Za-z0-9_.-]+', '_', str(name)).strip('._')
+        if not cleaned:
+            raise ValueError(f"Invalid program name: {name!r}")
+        return cleaned
+
+    def _program_path(self, name):
+        return os.path.join(self.directory, self.safe_name(name) + '.json')
+
+    def _runs_dir(self, name):
+        return os.path.join(self.directory, self.safe_name(name), 'runs')
+
+    def list_programs(self):
+        """Return the names of all saved programs"""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(f[:-5] for f in os.listdir(self.directory) if f.endswith('.json'))
+
+    def save(self, program):
+        """
+        Save a program
+
+        Returns:
+            str: Path of the written file
+        """
+        program.name = self.safe_name(program.name)
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._program_path(program.name)
+        with open(path, 'w') as f:
+            json.dump(program.to_dict(), f, indent=2)
+        logging.info(f"Saved inspection program to {path}")
+        return path
+
+    def load(self, name):
+        """
+        Load a program
+
+        Returns:
+            InspectionProgram: The program, or None if it does not exist
+        """
+        path = self._program_path(name)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return InspectionProgram.from_dict(json.load(f))
+
+    def save_run(self, name, results, metadata=None):
+        """
+        Store the results of one replay
+
+        Args:
+            name (str): Program name
+            results (list): Job results (one per measurement point)
+            metadata (dict): Extra information such as feed rate or refinement
+
+        Returns:
+            dict: The stored run
+        """
+        run_id = time.strftime('%Y%m%d-%H%M%S') + f'-{int(time.time() * 1000) % 1000:03d}'
+        run = dict(metadata or {}, id=run_id, program=self.safe_name(name), timestamp=time.time(), results=results)
+        runs_dir = self._runs_dir(name)
+        os.makedirs(runs_dir, exist_ok=True)
+        with open(os.path.join(runs_dir, run_id + '.json'), 'w') as f:
+            json.dump(run, f, indent=2)
+        return run
+
+    def list_runs(self, name):
+        """Return the run ids of a program, oldest first"""
+        runs_dir = self._runs_dir(name)
+        if not os.path.isdir(runs_dir):
+            return []
+        return sorted(f[:-5] for f in os.listdir(runs_dir) if f.endswith('.json'))
+
+    def load_run(self, name, run_id):
+        """Load a stored run, or None if it does not exist"""
+        path = os.path.join(self._runs_dir(name), self.safe_name(run_id) + '.json')
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+
+if __name__ == "__main__":
+    # Test program compilation
+    program = InspectionProgram('demo')
+    program.add_jog('x', 10)
+    program.add_measure(10, 0, 0)
+    program.add_jog('y', 5)
+    program.add_measure(10, 5, 0)
+    program.add_jog('z', -1)
+    program.add_measure(0, 5, -1)
+    print(program.to_gcode())
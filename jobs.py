@@ -0,0 +1,244 @@
+"""
+Job Management Module for Comparatron
+Runs long machine operations in the background and collects their results incrementally
+"""
+
+import collections
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class Job:
+    """
+    Class holding the state and the growing result list of one background job
+    """
+
+    def __init__(self, job_id, kind, total=None, lane=None):
+        self.id = job_id
+        self.kind = kind
+        self.total = total
+        self.lane = lane  # Jobs of the same lane (machine) never run concurrently
+        self.status = 'queued'
+        self.error = None
+        self.results = []
+        self.summary = None  # Optional final result of the whole job (set by the job function)
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self._cancel = threading.Event()
+        self._changed = threading.Condition()
+
+    @property
+    def cancelled(self):
+        """True once cancellation was requested; job functions should check this between steps"""
+        return self._cancel.is_set()
+
+    @property
+    def done(self):
+        return self.status in ('finished', 'failed', 'cancelled')
+
+    def cancel(self):
+        """Request cancellation of the job"""
+        self._cancel.set()
+        with self._changed:
+            self._changed.notify_all()
+
+    def add_result(self, result):
+        """
+        Append a result and wake up any waiting readers
+
+        Args:
+            result (dict): JSON-serializable result entry
+        """
+        with self._changed:
+            self.results.append(result)
+            self._changed.notify_all()
+
+    def _set_status(self, status, error=None):
+        with self._changed:
+            self.status = status
+            self.error = error
+            if status == 'running':
+                self.started = time.time()
+            elif status in ('finished', 'failed', 'cancelled'):
+                self.finished = time.time()
+            self._changed.notify_all()
+
+    def wait_for_results(self, since, timeout=1.0):
+        """
+        Block until there are results beyond index `since` or the job is done
+
+        Args:
+            since (int): Number of results the caller has already seen
+            timeout (float): Maximum wait in seconds
+
+        Returns:
+            list: New results (possibly empty on timeout)
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: len(self.results) > since or self.done, timeout)
+            return self.results[since:]
+
+    def snapshot(self, since=0):
+        """
+        Describe the job for the API
+
+        Args:
+            since (int): Only include results from this index on
+
+        Returns:
+            dict: Job status with the requested slice of results
+        """
+        with self._changed:
+            return {
+                'id': self.id,
+                'kind': self.kind,
+                'lane': self.lane,
+                'status': self.status,
+                'error': self.error,
+                'total': self.total,
+                'completed': len(self.results),
+                'since': since,
+                'results': self.results[since:],
+                'summary': self.summary,
+                'created': self.created,
+                'started': self.started,
+                'finished': self.finished
+            }
+
+
+class JobManager:
+    """
+    Class to run jobs on a shared worker pool, one at a time per lane
+
+    Jobs share a machine and its camera, so jobs of the same lane (station) are
+    serialized; jobs of different lanes run in parallel on the same pool.
+    """
+
+    def __init__(self, max_history=20, max_workers=4):
+        """
+        Initialize the job manager
+
+        Args:
+            max_history (int): Number of finished jobs kept for later queries
+            max_workers (int): Maximum number of lanes running at the same time
+        """
+        self.max_history = max_history
+        self.jobs = {}
+        self._ids = itertools.count(1)
+        self._pending = {}  # lane -> deque of (job, func, args, kwargs)
+        self._active = set()  # Lanes with a drain task on the pool
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers, thread_name_prefix='jobs')
+
+    def submit(self, kind, func, *args, total=None, lane=None, **kwargs):
+        """
+        Queue a job
+
+        Args:
+            kind (str): Job type name, e.g. 'measure_batch'
+            func (callable): Called as func(job, *args, **kwargs) on a worker thread
+            total (int): Expected number of results, if known
+            lane (str): Serialization key, e.g. the station id
+
+        Returns:
+            Job: The queued job
+        """
+        with self._lock:
+            job = Job(str(next(self._ids)), kind, total, lane)
+            self.jobs[job.id] = job
+            self._prune()
+            self._pending.setdefault(lane, collections.deque()).append((job, func, args, kwargs))
+            if lane not in self._active:
+                self._active.add(lane)
+                self._pool.submit(self._drain, lane)
+        return job
+
+    def get(self, job_id):
+        """Return the job with the given id or None"""
+        return self.jobs.get(str(job_id))
+
+    def list_jobs(self, lane=None):
+        """
+        Return snapshots (without results) of the known jobs
+
+        Args:
+            lane (str): Only jobs of this lane, all jobs if None
+        """
+        jobs = []
+        for job in list(self.jobs.values()):
+            if lane is not None and job.lane != lane:
+                continue
+            info = job.snapshot(len(job.results))
+            del info['results']
+            jobs.append(info)
+        return jobs
+
+    def cancel(self, job_id):
+        """
+        Cancel a queued or running job
+
+        Returns:
+            bool: True if the job exists
+        """
+        job = self.get(job_id)
+        if job is None:
+            return False
+        job.cancel()
+        return True
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond max_history"""
+        finished = [j for j in self.jobs.values() if j.done]
+        for job in finished[:max(0, len(finished) - self.max_history)]:
+            del self.jobs[job.id]
+
+    def _drain(self, lane):
+        """Run the queued jobs of one lane until its queue is empty"""
+        while True:
+            with self._lock:
+                pending = self._pending.get(lane)
+                if not pending:
+                    self._active.discard(lane)
+                    return
+                job, func, args, kwargs = pending.popleft()
+            self._execute(job, func, args, kwargs)
+
+    def _execute(self, job, func, args, kwargs):
+        """Run one job and record its outcome"""
+        if job.cancelled:
+            job._set_status('cancelled')
+            return
+        job._set_status('running')
+        try:
+            func(job, *args, **kwargs)
+            job._set_status('cancelled' if job.cancelled else 'finished')
+        except Exception as e:
+            logging.error(f"Job {job.id} ({job.kind}) failed: {e}")
+            print(f"Job {job.id} ({job.kind}) failed: {e}")
+            job._set_status('failed', str(e))
+
+
+if __name__ == "__main__":
+    # Test the job manager with a dummy job
+    def count(job, n):
+        for i in range(n):
+            if job.cancelled:
+                return
+            job.add_result({'index': i})
+            time.sleep(0.01)
+
+    manager = JobManager()
+    job = manager.submit('count', count, 5, total=5)
+    seen = 0
+    while not job.done or seen < len(job.results):
+        new = job.wait_for_results(seen)
+        seen += len(new)
+        print(f"Received {new}")
+    print(job.snapshot(seen))
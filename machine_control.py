@@ -3,7 +3,8 @@ Control Module for Comparatron
 Handles machine control functions like jogging, homing, etc.
 """
 
-from serial_comm import SerialCommunicator
+from serial_comm import SerialCommunicator, parse_status_report
+import re
 import time
 import logging
 
@@ -11,6 +12,28 @@ import logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 
+def move_gcode(x, y, z=None, feed_rate=None, rapid=False):
+    """
+    Build a single absolute move line
+
+    Args:
+        x (float): Target X in mm
+        y (float): Target Y in mm
+        z (float): Target Z in mm, omitted if None
+        feed_rate (float): Feed word for G1 moves, omitted if None (modal)
+        rapid (bool): Use G0 instead of G1
+
+    Returns:
+        str: G-code line such as 'G1X10.0000Y5.0000F1000'
+    """
+    line = f"{'G0' if rapid else 'G1'}X{x:.4f}Y{y:.4f}"
+    if z is not None:
+        line += f"Z{z:.4f}"
+    if feed_rate and not rapid:
+        line += f"F{feed_rate:g}"
+    return line
+
+
 class MachineController:
     """
     Class to handle machine control operations
@@ -27,6 +50,13 @@ class MachineController:
         self.current_feed_rate = self.feed_rates['default']
         self.jog_distance = 10.0  # Default jog distance
         self.position_history = []
+        self.last_position = None  # Latest parsed status report, for consumers that must not block
+        self.work_offset = None  # Last WCO reported by GRBL 1.1
+        # Backlash per axis (mm) and the direction of the last motion on each axis
+        # (+1/-1, 0 unknown); see compensate_backlash
+        self.backlash = {'x': 0.0, 'y': 0.0}
+        self.approach_direction = {'x': 0, 'y': 0}
+        self.relative_motion = False  # Last G90/G91 seen by track_motion
     
     def set_jog_distance(self, distance):
         """
@@ -79,9 +109,8 @@ class MachineController:
         command = f"G91G1F{self.current_feed_rate}X{distance}\rG90"  # Move only X, then return to absolute
         logging.info(f"Jogging X+ by {distance}mm at feed rate {self.current_feed_rate}")
         print(f"Jogging X+ by {distance}mm at feed rate {self.current_feed_rate}")
+        self.note_motion(dx=distance)
         result = self.comm.send_command(command)
-        # Ensure we wait for the move to complete before next command
-        time.sleep(0.1)  # Small delay to ensure command completes
         if result is None:
             print("X+ jog command sent but no response - check motor power")
         return result
@@ -92,9 +121,8 @@ class MachineController:
         command = f"G91G1F{self.current_feed_rate}X-{distance}\rG90"  # Move only X, then return to absolute
         logging.info(f"Jogging X- by {distance}mm at feed rate {self.current_feed_rate}")
         print(f"Jogging X- by {distance}mm at feed rate {self.current_feed_rate}")
+        self.note_motion(dx=-distance)
         result = self.comm.send_command(command)
-        # Ensure we wait for the move to complete before next command
-        time.sleep(0.1)  # Small delay to ensure command completes
         if result is None:
             print("X- jog command sent but no response - check motor power")
         return result
@@ -105,9 +133,8 @@ class MachineController:
         command = f"G91G1F{self.current_feed_rate}Y{distance}\rG90"  # Move only Y, then return to absolute
         logging.info(f"Jogging Y+ by {distance}mm at feed rate {self.current_feed_rate}")
         print(f"Jogging Y+ by {distance}mm at feed rate {self.current_feed_rate}")
+        self.note_motion(dy=distance)
         result = self.comm.send_command(command)
-        # Ensure we wait for the move to complete before next command
-        time.sleep(0.1)  # Small delay to ensure command completes
         if result is None:
             print("Y+ jog command sent but no response - check motor power")
         return result
@@ -118,9 +145,8 @@ class MachineController:
         command = f"G91G1F{self.current_feed_rate}Y-{distance}\rG90"  # Move only Y, then return to absolute
         logging.info(f"Jogging Y- by {distance}mm at feed rate {self.current_feed_rate}")
         print(f"Jogging Y- by {distance}mm at feed rate {self.current_feed_rate}")
+        self.note_motion(dy=-distance)
         result = self.comm.send_command(command)
-        # Ensure we wait for the move to complete before next command
-        time.sleep(0.1)  # Small delay to ensure command completes
         if result is None:
             print("Y- jog command sent but no response - check motor power")
         return result
@@ -132,8 +158,6 @@ class MachineController:
         logging.info(f"Jogging Z+ by {distance}mm at feed rate {self.current_feed_rate}")
         print(f"Jogging Z+ by {distance}mm at feed rate {self.current_feed_rate}")
         result = self.comm.send_command(command)
-        # Ensure we wait for the move to complete before next command
-        time.sleep(0.1)  # Small delay to ensure command completes
         if result is None:
             print("Z+ jog command sent but no response - check motor power")
         return result
@@ -145,8 +169,6 @@ class MachineController:
         logging.info(f"Jogging Z- by {distance}mm at feed rate {self.current_feed_rate}")
         print(f"Jogging Z- by {distance}mm at feed rate {self.current_feed_rate}")
         result = self.comm.send_command(command)
-        # Ensure we wait for the move to complete before next command
-        time.sleep(0.1)  # Small delay to ensure command completes
         if result is None:
             print("Z- jog command sent but no response - check motor power")
         return result
@@ -189,12 +211,154 @@ class MachineController:
     def get_current_position(self):
         """
         Get current machine position
-        
+
         Returns:
-            dict: Position information from machine
+            dict: Position information from machine (see parse_status_report)
+        """
+        status = parse_status_report(self.comm.get_machine_status(), self.work_offset)
+        self.update_position(status)
+        return status
+
+    def update_position(self, status):
         """
-        return self.comm.get_machine_status()
+        Remember the latest parsed status report without querying the machine
+
+        Args:
+            status (dict): Parsed status report, ignored if None
+        """
+        if status:
+            if status.get('wco'):
+                self.work_offset = status['wco']
+            self.last_position = status
     
+    def move_to(self, x, y, feed_rate=None, z=None):
+        """
+        Queue an absolute move in work coordinates without waiting for it to finish
+
+        Args:
+            x (float): Target X position in mm
+            y (float): Target Y position in mm
+            feed_rate (float): Feed rate in mm/min, defaults to the current feed rate
+            z (float): Target Z position in mm, unchanged if None
+
+        Returns:
+            bool: True if GRBL accepted the move
+        """
+        return self.execute(['G90', move_gcode(x, y, z, feed_rate or self.current_feed_rate)])
+
+    def execute(self, commands):
+        """
+        Stream G-code lines to the machine
+
+        Args:
+            commands (list): G-code lines
+
+        Returns:
+            bool: True if every line was acknowledged with 'ok'
+        """
+        if not commands:
+            return True
+        self.track_motion(commands)
+        responses = self.comm.stream_commands(commands)
+        return bool(responses) and all(r == 'ok' for r in responses)
+
+    def track_motion(self, commands):
+        """
+        Update approach_direction from the X/Y words of G0/G1 lines (G90/G91 aware)
+
+        Also used for G-code that bypasses execute() (manual jog buttons and the
+        raw console), so the distance mode is kept across calls.
+
+        Args:
+            commands (list): G-code lines, possibly several per string
+        """
+        commands = [part for line in commands for part in str(line).splitlines()]
+        relative = self.relative_motion
+        current = [None, None]
+        if self.last_position:
+            current = [self.last_position['x'], self.last_position['y']]
+        for line in commands:
+            line = line.upper().replace(' ', '')
+            if 'G91' in line:
+                relative = True
+            elif 'G90' in line:
+                relative = False
+            if not re.search(r'G0?[01](?!\d)', line):
+                continue
+            words = dict(re.findall(r'([XY])(-?\d*\.?\d+)', line))
+            delta = [0.0, 0.0]
+            for i, axis in enumerate('XY'):
+                if axis not in words:
+                    continue
+                value = float(words[axis])
+                if relative:
+                    delta[i] = value
+                    current[i] = None if current[i] is None else current[i] + value
+                else:
+                    if current[i] is not None:
+                        delta[i] = value - current[i]
+                    current[i] = value
+            self.note_motion(*delta)
+        self.relative_motion = relative
+
+    def note_motion(self, dx=0.0, dy=0.0):
+        """
+        Remember the direction of a motion for backlash compensation
+
+        Args:
+            dx (float): X travel of the move (sign is what matters)
+            dy (float): Y travel of the move
+        """
+        if dx:
+            self.approach_direction['x'] = 1 if dx > 0 else -1
+        if dy:
+            self.approach_direction['y'] = 1 if dy > 0 else -1
+
+    def compensate_backlash(self, x, y):
+        """
+        Correct a reported position for the direction the stage arrived from
+
+        Positions reached with a positive motion are the reference (the calibration
+        runner approaches from that side). After a negative motion the carriage stops
+        one backlash width further in the positive direction than the reported position.
+
+        Args:
+            x (float): Reported X position in mm
+            y (float): Reported Y position in mm
+
+        Returns:
+            tuple: (x, y) corrected position
+        """
+        if self.approach_direction['x'] < 0:
+            x += self.backlash['x']
+        if self.approach_direction['y'] < 0:
+            y += self.backlash['y']
+        return x, y
+
+    def wait_for_idle(self, timeout=60.0, poll_interval=0.01):
+        """
+        Poll the status report until the machine reports Idle
+
+        Args:
+            timeout (float): Maximum time to wait in seconds
+            poll_interval (float): Delay between status queries in seconds
+
+        Returns:
+            dict: Parsed Idle status report, or None on alarm or timeout
+        """
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            status = self.get_current_position()
+            if status:
+                if status['state'].startswith('Idle'):
+                    return status
+                if status['state'].startswith('Alarm'):
+                    logging.warning("Machine in alarm state while waiting for Idle")
+                    return None
+            time.sleep(poll_interval)
+        logging.warning("Timeout waiting for machine to become Idle")
+        return None
+
     def record_position(self):
         """
         Record current position in history
@@ -55,33 +55,16 @@ def main():
         print(f"Error importing GUI: {e}")
         print("Trying to ensure dependencies are available...")
 
-        # Try to install missing packages if needed
-        try:
-            import subprocess
-            import importlib
-            missing_packages = []
-
-            for pkg in ["flask", "numpy", "cv2", "PIL", "serial", "ezdxf"]:
-                try:
-                    if pkg == "cv2":
-                        import cv2 as cv
-                    elif pkg == "PIL":
-                        import PIL
-                    elif pkg == "serial":
-                        import serial
-                    else:
-                        importlib.import_module(pkg)
-                except ImportError:
-                    missing_packages.append(pkg)
-
-            if missing_packages:
-                print(f"Missing packages detected: {missing_packages}")
-                print("Please run the installation script first:")
-                print("cd dependencies/")
-                print("./install_dependencies_universal.sh")
-                return
-        except Exception as e:
-            print(f"Error checking packages: {e}")
+        # Find the missing packages without importing them again (slow and can fail the same way)
+        import importlib.util
+        missing_packages = [pkg for pkg in ["flask", "numpy", "cv2", "PIL", "serial", "ezdxf"]
+                            if importlib.util.find_spec(pkg) is None]
+        if missing_packages:
+            print(f"Missing packages detected: {missing_packages}")
+            print("Please run the installation script first:")
+            print("cd dependencies/")
+            print("./install_dependencies_universal.sh")
+            return
 
         raise e
 
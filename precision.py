@@ -0,0 +1,249 @@
+"""
+Precision Benchmark Module for Comparatron
+Characterizes repeatability, backlash and settling time of the stage with the camera
+"""
+
+import json
+import logging
+import os
+import time
+import numpy as np
+from camera_manager import pixel_to_stage
+from machine_control import move_gcode
+from vision import locate_fiducial
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Default locations of the active backlash values and of the benchmark reports
+DEFAULT_BACKLASH_FILE = os.path.expanduser('~/.comparatron/backlash.json')
+DEFAULT_REPORT_DIR = os.path.expanduser('~/.comparatron/reports')
+
+# Final motion direction of each approach
+DIRECTIONS = {'+x': (1, 0), '-x': (-1, 0), '+y': (0, 1), '-y': (0, -1)}
+
+
+def load_backlash(filename=DEFAULT_BACKLASH_FILE):
+    """
+    Load the backlash values applied by MachineController.compensate_backlash
+
+    Returns:
+        dict: {'x': mm, 'y': mm}, zeros if no values were saved
+    """
+    try:
+        with open(filename) as f:
+            data = json.load(f)
+        return {'x': float(data.get('x', 0.0)), 'y': float(data.get('y', 0.0))}
+    except (OSError, ValueError) as e:
+        if not isinstance(e, FileNotFoundError):
+            logging.error(f"Error loading backlash values from {filename}: {e}")
+        return {'x': 0.0, 'y': 0.0}
+
+
+def save_backlash(backlash, filename=DEFAULT_BACKLASH_FILE):
+    """
+    Save backlash values
+
+    Returns:
+        bool: True if saved successfully
+    """
+    try:
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(filename, 'w') as f:
+            json.dump({'x': backlash['x'], 'y': backlash['y'], 'timestamp': time.time()}, f, indent=2)
+        return True
+    except Exception as e:
+        logging.error(f"Error saving backlash values to {filename}: {e}")
+        print(f"Error saving backlash values to {filename}: {e}")
+        return False
+
+
+def summarize(samples):
+    """
+    Compute repeatability, backlash and settling statistics from benchmark samples
+
+    Repeatability is the pooled standard deviation of the measured feature position
+    over repeated approaches from the same direction. Backlash is the difference of
+    the mean positions after positive and negative approaches along the same axis:
+    the feature appears shifted by the backlash width when the carriage stops short.
+
+    Args:
+        samples (list): Dicts with 'feed', 'direction', 'x', 'y', 'settle_time'
+
+    Returns:
+        dict: {'repeatability': {'x', 'y'} (sigma, mm), 'backlash': {'x', 'y'} (mm),
+            'per_feed': {feed: {...}}, 'settle_time': {'mean', 'max'}}
+    """
+    def pooled_sigma(groups):
+        residuals = [v - np.mean(v) for v in groups if len(v) > 1]
+        dof = sum(len(v) - 1 for v in groups if len(v) > 1)
+        if not dof:
+            return None
+        return float(np.sqrt(sum((r ** 2).sum() for r in residuals) / dof))
+
+    def backlash(rows, axis):
+        positive = [r[axis] for r in rows if r['direction'] == '+' + axis]
+        negative = [r[axis] for r in rows if r['direction'] == '-' + axis]
+        if not positive or not negative:
+            return None
+        return float(np.mean(positive) - np.mean(negative))
+
+    def groups(rows, axis):
+        return [np.array([r[axis] for r in rows if r['direction'] == d])
+                for d in ('+' + axis, '-' + axis)]
+
+    per_feed = {}
+    for feed in sorted({s['feed'] for s in samples}):
+        rows = [s for s in samples if s['feed'] == feed]
+        settle = [r['settle_time'] for r in rows if r.get('settle_time') is not None]
+        per_feed[str(feed)] = {
+            'repeatability': {'x': pooled_sigma(groups(rows, 'x')), 'y': pooled_sigma(groups(rows, 'y'))},
+            'backlash': {'x': backlash(rows, 'x'), 'y': backlash(rows, 'y')},
+            'settle_time': {'mean': float(np.mean(settle)) if settle else None,
+                            'max': float(np.max(settle)) if settle else None}
+        }
+
+    # Feeds are pooled per feed so a feed-dependent offset does not inflate sigma
+    summary = {'repeatability': {}, 'backlash': {}, 'per_feed': per_feed}
+    feeds = sorted({s['feed'] for s in samples})
+    for axis in ('x', 'y'):
+        all_groups = []
+        for feed in feeds:
+            all_groups.extend(groups([s for s in samples if s['feed'] == feed], axis))
+        summary['repeatability'][axis] = pooled_sigma(all_groups)
+        values = [per_feed[str(f)]['backlash'][axis] for f in feeds if per_feed[str(f)]['backlash'][axis] is not None]
+        summary['backlash'][axis] = float(np.mean(values)) if values else None
+    settle = [s['settle_time'] for s in samples if s.get('settle_time') is not None]
+    summary['settle_time'] = {'mean': float(np.mean(settle)) if settle else None,
+                              'max': float(np.max(settle)) if settle else None}
+    return summary
+
+
+class PrecisionBenchmark:
+    """
+    Class to approach a fiducial repeatedly from +-X/+-Y and measure where it appears
+
+    The stage is commanded to the same position every time; any spread of the
+    feature position in the camera is the stage's (plus the vision's) repeatability.
+    """
+
+    def __init__(self, controller, grab_frame, mm_per_pixel):
+        """
+        Initialize the benchmark
+
+        Args:
+            controller (MachineController): Machine controller
+            grab_frame (callable): grab_frame(after) returns (frame, capture time) of the
+                first frame captured after time `after`, or (None, None)
+            mm_per_pixel (float): Camera scale
+        """
+        self.controller = controller
+        self.grab_frame = grab_frame
+        self.mm_per_pixel = mm_per_pixel
+
+    def measure_settled(self, status, idle_time, mode='blob', tolerance=0.1, timeout=2.0, frames=3):
+        """
+        Locate the fiducial in successive frames until it stops moving
+
+        Args:
+            status (dict): Idle status report (the commanded position)
+            idle_time (float): time.time() when Idle was reported
+            mode (str): Fiducial type for vision.locate_fiducial
+            tolerance (float): Spread of the last frames regarded as settled (pixels)
+            timeout (float): Maximum time to wait for settling (s)
+            frames (int): Number of consecutive frames that must agree
+
+        Returns:
+            dict: {'x', 'y'} feature position (mean of the settled frames), 'pixel' and
+                'settle_time' (s after Idle, None if it did not settle within the timeout)
+        """
+        history = []
+        after = idle_time
+        while True:
+            frame, frame_time = self.grab_frame(after)
+            if frame is None:
+                raise RuntimeError("No camera frame available")
+            pixel = locate_fiducial(frame, mode)
+            if pixel is None:
+                raise RuntimeError("Fiducial not found in the camera image")
+            history = (history + [(pixel[0], pixel[1], frame_time)])[-frames:]
+            recent = np.array(history)[:, :2]
+            settled = len(history) == frames and np.hypot(*(recent - recent.mean(axis=0)).T).max() <= tolerance
+            if settled or frame_time - idle_time > timeout:
+                px, py = recent.mean(axis=0) if settled else pixel
+                x, y = pixel_to_stage(px, py, status['x'], status['y'], self.mm_per_pixel, frame.shape)
+                return {'x': x, 'y': y, 'pixel': [float(px), float(py)],
+                        'settle_time': max(0.0, history[0][2] - idle_time) if settled else None}
+            after = frame_time
+
+    def run(self, job, feeds=(200, 1000), cycles=5, distance=2.0, mode='blob', tolerance=0.1,
+            report_dir=DEFAULT_REPORT_DIR, apply_backlash=False, backlash_file=DEFAULT_BACKLASH_FILE):
+        """
+        Job function: run the benchmark around the current position
+
+        Args:
+            job (Job): Job receiving one result per approach
+            feeds (list): Feed rates of the final approach (mm/min)
+            cycles (int): Approaches per feed and direction
+            distance (float): Length of the approach move (mm), larger than the expected backlash
+            mode (str): Fiducial type, 'blob' or 'corner'
+            tolerance (float): Settling threshold in pixels per frame
+            report_dir (str): Directory of the JSON report
+            apply_backlash (bool): Make the measured backlash the active compensation
+            backlash_file (str): File the applied backlash is saved to
+        """
+        start = self.controller.get_current_position()
+        if start is None:
+            raise RuntimeError("Could not read the machine position")
+        x0, y0 = start['x'], start['y']
+        samples = []
+        for feed in feeds:
+            for cycle in range(int(cycles)):
+                for name, (ux, uy) in DIRECTIONS.items():
+                    if job.cancelled:
+                        return
+                    commands = ['G90', move_gcode(x0 - ux * distance, y0 - uy * distance, rapid=True),
+                                move_gcode(x0, y0, feed_rate=feed)]
+                    if not self.controller.execute(commands):
+                        raise RuntimeError("Benchmark move was not accepted by the machine")
+                    status = self.controller.wait_for_idle()
+                    if status is None:
+                        raise RuntimeError("Machine did not reach Idle")
+                    sample = self.measure_settled(status, time.time(), mode, tolerance)
+                    sample.update({'feed': feed, 'direction': name, 'cycle': cycle})
+                    samples.append(sample)
+                    job.add_result(sample)
+
+        summary = summarize(samples)
+        summary['mm_per_pixel'] = self.mm_per_pixel
+        report = dict(summary, timestamp=time.time(), position={'x': x0, 'y': y0},
+                      settings={'feeds': list(feeds), 'cycles': int(cycles), 'distance': distance,
+                                'mode': mode, 'tolerance': tolerance},
+                      samples=samples)
+        os.makedirs(report_dir, exist_ok=True)
+        path = os.path.join(report_dir, time.strftime('precision-%Y%m%d-%H%M%S.json'))
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        summary['report'] = path
+        logging.info(f"Precision benchmark report written to {path}")
+
+        if apply_backlash:
+            backlash = {axis: max(0.0, summary['backlash'][axis] or 0.0) for axis in ('x', 'y')}
+            self.controller.backlash = backlash
+            summary['backlash_applied'] = save_backlash(backlash, backlash_file)
+        job.summary = summary
+
+
+if __name__ == "__main__":
+    # Test the statistics on simulated approaches with 8 um X and 5 um Y backlash
+    rng = np.random.default_rng(0)
+    simulated = []
+    for feed in (200, 1000):
+        for direction, (ux, uy) in DIRECTIONS.items():
+            for _ in range(10):
+                simulated.append({'feed': feed, 'direction': direction, 'settle_time': rng.uniform(0.02, 0.08),
+                                  'x': 0.004 * ux + rng.normal(0, 0.001), 'y': 0.0025 * uy + rng.normal(0, 0.001)})
+    result = summarize(simulated)
+    print(f"Repeatability: {result['repeatability']}, backlash: {result['backlash']}")
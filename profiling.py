@@ -0,0 +1,230 @@
+"""
+Profiling Module for Comparatron
+Handles opt-in timing spans around the hot paths and an on-demand sampling profiler
+"""
+
+import collections
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Samples kept per stage for the percentiles
+RECENT_SAMPLES = 256
+
+# Innermost Python functions of threads blocked waiting (locks, queues, sockets);
+# the blocking call itself is C code and does not appear in the stack
+IDLE_FUNCTIONS = frozenset(('wait', 'wait_for', '_wait_for_tstate_lock', 'get', 'select', 'poll',
+                            'accept', 'serve_forever', '_worker', 'readline'))
+
+
+class StageTimer:
+    """
+    Class collecting the durations of one named stage
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = collections.deque(maxlen=RECENT_SAMPLES)
+
+    def add(self, duration):
+        """Record one duration in seconds"""
+        self.count += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+        self.recent.append(duration)
+
+    def snapshot(self):
+        """
+        Return the statistics of the stage
+
+        Returns:
+            dict: count, total, mean and max over all calls and p50/p95 of the
+                recent calls, times in milliseconds
+        """
+        recent = sorted(self.recent)
+
+        def percentile(q):
+            return recent[min(len(recent) - 1, int(q * len(recent)))] * 1000 if recent else None
+
+        return {'count': self.count, 'total_ms': self.total * 1000,
+                'mean_ms': self.total / self.count * 1000 if self.count else None,
+                'max_ms': self.max * 1000, 'p50_ms': percentile(0.5), 'p95_ms': percentile(0.95)}
+
+
+class Profiler:
+    """
+    Class holding the per-stage timing counters
+
+    Spans cost one attribute check while profiling is disabled, so they can stay
+    in the capture, encode and serial paths permanently. Enable with the
+    COMPARATRON_PROFILE=1 environment variable or at runtime.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.started = time.time()
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, duration):
+        """Add a duration (s) to a stage"""
+        with self._lock:
+            timer = self._stages.get(name)
+            if timer is None:
+                timer = self._stages[name] = StageTimer(name)
+            timer.add(duration)
+
+    def span(self, name):
+        """
+        Context manager timing a block as stage `name`
+
+        Usage:
+            with profiler.span('camera.read'):
+                ret, frame = camera.read()
+        """
+        return _Span(self, name) if self.enabled else _NO_SPAN
+
+    def timed(self, name):
+        """
+        Decorator timing every call of a function as stage `name`
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record(name, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def reset(self):
+        """Clear all counters"""
+        with self._lock:
+            self._stages = {}
+            self.started = time.time()
+
+    def snapshot(self):
+        """
+        Return the counters of all stages
+
+        Returns:
+            dict: {'enabled', 'since', 'stages': {name: StageTimer.snapshot()}}
+        """
+        with self._lock:
+            stages = {name: timer.snapshot() for name, timer in sorted(self._stages.items())}
+        return {'enabled': self.enabled, 'since': self.started, 'stages': stages}
+
+
+class _Span:
+    """Timing context of Profiler.span"""
+
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NoSpan:
+    """Do-nothing context used while profiling is disabled"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+# Process-wide profiler used by the instrumented modules
+profiler = Profiler(enabled=os.environ.get('COMPARATRON_PROFILE', '') not in ('', '0'))
+span = profiler.span
+timed = profiler.timed
+
+
+def _frame_label(frame):
+    """Flame graph label of a stack frame: function (file:line of the definition)"""
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(duration=5.0, interval=0.005, include_idle=False):
+    """
+    Sample the Python stacks of all threads and fold them into collapsed stacks
+
+    The output is the "collapsed" format read by flamegraph.pl, speedscope and
+    similar tools: one line per distinct stack, frames separated by ';' from the
+    thread name down to the innermost call, followed by the sample count.
+
+    Args:
+        duration (float): Sampling time (s)
+        interval (float): Time between samples (s)
+        include_idle (bool): Keep stacks of threads blocked in a known wait (IDLE_FUNCTIONS)
+
+    Returns:
+        tuple: (collapsed stack text, number of samples taken)
+    """
+    own = threading.get_ident()
+    counts = collections.Counter()
+    samples = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            if not include_idle and frame.f_code.co_name in IDLE_FUNCTIONS:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, f'thread-{ident}'))
+            counts[';'.join(reversed(stack))] += 1
+        samples += 1
+        time.sleep(interval)
+    lines = [f"{stack} {count}" for stack, count in counts.most_common()]
+    return '\n'.join(lines) + ('\n' if lines else ''), samples
+
+
+if __name__ == "__main__":
+    # Test the counters and the sampler on a busy thread
+    profiler.enabled = True
+
+    def busy():
+        end = time.time() + 0.5
+        while time.time() < end:
+            with span('demo.sum'):
+                sum(i * i for i in range(2000))
+
+    worker = threading.Thread(target=busy, name='busy')
+    worker.start()
+    collapsed, taken = sample_stacks(0.3, 0.002)
+    worker.join()
+    print(f"{taken} samples, top stack: {collapsed.splitlines()[0] if collapsed else None}")
+    print(profiler.snapshot()['stages'])
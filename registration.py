@@ -0,0 +1,353 @@
+"""
+Registration Module for Comparatron
+Locates taught part datums with a coarse-to-fine template search and sets the work offset from them
+"""
+
+import json
+import logging
+import math
+import os
+import time
+import cv2 as cv
+import numpy as np
+from camera_manager import pixel_to_stage
+from inspection import ProgramStore
+from machine_control import move_gcode
+from settle import SettleDetector
+from vision import to_gray
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Saved datum templates: <directory>/<name>.json plus one PNG per datum
+DEFAULT_REGISTRATION_DIR = os.path.expanduser('~/.comparatron/registration')
+
+
+def _subpixel_peak(scores, x, y):
+    """Parabolic refinement of a correlation peak (offsets in -0.5..0.5)"""
+    h, w = scores.shape
+    dx = dy = 0.0
+    if 0 < x < w - 1:
+        left, centre, right = scores[y, x - 1], scores[y, x], scores[y, x + 1]
+        denom = left - 2.0 * centre + right
+        if denom < 0:
+            dx = float(np.clip(0.5 * (left - right) / denom, -0.5, 0.5))
+    if 0 < y < h - 1:
+        top, centre, bottom = scores[y - 1, x], scores[y, x], scores[y + 1, x]
+        denom = top - 2.0 * centre + bottom
+        if denom < 0:
+            dy = float(np.clip(0.5 * (top - bottom) / denom, -0.5, 0.5))
+    return dx, dy
+
+
+def _peaks(scores, count, exclusion):
+    """Up to `count` best positions of a score map, at least `exclusion` pixels apart"""
+    scores = scores.copy()
+    peaks = []
+    for _ in range(count):
+        _, value, _, (x, y) = cv.minMaxLoc(scores)
+        if not np.isfinite(value) or (peaks and value <= -1.0):
+            break
+        peaks.append((x, y))
+        scores[max(0, y - exclusion):y + exclusion + 1, max(0, x - exclusion):x + exclusion + 1] = -2.0
+    return peaks
+
+
+def pyramid_match(image, template, levels=None, min_size=12, candidates=3, window=2):
+    """
+    Find a template by normalized cross-correlation, coarse to fine
+
+    The full search only runs on the coarsest pyramid level; every finer level
+    re-scores a few pixels around the upscaled positions of the best coarse
+    candidates, and the final peak is refined to sub-pixel precision.
+
+    Args:
+        image (numpy.ndarray): Frame to search
+        template (numpy.ndarray): Template image (smaller than the frame)
+        levels (int): Pyramid levels below full resolution; chosen so the coarsest
+            template is still min_size pixels if None
+        min_size (int): Smallest template side at the coarsest level
+        candidates (int): Coarse candidates followed to full resolution
+        window (int): Search margin in pixels at each finer level
+
+    Returns:
+        dict: 'x', 'y' template centre in frame pixels (measured like the frame centre in
+            pixel_to_stage), 'score' (-1..1) and 'levels',
+            or None if the template does not fit into the frame
+    """
+    image = to_gray(image)
+    template = to_gray(template)
+    th, tw = template.shape[:2]
+    if th > image.shape[0] or tw > image.shape[1]:
+        return None
+    if levels is None:
+        levels = max(0, int(math.floor(math.log2(max(1, min(th, tw) / float(min_size))))))
+    images, templates = [image], [template]
+    for _ in range(levels):
+        images.append(cv.pyrDown(images[-1]))
+        templates.append(cv.pyrDown(templates[-1]))
+
+    coarse = cv.matchTemplate(images[-1], templates[-1], cv.TM_CCOEFF_NORMED)
+    positions = _peaks(coarse, candidates, max(2, min(templates[-1].shape[:2]) // 2))
+    best = None
+    for x, y in positions:
+        for level in range(levels - 1, -1, -1):
+            img, tpl = images[level], templates[level]
+            h, w = tpl.shape[:2]
+            x, y = 2 * x, 2 * y
+            x0, y0 = max(0, x - window), max(0, y - window)
+            x1 = min(img.shape[1], x + w + window + 1)
+            y1 = min(img.shape[0], y + h + window + 1)
+            scores = cv.matchTemplate(img[y0:y1, x0:x1], tpl, cv.TM_CCOEFF_NORMED)
+            _, _, _, (px, py) = cv.minMaxLoc(scores)
+            x, y = x0 + px, y0 + py
+        # Score map around the full resolution peak for the sub-pixel fit
+        x0, y0 = max(0, x - 1), max(0, y - 1)
+        scores = cv.matchTemplate(image[y0:min(image.shape[0], y + th + 1), x0:min(image.shape[1], x + tw + 1)],
+                                  template, cv.TM_CCOEFF_NORMED)
+        sx, sy = x - x0, y - y0
+        score = float(scores[sy, sx])
+        if best is None or score > best[2]:
+            dx, dy = _subpixel_peak(scores, sx, sy)
+            best = (x + dx, y + dy, score)
+    if best is None:
+        return None
+    return {'x': best[0] + tw / 2.0, 'y': best[1] + th / 2.0, 'score': best[2], 'levels': levels}
+
+
+def rigid_from_datums(nominal, measured):
+    """
+    Rotation and translation that map two nominal datums onto their measured positions
+
+    Args:
+        nominal (list): Two (x, y) datum positions in part coordinates
+        measured (list): The same datums measured in work coordinates
+
+    Returns:
+        dict: 'rotation' (degrees, counter-clockwise), 'offset' {'x', 'y'} (the part
+            origin in work coordinates) and 'distance_error' (mm, measured minus
+            nominal datum distance; a large value means a wrong match)
+    """
+    (n1, n2), (m1, m2) = np.asarray(nominal, float), np.asarray(measured, float)
+    vn, vm = n2 - n1, m2 - m1
+    if np.hypot(*vn) < 1e-9:
+        raise ValueError("The two datums must not coincide")
+    theta = math.atan2(vm[1], vm[0]) - math.atan2(vn[1], vn[0])
+    theta = math.atan2(math.sin(theta), math.cos(theta))
+    c, s = math.cos(theta), math.sin(theta)
+    # Average the translation over both datums
+    rotated = np.array([[c * p[0] - s * p[1], s * p[0] + c * p[1]] for p in (n1, n2)])
+    t = (np.array([m1, m2]) - rotated).mean(axis=0)
+    return {'rotation': math.degrees(theta), 'offset': {'x': float(t[0]), 'y': float(t[1])},
+            'distance_error': float(np.hypot(*vm) - np.hypot(*vn))}
+
+
+class RegistrationStore:
+    """
+    Class to save datum templates of parts
+
+    Layout: <directory>/<name>.json (datum positions and scale) and
+    <directory>/<name>-<datum>.png (template images)
+    """
+
+    def __init__(self, directory=DEFAULT_REGISTRATION_DIR):
+        self.directory = directory
+
+    def _path(self, name, suffix='.json'):
+        return os.path.join(self.directory, ProgramStore.safe_name(name) + suffix)
+
+    def list_parts(self):
+        """Return the names of all saved parts"""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(f[:-5] for f in os.listdir(self.directory) if f.endswith('.json'))
+
+    def load(self, name):
+        """
+        Load a part with its templates
+
+        Returns:
+            dict: {'name', 'mm_per_pixel', 'datums': [{'x', 'y', 'template'}, ...]} (template
+                as numpy array, None if missing), or None if the part does not exist
+        """
+        path = self._path(name)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            part = json.load(f)
+        for index, datum in enumerate(part['datums']):
+            datum['template'] = cv.imread(self._path(name, f'-{index + 1}.png'), cv.IMREAD_GRAYSCALE)
+        return part
+
+    def save_datum(self, name, index, template, x, y, mm_per_pixel):
+        """
+        Store (or replace) one datum of a part
+
+        Args:
+            name (str): Part name
+            index (int): Datum number (1 or 2)
+            template (numpy.ndarray): Template image
+            x (float): Datum X in work (part) coordinates
+            y (float): Datum Y in work (part) coordinates
+            mm_per_pixel (float): Camera scale at teach time
+
+        Returns:
+            dict: The part description (without template images)
+        """
+        if index not in (1, 2):
+            raise ValueError("Datum must be 1 or 2")
+        name = ProgramStore.safe_name(name)
+        path = self._path(name)
+        part = {'name': name, 'mm_per_pixel': mm_per_pixel, 'datums': []}
+        if os.path.exists(path):
+            with open(path) as f:
+                part = json.load(f)
+        while len(part['datums']) < index:
+            part['datums'].append(None)
+        part['datums'][index - 1] = {'x': float(x), 'y': float(y), 'taught': time.time()}
+        part['mm_per_pixel'] = mm_per_pixel
+        os.makedirs(self.directory, exist_ok=True)
+        cv.imwrite(self._path(name, f'-{index}.png'), to_gray(template))
+        with open(path, 'w') as f:
+            json.dump(part, f, indent=2)
+        logging.info(f"Saved datum {index} of part {name}")
+        return part
+
+
+class PartRegistration:
+    """
+    Class to register a part on the stage from two taught datum features
+
+    Each datum is approached at its taught position, located in a settled
+    frame with pyramid_match, and the two measured positions give the part's
+    offset and rotation. The offset is applied as a G92 work offset (GRBL
+    cannot rotate its coordinate system; the rotation is returned so program
+    replays can apply it).
+    """
+
+    def __init__(self, controller, grab_frame, mm_per_pixel):
+        """
+        Initialize the registration
+
+        Args:
+            controller (MachineController): Machine controller
+            grab_frame (callable): grab_frame(after) returns (frame, capture time) of the
+                first frame captured after time `after`, or (None, None)
+            mm_per_pixel (float): Camera scale
+        """
+        self.controller = controller
+        self.settle = SettleDetector(controller, grab_frame)
+        self.mm_per_pixel = mm_per_pixel
+
+    @staticmethod
+    def cut_template(frame, size=96):
+        """
+        Cut a square template centred on the crosshair
+
+        Returns:
+            numpy.ndarray: Grayscale template copy
+        """
+        gray = to_gray(frame)
+        h, w = gray.shape[:2]
+        size = min(int(size), h, w) // 2 * 2  # Even, so its centre is the frame centre of pixel_to_stage
+        y0, x0 = (h - size) // 2, (w - size) // 2
+        return gray[y0:y0 + size, x0:x0 + size].copy()
+
+    def find(self, frame, template, status, min_score=0.6):
+        """
+        Locate a datum template in a frame
+
+        Args:
+            frame (numpy.ndarray): Camera frame
+            template (numpy.ndarray): Datum template
+            status (dict): Stage position the frame was taken at
+            min_score (float): Lowest accepted correlation
+
+        Returns:
+            dict: Datum 'x', 'y' in work coordinates, 'score', 'pixel' and search time (ms)
+        """
+        start = time.perf_counter()
+        match = pyramid_match(frame, template)
+        elapsed = (time.perf_counter() - start) * 1000
+        if match is None or match['score'] < min_score:
+            score = None if match is None else round(match['score'], 3)
+            raise RuntimeError(f"Datum not found in the frame (correlation {score})")
+        x, y = pixel_to_stage(match['x'], match['y'], status['x'], status['y'], self.mm_per_pixel, frame.shape)
+        return {'x': x, 'y': y, 'score': match['score'], 'pixel': [match['x'], match['y']], 'search_ms': elapsed}
+
+    def locate(self, datum, feed_rate, min_score=0.6, settle_time=0.0):
+        """
+        Move to a taught datum position and measure where the datum actually is
+
+        Returns:
+            dict: See find(), plus the nominal position
+        """
+        x, y = datum['x'], datum['y']
+        if not self.controller.execute(['G90', move_gcode(x, y, feed_rate=feed_rate)]):
+            raise RuntimeError(f"Move to ({x:.3f}, {y:.3f}) was not accepted by the machine")
+        status = self.controller.wait_for_idle()
+        if status is None:
+            raise RuntimeError(f"Machine did not reach Idle at ({x:.3f}, {y:.3f})")
+        if settle_time > 0:
+            time.sleep(settle_time)
+        frame, _, _ = self.settle.wait_for_settled_frame(time.time())
+        if frame is None:
+            raise RuntimeError("No camera frame available")
+        found = self.find(frame, datum['template'], status, min_score)
+        found['nominal'] = {'x': x, 'y': y}
+        return found
+
+    def run(self, job, part, feed_rate=1000, min_score=0.6, settle_time=0.0, apply=True):
+        """
+        Job function: locate both datums and set the work offset
+
+        Args:
+            job (Job): Job receiving one result per datum
+            part (dict): Part loaded with RegistrationStore.load
+            feed_rate (float): Feed rate of the moves between the datums (mm/min)
+            min_score (float): Lowest accepted correlation
+            settle_time (float): Extra delay after Idle before the image settle check (s)
+            apply (bool): Set the work offset (G92) so the part origin becomes X0 Y0
+        """
+        datums = part['datums']
+        if len(datums) < 2 or any(d is None or d.get('template') is None for d in datums[:2]):
+            raise RuntimeError(f"Part {part['name']} needs two taught datums")
+        measured = []
+        for index, datum in enumerate(datums[:2]):
+            if job.cancelled:
+                return
+            found = self.locate(datum, feed_rate, min_score, settle_time)
+            found['datum'] = index + 1
+            measured.append(found)
+            job.add_result(found)
+
+        transform = rigid_from_datums([(d['x'], d['y']) for d in datums[:2]],
+                                      [(m['x'], m['y']) for m in measured])
+        transform['applied'] = False
+        if apply:
+            # G92 gives the current position the coordinates it has relative to the part origin
+            status = self.controller.get_current_position()
+            if status is None:
+                raise RuntimeError("Could not read the position to set the work offset")
+            offset = transform['offset']
+            command = f"G92X{status['x'] - offset['x']:.4f}Y{status['y'] - offset['y']:.4f}"
+            if not self.controller.execute([command]):
+                raise RuntimeError("Work offset was not accepted by the machine")
+            self.controller.get_current_position()  # Refresh the cached WCO
+            transform['applied'] = True
+        job.summary = dict(transform, part=part['name'])
+
+
+if __name__ == "__main__":
+    # Find a textured datum in a shifted copy of a frame and time the pyramid search
+    rng = np.random.default_rng(0)
+    scene = cv.GaussianBlur(rng.uniform(0, 255, (1080, 1920)).astype(np.uint8), (9, 9), 3)
+    template = PartRegistration.cut_template(scene[:, 400:1600], 128)
+    shifted = cv.warpAffine(scene, np.float32([[1, 0, 37.4], [0, 1, -21.7]]), (1920, 1080))
+    for name, search in (('pyramid', lambda: pyramid_match(shifted, template)),
+                         ('full', lambda: pyramid_match(shifted, template, levels=0))):
+        start = time.perf_counter()
+        match = search()
+        print(f"{name}: {match} in {(time.perf_counter() - start) * 1000:.1f} ms")
+    print(f"Expected centre: ({1000 + 37.4:.1f}, {540 - 21.7:.1f})")
+    print(rigid_from_datums([(0, 0), (50, 0)], [(1.0, 2.0), (1.0 + 50 * math.cos(0.01), 2.0 + 50 * math.sin(0.01))]))
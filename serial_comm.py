@@ -7,11 +7,116 @@ import serial
 import serial.tools.list_ports
 import time
 import logging
+import functools
+import re
+import threading
+from profiling import timed
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 
+# Size of the GRBL serial receive buffer used for character-counting streaming
+GRBL_RX_BUFFER_SIZE = 128
+
+
+def _serialized(method):
+    """Run a SerialCommunicator method while holding the port lock"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def parse_status_report(response, work_offset=None):
+    """
+    Parse a GRBL status report into a position dictionary
+
+    Handles both GRBL 1.1 ("<Idle|MPos:1.000,2.000,0.000|FS:0,0|WCO:0.000,0.000,0.000>")
+    and GRBL 0.9 ("<Idle,MPos:1.000,2.000,0.000,WPos:1.000,2.000,0.000>") formats.
+
+    Args:
+        response (str): Raw response text; the first '<...>' report found is used
+        work_offset (tuple): Last known WCO, used to derive the work position from
+            MPos when the report does not contain WPos or WCO
+
+    Returns:
+        dict: {'state', 'x', 'y', 'z', 'mpos', 'wpos', 'wco'} with x/y/z in work
+            coordinates, or None if no status report could be parsed
+    """
+    if not response:
+        return None
+    start = response.find('<')
+    end = response.find('>', start + 1)
+    if start < 0 or end < 0:
+        return None
+    body = response[start + 1:end]
+
+    # GRBL 1.1 separates fields with '|'; GRBL 0.9 uses ',' throughout
+    if '|' in body:
+        fields = body.split('|')
+        state = fields[0]
+        values = {}
+        for field in fields[1:]:
+            if ':' in field:
+                key, val = field.split(':', 1)
+                values[key] = val
+    else:
+        state, _, rest = body.partition(',')
+        values = {}
+        for key in ('MPos', 'WPos'):
+            idx = rest.find(key + ':')
+            if idx >= 0:
+                values[key] = ','.join(rest[idx + len(key) + 1:].split(',')[:3])
+
+    def _triplet(text):
+        try:
+            parts = [float(v) for v in text.split(',')[:3]]
+        except ValueError:
+            return None
+        return tuple(parts + [0.0] * (3 - len(parts)))
+
+    mpos = _triplet(values['MPos']) if 'MPos' in values else None
+    wpos = _triplet(values['WPos']) if 'WPos' in values else None
+    wco = _triplet(values['WCO']) if 'WCO' in values else work_offset
+
+    if wpos is None and mpos is not None:
+        wpos = tuple(m - o for m, o in zip(mpos, wco)) if wco else mpos
+    if wpos is None:
+        return None
+    if mpos is None and wco:
+        mpos = tuple(w + o for w, o in zip(wpos, wco))
+
+    return {
+        'state': state.split(':')[0],
+        'x': wpos[0],
+        'y': wpos[1],
+        'z': wpos[2],
+        'mpos': mpos,
+        'wpos': wpos,
+        'wco': wco,
+    }
+
+
+def parse_settings(response):
+    """
+    Parse the output of the $$ command
+
+    Args:
+        response (str): Raw response text ("$100=250.000 (x, step/mm)" lines, comments optional)
+
+    Returns:
+        dict: {setting number (int): value (str)}, empty if nothing could be parsed
+    """
+    settings = {}
+    for line in (response or '').splitlines():
+        match = re.match(r'\s*\$(\d+)\s*=\s*([^\s(]*)', line)
+        if match:
+            settings[int(match.group(1))] = match.group(2)
+    return settings
+
+
 class SerialCommunicator:
     """
     Class to handle serial communication with the CNC machine
@@ -26,7 +131,9 @@ class SerialCommunicator:
         self.timeout = 2  # Set a reasonable timeout to avoid hanging
         self.xonxoff = 0  # Disable software flow control to reduce potential issues
         self.rtscts = 0   # Disable hardware flow control
+        self.lock = threading.RLock()  # One request/response exchange at a time (GUI, jobs)
     
+    @_serialized
     def connect_to_com(self, com_port):
         """
         Connect to the specified COM port
@@ -108,6 +215,7 @@ class SerialCommunicator:
             print(f"Error connecting to {com_port}: {e}")
             return False
     
+    @_serialized
     def disconnect(self):
         """
         Close the serial connection
@@ -124,6 +232,8 @@ class SerialCommunicator:
             logging.info("No open serial connection to close")
             print("No open serial connection to close")
     
+    @timed('serial.send_command')
+    @_serialized
     def send_command(self, command_string, multi_line_response=False):
         """
         Send a command string to the machine with improved reliability
@@ -435,6 +545,7 @@ class SerialCommunicator:
             print("Check that motors and drivers are properly powered")
         return result
     
+    @_serialized
     def get_machine_status(self):
         """
         Get current machine status and position
@@ -466,9 +577,11 @@ class SerialCommunicator:
                     response = self.ser.readline()
                     response_str = response.decode('utf-8', errors='ignore').strip()
                     logging.debug(f"Received status response: {response_str}")
+                    if not response_str.startswith('<'):
+                        continue  # Late 'ok' of an earlier command, the report follows
                     print(f"Status response: {response_str}")
                     return response_str
-                time.sleep(0.05)
+                time.sleep(0.005)  # Status reports arrive within a few ms
 
             logging.warning("Timeout waiting for status response")
             print("Timeout waiting for status response")
@@ -479,6 +592,69 @@ class SerialCommunicator:
             print(f"Error getting machine status: {e}")
             return None
 
+    @timed('serial.stream_commands')
+    @_serialized
+    def stream_commands(self, commands, timeout=30.0):
+        """
+        Stream G-code lines using GRBL's character-counting protocol
+
+        Lines are written as long as they fit in GRBL's receive buffer instead of
+        waiting for each 'ok', so consecutive moves are queued without a serial
+        round-trip between them.
+
+        Args:
+            commands (list): G-code lines
+            timeout (float): Maximum time to wait for all acknowledgements (s)
+
+        Returns:
+            list: 'ok' / 'error:N' responses in command order, or None if error
+        """
+        if not self.ser or not self.ser.is_open:
+            logging.warning("No active serial connection")
+            print("No active serial connection")
+            return None
+
+        try:
+            if self.ser.in_waiting > 0:
+                self.ser.reset_input_buffer()
+
+            pending = []  # Byte counts of lines GRBL has not acknowledged yet
+            responses = []
+            deadline = time.time() + timeout
+
+            def read_ack():
+                while time.time() < deadline:
+                    line = self.ser.readline().decode('utf-8', errors='ignore').strip()
+                    # Status reports and messages may be interleaved with acknowledgements
+                    if line == 'ok' or line.startswith('error'):
+                        responses.append(line)
+                        pending.pop(0)
+                        return True
+                return False
+
+            for command in commands:
+                data = command.strip().encode() + b'\n'
+                while pending and sum(pending) + len(data) > GRBL_RX_BUFFER_SIZE:
+                    if not read_ack():
+                        raise TimeoutError("Timeout waiting for GRBL acknowledgement")
+                self.ser.write(data)
+                pending.append(len(data))
+            self.ser.flush()
+
+            while pending:
+                if not read_ack():
+                    raise TimeoutError("Timeout waiting for GRBL acknowledgement")
+
+            errors = [r for r in responses if r.startswith('error')]
+            if errors:
+                logging.warning(f"GRBL reported errors while streaming: {errors}")
+            return responses
+
+        except Exception as e:
+            logging.error(f"Error streaming commands: {e}")
+            print(f"Error streaming commands: {e}")
+            return None
+
     def send_raw_command(self, raw_command):
         """
         Send a raw command to the machine without any safety checks
@@ -496,6 +672,7 @@ class SerialCommunicator:
         print(f"Sending raw command: {raw_command}")
         return self.send_command(raw_command)
 
+    @_serialized
     def get_settings_list(self):
         """
         Get the list of all GRBL settings using the $$ command
@@ -560,6 +737,7 @@ class SerialCommunicator:
             print(f"Error getting settings list: {e}")
             return None
 
+    @_serialized
     def get_parameters_list(self):
         """
         Get the list of all GRBL parameters using the $# command
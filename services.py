@@ -0,0 +1,206 @@
+"""
+Service Monitor Module for Comparatron
+Handles cached systemd unit state and platform detection for the web interface
+"""
+
+import logging
+import os
+import subprocess
+import threading
+import time
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+COMPARATRON_SERVICE = 'comparatron.service'
+LASERWEB_SERVICE = 'laserweb.service'
+LASERWEB_SERVICE_FILE = '/etc/systemd/system/laserweb.service'
+
+# UnitFileState values for which `systemctl is-enabled` exits with 0
+ENABLED_STATES = frozenset(('enabled', 'enabled-runtime', 'static', 'alias', 'indirect', 'generated', 'transient'))
+
+
+def detect_platform_model():
+    """
+    Read the board model once (no subprocesses)
+
+    Returns:
+        tuple: (model string or '', True if this is a Raspberry Pi)
+    """
+    model = ''
+    try:
+        with open('/sys/firmware/devicetree/base/model', 'r') as f:
+            model = f.read().strip('\x00\n ')
+    except OSError:
+        pass
+    is_raspberry_pi = 'Raspberry' in model
+    if not is_raspberry_pi:
+        try:
+            with open('/proc/cpuinfo', 'r') as f:
+                cpuinfo = f.read()
+            is_raspberry_pi = 'Raspberry Pi' in cpuinfo or 'BCM' in cpuinfo
+        except OSError:
+            pass
+    return model, is_raspberry_pi
+
+
+def parse_systemctl_show(output):
+    """
+    Parse `systemctl show` output for several units
+
+    Args:
+        output (str): Blank-line separated blocks of Key=Value lines
+
+    Returns:
+        dict: Unit name -> {property: value}
+    """
+    units = {}
+    for block in output.strip().split('\n\n'):
+        properties = dict(line.split('=', 1) for line in block.splitlines() if '=' in line)
+        if properties.get('Id'):
+            units[properties['Id']] = properties
+    return units
+
+
+class ServiceMonitor:
+    """
+    Class serving systemd unit state from memory
+
+    One `systemctl show` call queries all watched units at once. Readers get the
+    cached state; when it is older than the TTL a single background refresh is
+    started (concurrent readers never start a second one), so status requests
+    do not fork processes. Only the very first read waits for a result.
+    """
+
+    def __init__(self, units=(COMPARATRON_SERVICE, LASERWEB_SERVICE), ttl=10.0):
+        """
+        Initialize the monitor and read the platform model
+
+        Args:
+            units (tuple): systemd unit names to watch
+            ttl (float): Age in seconds after which a read triggers a refresh
+        """
+        self.units = tuple(units)
+        self.ttl = ttl
+        self.model, self.is_raspberry_pi = detect_platform_model()
+        self._state = None  # {'units': {...}, 'laserweb_file': bool, 'error': str or None}
+        self._updated = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = None  # threading.Event of the running refresh
+        self._requery = False  # A forced refresh arrived while a query was running
+
+    def _query(self):
+        """Run the (only) systemctl query and store the result"""
+        state = {'units': {}, 'laserweb_file': os.path.isfile(LASERWEB_SERVICE_FILE), 'error': None}
+        try:
+            result = subprocess.run(['systemctl', 'show', *self.units,
+                                     '--property=Id,LoadState,ActiveState,UnitFileState'],
+                                    capture_output=True, text=True, timeout=10)
+            state['units'] = parse_systemctl_show(result.stdout)
+            if result.returncode != 0 and not state['units']:
+                state['error'] = result.stderr.strip() or f"systemctl exited with {result.returncode}"
+        except (OSError, subprocess.SubprocessError) as e:
+            state['error'] = str(e)
+        with self._lock:
+            self._state = state
+            self._updated = time.monotonic()
+
+    def refresh(self, wait=True, timeout=15.0, force=False):
+        """
+        Re-query the unit state unless a refresh is already running
+
+        Args:
+            wait (bool): Block until the refresh has finished
+            timeout (float): Longest wait in seconds
+            force (bool): The state changed (e.g. after systemctl start/stop), so a
+                running query may be stale; query again once it has finished
+        """
+        with self._lock:
+            done = self._refreshing
+            if done is None or done.is_set():
+                done = self._refreshing = threading.Event()
+                start = True
+            else:
+                start = False
+                if force:
+                    self._requery = True
+
+        if start:
+            def run():
+                try:
+                    while True:
+                        try:
+                            self._query()
+                        except Exception as e:
+                            logging.error(f"Error querying service state: {e}")
+                            print(f"Error querying service state: {e}")
+                        with self._lock:
+                            if not self._requery:
+                                # Set under the lock so a forced refresh never joins a finished query
+                                done.set()
+                                return
+                            self._requery = False
+                finally:
+                    done.set()
+
+            threading.Thread(target=run, name='service-monitor', daemon=True).start()
+        if wait:
+            done.wait(timeout)
+
+    def snapshot(self):
+        """
+        Current cached state, refreshed in the background when stale
+
+        Returns:
+            dict: The state of the last query (empty units if none finished yet)
+        """
+        with self._lock:
+            state = self._state
+            stale = time.monotonic() - self._updated > self.ttl
+        if state is None:
+            self.refresh(wait=True)
+            with self._lock:
+                state = self._state
+        elif stale:
+            self.refresh(wait=False)
+        return state or {'units': {}, 'laserweb_file': False, 'error': 'Service state not available'}
+
+    def unit(self, name):
+        """
+        Cached properties of one unit
+
+        Returns:
+            dict: LoadState, ActiveState, UnitFileState (empty if unknown)
+        """
+        return self.snapshot()['units'].get(name, {})
+
+    def is_enabled(self, name=COMPARATRON_SERVICE):
+        """Whether the unit starts on boot (as `systemctl is-enabled`)"""
+        return self.unit(name).get('UnitFileState', '') in ENABLED_STATES
+
+    def active_state(self, name=LASERWEB_SERVICE):
+        """ActiveState of the unit as printed by `systemctl is-active` ('' if unknown)"""
+        return self.unit(name).get('ActiveState', '')
+
+    def laserweb_status(self):
+        """
+        LaserWeb service state for the status route
+
+        Returns:
+            dict: 'status', 'service_exists' and 'error' (None when the query worked)
+        """
+        state = self.snapshot()
+        return {'status': self.active_state(LASERWEB_SERVICE), 'service_exists': state['laserweb_file'],
+                'error': state['error']}
+
+
+if __name__ == "__main__":
+    # Print the platform and the cached unit state
+    monitor = ServiceMonitor()
+    print(f"Model: {monitor.model or 'unknown'} (Raspberry Pi: {monitor.is_raspberry_pi})")
+    start = time.perf_counter()
+    print(f"Auto-start enabled: {monitor.is_enabled()}")
+    print(f"First read: {(time.perf_counter() - start) * 1000:.1f} ms")
+    start = time.perf_counter()
+    print(f"LaserWeb: {monitor.laserweb_status()}")
+    print(f"Cached read: {(time.perf_counter() - start) * 1000:.3f} ms")
@@ -0,0 +1,131 @@
+"""
+Motion Settle Module for Comparatron
+Detects when the stage has stopped moving so a frame can be captured immediately
+"""
+
+import logging
+import math
+import time
+import cv2 as cv
+from vision import center_roi, image_shift
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class SettleDetector:
+    """
+    Class combining GRBL's Idle state with frame-to-frame image motion
+
+    Idle only means the planner has finished; the stage can still ring for tens of
+    milliseconds. After Idle, consecutive frames are compared by phase correlation
+    on a small centre ROI, and the first frame after the motion has stayed below
+    the threshold for `stable_frames` comparisons is returned. A fixed delay would
+    either waste time or capture a moving stage.
+    """
+
+    def __init__(self, controller, grab_frame, threshold=0.1, roi_size=128, stable_frames=1,
+                 timeout=1.0, min_response=0.1):
+        """
+        Initialize the detector
+
+        Args:
+            controller (MachineController): Machine controller (status polling)
+            grab_frame (callable): grab_frame(after) returns (frame, capture time) of the
+                first frame captured after time `after`, or (None, None)
+            threshold (float): Frame-to-frame motion regarded as settled (pixels)
+            roi_size (int): Edge length of the centre ROI used for phase correlation
+            stable_frames (int): Consecutive comparisons that must be below the threshold
+            timeout (float): Maximum wait for the image to settle after Idle (s)
+            min_response (float): Phase correlation peaks below this are ignored (too
+                little texture to judge motion); Idle alone is then trusted
+        """
+        self.controller = controller
+        self.grab_frame = grab_frame
+        self.threshold = threshold
+        self.roi_size = roi_size
+        self.stable_frames = stable_frames
+        self.timeout = timeout
+        self.min_response = min_response
+        self._window = None
+
+    def _hanning(self, shape):
+        """Hanning window for the ROI shape, created once"""
+        if self._window is None or self._window.shape != shape:
+            self._window = cv.createHanningWindow((shape[1], shape[0]), cv.CV_32F)
+        return self._window
+
+    def wait_for_settled_frame(self, idle_time):
+        """
+        Return the first frame after idle_time that shows no more motion
+
+        Args:
+            idle_time (float): time.time() at which GRBL reported Idle
+
+        Returns:
+            tuple: (frame, frame_time, info) with info = {'settled', 'settle_time', 'shift',
+                'frames'}; frame is None if no camera frame arrived
+        """
+        previous = None
+        stable = 0
+        frames = 0
+        shift = None
+        after = idle_time
+        deadline = idle_time + self.timeout
+        while True:
+            frame, frame_time = self.grab_frame(after)
+            if frame is None:
+                return None, None, {'settled': False, 'settle_time': None, 'shift': shift, 'frames': frames}
+            frames += 1
+            roi = center_roi(frame, self.roi_size)
+            if previous is not None:
+                dx, dy, response = image_shift(previous, roi, self._hanning(roi.shape))
+                shift = math.hypot(dx, dy)
+                if response < self.min_response or shift <= self.threshold:
+                    stable += 1
+                else:
+                    stable = 0
+                if stable >= self.stable_frames:
+                    return frame, frame_time, {'settled': True, 'settle_time': frame_time - idle_time,
+                                               'shift': shift, 'frames': frames}
+            if frame_time > deadline:
+                logging.warning(f"Image not settled after {self.timeout} s (last shift {shift} px)")
+                return frame, frame_time, {'settled': False, 'settle_time': None, 'shift': shift, 'frames': frames}
+            previous = roi
+            after = frame_time
+
+    def wait(self, timeout=60.0):
+        """
+        Wait until the machine is Idle and the image has settled
+
+        Args:
+            timeout (float): Maximum wait for the Idle state (s)
+
+        Returns:
+            tuple: (status, frame, frame_time, info); status is None on alarm or timeout
+                (frame values are then None as well)
+        """
+        status = self.controller.wait_for_idle(timeout)
+        if status is None:
+            return None, None, None, None
+        frame, frame_time, info = self.wait_for_settled_frame(time.time())
+        return status, frame, frame_time, info
+
+
+if __name__ == "__main__":
+    # Test on a simulated textured scene that rings down after the move
+    import numpy as np
+
+    texture = cv.GaussianBlur(np.random.default_rng(0).uniform(0, 255, (480, 640)).astype(np.float32), (5, 5), 1)
+    started = time.time()
+
+    def simulated_frame(after):
+        t = max(after, time.time()) + 0.01  # 100 fps camera
+        time.sleep(max(0.0, t - time.time()))
+        offset = 3.0 * math.exp(-(t - started) / 0.02) * math.cos(2 * math.pi * 40 * (t - started))
+        frame = cv.warpAffine(texture, np.float32([[1, 0, offset], [0, 1, 0]]), (640, 480))
+        return frame, t
+
+    detector = SettleDetector(None, simulated_frame)
+    frame, frame_time, info = detector.wait_for_settled_frame(started)
+    print(f"Settled after {info['settle_time'] * 1000:.0f} ms ({info['frames']} frames, last shift {info['shift']:.3f} px)")
@@ -0,0 +1,808 @@
+"""
+Stations Module for Comparatron
+Handles several machine+camera stations hosted by one server process
+"""
+
+import json
+import logging
+import os
+import re
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import cv2 as cv
+import numpy as np
+from camera_manager import initialize_camera, stage_to_pixel, DEFAULT_MM_PER_PIXEL
+from serial_comm import SerialCommunicator
+from machine_control import MachineController
+from dxf_handler import DXFHandler
+from compensation import load_compensation, DEFAULT_COMPENSATION_FILE
+from grbl_settings import GRBLSettingsManager
+from settle import SettleDetector
+from precision import load_backlash, DEFAULT_BACKLASH_FILE
+from profiling import span
+from capture import CaptureProcess
+from evaluation import EvaluationEngine
+from vision import extract_silhouette
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Id of the station every unprefixed route works on
+DEFAULT_STATION = 'default'
+
+# Registry of the additional stations and the root of their data directories
+DEFAULT_STATIONS_FILE = os.path.expanduser('~/.comparatron/stations.json')
+DEFAULT_STATIONS_DIR = os.path.expanduser('~/.comparatron/stations')
+
+# Capture cameras in a worker process (COMPARATRON_CAPTURE_PROCESS=0 keeps the capture thread)
+CAPTURE_PROCESS = os.environ.get('COMPARATRON_CAPTURE_PROCESS', '1') != '0'
+
+
+class Station:
+    """
+    Class holding everything that belongs to one machine+camera pair
+
+    Each station has its own serial connection, controller, settings cache,
+    camera thread, recorded points and calibration files, so nothing measured on
+    one machine can leak into another.
+    """
+
+    def __init__(self, station_id, name=None, data_dir=None):
+        """
+        Initialize a station (nothing is connected yet)
+
+        Args:
+            station_id (str): Identifier used in the /stations/<id> routes
+            name (str): Display name, defaults to the id
+            data_dir (str): Directory of the station's compensation and backlash files;
+                None uses the single-machine default files
+        """
+        self.id = station_id
+        self.name = name or station_id
+        self.data_dir = data_dir
+        if data_dir is None:
+            self.compensation_file = DEFAULT_COMPENSATION_FILE
+            self.backlash_file = DEFAULT_BACKLASH_FILE
+        else:
+            self.compensation_file = os.path.join(data_dir, 'compensation.json')
+            self.backlash_file = os.path.join(data_dir, 'backlash.json')
+
+        self.serial_comm = SerialCommunicator()
+        self.controller = MachineController(self.serial_comm)
+        self.controller.backlash = load_backlash(self.backlash_file)
+        self.settings = GRBLSettingsManager(self.serial_comm)  # Cached $$ values
+        self.dxf_handler = DXFHandler()
+        self.recording = None  # InspectionProgram being recorded, if any
+        self.compensation = load_compensation(self.compensation_file)  # None when uncalibrated
+
+        # Point-to-point state
+        self.prev_point_x = 0.0
+        self.prev_point_y = 0.0
+        self.difference_x = 0.0
+        self.difference_y = 0.0
+        self.difference_distance = 0.0
+        self.data_acq_status = "ready"
+        self.jog_distance = 10.0
+        self.recorded_points = []
+        self.recorded_circles = []  # Measured holes/circles: centre and diameter
+        self.registration = None  # Offset/rotation of the registered part (registration.rigid_from_datums)
+        self.best_fit = None  # Last alignment of the recorded points to the nominal geometry (bestfit.best_fit)
+        self.evaluation = EvaluationEngine()  # Point groups with live form and position results
+
+        # Nominal CAD geometry for deviation checks and the live overlay
+        self.nominal = None
+        self.overlay_enabled = False
+        self.mm_per_pixel = DEFAULT_MM_PER_PIXEL
+        self._overlay_cache = None
+
+        # Silhouette (backlight) mode: outlines extracted from every new frame
+        self.silhouette_enabled = False
+        self.silhouette_options = {}  # extract_silhouette arguments (threshold, decimate, min_area)
+        self.silhouette = None  # Result of the current frame, with 'frame_time' and 'seconds'
+
+        # Last fused focus stack (all-in-focus image and height map) with its stage position
+        self.focus_stack = None
+
+        # Camera thread variables
+        self.camera = None  # cv.VideoCapture, or CaptureProcess when capturing in a worker
+        self.camera_index = None
+        self.camera_thread = None
+        self.capture_process = CAPTURE_PROCESS
+        self.current_frame = np.zeros((480, 640, 3), dtype=np.uint8)
+        self.current_frame_time = 0.0
+        self.frame_lock = threading.Lock()
+        self.frame_ready = threading.Condition(self.frame_lock)
+        self.settle = SettleDetector(self.controller, self.wait_for_frame)
+        self.running = False
+
+    def start_camera(self, camera_index):
+        """
+        Open a camera and start the station's capture thread
+
+        With capture_process set the camera is read by a worker process that
+        publishes frames in shared memory; the station thread then only follows
+        the ring. If no worker process can be started, the camera is opened here.
+
+        Args:
+            camera_index (int): OpenCV camera index
+
+        Returns:
+            bool: True if the camera was opened
+        """
+        camera = None
+        if self.capture_process:
+            try:
+                camera = CaptureProcess(camera_index)
+                if not camera.start():
+                    return False
+            except OSError as e:
+                logging.warning(f"Capture process unavailable, capturing in-process: {e}")
+                camera = None
+        if camera is None:
+            camera = initialize_camera(camera_index)
+        if camera is None:
+            return False
+        previous, self.camera = self.camera, camera
+        self.camera_index = camera_index
+        if previous is not None and previous is not camera:
+            self._release_camera(previous)
+        if not self.running:
+            self.running = True
+            self.camera_thread = threading.Thread(target=self.update_frames, name=f'camera-{self.id}')
+            self.camera_thread.daemon = True
+            self.camera_thread.start()
+        return True
+
+    def _release_camera(self, camera):
+        """Release a camera; a frame still pointing into a capture ring is copied first"""
+        if isinstance(camera, CaptureProcess):
+            with self.frame_lock:
+                self.current_frame = self.current_frame.copy()
+        camera.release()
+
+    def _follow_capture(self, camera):
+        """Make the newest frame of a capture process the current frame (zero-copy)"""
+        if not camera.wait(0.5):
+            return
+        ring = camera.ring
+        if ring is None:
+            return
+        seq, frame_time, frame = ring.get()
+        if frame is not None:
+            self.update_silhouette(frame, frame_time)
+            with self.frame_lock:
+                # A view into the ring; render_frame and wait_for_frame copy it
+                self.current_frame = frame
+                self.current_frame_time = frame_time
+                self.frame_ready.notify_all()
+
+    def update_frames(self):
+        """Continuously update frames from camera"""
+        while self.running:
+            camera = self.camera
+            if isinstance(camera, CaptureProcess):
+                if camera.isOpened():
+                    self._follow_capture(camera)
+                else:
+                    time.sleep(0.1)
+                continue
+            if self.camera is not None and self.camera.isOpened():
+                read_start = time.time()
+                with span('camera.read'):
+                    ret, frame = self.camera.read()
+                if ret:
+                    # Resize frame to desired resolution for performance
+                    if frame.shape[0] != 480 or frame.shape[1] != 640:
+                        with span('camera.resize'):
+                            frame = cv.resize(frame, (640, 480))
+                    self.update_silhouette(frame, read_start)
+                    with self.frame_lock:
+                        self.current_frame = frame
+                        self.current_frame_time = read_start  # Frame is at least this recent
+                        self.frame_ready.notify_all()
+            else:
+                # Use a dummy frame if no camera is available
+                with self.frame_lock:
+                    self.current_frame = np.zeros((480, 640, 3), dtype=np.uint8)
+            time.sleep(1/15)  # 15 FPS
+
+    def update_silhouette(self, frame, frame_time):
+        """
+        Extract the part outlines of a new frame when silhouette mode is on
+
+        Runs on the camera thread before the frame is published, so the video
+        overlay and the API always pair a frame with its own outlines.
+        """
+        if not self.silhouette_enabled:
+            return
+        start = time.perf_counter()
+        try:
+            with span('camera.silhouette'):
+                result = extract_silhouette(frame, **self.silhouette_options)
+        except Exception as e:
+            logging.error(f"Silhouette extraction failed: {e}")
+            self.silhouette_enabled = False
+            return
+        result['frame_time'] = frame_time
+        result['shape'] = frame.shape[:2]  # The outlines are in this frame's pixels
+        result['seconds'] = time.perf_counter() - start
+        self.silhouette = result
+
+    def draw_silhouette_overlay(self, frame, frame_time):
+        """Draw the outlines extracted from this frame (complete parts green, cut ones orange)"""
+        result = self.silhouette
+        if not self.silhouette_enabled or result is None or result['frame_time'] != frame_time:
+            return
+        for complete in (False, True):
+            # Fixed-point coordinates (shift=4) keep the sub-pixel edges visible
+            polys = [np.round(c['points'] * 16).astype(np.int32) for c in result['contours']
+                     if c['complete'] == complete]
+            if polys:
+                cv.polylines(frame, polys, True, (0, 200, 0) if complete else (0, 140, 255), 1, cv.LINE_AA, shift=4)
+
+    def wait_for_frame(self, after, timeout=1.0):
+        """
+        Return the first camera frame captured after a given time
+
+        Args:
+            after (float): time.time() value the frame must be newer than
+            timeout (float): Maximum wait in seconds
+
+        Returns:
+            tuple: (frame copy, capture time), or (None, None) on timeout
+        """
+        with self.frame_ready:
+            if not self.frame_ready.wait_for(lambda: self.current_frame_time > after, timeout):
+                return None, None
+            return self.current_frame.copy(), self.current_frame_time
+
+    def frames_since(self, after):
+        """
+        Return every camera frame captured after a given time, oldest first
+
+        With a capture process all frames still in its ring are returned, so a
+        sweep polling every few frames loses none; the in-process camera only
+        offers its current frame.
+
+        Args:
+            after (float): time.time() value the frames must be newer than
+
+        Returns:
+            list: (capture time, frame copy) tuples
+        """
+        camera = self.camera
+        ring = camera.ring if isinstance(camera, CaptureProcess) else None
+        if ring is None:
+            with self.frame_lock:
+                if self.current_frame is None or self.current_frame_time <= after:
+                    return []
+                return [(self.current_frame_time, self.current_frame.copy())]
+        frames = []
+        seq = ring.latest_seq
+        while seq > 0 and len(frames) < ring.slots:
+            _, frame_time, frame = ring.read(seq)
+            if frame is None or frame_time <= after:
+                break  # Overwritten, or already seen
+            frames.append((frame_time, frame))
+            seq -= 1
+        return frames[::-1]
+
+    def draw_nominal_overlay(self, frame):
+        """
+        Draw the nominal geometry projected through the last known stage position
+
+        The projected outline is cached until the stage position or scale changes.
+        """
+        nominal = self.nominal
+        pos = self.controller.last_position
+        if not self.overlay_enabled or nominal is None or not pos:
+            return
+        h, w = frame.shape[:2]
+        scale = self.mm_per_pixel
+        key = (pos['x'], pos['y'], scale, w, h, id(nominal))
+        cache = self._overlay_cache
+        if cache is None or cache[0] != key:
+            half_w, half_h = w / 2.0 * scale, h / 2.0 * scale
+            outlines = nominal.outline_in_view(pos['x'] - half_w, pos['y'] - half_h,
+                                               pos['x'] + half_w, pos['y'] + half_h, max_chord=scale * 0.5)
+            # Fixed-point coordinates (shift=4) keep sub-pixel accuracy in cv.polylines
+            polys = [np.round(stage_to_pixel(o, pos['x'], pos['y'], scale, frame.shape) * 16).astype(np.int32)
+                     for o in outlines]
+            cache = (key, polys)
+            self._overlay_cache = cache
+        if cache[1]:
+            cv.polylines(frame, cache[1], False, (0, 255, 0), 1, cv.LINE_AA, shift=4)
+
+    def render_frame(self):
+        """
+        Copy the current frame with the nominal overlay and the crosshair drawn on it
+
+        Returns:
+            tuple: (annotated frame, capture time)
+        """
+        with self.frame_lock:
+            frame = self.current_frame.copy()
+            frame_time = self.current_frame_time
+        h, w = frame.shape[:2]
+        center_x, center_y = w // 2, h // 2
+        # Draw nominal CAD outline and the silhouette outlines under the crosshair
+        self.draw_nominal_overlay(frame)
+        self.draw_silhouette_overlay(frame, frame_time)
+        cv.line(frame, (center_x - 20, center_y), (center_x + 20, center_y), (0, 0, 255), 1)
+        cv.line(frame, (center_x, center_y - 20), (center_x, center_y + 20), (0, 0, 255), 1)
+        return frame, frame_time
+
+    def connected_port(self):
+        """Return the name of the open serial port, or None"""
+        ser = self.serial_comm.ser
+        return ser.port if ser is not None and ser.is_open else None
+
+    def describe(self):
+        """
+        Summarize the station for the station list
+
+        Returns:
+            dict: id, name, serial port, camera index and whether a camera is running
+        """
+        return {'id': self.id, 'name': self.name, 'port': self.connected_port(),
+                'camera_index': self.camera_index, 'camera': self.camera is not None,
+                'recorded_points': len(self.recorded_points)}
+
+    def close(self):
+        """Stop the capture thread and release the camera and serial port"""
+        self.running = False
+        if self.camera_thread is not None:
+            self.camera_thread.join(timeout=1.0)
+        if self.camera is not None:
+            self._release_camera(self.camera)
+            self.camera = None
+        if self.serial_comm.ser is not None:
+            self.serial_comm.disconnect()
+
+
+class FrameEncoder:
+    """
+    Class encoding the annotated video frames of all stations on one small thread pool
+
+    Every viewer of a station asking for the same (quality, scale) profile gets
+    the same JPEG: a frame is rendered once per station, encoded once per
+    profile, however many clients stream it, and concurrent requests for the
+    same frame wait for the render or encode already in progress.
+    """
+
+    def __init__(self, max_workers=2, quality=80):
+        """
+        Initialize the encoder
+
+        Args:
+            max_workers (int): Encoder threads shared by all stations
+            quality (int): Default JPEG quality
+        """
+        self.quality = quality
+        self._pool = ThreadPoolExecutor(max_workers, thread_name_prefix='encoder')
+        self._lock = threading.Lock()
+        self._latest = {}  # station id -> frame entry: key, render lock, rendered frame, profile -> Future
+
+    def _encode(self, station, entry, quality, scale):
+        """Render the station's frame (once per entry), then scale and encode it"""
+        with entry['lock']:
+            if entry['frame'] is None:
+                with span('video.render'):
+                    entry['frame'], _ = station.render_frame()
+        frame = entry['frame']
+        if scale != 1.0:
+            h, w = frame.shape[:2]
+            with span('video.scale'):
+                frame = cv.resize(frame, (max(1, round(w * scale)), max(1, round(h * scale))),
+                                  interpolation=cv.INTER_AREA)
+        with span('video.encode'):
+            ret, buffer = cv.imencode('.jpg', frame, [cv.IMWRITE_JPEG_QUALITY, quality])
+        return buffer.tobytes() if ret else None
+
+    def jpeg(self, station, quality=None, scale=1.0):
+        """
+        Return the JPEG of the station's current frame
+
+        Args:
+            station (Station): Station to encode
+            quality (int): JPEG quality, defaults to the encoder quality
+            scale (float): Size relative to the station frame
+
+        Returns:
+            bytes: JPEG data, or None if encoding failed
+        """
+        profile = (quality or self.quality, scale)
+        overlay = station._overlay_cache[0] if station.overlay_enabled and station._overlay_cache else None
+        key = (station.current_frame_time, station.overlay_enabled, overlay, station.silhouette_enabled)
+        with self._lock:
+            entry = self._latest.get(station.id)
+            # Without a camera the frame time never changes; re-encode now and then
+            if entry is None or entry['key'] != key or (not key[0] and profile in entry['jpeg']
+                                                         and entry['jpeg'][profile].done()):
+                entry = {'key': key, 'lock': threading.Lock(), 'frame': None, 'jpeg': {}}
+                self._latest[station.id] = entry
+            future = entry['jpeg'].get(profile)
+            if future is None:
+                future = entry['jpeg'][profile] = self._pool.submit(self._encode, station, entry, *profile)
+        return future.result()
+
+    def forget(self, station_id):
+        """Drop the cached frame of a removed station"""
+        with self._lock:
+            self._latest.pop(station_id, None)
+
+
+# (JPEG quality, scale) steps of the adaptive video stream, best first
+VIDEO_LEVELS = ((80, 1.0), (70, 1.0), (60, 0.75), (50, 0.75), (45, 0.5), (35, 0.5), (30, 0.35))
+
+# Send buffer of a video viewer's socket where its queue cannot be read (bytes), so slow writes block
+VIDEO_SEND_BUFFER = 64 * 1024
+
+
+def socket_backlog(sock):
+    """
+    Bytes written to a socket that the peer has not acknowledged yet
+
+    Args:
+        sock (socket.socket): Connected socket
+
+    Returns:
+        int: Queued bytes, None where the platform cannot tell (SIOCOUTQ is Linux only)
+    """
+    try:
+        import fcntl
+        import termios
+        return struct.unpack('i', fcntl.ioctl(sock.fileno(), termios.TIOCOUTQ, b'\0' * 4))[0]
+    except (ImportError, AttributeError, OSError, ValueError):
+        return None
+
+
+class VideoSubscriber:
+    """
+    Class adapting the video stream of one viewer to how fast it drains
+
+    Where the platform reports the socket send queue, the queue is polled
+    while frames are held back: how fast it shrinks is the viewer's drain
+    rate, and no new frame is written while more than one frame is still
+    queued, so a slow link skips frames and always gets the newest one.
+    Elsewhere the time a write blocked stands in for both. A frame that
+    takes longer than the target latency to deliver steps down one
+    VIDEO_LEVELS level and spaces the frames to what the link carries;
+    two seconds of quick deliveries step back up. Quality, scale and frame
+    rate given explicitly are kept fixed.
+    """
+
+    def __init__(self, quality=None, fps=None, scale=None, max_fps=30.0, target_latency=0.25, queued=None):
+        """
+        Initialize
+
+        Args:
+            quality (int): Fixed JPEG quality (1-100), adapted if None
+            fps (float): Fixed maximum frame rate, adapted up to max_fps if None
+            scale (float): Fixed size relative to the station frame, adapted if None
+            max_fps (float): Highest frame rate sent when adapting
+            target_latency (float): Longest acceptable time from sending a frame to its delivery (s)
+            queued (callable): Returns the bytes not yet delivered to the viewer, or None if unknown
+        """
+        self.quality = quality
+        self.scale = scale
+        self.fps = fps
+        self.max_fps = fps or max_fps
+        self.target_latency = target_latency
+        self.queued = queued
+        self.level = 0
+        self.interval = 1.0 / self.max_fps  # Current minimum time between frames
+        self.throughput = None  # Drain rate in bytes/s, measured while the link was busy
+        self.backlog = 0.0  # Seconds of data waiting for the viewer after the last frame
+        self.drain_time = 0.0  # Longest measured time from writing a frame to its delivery, since the last frame
+        self._written = 0
+        self._pending = None  # (bytes written through the last frame, its send time) until it is delivered
+        self._mark = None  # (time, delivered bytes) since which the send queue has not run empty
+        self._last_sent = 0.0
+        self._last_size = 0
+        self._quick_since = None  # Since when frames have left with an (almost) empty queue
+
+    def profile(self):
+        """
+        Encoding profile for the next frame
+
+        Returns:
+            tuple: (quality, scale)
+        """
+        quality, scale = VIDEO_LEVELS[self.level]
+        return (self.quality or quality, self.scale or scale)
+
+    def _queued(self):
+        return self.queued() if self.queued else None
+
+    def ready_in(self):
+        """
+        Seconds to wait before the next frame may be sent
+
+        Returns:
+            float: 0 when a frame can go now
+        """
+        wait = 0.0
+        if self.fps is not None or self.interval > 1.0 / self.max_fps:
+            # At the default cap the camera paces the stream; waiting out of phase only adds latency
+            wait = self._last_sent + self.interval - time.monotonic()
+        queued = self._look()
+        if queued:
+            # At most one frame may wait in the queue; half of one until the drain rate is known
+            allowed = min(0.5 * self.target_latency * self.throughput, self._last_size) if self.throughput \
+                else 0.5 * self._last_size
+            if queued > allowed:
+                wait = max(wait, 0.01)
+            # Short polls while data is queued keep measuring the drain; an old estimate may be far too low
+            wait = min(wait, 0.02)
+        return max(0.0, wait)
+
+    def _look(self):
+        """
+        Read the send queue and measure the drain rate
+
+        The rate is taken over windows of at least 0.1 s in which the queue
+        never ran empty, so the link (not the stream) was the limit.
+
+        Returns:
+            int: Queued bytes, None if unknown
+        """
+        queued = self._queued()
+        if queued is None:
+            return None
+        now = time.monotonic()
+        delivered = self._written - queued
+        if self._pending is not None and delivered >= self._pending[0]:
+            # The last frame has left: its measured delivery time
+            self.drain_time = max(self.drain_time, now - self._pending[1])
+            self._pending = None
+        if not queued:
+            if self._mark is not None and self.throughput and now - self._mark[0] >= 0.01:
+                # Everything drained before we looked: a lower bound that can only raise the estimate
+                rate = (delivered - self._mark[1]) / (now - self._mark[0])
+                if rate > self.throughput:
+                    self._measured(rate)
+            self._mark = None
+        elif self._mark is None:
+            self._mark = (now, delivered)
+        elif now - self._mark[0] >= 0.1:
+            self._measured((delivered - self._mark[1]) / (now - self._mark[0]))
+            self._mark = (now, delivered)
+        return queued
+
+    def sent(self, size, seconds):
+        """
+        Account for a sent frame and adapt the stream
+
+        Args:
+            size (int): Bytes written
+            seconds (float): Time the write blocked
+        """
+        now = time.monotonic()
+        self._last_sent = now - seconds
+        self._last_size = size
+        self._written += size
+        queued = self._look()
+        if queued is None:
+            # The write only blocks once the link is the bottleneck
+            if seconds > 0.005:
+                self._measured(size / seconds)
+            self.backlog = seconds
+        else:
+            # Estimated from the drain rate, or measured on the previous frame if that took longer
+            self.backlog = max(queued / self.throughput if self.throughput else 0.0, self.drain_time)
+            self.drain_time = 0.0
+            self._pending = (self._written, self._last_sent)
+        self._adapt(size)
+
+    def _measured(self, rate):
+        """Fold a drain rate sample into the throughput estimate"""
+        self.throughput = rate if self.throughput is None else self.throughput + 0.3 * (rate - self.throughput)
+
+    def _adapt(self, size):
+        """Change level and frame interval after a frame of the given size"""
+        now = time.monotonic()
+        base = 1.0 / self.max_fps
+        quick = self.backlog < 0.25 * self.target_latency
+        if self.fps is None:
+            if quick or not self.throughput:
+                self.interval = max(base, 0.9 * self.interval)
+            else:
+                # The link is the limit: space frames so the queue drains between them
+                self.interval = min(1.0, max(base, 1.25 * size / self.throughput))
+        if self.quality is not None and self.scale is not None:
+            return
+        if self.backlog > self.target_latency:
+            # Step down at once; only stepping up waits, so a bad link is left quickly
+            self.level = min(self.level + 1, len(VIDEO_LEVELS) - 1)
+            self._quick_since = None
+        elif not quick:
+            self._quick_since = None
+        elif self._quick_since is None:
+            self._quick_since = now
+        elif now - self._quick_since >= 2.0 and self.level > 0:
+            self.level -= 1
+            self._quick_since = now
+
+
+class StationRegistry:
+    """
+    Class to create, look up and remove the stations of the server
+
+    The default station always exists and keeps the single-machine file locations;
+    added stations are persisted (id and name) and get their own data directory.
+    """
+
+    def __init__(self, filename=DEFAULT_STATIONS_FILE, data_root=DEFAULT_STATIONS_DIR):
+        """
+        Initialize the registry with the default station and the saved stations
+
+        Args:
+            filename (str): JSON file listing the added stations, None to not persist
+            data_root (str): Parent directory of the station data directories
+        """
+        self.filename = filename
+        self.data_root = data_root
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stations = {DEFAULT_STATION: Station(DEFAULT_STATION, 'Station 1')}
+        for entry in self._load():
+            try:
+                self.add(entry['id'], entry.get('name'), save=False)
+            except (KeyError, ValueError) as e:
+                logging.error(f"Skipping invalid station entry {entry}: {e}")
+
+    @staticmethod
+    def safe_id(station_id):
+        """
+        Validate a station id for use in URLs and directory names
+
+        Raises:
+            ValueError: If the id is empty or contains other characters than letters,
+                digits, '-' and '_'
+        """
+        station_id = str(station_id).strip()
+        if not re.fullmatch(r'[A-Za-z0-9_-]{1,32}', station_id):
+            raise ValueError("Station ids may only contain letters, digits, '-' and '_' (max. 32)")
+        return station_id
+
+    def _load(self):
+        """Read the saved station list"""
+        if not self.filename:
+            return []
+        try:
+            with open(self.filename) as f:
+                return json.load(f).get('stations', [])
+        except (OSError, ValueError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logging.error(f"Error loading stations from {self.filename}: {e}")
+            return []
+
+    def _save(self):
+        """Write the list of added stations"""
+        if not self.filename:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+            entries = [{'id': s.id, 'name': s.name} for s in self.stations.values() if s.id != DEFAULT_STATION]
+            with open(self.filename, 'w') as f:
+                json.dump({'stations': entries}, f, indent=2)
+        except OSError as e:
+            logging.error(f"Error saving stations to {self.filename}: {e}")
+            print(f"Error saving stations to {self.filename}: {e}")
+
+    def add(self, station_id, name=None, save=True):
+        """
+        Create a station
+
+        Args:
+            station_id (str): New station id
+            name (str): Display name
+            save (bool): Persist the station list
+
+        Returns:
+            Station: The new station
+
+        Raises:
+            ValueError: If the id is invalid or already used
+        """
+        station_id = self.safe_id(station_id)
+        with self._lock:
+            if station_id in self.stations:
+                raise ValueError(f"Station {station_id} already exists")
+            station = Station(station_id, name, os.path.join(self.data_root, station_id))
+            self.stations[station_id] = station
+            if save:
+                self._save()
+        logging.info(f"Added station {station_id}")
+        return station
+
+    def remove(self, station_id):
+        """
+        Close and remove a station (the default station cannot be removed)
+
+        Returns:
+            bool: True if the station existed and was removed
+        """
+        if station_id == DEFAULT_STATION:
+            return False
+        with self._lock:
+            station = self.stations.pop(station_id, None)
+            if station is None:
+                return False
+            self._save()
+        station.close()
+        logging.info(f"Removed station {station_id}")
+        return True
+
+    def get(self, station_id):
+        """Return the station with the given id or None"""
+        return self.stations.get(station_id)
+
+    @property
+    def default(self):
+        """The default station"""
+        return self.stations[DEFAULT_STATION]
+
+    def list_stations(self):
+        """Return the descriptions of all stations"""
+        return [station.describe() for station in list(self.stations.values())]
+
+    def owner_of_port(self, port):
+        """Return the station connected to a serial port, or None"""
+        for station in list(self.stations.values()):
+            if station.connected_port() == port:
+                return station
+        return None
+
+    def owner_of_camera(self, camera_index):
+        """Return the station using a camera index, or None"""
+        for station in list(self.stations.values()):
+            if station.camera is not None and station.camera_index == camera_index:
+                return station
+        return None
+
+    def bound(self):
+        """Return the station bound to the calling thread (see bind), or None"""
+        return getattr(self._local, 'station', None)
+
+    def bind(self, station, func):
+        """
+        Wrap a function so it runs with the station bound to its thread
+
+        Job functions run on pool threads outside any request; the binding tells
+        them which station's machine and camera they drive.
+
+        Args:
+            station (Station): Station to bind
+            func (callable): Function to wrap
+
+        Returns:
+            callable: Wrapped function
+        """
+        def bound(*args, **kwargs):
+            previous = self.bound()
+            self._local.station = station
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._local.station = previous
+        return bound
+
+    def close(self):
+        """Close all stations"""
+        for station in list(self.stations.values()):
+            station.close()
+
+
+if __name__ == "__main__":
+    # Test the registry without persistence
+    registry = StationRegistry(filename=None, data_root='/tmp/comparatron-stations')
+    second = registry.add('bench-2', 'Bench 2')
+    print(f"Stations: {registry.list_stations()}")
+    print(f"Bench 2 compensation file: {second.compensation_file}")
+    print(f"Bound outside a job: {registry.bound()}, inside: {registry.bind(second, registry.bound)().id}")
+    registry.remove('bench-2')
+    registry.close()
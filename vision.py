@@ -0,0 +1,437 @@
+"""
+Vision Module for Comparatron
+Image measurement helpers used to refine positions taken under the crosshair
+"""
+
+import time
+import cv2 as cv
+import numpy as np
+import logging
+from geometry_fit import fit_circle, fit_circle_geometric
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def to_gray(frame):
+    """
+    Convert a BGR or grayscale frame to a single channel image
+
+    Args:
+        frame (numpy.ndarray): Camera frame
+
+    Returns:
+        numpy.ndarray: Grayscale image
+    """
+    if frame.ndim == 3:
+        return cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+    return frame
+
+
+def _bilinear(image, x, y):
+    """Sample a float image at a sub-pixel position (clamped to the border)"""
+    h, w = image.shape[:2]
+    x = min(max(x, 0.0), w - 1.001)
+    y = min(max(y, 0.0), h - 1.001)
+    x0, y0 = int(x), int(y)
+    fx, fy = x - x0, y - y0
+    top = image[y0, x0] * (1 - fx) + image[y0, x0 + 1] * fx
+    bottom = image[y0 + 1, x0] * (1 - fx) + image[y0 + 1, x0 + 1] * fx
+    return float(top * (1 - fy) + bottom * fy)
+
+
+def refine_edge_point(frame, search_radius=40, low_threshold=50, high_threshold=150):
+    """
+    Locate the edge nearest to the crosshair with sub-pixel accuracy
+
+    Only a window of search_radius pixels around the frame centre is processed.
+    The edge position is refined along the gradient direction by fitting a
+    parabola through the gradient magnitude.
+
+    Args:
+        frame (numpy.ndarray): Camera frame
+        search_radius (int): Maximum distance from the centre in pixels
+        low_threshold (int): Canny hysteresis low threshold
+        high_threshold (int): Canny hysteresis high threshold
+
+    Returns:
+        tuple: (px, py) edge position in frame pixels, or None if no edge was found
+    """
+    gray = to_gray(frame)
+    h, w = gray.shape[:2]
+    cx, cy = w // 2, h // 2
+    margin = search_radius + 3
+    x0, y0 = max(0, cx - margin), max(0, cy - margin)
+    x1, y1 = min(w, cx + margin + 1), min(h, cy + margin + 1)
+    roi = cv.GaussianBlur(gray[y0:y1, x0:x1], (5, 5), 0)
+
+    edges = cv.Canny(roi, low_threshold, high_threshold)
+    ys, xs = np.nonzero(edges)
+    if len(xs) == 0:
+        return None
+    d2 = (xs + x0 - cx) ** 2 + (ys + y0 - cy) ** 2
+    k = int(np.argmin(d2))
+    if d2[k] > search_radius ** 2:
+        return None
+    ex, ey = int(xs[k]), int(ys[k])
+
+    gx = cv.Sobel(roi, cv.CV_32F, 1, 0, ksize=3)
+    gy = cv.Sobel(roi, cv.CV_32F, 0, 1, ksize=3)
+    norm = float(np.hypot(gx[ey, ex], gy[ey, ex]))
+    if norm == 0:
+        return float(ex + x0), float(ey + y0)
+    nx, ny = gx[ey, ex] / norm, gy[ey, ex] / norm
+    magnitude = cv.magnitude(gx, gy)
+
+    m_minus = _bilinear(magnitude, ex - nx, ey - ny)
+    m_centre = float(magnitude[ey, ex])
+    m_plus = _bilinear(magnitude, ex + nx, ey + ny)
+    denom = m_minus - 2.0 * m_centre + m_plus
+    t = 0.0
+    if denom < 0:
+        t = float(np.clip(0.5 * (m_minus - m_plus) / denom, -0.5, 0.5))
+    return float(ex + x0 + t * nx), float(ey + y0 + t * ny)
+
+
+def locate_fiducial(frame, mode='blob', search_radius=None):
+    """
+    Locate the fiducial feature nearest to the crosshair with sub-pixel accuracy
+
+    Args:
+        frame (numpy.ndarray): Camera frame
+        mode (str): 'blob' for a dot or graduation mark (intensity-weighted centroid of
+            the Otsu segment nearest the centre), 'corner' for a square corner
+        search_radius (int): Maximum distance from the centre in pixels, whole frame if None
+
+    Returns:
+        tuple: (px, py) fiducial position in frame pixels, or None if nothing was found
+    """
+    gray = to_gray(frame)
+    h, w = gray.shape[:2]
+    cx, cy = w // 2, h // 2
+    if search_radius is None:
+        search_radius = max(w, h)
+    blurred = cv.GaussianBlur(gray, (5, 5), 0)
+
+    if mode == 'corner':
+        corners = cv.goodFeaturesToTrack(blurred, 20, 0.05, 10)
+        if corners is None:
+            return None
+        corners = corners.reshape(-1, 2)
+        d2 = (corners[:, 0] - cx) ** 2 + (corners[:, 1] - cy) ** 2
+        k = int(np.argmin(d2))
+        if d2[k] > search_radius ** 2:
+            return None
+        criteria = (cv.TERM_CRITERIA_EPS + cv.TERM_CRITERIA_MAX_ITER, 40, 0.001)
+        refined = cv.cornerSubPix(gray, corners[k:k + 1].astype(np.float32).reshape(-1, 1, 2),
+                                  (5, 5), (-1, -1), criteria)
+        return float(refined[0, 0, 0]), float(refined[0, 0, 1])
+
+    level, mask = cv.threshold(blurred, 0, 255, cv.THRESH_BINARY + cv.THRESH_OTSU)
+    # The fiducial is the minority class (a mark on a plain background); pixels are
+    # weighted by their contrast to the background so partial edge pixels count less
+    background = float(np.median(blurred))
+    if np.count_nonzero(mask) > mask.size // 2:
+        mask = cv.bitwise_not(mask)
+        weight = np.clip(background - blurred.astype(np.float32), 0, None)
+    else:
+        weight = np.clip(blurred.astype(np.float32) - background, 0, None)
+    mask = cv.dilate(mask, np.ones((3, 3), np.uint8))  # Include the anti-aliased rim
+    count, labels, stats, centroids = cv.connectedComponentsWithStats(mask)
+    best, best_d2 = None, search_radius ** 2
+    for label in range(1, count):
+        x, y, bw, bh, area = stats[label]
+        if area < 4 or x == 0 or y == 0 or x + bw >= w or y + bh >= h:
+            continue  # Too small, or cut off by the frame border
+        d2 = (centroids[label, 0] - cx) ** 2 + (centroids[label, 1] - cy) ** 2
+        if d2 <= best_d2:
+            best, best_d2 = label, d2
+    if best is None:
+        return None
+    x, y, bw, bh, _ = stats[best]
+    region = (labels[y:y + bh, x:x + bw] == best) * weight[y:y + bh, x:x + bw]
+    moments = cv.moments(region.astype(np.float32))
+    if moments['m00'] == 0:
+        return float(centroids[best, 0]), float(centroids[best, 1])
+    return float(x + moments['m10'] / moments['m00']), float(y + moments['m01'] / moments['m00'])
+
+
+def measure_circle(frame, search_radius=150, min_radius=5, max_radius=None, downsample=2, rays=120,
+                   canny_threshold=100, accumulator_threshold=20):
+    """
+    Measure the circle (hole, bore or boss) around the crosshair with sub-pixel accuracy
+
+    A Hough circle search on a downsampled window around the frame centre finds
+    the circle roughly. Edge points are then located along rays from its centre
+    at full resolution (gradient peak refined with a parabola) and fitted with an
+    algebraic and then a geometric least-squares circle fit, after discarding
+    outlier points.
+
+    Args:
+        frame (numpy.ndarray): Camera frame
+        search_radius (int): Half size of the searched window in pixels
+        min_radius (int): Smallest circle radius in pixels
+        max_radius (int): Largest circle radius in pixels, search_radius if None
+        downsample (int): Reduction factor for the Hough search
+        rays (int): Number of radial edge samples
+        canny_threshold (int): Upper Canny threshold of the Hough search
+        accumulator_threshold (int): Hough accumulator threshold (lower finds weaker circles)
+
+    Returns:
+        dict: 'center' (px, py) and 'radius' in frame pixels, 'rms' fit residual (px),
+            'points' used and 'coverage' (fraction of rays with an edge), or None
+    """
+    gray = to_gray(frame)
+    h, w = gray.shape[:2]
+    cx, cy = w // 2, h // 2
+    search_radius = int(search_radius)
+    max_radius = int(max_radius or search_radius)
+    x0, y0 = max(0, cx - search_radius), max(0, cy - search_radius)
+    x1, y1 = min(w, cx + search_radius + 1), min(h, cy + search_radius + 1)
+    roi = gray[y0:y1, x0:x1]
+
+    # Coarse search on a downsampled window
+    f = max(1, int(downsample))
+    small = cv.resize(roi, (roi.shape[1] // f, roi.shape[0] // f), interpolation=cv.INTER_AREA) if f > 1 else roi
+    circles = cv.HoughCircles(cv.medianBlur(small, 5), cv.HOUGH_GRADIENT, dp=1,
+                              minDist=max(2, int(min_radius) // f), param1=canny_threshold,
+                              param2=accumulator_threshold, minRadius=max(1, int(min_radius) // f),
+                              maxRadius=max(2, max_radius // f))
+    if circles is None:
+        return None
+    centre = np.array([cx - x0, cy - y0], dtype=np.float64)
+    candidates = [((c[0] + 0.5) * f - 0.5, (c[1] + 0.5) * f - 0.5, c[2] * f) for c in circles[0]]
+    # Strongest circle around the crosshair, else the one centred nearest to it
+    around = [c for c in candidates if np.hypot(c[0] - centre[0], c[1] - centre[1]) < c[2]]
+    hx, hy, hr = around[0] if around else min(candidates, key=lambda c: np.hypot(c[0] - centre[0],
+                                                                                   c[1] - centre[1]))
+
+    # Sub-pixel edge points along rays through the coarse centre
+    blurred = cv.GaussianBlur(roi, (5, 5), 0).astype(np.float32)
+    band = max(2.0 * f + 2.0, 0.15 * hr)
+    radii = np.arange(max(1.0, hr - band), hr + band, 0.5)
+    if len(radii) < 5:
+        return None
+    angles = np.linspace(0, 2 * np.pi, int(rays), endpoint=False)
+    cos, sin = np.cos(angles)[:, None], np.sin(angles)[:, None]
+    map_x = (hx + cos * radii).astype(np.float32)
+    map_y = (hy + sin * radii).astype(np.float32)
+    inside = ((map_x >= 0) & (map_x <= roi.shape[1] - 1) & (map_y >= 0) & (map_y <= roi.shape[0] - 1)).all(axis=1)
+    profiles = cv.remap(blurred, map_x, map_y, cv.INTER_LINEAR, borderMode=cv.BORDER_REPLICATE)
+    slopes = np.diff(profiles, axis=1)  # Between samples i and i + 1
+    # Keep the edge polarity of the majority (dark hole on a bright part or the reverse)
+    polarity = 1.0 if np.median(slopes.max(axis=1)) >= np.median(-slopes.min(axis=1)) else -1.0
+    slopes = slopes * polarity
+    peak = slopes.argmax(axis=1)
+    rows = np.arange(len(angles))
+    strength = slopes[rows, peak]
+    usable = inside & (peak > 0) & (peak < slopes.shape[1] - 1) & (strength > max(2.0, 0.3 * np.median(strength)))
+    if usable.sum() < 8:
+        return None
+    rows, peak = rows[usable], peak[usable]
+    before, centre_value, after = slopes[rows, peak - 1], slopes[rows, peak], slopes[rows, peak + 1]
+    denom = before - 2.0 * centre_value + after
+    offset = np.where(denom < 0, np.clip(0.5 * (before - after) / np.where(denom < 0, denom, -1.0), -0.5, 0.5), 0.0)
+    edge_radius = radii[peak] + 0.25 + 0.5 * offset  # Slope i sits half a step past sample i
+    points = np.column_stack((hx + np.cos(angles[rows]) * edge_radius, hy + np.sin(angles[rows]) * edge_radius))
+
+    # Algebraic then geometric fit, once more without the outliers
+    circle = fit_circle_geometric(points, fit_circle(points))
+    if circle is None:
+        return None
+    residual = np.abs(np.hypot(points[:, 0] - circle[0], points[:, 1] - circle[1]) - circle[2])
+    limit = max(0.5, 3.0 * 1.4826 * np.median(residual))
+    keep = residual <= limit
+    if keep.sum() >= 8 and not keep.all():
+        points = points[keep]
+        circle = fit_circle_geometric(points, circle)
+        if circle is None:
+            return None
+    residual = np.hypot(points[:, 0] - circle[0], points[:, 1] - circle[1]) - circle[2]
+    return {'center': (circle[0] + x0, circle[1] + y0), 'radius': circle[2],
+            'rms': float(np.sqrt(np.mean(residual ** 2))), 'points': int(len(points)),
+            'coverage': float(len(points) / len(angles))}
+
+
+# Binary lookup tables by (threshold, invert), built once
+_threshold_luts = {}
+
+
+def threshold_lut(threshold, invert=True):
+    """
+    Cached 256-entry lookup table mapping gray values to 0/255
+
+    Args:
+        threshold (int): Gray value splitting background and part
+        invert (bool): Mark values below the threshold (a dark part on a backlight)
+
+    Returns:
+        numpy.ndarray: uint8 LUT for cv.LUT
+    """
+    key = (int(threshold), bool(invert))
+    lut = _threshold_luts.get(key)
+    if lut is None:
+        values = np.arange(256)
+        lut = np.where(values < key[0] if invert else values >= key[0], 255, 0).astype(np.uint8)
+        _threshold_luts[key] = lut
+    return lut
+
+
+def extract_silhouette(frame, threshold=None, decimate=4, min_area=50, refine=True, min_contrast=20):
+    """
+    Outlines of backlit parts with sub-pixel edges
+
+    The frame is decimated, binarized through a cached LUT and traced with
+    findContours; every contour point is then moved to the 50 % crossing of
+    the intensity profile along the contour normal in the full-resolution
+    frame. On 640x480 frames this takes a few milliseconds, so outlines can
+    follow the camera frame rate.
+
+    Args:
+        frame (numpy.ndarray): Camera frame of a dark part in front of a backlight
+        threshold (int): Binarization level; Otsu's level of the decimated image if None
+        decimate (int): Reduction factor for thresholding and tracing
+        min_area (float): Smallest traced area in full-resolution pixels
+        refine (bool): Refine the points to sub-pixel precision
+        min_contrast (float): Smallest edge profile contrast for the refinement (gray levels)
+
+    Returns:
+        dict: 'threshold' used and 'contours', a list of dicts with 'points' ((N, 2) pixel
+            coordinates), 'area', 'centroid' and 'perimeter' (pixels), 'hole' (inner boundary),
+            'complete' (not cut by the frame border) and 'refined' (fraction of points
+            moved to a sub-pixel edge)
+    """
+    gray = to_gray(frame)
+    h, w = gray.shape[:2]
+    f = max(1, int(decimate))
+    small = cv.resize(gray, (w // f, h // f), interpolation=cv.INTER_AREA) if f > 1 else gray
+    if threshold is None:
+        threshold, _ = cv.threshold(small, 0, 255, cv.THRESH_BINARY | cv.THRESH_OTSU)
+    binary = cv.LUT(small, threshold_lut(threshold))
+    contours, hierarchy = cv.findContours(binary, cv.RETR_CCOMP, cv.CHAIN_APPROX_NONE)
+    result = {'threshold': int(threshold), 'contours': []}
+    if not contours:
+        return result
+    image = gray.astype(np.float32) if refine else None
+    sh, sw = small.shape[:2]
+    for contour, (_, _, _, parent) in zip(contours, hierarchy[0]):
+        area = cv.contourArea(contour) * f * f
+        if area < min_area or len(contour) < 3:
+            continue
+        small_points = contour[:, 0, :]
+        complete = bool(small_points.min() > 0 and small_points[:, 0].max() < sw - 1
+                        and small_points[:, 1].max() < sh - 1)
+        points = (small_points.astype(np.float64) + 0.5) * f - 0.5
+        refined = 0.0
+        if refine:
+            points, refined = _refine_outline(image, points, f, min_contrast)
+        closed = np.vstack((points, points[:1]))
+        moments = cv.moments(points.astype(np.float32))
+        if moments['m00']:
+            area = abs(moments['m00'])
+            centroid = (moments['m10'] / moments['m00'], moments['m01'] / moments['m00'])
+        else:
+            centroid = tuple(points.mean(axis=0))
+        result['contours'].append({
+            'points': points, 'area': float(area), 'centroid': (float(centroid[0]), float(centroid[1])),
+            'perimeter': float(np.hypot(*np.diff(closed, axis=0).T).sum()),
+            'hole': bool(parent >= 0), 'complete': complete, 'refined': refined})
+    return result
+
+
+def _refine_outline(image, points, decimate, min_contrast):
+    """Move outline points to the sub-pixel edge along their normals (vectorized over all points)"""
+    # Normals from the neighbouring points of the closed contour
+    tangent = np.roll(points, -1, axis=0) - np.roll(points, 1, axis=0)
+    length = np.hypot(tangent[:, 0], tangent[:, 1])
+    valid = length > 0
+    normal = np.column_stack((-tangent[:, 1], tangent[:, 0])) / np.where(valid, length, 1.0)[:, None]
+    offsets = np.arange(-(decimate + 1.5), decimate + 1.5 + 1e-9, 0.5)
+    map_x = (points[:, 0:1] + normal[:, 0:1] * offsets).astype(np.float32)
+    map_y = (points[:, 1:2] + normal[:, 1:2] * offsets).astype(np.float32)
+    profiles = cv.remap(image, map_x, map_y, cv.INTER_LINEAR, borderMode=cv.BORDER_REPLICATE)
+    low, high = profiles.min(axis=1), profiles.max(axis=1)
+    level = (0.5 * (low + high))[:, None]
+    above = profiles >= level
+    crossing = above[:, 1:] != above[:, :-1]
+    # Crossing nearest to the traced point
+    distance = np.where(crossing, np.abs(offsets[:-1] + 0.25), np.inf)
+    k = distance.argmin(axis=1)
+    rows = np.arange(len(points))
+    ok = valid & (high - low >= min_contrast) & np.isfinite(distance[rows, k])
+    p0, p1 = profiles[rows, k], profiles[rows, k + 1]
+    step = np.where(p1 != p0, (level[:, 0] - p0) / np.where(p1 != p0, p1 - p0, 1.0), 0.5)
+    t = offsets[k] + 0.5 * np.clip(step, 0.0, 1.0)
+    refined = np.where(ok[:, None], points + normal * t[:, None], points)
+    return refined, float(ok.mean())
+
+
+def center_roi(frame, size=128):
+    """
+    Cut a square grayscale float32 region around the frame centre
+
+    Args:
+        frame (numpy.ndarray): Camera frame
+        size (int): Edge length in pixels (clipped to the frame)
+
+    Returns:
+        numpy.ndarray: ROI as float32
+    """
+    gray = to_gray(frame)
+    h, w = gray.shape[:2]
+    size = min(size, h, w)
+    y0, x0 = (h - size) // 2, (w - size) // 2
+    return gray[y0:y0 + size, x0:x0 + size].astype(np.float32)
+
+
+def image_shift(previous, current, window=None):
+    """
+    Measure the translation between two equally sized images by phase correlation
+
+    Args:
+        previous (numpy.ndarray): float32 image
+        current (numpy.ndarray): float32 image
+        window (numpy.ndarray): Optional Hanning window (cv.createHanningWindow) to reuse
+
+    Returns:
+        tuple: (dx, dy, response) shift in pixels and the correlation peak strength (0..1);
+            a low response means the image has too little texture to judge motion
+    """
+    (dx, dy), response = cv.phaseCorrelate(previous, current, window)
+    return float(dx), float(dy), float(response)
+
+
+if __name__ == "__main__":
+    # Test edge refinement on a synthetic vertical edge at x = 325.3
+    xs = np.arange(640, dtype=np.float64)
+    row = 40 + 160 / (1 + np.exp(-(xs - 325.3) / 0.8))
+    image = np.tile(row, (480, 1)).astype(np.uint8)
+    print(f"Refined edge: {refine_edge_point(image)}")
+
+    # Test fiducial location on a synthetic dot at (300.4, 250.7)
+    image = np.full((480, 640), 220, np.uint8)
+    cv.circle(image, (int(300.4 * 16), int(250.7 * 16)), 8 * 16, 30, -1, cv.LINE_AA, shift=4)
+    print(f"Fiducial: {locate_fiducial(image)}")
+
+    # Test phase correlation on a textured image shifted by (1.5, -0.5) pixels
+    texture = cv.GaussianBlur(np.random.default_rng(0).uniform(0, 255, (480, 640)).astype(np.float32), (7, 7), 2)
+    moved = cv.warpAffine(texture, np.float32([[1, 0, 1.5], [0, 1, -0.5]]), (640, 480))
+    print(f"Image shift: {image_shift(center_roi(texture), center_roi(moved))}")
+
+    # Test circle measurement on a synthetic hole at (318.3, 243.6) with radius 61.7 (4x supersampled)
+    ys, xs = np.mgrid[0:480 * 4, 0:640 * 4] / 4.0 - 0.375
+    hole = (np.hypot(xs - 318.3, ys - 243.6) < 61.7).reshape(480, 4, 640, 4).mean(axis=(1, 3))
+    print(f"Circle: {measure_circle((200 - 160 * hole).astype(np.uint8))}")
+
+    # Test silhouette extraction on a backlit washer (outer radius 90.4, hole 35.2, 4x supersampled)
+    radius = np.hypot(xs - 321.7, ys - 238.2)
+    washer = ((radius < 90.4) & (radius >= 35.2)).reshape(480, 4, 640, 4).mean(axis=(1, 3))
+    backlit = (230 - 200 * washer).astype(np.uint8)
+    start = time.perf_counter()
+    silhouette = extract_silhouette(backlit)
+    elapsed = (time.perf_counter() - start) * 1000
+    for outline in silhouette['contours']:
+        cx, cy, r = fit_circle_geometric(outline['points'])
+        print(f"Silhouette {'hole' if outline['hole'] else 'outline'}: centre ({cx:.3f}, {cy:.3f}), "
+              f"radius {r:.3f}, {len(outline['points'])} points")
+    print(f"Silhouette extraction: {elapsed:.2f} ms")